@@ -5,8 +5,8 @@ import os.path as op
 import math
 import re
 import logging
-import multiprocessing
 from collections import defaultdict, namedtuple
+from itertools import islice
 
 from pbcore.util.Process import backticks
 from pbcore.io import FastaWriter
@@ -17,8 +17,10 @@ from pbtranscript.io.ContigSetReaderWrapper import ContigSetReaderWrapper
 from pbtranscript.io import ReadAnnotation
 from pbtranscript.io.PbiBamIO import CCSInput
 from pbtranscript.io.Summary import ClassifySummary
-from pbtranscript.Utils import (revcmp, realpath, as_contigset,
-    generateChunkedFN, cat_files, real_upath, ln)
+from pbtranscript.PhmmerPool import PhmmerPool, PHMMER_BATCH_SIZE
+from pbtranscript.NativePrimerDetector import NativePrimerDetector
+from pbtranscript.Utils import (revcmp, realpath, real_ppath, as_contigset,
+    cat_files, ln)
 
 
 PBMATRIXFN = "PBMATRIX.txt"
@@ -31,6 +33,14 @@ FLCHIMERADOMFN = "hmmer.fl.chimera.dom"
 NFLCHIMERADOMFN = "hmmer.nfl.chimera.dom"
 CLASSIFYSUMMARY = "classify_summary.txt"
 
+# Primer detectors: phmmer, or the compiled local aligner of
+# NativePrimerDetector.
+PRIMER_DETECTORS = ("phmmer", "native")
+
+# Number of reads classified at a time by the single-pass pipeline,
+# which bounds memory used by reads and their primer hits.
+READS_PER_BATCH = 10000
+
 
 # ChimeraDetectionOptions:
 # Minimum length to output a (trimmed) sequence.
@@ -101,8 +111,8 @@ class Classifier(object):
                  cpus=1, change_read_id=True,
                  opts=ChimeraDetectionOptions(50, 10, 100, 50, 100, False),
                  out_nfl_fn=None, out_flnc_fn=None,
-                 ignore_polyA=False, reuse_dom=False,
-                 ignore_empty_output=False):
+                 ignore_polyA=False, reuse_dom=False, keep_dom=False,
+                 ignore_empty_output=False, primer_detector="phmmer"):
         self.reads_fn = realpath(reads_fn)
         self.out_dir = realpath(out_dir)
         self.cpus = cpus
@@ -110,7 +120,15 @@ class Classifier(object):
         self.chimera_detection_opts = opts
         self.ignore_polyA = ignore_polyA
         self.reuse_dom = reuse_dom
+        # Whether or not the single-pass classify writes dom files, which
+        # are only needed by a later run with reuse_dom.
+        self.keep_dom = keep_dom
         self.ignore_empty_output = ignore_empty_output
+        if primer_detector not in PRIMER_DETECTORS:
+            raise ClassifierException(
+                "Unknown primer detector {d}, must be one of {ds}.".format(
+                    d=primer_detector, ds=", ".join(PRIMER_DETECTORS)))
+        self.primer_detector = primer_detector
         self._numReads = None
 
         # The input primer file: primers.fasta
@@ -152,11 +170,9 @@ class Classifier(object):
         self.out_trimmed_fl_dom_fn = op.join(self.out_dir, FLCHIMERADOMFN)
         self.out_trimmed_nfl_dom_fn = op.join(self.out_dir, NFLCHIMERADOMFN)
 
-        self.chunked_front_back_reads_fns = None
-        self.chunked_front_back_dom_fns = None
-
-        #self.chunked_trimmed_reads_fns = None
-        #self.chunked_trimmed_reads_dom_fns = None
+        # Primer detector (persistent phmmer workers or native) shared
+        # by primer search and chimera detection, started on first use.
+        self._primer_detector = None
 
         # The summary file: *.classify_summary.txt
         self.summary = ClassifySummary()
@@ -366,71 +382,69 @@ class Classifier(object):
             if fwriter is not None:
                 fwriter.close()
 
-    def _startPhmmers(self, chunked_reads_fns, chunked_dom_fns,
-                      out_dom_fn, primer_fn, pbmatrix_fn):
-        """Run phmmers on chunked reads files in 'chunked_reads_fns' and
-        generate chunked dom files as listed in 'chunked_dom_fns', finally
-        concatenate dom files to 'out_dom_fn'."""
-        logging.info("Start to launch phmmer on chunked reads.")
-        jobs = []
-        for reads_fn, domFN in zip(chunked_reads_fns, chunked_dom_fns):
-            p = multiprocessing.Process(
-                target=self._phmmer,
-                args=(reads_fn, domFN, primer_fn, pbmatrix_fn))
-            jobs.append((p, domFN))
-            p.start()
-
-        for p, domFN in jobs:
-            p.join()
-            cmd = "cat {0} >> {1}".format(real_upath(domFN),
-                                          real_upath(out_dom_fn))
-            _output, errCode, errMsg = backticks(cmd)
-            if errCode != 0:
-                raise ClassifierException(
-                    "Error concatenating dom files: {e}".
-                    format(e=str(errMsg)))
-
-        self._cleanup(chunked_reads_fns)
-        self._cleanup(chunked_dom_fns)
-
-    def _phmmer(self, reads_fn, domFN, primer_fn, pbmaxtrixFN):
-        """Invoke phmmer once."""
-        cmd = "phmmer --cpu 1 --domtblout {d} --noali --domE 1 ".\
-              format(d=real_upath(domFN)) + \
-              "--mxfile {m} ".format(m=real_upath(pbmaxtrixFN)) + \
-              "--popen 0.07 --pextend 0.07 {r} {p} > /dev/null".\
-              format(r=real_upath(reads_fn), p=real_upath(primer_fn))
-        logging.debug("Calling phmmer: {cmd}".format(cmd=cmd))
-        _output, errCode, errMsg = backticks(cmd)
-        if (errCode != 0):
-            raise ClassifierException(
-                "Error calling phmmer: {e}.".format(e=str(errMsg)))
+    @property
+    def primerDetector(self):
+        """Return the PhmmerPool or NativePrimerDetector of this
+        classifier, create it if needed."""
+        if self._primer_detector is None:
+            if self.primer_detector == "native":
+                self._primer_detector = NativePrimerDetector()
+            else:
+                self._primer_detector = PhmmerPool(num_workers=self.cpus,
+                                                   pbmatrix_fn=self.pbmatrix_fn,
+                                                   tmp_dir=self.out_dir)
+        return self._primer_detector
+
+    def _closePrimerDetector(self):
+        """Stop phmmer workers if they have been started."""
+        if self._primer_detector is not None:
+            self._primer_detector.close()
+            self._primer_detector = None
+
+    def _phmmerBatchSize(self, num_seqs):
+        """Return number of sequences per phmmer batch, so that num_seqs
+        sequences keep all workers busy, and a batch has at most
+        PHMMER_BATCH_SIZE sequences."""
+        return max(1, min(PHMMER_BATCH_SIZE,
+                          int(math.ceil(num_seqs / float(max(1, self.cpus))))))
+
+    def _frontBackWindows(self, reads_fn, window_size):
+        """Yield (readname_front, first 'window_size' bases) and
+        (readname_back, reverse complement of last 'window_size' bases)
+        of each read in reads_fn."""
+        with CCSInput(reads_fn) as freader:
+            for window in self._readWindows(freader, window_size):
+                yield window
+
+    @staticmethod
+    def _readWindows(reads, window_size):
+        """Yield front and back windows of reads, see _frontBackWindows."""
+        for read in reads:
+            yield (read.name + "_front", read.sequence[:window_size])
+            yield (read.name + "_back", revcmp(read.sequence[-window_size:]))
 
     def _getBestFrontBackRecord(self, domFN):
         """Parses DOM output from phmmer and fill in best_of_front, best_of_back
            bestOf: sequence id ---> DOMRecord
         """
+        return self._pickBestFrontBackRecords(DOMReader(domFN), src=domFN)
+
+    def _pickBestFrontBackRecords(self, records, src="phmmer"):
+        """Fill in best_of_front, best_of_back from DOMRecords of front
+           and back windows of reads, either parsed from a DOM file or
+           streamed from PhmmerPool.
+           bestOf: sequence id ---> DOMRecord
+        """
         logging.info("Get the best front & back primer hits.")
         # bestOf_ = {} # key: sid --> primer name --> DOMRecord
         best_of_front = defaultdict(lambda: None)
         best_of_back = defaultdict(lambda: None)
 
-        reader = DOMReader(domFN)
-        for r in reader:
-            # allow missing adapter
-            if r.sStart > 48 or r.pStart > 48:
+        for r in records:
+            isFront = self._frontBackRecordSide(r, src)
+            if isFront is None:
                 continue
-
-            if r.sid.endswith('_front'):  # _front
-                bestOf = best_of_front
-                r.sid = r.sid[:-6]
-            elif r.sid.endswith('_back'):  # _back
-                bestOf = best_of_back
-                r.sid = r.sid[:-5]
-            else:
-                raise ClassifierException(
-                    "Unable to parse a read {r} in phmmer dom file {f}.".
-                    format(r=r.sid, f=domFN))
+            bestOf = best_of_front if isFront else best_of_back
             if r.sid not in bestOf:
                 bestOf[r.sid] = {}
             if (r.pid in bestOf[r.sid] and
@@ -439,6 +453,80 @@ class Classifier(object):
                 bestOf[r.sid][r.pid] = r
         return (best_of_front, best_of_back)
 
+    @staticmethod
+    def _frontBackRecordSide(r, src):
+        """Return True if DOMRecord r is a hit of the front window of a
+           read, False if of the back window, and None if the hit is too
+           far from the read end to be used. Strip _front or _back from
+           r.sid, so that it is the read id.
+        """
+        # allow missing adapter
+        if r.sStart > 48 or r.pStart > 48:
+            return None
+
+        if r.sid.endswith('_front'):  # _front
+            r.sid = r.sid[:-6]
+            return True
+        elif r.sid.endswith('_back'):  # _back
+            r.sid = r.sid[:-5]
+            return False
+        else:
+            raise ClassifierException(
+                "Unable to parse a read {r} in phmmer dom file {f}.".
+                format(r=r.sid, f=src))
+
+    def _iterBestFrontBackRecords(self, reads, records, src="phmmer"):
+        """Yield (read, dFront, dBack) for each read in reads, where
+           dFront and dBack are the best front and back primer hits of
+           the read ({primer name: DOMRecord} or None), the same as
+           _pickBestFrontBackRecords returns for the read.
+           Unlike _pickBestFrontBackRecords, DOMRecords must be sorted
+           by reads, i.e., hits of a read come after hits of earlier
+           reads, so that only hits of the current read are kept in
+           memory, however many reads there are.
+        """
+        def groups():
+            """Yield (read id, dFront, dBack) of reads with hits."""
+            rid, dFront, dBack = None, {}, {}
+            for r in records:
+                isFront = self._frontBackRecordSide(r, src)
+                if isFront is None:
+                    continue
+                if r.sid != rid:
+                    if rid is not None:
+                        yield (rid, dFront or None, dBack or None)
+                    rid, dFront, dBack = r.sid, {}, {}
+                bestOf = dFront if isFront else dBack
+                if r.pid not in bestOf or bestOf[r.pid].score < r.score:
+                    bestOf[r.pid] = r
+            if rid is not None:
+                yield (rid, dFront or None, dBack or None)
+
+        hits = groups()
+        group = next(hits, None)
+        for read in reads:
+            if group is not None and group[0] == read.name:
+                yield (read, group[1], group[2])
+                group = next(hits, None)
+            else:  # No hits of this read
+                yield (read, None, None)
+        if group is not None:
+            raise ClassifierException(
+                "Primer hits of read {r} in {f} are not sorted by reads.".
+                format(r=group[0], f=src))
+
+    def _isSortedByReads(self, reads_fn, domFN):
+        """Return True if primer hits in domFN are sorted by reads in
+        reads_fn, so that _iterBestFrontBackRecords can be used."""
+        with CCSInput(reads_fn) as reads:
+            try:
+                for dummy_hits in self._iterBestFrontBackRecords(
+                        reads, DOMReader(domFN), src=domFN):
+                    pass
+            except ClassifierException:
+                return False
+        return True
+
     def _getChimeraRecord(self, domFN, opts):
         """Parses phmmer DOM output from trimmed reads for chimera
            detection, return DOMRecord of suspicious chimeras, which
@@ -446,11 +534,17 @@ class Classifier(object):
         """
         logging.info("Identify chimera records from {f}.".
                      format(f=domFN))
+        return self._pickChimeraRecords(DOMReader(domFN), opts)
+
+    def _pickChimeraRecords(self, records, opts):
+        """Return DOMRecords of suspicious chimeras among DOMRecords of
+           trimmed reads, which have primer hits in the MIDDLE of the
+           sequence.
+        """
         # sid --> list of DOMRecord with primer hits in the middle
         # of sequence.
         suspicous_hits = defaultdict(lambda: [])
-        reader = DOMReader(domFN)
-        for r in reader:
+        for r in records:
             # A hit has to be in the middle of sequence, and with
             # decent score.
             if r.sStart > opts.min_dist_from_end and \
@@ -489,20 +583,13 @@ class Classifier(object):
             if write_report_header:
                 reporter.write(ReadAnnotation.header(delimiter=",") + "\n")
             for r in reader:
-                # e.g. r.name="movie/zmw/0_100_CCS fiveend=1;threeend=100;"
-                readid = r.name.split()[0]
-                annotation = ReadAnnotation.fromString(r.name,
-                                                       ignore_polyA=self.ignore_polyA)
-                if readid not in suspicous_hits:  # Non-chimeric reads
-                    # Primer of a primer-trimmed read can not be None.
-                    # assert(annotation.primer is not None)
-                    annotation.chimera = 0
+                annotation = self._chimeraAnnotation(r.name, suspicous_hits)
+                if annotation.chimera == 0:  # Non-chimeric reads
                     num_nc += 1
                     num_nc_bases += len(r.sequence)
                     writer.writeRecord(annotation.toAnnotation(),
                                        r.sequence[:])
                 else:  # chimeric reads
-                    annotation.chimera = 1
                     num_c += 1
                     num_c_bases += len(r.sequence)
                     writer_chimera.writeRecord(annotation.toAnnotation(),
@@ -511,6 +598,18 @@ class Classifier(object):
                 reporter.write(annotation.toReportRecord(delimitor=",") + "\n")
         return (num_nc, num_c, num_nc_bases, num_c_bases)
 
+    def _chimeraAnnotation(self, name, suspicous_hits):
+        """Return annotation of a trimmed read, with chimera set to 1
+        if the read has suspicious primer hits, and 0 otherwise.
+            name --- read name with annotation, e.g.,
+                     "movie/zmw/0_100_CCS fiveend=1;threeend=100;"
+        """
+        annotation = ReadAnnotation.fromString(name,
+                                               ignore_polyA=self.ignore_polyA)
+        # Primer of a primer-trimmed read can not be None.
+        annotation.chimera = 1 if name.split()[0] in suspicous_hits else 0
+        return annotation
+
     def _findPolyA(self, seq, min_a_num=8, three_start=None):
         """
         Find poly A tail, which has at least 'min_a_num' A bases and at most
@@ -588,7 +687,7 @@ class Classifier(object):
                      primer_report_nfl_fn,
                      best_of_front, best_of_back, primer_indices,
                      min_seq_len, min_score, change_read_id,
-                     ignore_polyA):
+                     ignore_polyA, sorted_records=None):
         """Trim bar code from reads in 'reads_fn', annotate each read,
         indicating:
             whether its 5' primer, 3' primer and polyA tail are seen,
@@ -605,6 +704,9 @@ class Classifier(object):
         is done.
 
         best_of_front/Back: {read_id: {primer_name:DOMRecord}}
+        sorted_records: if not None, DOMRecords of front and back windows
+            of reads, sorted by reads in reads_fn, which are aggregated
+            read by read instead of using best_of_front/Back.
         min_seq_len: minimum length to output a read.
         min_score: minimum score to output a read.
         change_read_id: if True, change read ids to 'movie/zmw/start_end'.
@@ -622,76 +724,16 @@ class Classifier(object):
                 FastaWriter(out_nfl_reads_fn) as nfl_fawriter, \
                 FastaWriter(out_fl_reads_fn) as fl_fawriter, \
                 open(primer_report_nfl_fn, 'w') as reporter:
-            for read in fareader:
+            if sorted_records is not None:
+                hits = self._iterBestFrontBackRecords(fareader, sorted_records)
+            else:
+                hits = ((read, best_of_front[read.name], best_of_back[read.name])
+                        for read in fareader)
+            for read, dFront, dBack in hits:
                 self.summary.num_reads += 1  # number of ROI reads
-                pbread = PBRead(read)
-                logging.debug("Pick up best primer combo for {r}".
-                              format(r=read.name))
-                primerIndex, strand, fw, rc = self._pickBestPrimerCombo(
-                    best_of_front[read.name], best_of_back[read.name],
-                    primer_indices, min_score)
-                logging.debug("read={0}\n".format(read.name) +
-                              "primer={0} strand={1} fw={2} rc={3}".
-                              format(primerIndex, strand, fw, rc))
-
-                if fw is None and rc is None:
-                    # No primer seen in this sequence, classified
-                    # as non-full-length
-                    newName = pbread.name
-                    if change_read_id:
-                        newName = "{m}/{z}/{s1}_{e1}{isccs}".format(
-                                  m=pbread.movie, z=pbread.zmw,
-                                  s1=pbread.start, e1=pbread.end,
-                                  isccs=("_CCS" if pbread.isCCS else ""))
-                    annotation = ReadAnnotation(ID=newName)
-                    # Write reports of nfl reads
-                    reporter.write(annotation.toReportRecord(delimitor=",") + "\n")
-                    if len(read.sequence) >= min_seq_len:
-                        # output non-full-length reads to nfl.trimmed.fasta
-                        nfl_fawriter.writeRecord(annotation.toAnnotation(),
-                                                 read.sequence[:])
-                        self.summary.num_nfl += 1
-                    else:
-                        self.summary.num_filtered_short_reads += 1
-                    continue
-                seq = read.sequence[:] if strand == "+" else revcmp(read.sequence[:])
-                five_end, three_start = None, None
-                if fw is not None:
-                    five_end = fw.sEnd
-                    self.summary.num_5_seen += 1
-                if rc is not None:
-                    three_start = len(seq) - rc.sEnd
-                    self.summary.num_3_seen += 1
-
-                s, e = pbread.start, pbread.end
-                # Try to find polyA tail in read
-                polyAPos = self._findPolyA(seq, three_start=three_start)
-                if polyAPos >= 0:  # polyA found
-                    seq = seq[:polyAPos]
-                    e1 = s + polyAPos if strand == "+" else e - polyAPos
-                    self.summary.num_polya_seen += 1
-                elif three_start is not None:  # polyA not found
-                    seq = seq[:three_start]
-                    e1 = s + three_start if strand == "+" else e - three_start
-                else:
-                    e1 = e if strand == "+" else s
-
-                if five_end is not None:
-                    seq = seq[five_end:]
-                    s1 = s + five_end if strand == "+" else e - five_end
-                else:
-                    s1 = s if strand == "+" else e
-
-                newName = pbread.name
-                if change_read_id:
-                    newName = "{m}/{z}/{s1}_{e1}{isccs}".format(
-                        m=pbread.movie, z=pbread.zmw, s1=s1, e1=e1,
-                        isccs=("_CCS" if pbread.isCCS else ""))
-                # Create an annotation
-                annotation = ReadAnnotation(ID=newName, strand=strand,
-                                            fiveend=five_end, polyAend=polyAPos,
-                                            threeend=three_start, primer=primerIndex,
-                                            ignore_polyA=ignore_polyA)
+                annotation, seq = self._trimRead(
+                    read, dFront, dBack, primer_indices, min_score,
+                    change_read_id, ignore_polyA)
 
                 # Write reports for nfl reads
                 if annotation.isFullLength is not True:
@@ -709,6 +751,74 @@ class Classifier(object):
                 else:
                     self.summary.num_filtered_short_reads += 1
 
+    def _trimRead(self, read, dFront, dBack, primer_indices, min_score,
+                  change_read_id, ignore_polyA):
+        """Pick up the best primer combo of a read given its best front
+        and back primer hits (dFront, dBack), trim primers and polyA tail
+        away, and update 5' seen, 3' seen and polyA seen summary.
+        Return (annotation, trimmed sequence), where sequence is not
+        trimmed if no primer is seen.
+        """
+        pbread = PBRead(read)
+        logging.debug("Pick up best primer combo for {r}".
+                      format(r=read.name))
+        primerIndex, strand, fw, rc = self._pickBestPrimerCombo(
+            dFront, dBack, primer_indices, min_score)
+        logging.debug("read={0}\n".format(read.name) +
+                      "primer={0} strand={1} fw={2} rc={3}".
+                      format(primerIndex, strand, fw, rc))
+
+        if fw is None and rc is None:
+            # No primer seen in this sequence, classified
+            # as non-full-length
+            newName = pbread.name
+            if change_read_id:
+                newName = "{m}/{z}/{s1}_{e1}{isccs}".format(
+                          m=pbread.movie, z=pbread.zmw,
+                          s1=pbread.start, e1=pbread.end,
+                          isccs=("_CCS" if pbread.isCCS else ""))
+            return ReadAnnotation(ID=newName), read.sequence[:]
+
+        seq = read.sequence[:] if strand == "+" else revcmp(read.sequence[:])
+        five_end, three_start = None, None
+        if fw is not None:
+            five_end = fw.sEnd
+            self.summary.num_5_seen += 1
+        if rc is not None:
+            three_start = len(seq) - rc.sEnd
+            self.summary.num_3_seen += 1
+
+        s, e = pbread.start, pbread.end
+        # Try to find polyA tail in read
+        polyAPos = self._findPolyA(seq, three_start=three_start)
+        if polyAPos >= 0:  # polyA found
+            seq = seq[:polyAPos]
+            e1 = s + polyAPos if strand == "+" else e - polyAPos
+            self.summary.num_polya_seen += 1
+        elif three_start is not None:  # polyA not found
+            seq = seq[:three_start]
+            e1 = s + three_start if strand == "+" else e - three_start
+        else:
+            e1 = e if strand == "+" else s
+
+        if five_end is not None:
+            seq = seq[five_end:]
+            s1 = s + five_end if strand == "+" else e - five_end
+        else:
+            s1 = s if strand == "+" else e
+
+        newName = pbread.name
+        if change_read_id:
+            newName = "{m}/{z}/{s1}_{e1}{isccs}".format(
+                m=pbread.movie, z=pbread.zmw, s1=s1, e1=e1,
+                isccs=("_CCS" if pbread.isCCS else ""))
+        # Create an annotation
+        annotation = ReadAnnotation(ID=newName, strand=strand,
+                                    fiveend=five_end, polyAend=polyAPos,
+                                    threeend=three_start, primer=primerIndex,
+                                    ignore_polyA=ignore_polyA)
+        return annotation, seq
+
     def _validate_outputs(self, out_dir, out_all_reads_fn):
         """Validate and create output directory."""
         logging.info("Creating output directory {d}.".format(d=out_dir))
@@ -735,9 +845,12 @@ class Classifier(object):
     def runPrimerTrimmer(self):
         """Run PHMMER to identify barcodes and trim them away.
         (1) create forward/reverse primers
-        (2) copy input with just the first/last k bases
-        (3) run phmmer
-        (4) parse phmmer DOM output, trim barcodes and output summary
+        (2) stream the first/last k bases of reads to phmmer workers
+            (or the native primer detector)
+        (3) collect best primer hits of reads in order as phmmer batches
+            finish, keeping only hits of the read being trimmed, unless
+            hits of a reused dom file are not sorted by reads
+        (4) trim barcodes and output summary
         """
         logging.info("Start to find and trim 3'/5' primers and polyAs.")
         # Sanity check input primers and create forward/reverse primers
@@ -752,43 +865,29 @@ class Classifier(object):
         if op.exists(self.out_front_back_dom_fn) and self.reuse_dom:
             logging.warn("Primer detection output already exists. Parsing {0}".
                          format(self.out_front_back_dom_fn))
+            records = DOMReader(self.out_front_back_dom_fn)
+            is_sorted = self._isSortedByReads(self.reads_fn,
+                                              self.out_front_back_dom_fn)
         else:
-            # Split reads in reads_fn into smaller chunks.
-            num_chunks = max(min(self.cpus, self.numReads), 1)
-            reads_per_chunk = int(math.ceil(self.numReads / (float(num_chunks))))
-            num_chunks = int(math.ceil(self.numReads / float(reads_per_chunk)))
-
-            logging.debug("Split {r} reads into {n} chunks".format(
-                n=num_chunks, r=self.numReads))
-            # Divide input reads into smaller chunks and extract only
-            # the front and the end segment from each read.
-            self.chunked_front_back_reads_fns = generateChunkedFN(self.out_dir,
-                                                                  "in.front_end.fasta_split", num_chunks)
-
-            # Dom output of phmmer for the above front/end sequences.
-            self.chunked_front_back_dom_fns = generateChunkedFN(self.out_dir,
-                                                                "out.front_end.hmmer_split", num_chunks)
-
-            # Split reads within 'reads_fn' into 'num_chunks' chunks, and only
-            # extract the front and end segment from each read.
+            # Search primers in the front and end segment of each read,
+            # which is also saved to out_front_back_dom_fn.
             window_size = self.chimera_detection_opts.primer_search_window
-            self._chunkReads(reads_fn=self.reads_fn,
-                             reads_per_chunk=reads_per_chunk,
-                             chunked_reads_fns=self.chunked_front_back_reads_fns,
-                             extract_front_back_only=True,
-                             window_size=window_size)
-
-            # Start n='num_chunks' phmmer.
-            self._startPhmmers(
-                chunked_reads_fns=self.chunked_front_back_reads_fns,
-                chunked_dom_fns=self.chunked_front_back_dom_fns,
-                out_dom_fn=self.out_front_back_dom_fn,
+            records = self.primerDetector.search(
+                seqs=self._frontBackWindows(self.reads_fn, window_size),
                 primer_fn=self.primer_front_back_fn,
-                pbmatrix_fn=self.pbmatrix_fn)
+                out_dom_fn=self.out_front_back_dom_fn,
+                batch_size=self._phmmerBatchSize(2 * self.numReads),
+                ordered=True)
+            is_sorted = True
 
-        # Parse dome file, and return dictionary of front & back.
-        best_of_front, best_of_back = self._getBestFrontBackRecord(
-            self.out_front_back_dom_fn)
+        if is_sorted:
+            # Collect best front & back primer hits read by read.
+            best_of_front, best_of_back, sorted_records = None, None, records
+        else:
+            # Collect best front & back primer hits of all reads.
+            best_of_front, best_of_back = self._pickBestFrontBackRecords(
+                records, src=self.out_front_back_dom_fn)
+            sorted_records = None
 
         # Trim bar code away
         self._trimBarCode(reads_fn=self.reads_fn,
@@ -801,11 +900,9 @@ class Classifier(object):
                           min_seq_len=self.chimera_detection_opts.min_seq_len,
                           min_score=self.chimera_detection_opts.min_score,
                           change_read_id=self.change_read_id,
-                          ignore_polyA=self.ignore_polyA)
+                          ignore_polyA=self.ignore_polyA,
+                          sorted_records=sorted_records)
 
-        # Clean intemediate files: chunked reads files and chunked dom files.
-        self._cleanup(self.chunked_front_back_reads_fns)
-        self._cleanup(self.chunked_front_back_dom_fns)
         logging.info("Done with finding and trimming primers and polyAs.")
 
     def _detect_chimera(self, in_fasta, out_nc_fasta, out_c_fasta,
@@ -827,30 +924,20 @@ class Classifier(object):
         if op.exists(out_dom) and self.reuse_dom:
             logging.warn("Chimera detection output already exists. Parse {o}.".
                          format(o=out_dom))
+            records = DOMReader(out_dom)
         else:
-            num_chunks = max(min(num_reads, self.cpus), 1)
-            reads_per_chunk = int(math.ceil(num_reads / float(num_chunks)))
-            num_chunks = int(math.ceil(num_reads / float(reads_per_chunk)))
-
-            chunked_reads_fns = generateChunkedFN(self.out_dir,
-                                                  "in.{n}.trimmed.fasta_split".format(n=job_name), num_chunks)
-
-            chunked_dom_fns = generateChunkedFN(self.out_dir,
-                                                "out.{n}.trimmed.hmmer_split".format(n=job_name), num_chunks)
-
-            self._chunkReads(reads_fn=in_fasta,
-                             reads_per_chunk=reads_per_chunk,
-                             chunked_reads_fns=chunked_reads_fns,
-                             extract_front_back_only=False)
-
-            self._startPhmmers(chunked_reads_fns=chunked_reads_fns,
-                               chunked_dom_fns=chunked_dom_fns,
-                               out_dom_fn=out_dom,
-                               primer_fn=self.primer_chimera_fn,
-                               pbmatrix_fn=self.pbmatrix_fn)
-
-        suspicous_hits = self._getChimeraRecord(out_dom,
-                                                self.chimera_detection_opts)
+            def reads():
+                """Yield (name, sequence) of reads in in_fasta."""
+                with CCSInput(in_fasta) as freader:
+                    for read in freader:
+                        yield (read.name, read.sequence)
+            records = self.primerDetector.search(
+                seqs=reads(), primer_fn=self.primer_chimera_fn,
+                out_dom_fn=out_dom,
+                batch_size=self._phmmerBatchSize(num_reads))
+
+        suspicous_hits = self._pickChimeraRecords(records,
+                                                  self.chimera_detection_opts)
 
         # Update chimera information
         (num_nc, num_c, num_nc_bases, num_c_bases) = \
@@ -932,15 +1019,191 @@ class Classifier(object):
         self._cleanup([self._primer_report_nfl_fn,
                        self._primer_report_fl_fn])
 
+    def _classifyChimeras(self, trimmed_reads, writers, writers_chimera,
+                          reporter, out_dom):
+        """Detect chimeras among a batch of trimmed reads, write
+        non-chimeric reads to each of writers, chimeric reads to each
+        of writers_chimera, and their annotations to reporter.
+            trimmed_reads --- a list of (ReadAnnotation, trimmed sequence)
+            out_dom --- phmmer output, to which hits of the batch are
+                        appended, or None
+        Return:
+            (num_nc, num_c, num_nc_bases, num_c_bases)
+        """
+        # Reads are named by their annotations, the way they are
+        # written to trimmed fasta files by the multi-pass classify.
+        reads = [(annotation.toAnnotation(), seq)
+                 for annotation, seq in trimmed_reads]
+        records = self.primerDetector.search(
+            seqs=reads, primer_fn=self.primer_chimera_fn,
+            out_dom_fn=out_dom, append_dom=True,
+            batch_size=self._phmmerBatchSize(len(reads)))
+        suspicous_hits = self._pickChimeraRecords(records,
+                                                  self.chimera_detection_opts)
+
+        num_nc, num_c, num_nc_bases, num_c_bases = 0, 0, 0, 0
+        for name, seq in reads:
+            annotation = self._chimeraAnnotation(name, suspicous_hits)
+            if annotation.chimera == 0:  # Non-chimeric reads
+                num_nc += 1
+                num_nc_bases += len(seq)
+                out_writers = writers
+            else:  # chimeric reads
+                num_c += 1
+                num_c_bases += len(seq)
+                out_writers = writers_chimera
+            for writer in out_writers:
+                writer.writeRecord(annotation.toAnnotation(), seq)
+            reporter.write(annotation.toReportRecord(delimitor=",") + "\n")
+        return (num_nc, num_c, num_nc_bases, num_c_bases)
+
+    def runPipeline(self, reads_per_batch=READS_PER_BATCH):
+        """Find and trim primers and polyAs, and detect chimeras in a
+        single pass over reads, READS_PER_BATCH reads at a time.
+        (1) create primers for primer detection and chimera detection
+        (2) search primers in front/back windows of a batch of reads
+        (3) trim primers and polyAs of reads in the batch
+        (4) detect chimeras among trimmed fl reads (and nfl reads if
+            required) of the batch, write them straight to flnc/flc
+            (nflnc/nflc), nfl and all reads outputs, and their
+            annotations to the primer report.
+        Outputs hold the same reads as those of runPrimerTrimmer +
+        runChimeraDetector, in the order of batches. Neither trimmed
+        reads nor concatenated copies of outputs are written, so memory
+        and disk besides the outputs are bounded by the batch size. Dom
+        files are only written, batch by batch, if keep_dom is set.
+        """
+        logging.info("Start to classify reads in batches of {n}.".
+                     format(n=reads_per_batch))
+        opts = self.chimera_detection_opts
+        primer_indices = self._processPrimers(
+            primer_fn=self.primer_fn, window_size=opts.primer_search_window,
+            primer_out_fn=self.primer_front_back_fn, revcmp_primers=False)
+        self._processPrimers(
+            primer_fn=self.primer_fn, window_size=opts.primer_search_window,
+            primer_out_fn=self.primer_chimera_fn, revcmp_primers=True)
+
+        detect_chimera_nfl = opts.detect_chimera_nfl is True
+        if detect_chimera_nfl:
+            self.summary.num_nflnc, self.summary.num_nflc = 0, 0
+
+        # Hits of batches are appended to dom files, truncate them first.
+        front_back_dom_fn, fl_dom_fn, nfl_dom_fn = None, None, None
+        if self.keep_dom:
+            front_back_dom_fn = self.out_front_back_dom_fn
+            fl_dom_fn = self.out_trimmed_fl_dom_fn
+            if detect_chimera_nfl:
+                nfl_dom_fn = self.out_trimmed_nfl_dom_fn
+            for fn in [front_back_dom_fn, fl_dom_fn, nfl_dom_fn]:
+                if fn is not None:
+                    open(fn, 'w').close()
+
+        # out_nfl_fn may be a link to trimmed nfl reads of a previous
+        # multi-pass run, which should not be written through.
+        if op.islink(self.out_nfl_fn_fasta):
+            os.remove(self.out_nfl_fn_fasta)
+
+        # Output files are opened in order, and closed in reverse order.
+        fns = [self.out_flnc_fn_fasta, self.out_flc_fn_fasta,
+               self.out_nfl_fn_fasta, self.out_all_reads_fn_fasta]
+        if detect_chimera_nfl:
+            fns += [self.out_nflnc_fn_fasta, self.out_nflc_fn_fasta]
+        writers = []
+        try:
+            for fn in fns:
+                writers.append(FastaWriter(fn))
+            writers.append(open(real_ppath(self.primer_report_fn), 'w'))
+            if detect_chimera_nfl:
+                flnc_writer, flc_writer, nfl_writer, all_writer, \
+                    nflnc_writer, nflc_writer, reporter = writers
+            else:
+                flnc_writer, flc_writer, nfl_writer, all_writer, \
+                    reporter = writers
+            reporter.write(ReadAnnotation.header(delimiter=",") + "\n")
+
+            with CCSInput(self.reads_fn) as freader:
+                freader = iter(freader)
+                while True:
+                    reads = list(islice(freader, reads_per_batch))
+                    if len(reads) == 0:
+                        break
+                    logging.debug("Classify a batch of {n} reads.".
+                                  format(n=len(reads)))
+                    self.summary.num_reads += len(reads)
+
+                    # Search primers in the front and end segment of reads.
+                    records = self.primerDetector.search(
+                        seqs=self._readWindows(reads, opts.primer_search_window),
+                        primer_fn=self.primer_front_back_fn,
+                        out_dom_fn=front_back_dom_fn, append_dom=True,
+                        batch_size=self._phmmerBatchSize(2 * len(reads)),
+                        ordered=True)
+
+                    # Trim primers and polyAs, see _trimBarCode.
+                    fl_reads, nfl_reads = [], []
+                    for read, dFront, dBack in \
+                            self._iterBestFrontBackRecords(reads, records):
+                        annotation, seq = self._trimRead(
+                            read, dFront, dBack, primer_indices,
+                            opts.min_score, self.change_read_id,
+                            self.ignore_polyA)
+                        isFullLength = annotation.isFullLength is True
+                        if not isFullLength and not detect_chimera_nfl:
+                            reporter.write(annotation.toReportRecord(
+                                delimitor=",") + "\n")
+                        if len(seq) < opts.min_seq_len:
+                            self.summary.num_filtered_short_reads += 1
+                        elif isFullLength:
+                            fl_reads.append((annotation, seq))
+                        else:
+                            nfl_reads.append((annotation, seq))
+                    del reads
+
+                    # Detect chimeras among trimmed reads.
+                    self.summary.num_fl += len(fl_reads)
+                    if len(fl_reads) > 0:
+                        num_nc, num_c, num_nc_bases, _x = \
+                            self._classifyChimeras(fl_reads,
+                                                   [flnc_writer, all_writer],
+                                                   [flc_writer], reporter,
+                                                   fl_dom_fn)
+                        self.summary.num_flnc += num_nc
+                        self.summary.num_flc += num_c
+                        self.summary.num_flnc_bases += num_nc_bases
+
+                    self.summary.num_nfl += len(nfl_reads)
+                    if detect_chimera_nfl and len(nfl_reads) > 0:
+                        num_nc, num_c, _x, _y = \
+                            self._classifyChimeras(
+                                nfl_reads,
+                                [nflnc_writer, nfl_writer, all_writer],
+                                [nflc_writer, nfl_writer], reporter,
+                                nfl_dom_fn)
+                        self.summary.num_nflnc += num_nc
+                        self.summary.num_nflc += num_c
+                    elif not detect_chimera_nfl:
+                        for annotation, seq in nfl_reads:
+                            nfl_writer.writeRecord(annotation.toAnnotation(), seq)
+                            all_writer.writeRecord(annotation.toAnnotation(), seq)
+        finally:
+            for writer in reversed(writers):
+                writer.close()
+
+        logging.info("Done with classifying reads.")
+
     def run(self):
         """Classify/annotate reads according to 5' primer seen,
         3' primer seen, polyA seen, chimera (concatenation of two
         or multiple transcripts with primers seen in the middle of
         a read)
         (1) Create and validate input/output
-        (2) Check phmmer is runnable
-        (3) Find primers using phmmer and trim away primers and polyAs
+        (2) Check phmmer is runnable, unless primers are detected natively
+        (3) Find primers and trim away primers and polyAs
         (4) Detect chimeras from trimmed reads
+        (3) and (4) are done in a single pass over reads by runPipeline,
+        unless dom files of a previous run are reused, in which case
+        runPrimerTrimmer and runChimeraDetector parse them instead.
+        runPipeline only writes dom files if keep_dom is set.
         """
         # Validate input files and required data files.
         self._validate_inputs(self.reads_fn, self.primer_fn, self.pbmatrix_fn)
@@ -949,20 +1212,27 @@ class Classifier(object):
         self._validate_outputs(self.out_dir, self.out_all_reads_fn_fasta)
 
         # Sanity check phmmer can be called successfully.
-        self._checkPhmmer()
+        if self.primer_detector == "phmmer":
+            self._checkPhmmer()
 
-        # Find and trim primers and polyAs.
-        self.runPrimerTrimmer()
+        no_flnc_errMsg = "No full-length non-chimeric reads detected."
+        try:
+            if self.reuse_dom:
+                # Find and trim primers and polyAs.
+                self.runPrimerTrimmer()
+                if self.summary.num_fl > 0:
+                    # Detect chimeras and generate primer reports.
+                    self.runChimeraDetector()
+            else:
+                self.runPipeline()
+        finally:
+            self._closePrimerDetector()
 
         # Check whether no fl reads detected.
-        no_flnc_errMsg = "No full-length non-chimeric reads detected."
         if self.summary.num_fl == 0:
             logging.error(no_flnc_errMsg)
             if not self.ignore_empty_output:
                 raise ClassifierException(no_flnc_errMsg)
-        else:
-            # Detect chimeras and generate primer reports.
-            self.runChimeraDetector()
 
         dataset_uuids = []
         for file_attr in ["out_nfl_fn", "out_nflnc_fn", "out_nflc_fn",
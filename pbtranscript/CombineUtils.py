@@ -11,6 +11,7 @@ import cPickle
 from pbcore.io import FastqReader, FastqWriter, FastaWriter
 
 from pbtranscript.io.ContigSetReaderWrapper import ContigSetReaderWrapper
+from pbtranscript.io.PartialUCIO import PartialUCIndex, fresh_partial_uc_txt_fn
 from pbtranscript.Utils import mkdir, realpath
 from pbtranscript.ice.IceQuiverPostprocess import IceQuiverPostprocess
 from pbtranscript.ice.IceFiles import write_cluster_summary
@@ -188,6 +189,8 @@ def write_combined_cluster_report(split_indices, split_uc_pickles,
       split_partial_uc_pickles -- partial uc pickle
                           (output/map_noFL/nfl.all.partial.pickle)
                           in each splitted cluster bin.
+    nfl reads of clusters are looked up in the partial uc file next to a
+    partial uc pickle if it exists, instead of loading the pickle.
     """
     assert len(split_indices) == len(split_uc_pickles)
     assert len(split_indices) == len(split_partial_uc_pickles)
@@ -200,16 +203,22 @@ def write_combined_cluster_report(split_indices, split_uc_pickles,
             logging.info("Combining uc pickle %s and partial uc pickle %s",
                          uc_pickle, partial_uc_pickle)
             uc = cPickle.load(open(uc_pickle, 'rb'))['uc']
-            partial_uc = cPickle.load(open(partial_uc_pickle, 'rb'))['partial_uc']
+            partial_uc_txt = fresh_partial_uc_txt_fn(partial_uc_pickle)
+            if partial_uc_txt is not None:
+                partial_uc = PartialUCIndex(partial_uc_txt)
+            else:
+                partial_uc = cPickle.load(open(partial_uc_pickle, 'rb'))['partial_uc']
             for c in uc.keys():
                 for r in uc[c]:
                     cid = combined_cid_ice_name(name="c{c}".format(c=c),
                                                 cluster_bin_index=i,
                                                 sample_name=sample_name)
                     f.write("{cid},{r},FL\n".format(cid=cid, r=r))
-                if partial_uc is not None and c in partial_uc.keys():
+                if partial_uc is not None and c in partial_uc:
                     for r in partial_uc[c]:
                         f.write("{cid},{r},NonFL\n".format(cid=cid, r=r))
+            if isinstance(partial_uc, PartialUCIndex):
+                partial_uc.close()
 
 
 class CombineRunner(CombinedFiles):
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+
+"""
+Event-driven scheduler for jobs with dependencies.
+
+A job starts the moment all jobs it depends on have succeeded, instead
+of being chained with 'qsub -hold_jid' or waiting for 'qstat' polling.
+Jobs run on a pluggable backend:
+    LocalBackend - runs jobs in local worker threads, shell commands
+                   as subprocesses, limited by a number of cpus and,
+                   optionally, an amount of memory.
+    SgeBackend - submits every job by 'qsub -sync y', which returns
+                 as soon as the job exits, with the job's exit code.
+"""
+
+import os.path as op
+import logging
+import cPickle
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from Queue import Queue
+from collections import deque
+from pbtranscript.RunnerUtils import write_cmd_to_script
+
+__all__ = ["Job", "JobScheduler", "LocalBackend", "SgeBackend",
+           "python_job_cmd"]
+
+
+class Job(object):
+
+    """
+    A job to run by JobScheduler.
+
+      name - unique name of the job
+      cmd - a shell command string, or a python callable taking no
+            argument and returning an exit code (LocalBackend only)
+      depends_on - names of jobs which must succeed before this job starts
+      nproc - number of cpus the job needs
+      mem - memory in GB the job needs (LocalBackend)
+      cost - estimated cost of the job, with by_cost, the most costly
+             ready job starts first (see JobScheduler)
+      script - script file to write cmd to (SgeBackend), if cmd is None,
+               an existing script to run
+      timeout - kill the job after timeout seconds, if not None
+      elog, olog - error and output logs (SgeBackend), default to
+                   script.elog and script.olog
+    """
+
+    PENDING, RUNNING, SUCCEEDED, FAILED, SKIPPED = \
+        "pending", "running", "succeeded", "failed", "skipped"
+
+    def __init__(self, name, cmd=None, depends_on=(), nproc=1, mem=0, cost=0,
+                 script=None, timeout=None, elog=None, olog=None):
+        if cmd is None and script is None:
+            raise ValueError("Job {n} has neither cmd nor script.".format(n=name))
+        self.name = name
+        self.cmd = cmd
+        self.depends_on = list(depends_on)
+        self.nproc = nproc
+        self.mem = mem
+        self.cost = cost
+        self.script = script
+        self.timeout = timeout
+        self.elog = elog
+        self.olog = olog
+
+        self.status = Job.PENDING
+        self.returncode = None
+        self.output = None
+        self.tries = 0
+        self.start_time = None
+        self.end_time = None
+        self.slot = None
+
+    @property
+    def shell_cmd(self):
+        """Return cmd (or script) as a shell command string, with timeout."""
+        cmd = self.cmd if self.cmd is not None else "bash " + self.script
+        if self.timeout is not None and not cmd.startswith("timeout"):
+            cmd = "timeout %d %s" % (self.timeout, cmd)
+        return cmd
+
+    @property
+    def elapsed(self):
+        """Return run time of the last try in seconds, or None."""
+        if self.start_time is None or self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def __repr__(self):
+        return "<Job {n} ({s})>".format(n=self.name, s=self.status)
+
+
+def python_job_cmd(func, pickle_fn):
+    """
+    Pickle func to pickle_fn and return a shell command which calls
+    func() in a new python interpreter, so that python jobs run by
+    LocalBackend are not serialized by the GIL, and no process is
+    forked from a worker thread except to exec the command.
+    The command exits with the value returned by func, or 1 if func
+    raises an exception. func must be picklable, e.g., a module level
+    function or a functools.partial of one.
+    """
+    with open(pickle_fn, 'wb') as writer:
+        # sys.path is loaded before func, so that func's module is found.
+        cPickle.dump((sys.path, logging.getLogger().getEffectiveLevel()),
+                     writer, cPickle.HIGHEST_PROTOCOL)
+        cPickle.dump(func, writer, cPickle.HIGHEST_PROTOCOL)
+    return "{py} -m pbtranscript.JobScheduler {f}".format(
+        py=sys.executable, f=pickle_fn)
+
+
+def _call_pickled(pickle_fn):
+    """Call func pickled by python_job_cmd to pickle_fn, return its
+    exit code."""
+    with open(pickle_fn, 'rb') as reader:
+        path, level = cPickle.load(reader)
+        sys.path.extend(p for p in path if p not in sys.path)
+        logging.basicConfig(level=level,
+                            format="%(asctime)s [%(levelname)s] %(message)s")
+        func = cPickle.load(reader)
+    code = func()
+    return code if isinstance(code, int) else 0
+
+
+def _run_in_thread(target, args):
+    """Run target(*args) in a daemon thread."""
+    t = threading.Thread(target=target, args=args)
+    t.daemon = True
+    t.start()
+    return t
+
+
+class LocalBackend(object):
+
+    """
+    Run jobs locally, each in a worker thread, with at most nproc cpus
+    and, if mem is not None, at most mem GB of memory used at a time.
+    A job which needs more than nproc cpus or mem GB runs alone.
+    """
+
+    def __init__(self, nproc, mem=None):
+        self.nproc = max(1, nproc)
+        self.mem = mem
+
+    def can_start(self, job, running):
+        """Return True if job can start while jobs in running run."""
+        if len(running) == 0:
+            return True
+        if self.mem is not None and \
+           sum(j.mem for j in running) + job.mem > self.mem:
+            return False
+        return sum(j.nproc for j in running) + job.nproc <= self.nproc
+
+    def start(self, job, on_done):
+        """Start job, call on_done(job, returncode, output) when it exits."""
+        _run_in_thread(self._run, (job, on_done))
+
+    @staticmethod
+    def _run(job, on_done):
+        """Run job and report its exit code."""
+        try:
+            if callable(job.cmd):
+                code, out = job.cmd(), None
+            else:
+                p = subprocess.Popen(job.shell_cmd, shell=True,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT)
+                out = p.communicate()[0]
+                code = p.returncode
+        except Exception:
+            code, out = 1, traceback.format_exc()
+        on_done(job, code, out)
+
+
+class SgeBackend(object):
+
+    """
+    Run jobs on SGE, each submitted by 'qsub -sync y'. At most max_jobs
+    jobs are submitted at a time if max_jobs is not None.
+
+      sge_opts - SgeOptions to make qsub commands
+      script_dir - directory of scripts of jobs without a script
+      qsub - program to call instead of 'qsub', e.g., a fake qsub
+             (see pbtranscript.testkit.fake_qsub) to run jobs locally
+    """
+
+    def __init__(self, sge_opts, script_dir=".", max_jobs=None, qsub="qsub"):
+        self.sge_opts = sge_opts
+        self.script_dir = script_dir
+        self.max_jobs = max_jobs
+        self.qsub = qsub
+
+    def can_start(self, job, running):
+        """Return True if job can be submitted while jobs in running run."""
+        return self.max_jobs is None or len(running) < max(1, self.max_jobs)
+
+    def qsub_cmd(self, job):
+        """Write job's script if necessary and return its qsub command."""
+        if callable(job.cmd):
+            raise ValueError("Job {n} can not run a python callable on SGE.".
+                             format(n=job.name))
+        if job.script is None:
+            job.script = op.join(self.script_dir, job.name + ".sh")
+        if job.cmd is not None:
+            write_cmd_to_script(cmd=job.shell_cmd, script=job.script)
+        cmd = self.sge_opts.qsub_cmd(script=job.script, num_threads=job.nproc,
+                                     wait_before_exit=True,
+                                     elog=job.elog or job.script + ".elog",
+                                     olog=job.olog or job.script + ".olog")
+        assert cmd.startswith("qsub ")
+        return self.qsub + cmd[len("qsub"):]
+
+    def start(self, job, on_done):
+        """Submit job, call on_done(job, returncode, output) when it exits."""
+        _run_in_thread(self._run, (job, on_done))
+
+    def _run(self, job, on_done):
+        """Submit job and wait for it, exit code of 'qsub -sync y' is
+        the exit code of the job."""
+        try:
+            p = subprocess.Popen(self.qsub_cmd(job), shell=True,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT)
+            out = p.communicate()[0]
+            code = p.returncode
+        except Exception:
+            code, out = 1, traceback.format_exc()
+        on_done(job, code, out)
+
+
+class JobScheduler(object):
+
+    """
+    Run jobs on a backend in dependency order, a job is started as soon
+    as all jobs it depends on have succeeded, and as the backend allows.
+    A failed job is retried at most {retries} times, if it still fails,
+    all jobs depending on it are skipped.
+    Ready jobs start in the order they became ready. If backfill is True,
+    a ready job which does not fit in the backend yet does not hold back
+    later ready jobs which do, e.g., small jobs fill the cpus left by
+    large ones.
+    If by_cost is True, ready jobs start in decreasing order of their
+    estimated costs instead, i.e., longest processing time first (LPT),
+    so that the most costly jobs do not start last and set the makespan
+    alone, while cheap jobs fill workers as they become free.
+    Every running job occupies a worker slot, the lowest one free when
+    it starts, so that utilization() reports busy time per worker.
+
+    Example:
+        s = JobScheduler(LocalBackend(nproc=8))
+        s.add_job("a", "echo a")
+        s.add_job("b", "echo b", depends_on=["a"], nproc=4)
+        failed_jobs = s.run()
+    """
+
+    def __init__(self, backend, retries=0, backfill=False, by_cost=False):
+        self.backend = backend
+        self.retries = retries
+        self.backfill = backfill
+        self.by_cost = by_cost
+        self.jobs = []
+        self.peak_concurrency = 0
+        self.makespan = 0.0
+        self.slot_jobs = []  # number of jobs run by each worker slot
+        self.slot_busy = []  # seconds each worker slot was busy
+        self._jobs_by_name = {}
+        self._events = Queue()
+
+    def add(self, job):
+        """Add a Job, return it."""
+        if job.name in self._jobs_by_name:
+            raise ValueError("Job {n} already exists.".format(n=job.name))
+        self.jobs.append(job)
+        self._jobs_by_name[job.name] = job
+        return job
+
+    def add_job(self, name, cmd=None, depends_on=(), nproc=1, **kwargs):
+        """Create a Job, add it and return it."""
+        return self.add(Job(name=name, cmd=cmd, depends_on=depends_on,
+                            nproc=nproc, **kwargs))
+
+    def __getitem__(self, name):
+        return self._jobs_by_name[name]
+
+    def dependents(self):
+        """Return {job name: [jobs depending on it]}, raise ValueError if
+        a job depends on an unknown job or jobs depend on each other in
+        a cycle."""
+        ret = dict((job.name, []) for job in self.jobs)
+        for job in self.jobs:
+            for name in job.depends_on:
+                if name not in ret:
+                    raise ValueError("Job {j} depends on unknown job {n}.".
+                                     format(j=job.name, n=name))
+                ret[name].append(job)
+
+        # Kahn's algorithm
+        n_deps = dict((job.name, len(job.depends_on)) for job in self.jobs)
+        todo = [job for job in self.jobs if n_deps[job.name] == 0]
+        n_sorted = 0
+        while len(todo) > 0:
+            job = todo.pop()
+            n_sorted += 1
+            for d in ret[job.name]:
+                n_deps[d.name] -= 1
+                if n_deps[d.name] == 0:
+                    todo.append(d)
+        if n_sorted != len(self.jobs):
+            raise ValueError("Jobs {j} depend on each other in a cycle.".format(
+                j=", ".join(sorted(n for n, k in n_deps.iteritems() if k > 0))))
+        return ret
+
+    def _on_done(self, job, returncode, output):
+        """Called by backend threads when a job exits."""
+        self._events.put((job, returncode, output))
+
+    def _skip_dependents(self, job, dependents):
+        """Skip all jobs which directly or indirectly depend on job."""
+        todo = list(dependents[job.name])
+        while len(todo) > 0:
+            d = todo.pop()
+            if d.status == Job.PENDING:
+                d.status = Job.SKIPPED
+                logging.warn("Skip job %s since job %s failed.", d.name, job.name)
+                todo.extend(dependents[d.name])
+
+    def _next_ready(self, ready, running):
+        """Pop and return the next ready job which can start, or None."""
+        candidates = sorted(ready, key=lambda j: -j.cost) if self.by_cost else ready
+        for job in candidates:
+            if self.backend.can_start(job, running.values()):
+                ready.remove(job)
+                return job
+            if not self.backfill:
+                break
+        return None
+
+    def _take_slot(self, job, running):
+        """Assign job the lowest worker slot not used by running jobs."""
+        used = set(j.slot for j in running.values())
+        job.slot = min(i for i in xrange(len(used) + 1) if i not in used)
+        if job.slot == len(self.slot_jobs):
+            self.slot_jobs.append(0)
+            self.slot_busy.append(0.0)
+
+    def utilization(self):
+        """Return a list of (slot, number of jobs, busy seconds, fraction
+        of makespan busy) of every worker slot used by the last run()."""
+        return [(slot, n, busy, busy / self.makespan if self.makespan > 0 else 0.)
+                for slot, (n, busy) in enumerate(zip(self.slot_jobs, self.slot_busy))]
+
+    def run(self):
+        """Run all jobs and wait for them to exit.
+        Return failed and skipped jobs in a list."""
+        dependents = self.dependents()
+        n_deps = dict((job.name, len(job.depends_on)) for job in self.jobs)
+        ready = deque(job for job in self.jobs if n_deps[job.name] == 0)
+        running = {}
+        self.peak_concurrency = 0
+        self.slot_jobs, self.slot_busy = [], []
+        start_t = time.time()
+
+        while len(ready) > 0 or len(running) > 0:
+            # start ready jobs in order, as many as backend allows
+            job = self._next_ready(ready, running)
+            while job is not None:
+                job.status = Job.RUNNING
+                job.tries += 1
+                job.start_time = time.time()
+                self._take_slot(job, running)
+                running[job.name] = job
+                self.peak_concurrency = max(self.peak_concurrency, len(running))
+                logging.debug("Start job %s.", job.name)
+                self.backend.start(job, self._on_done)
+                job = self._next_ready(ready, running)
+
+            # wait for the next job to exit
+            job, returncode, output = self._events.get()
+            job.end_time = time.time()
+            job.returncode, job.output = returncode, output
+            del running[job.name]
+            self.slot_jobs[job.slot] += 1
+            self.slot_busy[job.slot] += job.elapsed
+
+            if returncode == 0:
+                job.status = Job.SUCCEEDED
+                logging.debug("Job %s succeeded in %.2f sec.", job.name, job.elapsed)
+                for d in dependents[job.name]:
+                    n_deps[d.name] -= 1
+                    if n_deps[d.name] == 0:
+                        ready.append(d)
+            elif job.tries <= self.retries:
+                logging.warn("Job %s failed with code %s, retrying.",
+                             job.name, returncode)
+                job.status = Job.PENDING
+                ready.appendleft(job)
+            else:
+                job.status = Job.FAILED
+                logging.error("Job %s failed with code %s: %s",
+                              job.name, returncode, output)
+                self._skip_dependents(job, dependents)
+
+        self.makespan = time.time() - start_t
+        return [job for job in self.jobs
+                if job.status in (Job.FAILED, Job.SKIPPED)]
+
+
+if __name__ == "__main__":
+    sys.exit(_call_pickled(sys.argv[1]))
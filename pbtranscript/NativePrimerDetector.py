@@ -0,0 +1,93 @@
+"""Define class `NativePrimerDetector`, an in-process alternative to
+phmmer for finding short primers in reads."""
+
+import logging
+
+from pbcore.io import FastaReader
+
+from pbtranscript.io.DOMIO import DOMRecord
+from pbtranscript.c_primer import primer_hits
+
+__all__ = ["NativePrimerDetector"]
+
+# Hits scoring lower than this (in bits) are not reported, similar to
+# phmmer --domE 1 on short primers.
+MIN_REPORT_SCORE = 5.0
+# Maximum number of hits reported per primer and sequence.
+MAX_HITS = 4
+
+
+class NativePrimerDetector(object):
+
+    """
+    Find primers in sequences by a compiled local aligner instead of
+    phmmer, see pbtranscript.ice.C.c_primer. Hits are reported as
+    DOMRecords with bit-like scores, so that they can be used in place
+    of phmmer hits by Classifier.
+
+    Has the interface of PhmmerPool, but searches in this process,
+    which is much cheaper than starting phmmer on short primers.
+
+    Example:
+        with NativePrimerDetector() as detector:
+            for r in detector.search(seqs=((name, seq), ...),
+                                     primer_fn=primer_fn):
+                print r.sid, r.pid, r.score
+    """
+
+    def __init__(self, min_report_score=MIN_REPORT_SCORE, max_hits=MAX_HITS):
+        self.min_report_score = min_report_score
+        self.max_hits = max_hits
+
+    def start(self):
+        """Nothing to start, for the interface of PhmmerPool."""
+        pass
+
+    def close(self):
+        """Nothing to stop, for the interface of PhmmerPool."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback_):
+        self.close()
+
+    def search(self, seqs, primer_fn, out_dom_fn=None, batch_size=None,
+               ordered=False, append_dom=False):
+        """
+        Search sequences against primers in primer_fn.
+            seqs --- iterable of (name, sequence)
+            primer_fn --- fasta of primers
+            out_dom_fn --- if not None, write hits to this dom file
+            append_dom --- if True, append hits to out_dom_fn instead of
+                           overwriting it
+            batch_size --- ignored, for the interface of PhmmerPool
+            ordered --- ignored, hits are always in the order of seqs
+        Yield DOMRecords of hits, sequence by sequence, hits of a
+        primer best first.
+        """
+        with FastaReader(primer_fn) as reader:
+            primers = [(r.name.split()[0], r.sequence.upper()) for r in reader]
+        logging.debug("Search %s primers natively.", len(primers))
+        # scores of c_primer are in half bits
+        min_score = int(2 * self.min_report_score)
+
+        dom_writer = open(out_dom_fn, 'a' if append_dom else 'w') \
+            if out_dom_fn is not None else None
+        try:
+            for name, seq in seqs:
+                sid, seq = name.split()[0], seq.upper()
+                for pid, pseq in primers:
+                    for score, pStart, pEnd, sStart, sEnd in \
+                            primer_hits(pseq, seq, min_score, self.max_hits):
+                        r = DOMRecord(pid=pid, sid=sid, score=score / 2.0,
+                                      pStart=pStart, pEnd=pEnd,
+                                      pLen=len(pseq), sStart=sStart,
+                                      sEnd=sEnd, sLen=len(seq))
+                        if dom_writer is not None:
+                            dom_writer.write(r.toDomString() + "\n")
+                        yield r
+        finally:
+            if dom_writer is not None:
+                dom_writer.close()
@@ -121,6 +121,13 @@ def add_classify_arguments(parser):
                            dest="cpus",
                            help="Number of CPUs to run HMMER (default: 8)")
 
+    hmm_group.add_argument("--primer_detector",
+                           default="phmmer",
+                           choices=["phmmer", "native"],
+                           dest="primer_detector",
+                           help="Find primers by phmmer, or by a built-in " +
+                                "aligner for short primers (default: phmmer)")
+
     hmm_group.add_argument("--summary",
                            default=None,
                            type=str,
@@ -219,6 +226,13 @@ def add_classify_arguments(parser):
                         action="store_true",
                         help=argparse.SUPPRESS)
 
+    helpstr = "Write dom files by phmmer, to be reused by --reuse_dom"
+    parser.add_argument("--keep_dom",
+                        dest="keep_dom",
+                        default=False,
+                        action="store_true",
+                        help=argparse.SUPPRESS)
+
     parser.add_argument("--ignore-empty-output", dest="ignore_empty_output",
         default=False, action="store_true", help="DEVELOPER OPTION")
 
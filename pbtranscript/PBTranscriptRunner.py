@@ -116,7 +116,9 @@ class PBTranscript(PBMultiToolRunner):
                                  out_nfl_fn=self.args.nfl_fa,
                                  ignore_polyA=self.args.ignore_polyA,
                                  reuse_dom=self.args.reuse_dom,
-                                 ignore_empty_output=self.args.ignore_empty_output)
+                                 keep_dom=self.args.keep_dom,
+                                 ignore_empty_output=self.args.ignore_empty_output,
+                                 primer_detector=self.args.primer_detector)
                 obj.run()
             elif cmd == 'cluster':
                 ice_opts = IceOptions(quiver=self.args.quiver,
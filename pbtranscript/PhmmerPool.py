@@ -0,0 +1,222 @@
+"""Define class `PhmmerPool`, a persistent pool of phmmer workers."""
+
+import os
+import os.path as op
+import logging
+import multiprocessing
+import traceback
+from Queue import Empty
+
+from pbcore.util.Process import backticks
+
+from pbtranscript.PBTranscriptException import PBTranscriptException
+from pbtranscript.io.DOMIO import DOMRecord
+from pbtranscript.Utils import real_upath
+
+__all__ = ["phmmer_cmd", "PhmmerPool"]
+
+# Number of sequences phmmer searches at a time in a worker.
+PHMMER_BATCH_SIZE = 1000
+
+# Seconds to wait for a result before checking workers are alive.
+WORKER_POLL_SECONDS = 10
+
+
+def phmmer_cmd(reads_fn, dom_fn, primer_fn, pbmatrix_fn):
+    """Return a phmmer command which searches reads_fn against primer_fn,
+    and writes hits to dom_fn."""
+    return "phmmer --cpu 1 --domtblout {d} --noali --domE 1 ".\
+           format(d=real_upath(dom_fn)) + \
+           "--mxfile {m} ".format(m=real_upath(pbmatrix_fn)) + \
+           "--popen 0.07 --pextend 0.07 {r} {p} > /dev/null".\
+           format(r=real_upath(reads_fn), p=real_upath(primer_fn))
+
+
+def _phmmer_worker(worker_id, tasks, results, pbmatrix_fn, tmp_dir):
+    """
+    Worker process of PhmmerPool. Get (batch_id, primer_fn, seqs) from
+    tasks, search seqs against primer_fn by phmmer, and put
+    (batch_id, dom lines, DOMRecords, error message or None) to results,
+    until None is got from tasks.
+    """
+    reads_fn = op.join(tmp_dir, "phmmer_pool.{w}.fasta".format(w=worker_id))
+    dom_fn = op.join(tmp_dir, "phmmer_pool.{w}.dom".format(w=worker_id))
+    try:
+        for batch_id, primer_fn, seqs in iter(tasks.get, None):
+            try:
+                with open(reads_fn, 'w') as writer:
+                    for name, seq in seqs:
+                        writer.write(">{n}\n{s}\n".format(n=name, s=seq))
+                cmd = phmmer_cmd(reads_fn=reads_fn, dom_fn=dom_fn,
+                                 primer_fn=primer_fn, pbmatrix_fn=pbmatrix_fn)
+                _output, errCode, errMsg = backticks(cmd)
+                if errCode != 0:
+                    raise PBTranscriptException(
+                        cmd, "Error calling phmmer: {e}.".format(e=errMsg))
+                with open(dom_fn, 'r') as reader:
+                    lines = [line for line in reader
+                             if len(line.strip()) > 0 and line[0] != "#"]
+                records = [DOMRecord.fromString(line) for line in lines]
+                results.put((batch_id, lines, records, None))
+            except Exception:
+                results.put((batch_id, None, None, traceback.format_exc()))
+    finally:
+        for fn in (reads_fn, dom_fn):
+            if op.exists(fn):
+                os.remove(fn)
+
+
+class PhmmerPool(object):
+
+    """
+    A pool of long-lived worker processes, each running phmmer on
+    batches of sequences streamed to it, and parsing the hits.
+    Only one batch per worker is on disk at a time, so temporary
+    files do not grow with the number of sequences searched.
+
+    Example:
+        with PhmmerPool(num_workers=8, pbmatrix_fn=pbmatrix_fn,
+                        tmp_dir=out_dir) as pool:
+            for r in pool.search(seqs=((name, seq), ...),
+                                 primer_fn=primer_fn, out_dom_fn=dom_fn):
+                print r.sid, r.pid, r.score
+    """
+
+    def __init__(self, num_workers, pbmatrix_fn, tmp_dir,
+                 batch_size=PHMMER_BATCH_SIZE):
+        self.num_workers = max(1, num_workers)
+        self.pbmatrix_fn = pbmatrix_fn
+        self.tmp_dir = tmp_dir
+        self.batch_size = max(1, batch_size)
+        self.poll_seconds = WORKER_POLL_SECONDS
+        self._tasks = None
+        self._results = None
+        self._workers = []
+
+    def start(self):
+        """Start workers if not started yet."""
+        if len(self._workers) > 0:
+            return
+        logging.info("Start %s phmmer workers.", self.num_workers)
+        self._tasks = multiprocessing.Queue()
+        self._results = multiprocessing.Queue()
+        for w in xrange(self.num_workers):
+            p = multiprocessing.Process(
+                target=_phmmer_worker,
+                args=(w, self._tasks, self._results,
+                      self.pbmatrix_fn, self.tmp_dir))
+            p.daemon = True
+            p.start()
+            self._workers.append(p)
+
+    def close(self):
+        """Stop workers and wait for them to exit."""
+        for dummy_p in self._workers:
+            self._tasks.put(None)
+        for p in self._workers:
+            p.join()
+        self._workers = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback_):
+        self.close()
+
+    @staticmethod
+    def _batches(seqs, batch_size):
+        """Group (name, sequence) tuples of seqs into lists of batch_size."""
+        batch = []
+        for name_seq in seqs:
+            batch.append(name_seq)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
+    def _get_result(self):
+        """Wait for the next result put by workers and return it. Raise
+        PBTranscriptException if a worker exited, as it would never put
+        results of batches it took."""
+        while True:
+            try:
+                return self._results.get(timeout=self.poll_seconds)
+            except Empty:
+                dead = [(w, p.exitcode) for w, p in enumerate(self._workers)
+                        if not p.is_alive()]
+                if len(dead) > 0:
+                    raise PBTranscriptException(
+                        "phmmer", "Workers exited unexpectedly: {d}".format(
+                            d=", ".join("worker {w} with code {c}".format(
+                                w=w, c=c) for w, c in dead)))
+
+    def _collect(self, dom_writer, done, batch_id=None):
+        """Wait for the next finished batch, or for batch batch_id if it
+        is not None, return its DOMRecords. Batches finishing before
+        batch_id are kept in done: {batch_id: (lines, records, error)}.
+        """
+        while batch_id is None or batch_id not in done:
+            b, lines, records, error = self._get_result()
+            done[b] = (lines, records, error)
+            if batch_id is None:
+                batch_id = b
+        lines, records, error = done[batch_id]
+        if error is not None:
+            raise PBTranscriptException(
+                "phmmer", "Batch {b} failed: {e}".format(b=batch_id, e=error))
+        del done[batch_id]
+        if dom_writer is not None:
+            dom_writer.writelines(lines)
+        return records
+
+    def search(self, seqs, primer_fn, out_dom_fn=None, batch_size=None,
+               ordered=False, append_dom=False):
+        """
+        Search sequences against primers in primer_fn by phmmer.
+            seqs --- iterable of (name, sequence)
+            primer_fn --- fasta of primers
+            out_dom_fn --- if not None, write hits to this dom file
+            append_dom --- if True, append hits to out_dom_fn instead of
+                           overwriting it
+            batch_size --- number of sequences per batch, default to
+                           self.batch_size
+            ordered --- if True, yield batches in the order of seqs
+        Yield DOMRecords of hits, batch by batch as batches finish.
+        Hits of a sequence are yielded together, in phmmer's order,
+        but batches may finish out of order unless ordered is True.
+        At most two batches per worker are held in memory.
+        """
+        self.start()
+        dom_writer = open(out_dom_fn, 'a' if append_dom else 'w') \
+            if out_dom_fn is not None else None
+        # number of batches submitted and not yielded yet, and batches
+        # finished but not yielded yet, waiting for earlier batches.
+        n_pending, done = 0, {}
+        next_id = 0
+        try:
+            for batch_id, batch in enumerate(
+                    self._batches(seqs, batch_size or self.batch_size)):
+                if n_pending == 2 * self.num_workers:
+                    records = self._collect(dom_writer, done,
+                                            next_id if ordered else None)
+                    n_pending, next_id = n_pending - 1, next_id + 1
+                    for r in records:
+                        yield r
+                self._tasks.put((batch_id, primer_fn, batch))
+                n_pending += 1
+            while n_pending > 0:
+                records = self._collect(dom_writer, done,
+                                        next_id if ordered else None)
+                n_pending, next_id = n_pending - 1, next_id + 1
+                for r in records:
+                    yield r
+        finally:
+            # Discard results of batches still running if search failed
+            # or was abandoned, so that they are not taken as results of
+            # the next search.
+            for dummy_i in xrange(n_pending - len(done)):
+                self._get_result()
+            if dom_writer is not None:
+                dom_writer.close()
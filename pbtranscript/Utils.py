@@ -306,6 +306,22 @@ def cat_files(src, dst):
                     writer.write(line.rstrip() + '\n')
 
 
+def balance_by_cost(costs, n_bins):
+    """
+    Greedily assign items with given costs to n_bins bins, largest item
+    first to the least loaded bin (LPT). Return a list of n_bins lists
+    of item indices, each in decreasing order of cost, empty bins are
+    not returned.
+    """
+    bins = [[] for dummy in xrange(max(1, n_bins))]
+    loads = [0.0] * len(bins)
+    for i in sorted(xrange(len(costs)), key=lambda i: -costs[i]):
+        b = loads.index(min(loads))
+        bins[b].append(i)
+        loads[b] += costs[i]
+    return [b for b in bins if len(b) > 0]
+
+
 def get_all_files_in_dir(dir_path, extension=None):
     """return all files in a directory."""
     fs = []
@@ -16,9 +16,14 @@ Note that Branch input GMAP SAM file must be sorted by
     (2) reference coordinates.
 
 Note that Branch does not merge fuzzy junctions
+
+Branch.run with nproc > 1 collapses loci in worker processes and writes
+their GFF and group records in the same order as the serial run does.
 """
 import logging
 import os.path as op
+from collections import deque
+from multiprocessing import Pool
 
 from pbtranscript.Utils import ln, realpath
 from pbtranscript.io import iter_gmap_sam, ContigSetReaderWrapper, \
@@ -36,6 +41,40 @@ __author__ = 'etseng@pacificbiosciences.com'
 
 log = logging.getLogger(__name__)
 
+# Number of loci sent to a worker process at a time by Branch.run.
+LOCI_PER_TASK = 50
+
+
+class _RecordCollector(object):
+    """Collect records as text, the same as CollapseGffWriter and
+    GroupWriter write them."""
+    def __init__(self):
+        self.lines = []
+
+    def writeRecord(self, record):
+        """Format and append a record."""
+        self.lines.append("{0}\n".format(str(record)))
+
+    def __str__(self):
+        return "".join(self.lines)
+
+
+def _collapse_loci(args):
+    """
+    Collapse a batch of loci in a worker process.
+    args -- (loci, kwargs), where loci is a list of (cuff_index, records),
+            and kwargs are passed to collapse_sam_records.
+    Returns text of (good gff records, bad gff records, group records)
+    of all loci in the batch.
+    """
+    loci, kwargs = args
+    good, bad, group = _RecordCollector(), _RecordCollector(), _RecordCollector()
+    for cuff_index, records in loci:
+        collapse_sam_records(records=records, cuff_index=cuff_index,
+                             good_gff_writer=good, bad_gff_writer=bad,
+                             group_writer=group, **kwargs)
+    return str(good), str(bad), str(group)
+
 
 class Branch(object):
     """
@@ -73,45 +112,104 @@ class Branch(object):
         self.min_aln_coverage = min_aln_coverage
         self.min_aln_identity = min_aln_identity
 
+    def _iter_loci(self, ignored_ids_writer):
+        """
+        Yield (cuff_index, records) for each locus, where records is a
+        list of overlapping SAM records of the same strand, and loci are
+        numbered from 1 in the order of the SORTED SAM file.
+        """
+        cuff_index = 1
+        for recs in iter_gmap_sam(sam_filename=self.sam_filename,
+                                  query_len_dict=self.isoform_len_dict,
+                                  min_aln_coverage=self.min_aln_coverage,
+                                  min_aln_identity=self.min_aln_identity,
+                                  ignored_ids_writer=ignored_ids_writer):
+            # Iterate over groups of overlapping SAM records
+            for records in recs.itervalues():
+                if len(records) > 0:
+                    yield cuff_index, records
+                    cuff_index += 1
+
+    @staticmethod
+    def _iter_batches(loci, loci_per_task):
+        """Yield lists of at most loci_per_task loci, of which SAM records
+        are detached from pysam so that they can be sent to workers."""
+        batch = []
+        for cuff_index, records in loci:
+            for r in records:
+                r.peer = None
+            batch.append((cuff_index, records))
+            if len(batch) == loci_per_task:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
     def run(self, allow_extra_5exon, skip_5_exon_alt,
             ignored_ids_fn, good_gff_fn, bad_gff_fn, group_fn,
-            tolerate_end=100):
+            tolerate_end=100, nproc=1, loci_per_task=LOCI_PER_TASK):
         """
         Process the whole SAM file:
           (1) Group SAM records based on where they mapped to and strands
           (2) Collapse records, write collapsed isoforms to *_gff_writer,
               write supportive records associated with each collapsed isoforms
               to group_writer.
+        If nproc > 1, loci are collapsed by nproc worker processes in
+        batches of loci_per_task loci, while outputs are written in the
+        order of loci, identical to outputs of nproc = 1.
         """
         ignored_ids_writer = open(ignored_ids_fn, 'w') if ignored_ids_fn else None
         good_gff_writer = CollapseGffWriter(good_gff_fn) if good_gff_fn else None
         bad_gff_writer = CollapseGffWriter(bad_gff_fn) if bad_gff_fn else None
         group_writer = GroupWriter(group_fn) if group_fn else None
 
-        cuff_index = 1
-        for recs in iter_gmap_sam(sam_filename=self.sam_filename,
-                                  query_len_dict=self.isoform_len_dict,
-                                  min_aln_coverage=self.min_aln_coverage,
-                                  min_aln_identity=self.min_aln_identity,
-                                  ignored_ids_writer=ignored_ids_writer):
-            # Iterate over groups of overlapping SAM records
-            for records in recs.itervalues():
-                if len(records) > 0:
+        kwargs = dict(cov_threshold=self.cov_threshold,
+                      allow_extra_5exon=allow_extra_5exon,
+                      skip_5_exon_alt=skip_5_exon_alt,
+                      tolerate_end=tolerate_end)
+        loci = self._iter_loci(ignored_ids_writer=ignored_ids_writer)
+        try:
+            if nproc <= 1:
+                for cuff_index, records in loci:
                     # records: a list of overlapping SAM records, same strands
                     collapse_sam_records(records=records, cuff_index=cuff_index,
-                                         cov_threshold=self.cov_threshold,
-                                         allow_extra_5exon=allow_extra_5exon,
-                                         skip_5_exon_alt=skip_5_exon_alt,
                                          good_gff_writer=good_gff_writer,
                                          bad_gff_writer=bad_gff_writer,
-                                         group_writer=group_writer,
-                                         tolerate_end=tolerate_end)
-                    cuff_index += 1
-
-        # close writers.
-        for writer in (ignored_ids_writer, good_gff_writer, bad_gff_writer, bad_gff_writer):
-            if writer:
-                writer.close()
+                                         group_writer=group_writer, **kwargs)
+            else:
+                writers = (good_gff_writer, bad_gff_writer, group_writer)
+                for texts in self._imap_loci(loci=loci, kwargs=kwargs, nproc=nproc,
+                                             loci_per_task=loci_per_task):
+                    for writer, text in zip(writers, texts):
+                        if writer and len(text) > 0:
+                            writer.file.write(text)
+        finally:
+            # close writers.
+            for writer in (ignored_ids_writer, good_gff_writer, bad_gff_writer, group_writer):
+                if writer:
+                    writer.close()
+
+    def _imap_loci(self, loci, kwargs, nproc, loci_per_task):
+        """
+        Collapse batches of loci by a pool of nproc processes, yield
+        results of batches in order. At most 2 * nproc batches are
+        pending, so that SAM records are read no faster than collapsed.
+        """
+        pool = Pool(processes=nproc)
+        try:
+            pending = deque()
+            for batch in self._iter_batches(loci, loci_per_task):
+                pending.append(pool.apply_async(_collapse_loci, ((batch, kwargs),)))
+                if len(pending) >= 2 * nproc:
+                    yield pending.popleft().get()
+            while len(pending) > 0:
+                yield pending.popleft().get()
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
 
 
 class CollapseIsoformsRunner(CollapsedFiles):
@@ -130,7 +228,8 @@ class CollapseIsoformsRunner(CollapsedFiles):
     """
     def __init__(self, isoform_filename, sam_filename, output_prefix,
                  min_aln_coverage, min_aln_identity, min_flnc_coverage,
-                 max_fuzzy_junction, allow_extra_5exon, skip_5_exon_alt):
+                 max_fuzzy_junction, allow_extra_5exon, skip_5_exon_alt,
+                 nproc=1):
         """
         Parameters:
           isoform_filename -- input file containing isoforms, as fastq|fasta|contigset
@@ -144,6 +243,7 @@ class CollapseIsoformsRunner(CollapsedFiles):
           max_fuzzy_junction -- max edit distance between fuzzy-matching exons
           allow_extra_5exon -- whether or not to allow shorter 5' exons
           skip_5_exon_alt -- whether or not to skip alternative 5' exons
+          nproc -- number of processes to collapse loci and fuzzy junctions
         """
         self.suffix = parse_ds_filename(isoform_filename)[1]
         super(CollapseIsoformsRunner, self).__init__(prefix=output_prefix,
@@ -159,6 +259,7 @@ class CollapseIsoformsRunner(CollapsedFiles):
         self.max_fuzzy_junction = int(max_fuzzy_junction)
         self.allow_extra_5exon = bool(allow_extra_5exon)
         self.skip_5_exon_alt = bool(skip_5_exon_alt)
+        self.nproc = int(nproc)
 
     @property
     def shall_collapse_fuzzy_junctions(self):
@@ -210,7 +311,8 @@ class CollapseIsoformsRunner(CollapsedFiles):
               ignored_ids_fn=self.ignored_ids_txt_fn,
               good_gff_fn=self.good_unfuzzy_gff_fn,
               bad_gff_fn=self.bad_unfuzzy_gff_fn,
-              group_fn=self.unfuzzy_group_fn)
+              group_fn=self.unfuzzy_group_fn,
+              nproc=self.nproc)
 
         logging.info("Good unfuzzy isoforms written to: %s", realpath(self.good_unfuzzy_gff_fn))
         logging.info("Bad unfuzzy isoforms written to: %s", realpath(self.bad_unfuzzy_gff_fn))
@@ -224,7 +326,8 @@ class CollapseIsoformsRunner(CollapsedFiles):
                                      fuzzy_gff_filename=self.good_fuzzy_gff_fn,
                                      fuzzy_group_filename=self.fuzzy_group_fn,
                                      allow_extra_5exon=self.allow_extra_5exon,
-                                     max_fuzzy_junction=self.max_fuzzy_junction)
+                                     max_fuzzy_junction=self.max_fuzzy_junction,
+                                     nproc=self.nproc)
 
             logging.info("Good fuzzy isoforms written to: %s", realpath(self.good_fuzzy_gff_fn))
             logging.info("Bad fuzzy isoforms written to: %s", realpath(self.bad_fuzzy_gff_fn))
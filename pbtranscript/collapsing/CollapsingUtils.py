@@ -13,10 +13,14 @@ import os.path as op
 import logging
 import random
 import string
+import heapq
+from bisect import bisect_right
 from collections import defaultdict
+from itertools import izip
+from multiprocessing import Pool
 import numpy as np
 from pbcore.io import FastaWriter, FastqWriter, ContigSet
-from pbtranscript.Utils import execute, rmpath, as_contigset, realpath
+from pbtranscript.Utils import execute, rmpath, mknewdir, as_contigset, realpath
 from pbtranscript.io import ContigSetReaderWrapper, FastaRandomReader, FastqRandomReader, \
     CollapseGffRecord, CollapseGffReader, CollapseGffWriter, \
     GroupRecord, GroupReader, GroupWriter, parse_ds_filename
@@ -31,11 +35,15 @@ __all__ = ["ContiVec",
            "exons_match_sam_record",
            "compare_exon_matrix",
            "iterative_merge_transcripts",
+           "compare_exon_indices",
+           "merge_exon_indices",
            "get_fl_from_id",
            "can_merge",
            "collapse_sam_records",
            "compare_fuzzy_junctions",
            "collapse_fuzzy_junctions",
+           "expected_errors",
+           "pick_rep_of_group",
            "pick_rep"]
 
 logger = logging.getLogger(op.basename(__file__))
@@ -352,25 +360,125 @@ def compare_exon_matrix(m1, m2, node_d, strand, merge5=True):
 def iterative_merge_transcripts(result_list, node_d, merge5=True):
     """
     result_list --- list of (qID, strand, binary exon sparse matrix)
+    Transcripts are merged by merge_exon_indices.
+    """
+    if len(result_list) == 0:
+        return
+    shape = result_list[0][2].shape
+    indices = [(qid, strand, tuple(m.nonzero()[1])) for qid, strand, m in result_list]
+    merge_exon_indices(indices, node_d, merge5)
+    result_list[:] = []
+    for qid, strand, l in indices:
+        m = np.zeros(shape, dtype=np.int)
+        m[0, list(l)] = 1
+        result_list.append((qid, strand, m))
+
+
+def compare_exon_indices(l1, l2, node_d, strand, merge5=True):
+    """
+    Same as compare_exon_matrix, but l1 and l2 are tuples of indices of
+    exons, in ascending order, which a transcript uses, e.g., (0, 2, 3, 4, 5).
+    return {True|False}, {merged exon indices|None}
+    """
+    # let l1 be the one that has the earliest start
+    if l2[0] < l1[0]:
+        l1, l2 = l2, l1
+
+    # does not intersect at all
+    if l1[-1] < l2[0]:
+        return False, None
+
+    # l1 and l2 must agree from where l2 starts in l1 till one of them ends
+    try:
+        i = l1.index(l2[0])
+    except ValueError:
+        return False, None
+    n1, n2 = len(l1), len(l2)
+    k = min(n1 - i, n2)
+    if l1[i:i+k] != l2[:k]:
+        return False, None
+
+    def _is_junction(a, b):
+        """Returns True if exon a and exon b are not adjacent."""
+        return node_d[a].end != node_d[b].start
+
+    # not ok if this is at the 3' end and l1 has extra exons;
+    # if 5' end, ok to have extra exons if merge5 is allowed
+    if strand == '-' or not merge5:
+        for x in xrange(1, i):
+            if _is_junction(l1[x-1], l1[x]):
+                return False, None
+
+    def _has_extra_junctions(l, start):
+        """Returns True if the 3' end (+) or the 5' end (-, when merge5 is
+        not allowed) of l has more exons from start on."""
+        if strand == '+' or not merge5:
+            for x in xrange(start, len(l)):
+                if _is_junction(l[x-1], l[x]):
+                    return True
+        return False
+
+    if i + k == n1: # l1 ends, check that the remaining of l2 are adjacent
+        if k == n2:
+            return True, l1
+        if _has_extra_junctions(l2, k):
+            return False, None
+        return True, l1 + l2[k:]
+    # l2 ends, check that the remaining of l1 are adjacent
+    if _has_extra_junctions(l1, i + k):
+        return False, None
+    return True, l1
+
+
+def merge_exon_indices(result_list, node_d, merge5=True):
+    """
+    Merge compatible transcripts in place, the same as iterative merging of
+    exon matrices: sort transcripts by strand and the first exon, and merge
+    every transcript, in order, with the following ones it is compatible
+    with according to compare_exon_indices.
+
+    result_list --- list of (qID, strand, tuple of exon indices in ascending order)
+
+    Only transcripts which start at an exon of a transcript may be merged
+    to it, so instead of comparing with all transcripts that follow,
+    transcripts are looked up by their strand and first exon.
     """
     # sort by strand then starting position
-    result_list.sort(key=lambda x: (x[1], x[2].nonzero()[1][0]))
-    i = 0
-    while i < len(result_list) - 1:
-        j = i + 1
-        while j < len(result_list):
-            id1, strand1, m1 = result_list[i]
-            id2, strand2, m2 = result_list[j]
-            if (strand1 != strand2) or (m1.nonzero()[1][-1] < m2.nonzero()[1][0]):
-                break
-            else:
-                flag, m3 = compare_exon_matrix(m1, m2, node_d, strand1, merge5)
-                if flag:
-                    result_list[i] = (id1+','+id2, strand1, m3)
-                    result_list.pop(j)
-                else:
-                    j += 1
-        i += 1
+    result_list.sort(key=lambda x: (x[1], x[2][0]))
+    starts = defaultdict(list) # (strand, first exon) --> positions in result_list
+    for pos, (dummy_qid, strand, l) in enumerate(result_list):
+        starts[(strand, l[0])].append(pos)
+
+    def _positions_after(pos, strand, exons):
+        """Returns positions after pos of transcripts starting at exons."""
+        ret = []
+        for e in exons:
+            ps = starts.get((strand, e))
+            if ps is not None:
+                ret.extend(ps[bisect_right(ps, pos):])
+        return ret
+
+    merged = [False] * len(result_list)
+    for i in xrange(len(result_list)):
+        if merged[i]:
+            continue
+        ids, strand, l1 = result_list[i]
+        # visit candidates in list order, while l1 may extend and have more
+        candidates = _positions_after(i, strand, l1)
+        heapq.heapify(candidates)
+        while len(candidates) > 0:
+            j = heapq.heappop(candidates)
+            if merged[j]:
+                continue
+            flag, l3 = compare_exon_indices(l1, result_list[j][2], node_d, strand, merge5)
+            if flag:
+                merged[j] = True
+                ids = ids + ',' + result_list[j][0]
+                for pos in _positions_after(j, strand, l3[len(l1):]):
+                    heapq.heappush(candidates, pos)
+                l1 = l3
+        result_list[i] = (ids, strand, l1)
+    result_list[:] = [x for pos, x in enumerate(result_list) if not merged[pos]]
 
 
 class ContiVec(object):
@@ -416,7 +524,7 @@ def collapse_sam_records(records, cuff_index, cov_threshold,
     Write supportive records of collapsed isoforms to group_writer.
 
     Returns result and merged_result, where
-    result: [ (r.qID, r.strand, nparray representing r) for r in records]
+    result: [ (r.qID, r.strand, tuple of exon indices of r) for r in records]
     result_merge: merged result
     """
     contiVec, offset, chrom, strand = transfrag_to_contig(gmap_sam_records=records,
@@ -426,17 +534,14 @@ def collapse_sam_records(records, cuff_index, cov_threshold,
     p = []
     exons.traverse(p.append)
     node_d = dict((x.interval.value, x) for x in p)
-    mat_size = max(x.interval.value for x in p) + 1
     result = []
     for r in records:
         matched_exons = exons_match_sam_record(record=r, exons=exons, tolerate_end=tolerate_end)
-        m = np.zeros((1, mat_size), dtype=np.int)
-        for _exon in matched_exons:
-            m[0, _exon.value] = 1
-        result.append((r.qID, r.flag.strand, m))
+        result.append((r.qID, r.flag.strand,
+                       tuple(sorted(set(_exon.value for _exon in matched_exons)))))
 
     result_merged = list(result)
-    iterative_merge_transcripts(result_merged, node_d, allow_extra_5exon)
+    merge_exon_indices(result_merged, node_d, allow_extra_5exon)
 
     if len(result) > 0 and len(result_merged) > 0:
         logging.debug("merged %s (%s, ...) down to %s transcripts",
@@ -445,14 +550,14 @@ def collapse_sam_records(records, cuff_index, cov_threshold,
     isoform_index = starting_isoform_index
     # make the exon value --> interval dictionary
 
-    for ids, _strand, m in result_merged:
+    for ids, _strand, l in result_merged:
         assert strand == _strand
         if ids.count(',')+1 < cov_threshold:
             f_out = bad_gff_writer
         else:
             f_out = good_gff_writer
         isoform_index += 1
-        segments = [node_d[x] for x in m.nonzero()[1]]
+        segments = [node_d[x] for x in l]
 
         gene_id = "{p}.{i}".format(p=gene_prefix, i=cuff_index)
         transcript_id = "{g}.{j}".format(g=gene_id, j=isoform_index)
@@ -620,9 +725,109 @@ def can_merge(m, r1, r2, allow_extra_5exon, max_fuzzy_junction):
     return False
 
 
+def _fuzzy_sort_key(seqid):
+    """Returns key to sort transcripts by, e.g., PB.10.2 --> [10, 2]"""
+    return map(int, seqid.split('.')[1:])
+
+
+def _iter_gff_transcript_lines(gff_filename):
+    """Yields lines of each transcript and its exons in a collapsed gff
+    file as a list, without parsing exons."""
+    lines = []
+    with open(gff_filename, 'r') as reader:
+        for line in reader:
+            if line.startswith("#"):
+                continue
+            if line.split('\t', 3)[2] == CollapseGffRecord.TRANSCRIPT and len(lines) > 0:
+                yield lines
+                lines = []
+            lines.append(line)
+    if len(lines) > 0:
+        yield lines
+
+
+def _collapse_fuzzy_junctions_of_shard(kwargs):
+    """Call collapse_fuzzy_junctions in a worker process, returns
+    fuzzy_match as a dict."""
+    return dict(collapse_fuzzy_junctions(**kwargs))
+
+
+def _parallel_collapse_fuzzy_junctions(gff_filename, group_filename,
+                                       fuzzy_gff_filename, fuzzy_group_filename,
+                                       allow_extra_5exon, max_fuzzy_junction, nproc):
+    """
+    Same as collapse_fuzzy_junctions, but transcripts are split by
+    (chromosome, strand) into shards, which are collapsed by nproc processes.
+    Since only transcripts of the same chromosome and strand may merge,
+    outputs of shards are merged in the order of the serial output.
+    Records are copied between files as text, which is what writers write.
+    """
+    shard_dir = fuzzy_gff_filename + ".shards"
+    mknewdir(shard_dir)
+    n_shards = 4 * nproc
+    shard_fn = lambda i, suffix: op.join(shard_dir, "shard%s.%s" % (i, suffix))
+
+    # split input gff and group files to shards by (chromosome, strand)
+    shard_of_key, shard_of_seqid = {}, {}
+    gff_writers = [CollapseGffWriter(shard_fn(i, "gff")) for i in xrange(n_shards)]
+    for lines in _iter_gff_transcript_lines(gff_filename):
+        r = CollapseGffRecord.fromString(lines[0])
+        i = shard_of_key.setdefault((r.seqid, r.strand), len(shard_of_key) % n_shards)
+        shard_of_seqid[r.transcript_id.replace("\"", "")] = i
+        gff_writers[i].file.write("".join(lines))
+    group_writers = [GroupWriter(shard_fn(i, "group.txt")) for i in xrange(n_shards)]
+    with open(group_filename, 'r') as reader:
+        for line in reader:
+            name = line.split('\t', 1)[0]
+            if name in shard_of_seqid:
+                group_writers[shard_of_seqid[name]].file.write(line.rstrip('\n') + '\n')
+    for writer in gff_writers + group_writers:
+        writer.close()
+
+    shards = range(min(n_shards, len(shard_of_key)))
+    kwargs = [dict(gff_filename=shard_fn(i, "gff"),
+                   group_filename=shard_fn(i, "group.txt"),
+                   fuzzy_gff_filename=shard_fn(i, "fuzzy.gff"),
+                   fuzzy_group_filename=shard_fn(i, "fuzzy.group.txt"),
+                   allow_extra_5exon=allow_extra_5exon,
+                   max_fuzzy_junction=max_fuzzy_junction) for i in shards]
+    pool = Pool(processes=nproc)
+    try:
+        fuzzy_matches = pool.map(_collapse_fuzzy_junctions_of_shard, kwargs)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    def _iter_shard_output(i):
+        """Yields (sort key, shard, gff lines, group line) of fuzzy groups
+        in the order collapse_fuzzy_junctions writes them."""
+        keys = sorted(fuzzy_matches[i].keys(), key=_fuzzy_sort_key)
+        with open(shard_fn(i, "fuzzy.group.txt"), 'r') as group_reader:
+            for k, lines, group in izip(keys, _iter_gff_transcript_lines(shard_fn(i, "fuzzy.gff")),
+                                       group_reader):
+                yield _fuzzy_sort_key(k), i, lines, group
+
+    fuzzy_gff_writer = CollapseGffWriter(fuzzy_gff_filename)
+    fuzzy_group_writer = GroupWriter(fuzzy_group_filename)
+    for dummy_key, dummy_i, lines, group in heapq.merge(*[_iter_shard_output(i) for i in shards]):
+        fuzzy_gff_writer.file.write("".join(lines))
+        fuzzy_group_writer.file.write(group)
+    fuzzy_gff_writer.close()
+    fuzzy_group_writer.close()
+    rmpath(shard_dir)
+
+    fuzzy_match = defaultdict(lambda: [])
+    for m in fuzzy_matches:
+        fuzzy_match.update(m)
+    return fuzzy_match
+
+
 def collapse_fuzzy_junctions(gff_filename, group_filename,
                              fuzzy_gff_filename, fuzzy_group_filename,
-                             allow_extra_5exon, max_fuzzy_junction):
+                             allow_extra_5exon, max_fuzzy_junction, nproc=1):
     """
     Collapses those transcripts in gff_filename which have fuzzy junctions.
     Returns fuzzy_match
@@ -635,7 +840,16 @@ def collapse_fuzzy_junctions(gff_filename, group_filename,
       fuzzy_group_filename -- output group filename
       allow_etra_5exon -- whether or not to allow extra 5 exons
       max_fuzzy_junction -- maximum differences to call two exons match
+      nproc -- if nproc > 1, collapse transcripts of different chromosomes
+               and strands by nproc processes, outputs are the same.
     """
+    if nproc > 1:
+        return _parallel_collapse_fuzzy_junctions(
+            gff_filename=gff_filename, group_filename=group_filename,
+            fuzzy_gff_filename=fuzzy_gff_filename,
+            fuzzy_group_filename=fuzzy_group_filename,
+            allow_extra_5exon=allow_extra_5exon,
+            max_fuzzy_junction=max_fuzzy_junction, nproc=nproc)
 
     d = {} # seqid --> GmapRecord
     recs = defaultdict(lambda: {'+':IntervalTree(), '-':IntervalTree()}) # chr --> strand --> tree
@@ -662,7 +876,7 @@ def collapse_fuzzy_junctions(gff_filename, group_filename,
 
     # pick for each fuzzy group the one that has the most exons (if tie, then most FL)
     keys = fuzzy_match.keys()
-    keys.sort(key=lambda x: map(int, x.split('.')[1:]))
+    keys.sort(key=_fuzzy_sort_key)
 
     fuzzy_gff_writer = CollapseGffWriter(fuzzy_gff_filename)
     fuzzy_group_writer = GroupWriter(fuzzy_group_filename)
@@ -692,6 +906,39 @@ def collapse_fuzzy_junctions(gff_filename, group_filename,
     return fuzzy_match
 
 
+# Expected errors of a base of each QV, scored as pick_rep always has
+_QV_ERRS = np.array([np.uint8(qv) ** -(np.uint8(qv) / 10.) for qv in xrange(256)])
+
+
+def expected_errors(quality):
+    """Return expected errors of a read of quality values (QVs), summed
+    in read order so that the result equals the sum of the QVs' errors
+    base by base."""
+    if len(quality) == 0:
+        return 0
+    return np.cumsum(_QV_ERRS[np.asarray(quality, dtype=np.uint8)])[-1]
+
+
+def pick_rep_of_group(fd, members, pick_least_err_instead=False):
+    """
+    Return (best_id, best_record) of a group of members, reading members
+    from fd, a FastaRandomReader or FastqRandomReader, in one batch.
+    If pick_least_err_instead, fd must be FASTQ, pick the first member
+    with the least expected errors, otherwise, pick the last member of
+    the maximum length, which is looked up in the index of fd so that
+    only the representative is read.
+    """
+    if pick_least_err_instead:
+        records = fd.get_many(members)
+        i = int(np.argmin([expected_errors(r.quality) for r in records]))
+        return members[i], records[i]
+    else:
+        lengths = fd.get_lengths(members)
+        max_len = max(lengths)
+        i = len(lengths) - 1 - lengths[::-1].index(max_len)
+        return members[i], fd[members[i]]
+
+
 def pick_rep(isoform_filename, gff_filename,
              group_filename, output_filename,
              pick_least_err_instead=False,
@@ -703,6 +950,7 @@ def pick_rep(isoform_filename, gff_filename,
     If is FASTQ file -- then
           If pick_least_err_instead is True, pick the one w/ least number of expected base errors
           Else, pick the longest one
+    Members of each group are looked up in batch, see pick_rep_of_group.
     """
     fd = None
     is_fq = False
@@ -723,6 +971,7 @@ def pick_rep(isoform_filename, gff_filename,
                 # Must be indexed FASTA, or exactly contains one FASTQ file
                 raise IOError("%s must contain either indexed FASTA files or " % isoform_filename +
                               "contain exactly one FASTQ file!")
+            fd = FastaRandomReader(isoform_filename)
     else:
         raise IOError("Unable to recognize file type of %s." % isoform_filename)
 
@@ -757,37 +1006,23 @@ def pick_rep(isoform_filename, gff_filename,
             tid = r.transcript_id
             coords[tid] = "{0}:{1}-{2}({3})".format(r.seqid, r.start, r.end, r.strand)
 
-    for group in GroupReader(group_filename):
-        pb_id, members = group.name, group.members
-        if not pb_id in coords:
-            raise ValueError("Could not find %s in %s and %s" %
-                             (pb_id, gff_filename, bad_gff_filename))
-        #logging.info("Picking representative sequence for %s", pb_id)
-        best_id = None
-        best_seq = None
-        best_qual = None
-        best_err = 9999999
-        err = 9999999
-        max_len = 0
-
-        for x in members:
-            if is_fq and pick_least_err_instead:
-                err = sum(i**-(i/10.) for i in fd[x].quality)
-            if (is_fq and pick_least_err_instead and err < best_err) or \
-               ((not is_fq or not pick_least_err_instead) and len(fd[x].sequence) >= max_len):
-                best_id = x
-                best_seq = fd[x].sequence
-                if is_fq:
-                    best_qual = fd[x].quality
-                    best_err = err
-                max_len = len(fd[x].sequence)
-
-        _id_ = "{0}|{1}|{2}".format(pb_id, coords[pb_id], best_id)
-        _seq_ = best_seq
-        if fq_writer is not None:
-            fq_writer.writeRecord(_id_, _seq_, best_qual)
-        if fa_writer is not None:
-            fa_writer.writeRecord(_id_, _seq_)
+    with fd:
+        for group in GroupReader(group_filename):
+            pb_id, members = group.name, group.members
+            if not pb_id in coords:
+                raise ValueError("Could not find %s in %s and %s" %
+                                 (pb_id, gff_filename, bad_gff_filename))
+            #logging.info("Picking representative sequence for %s", pb_id)
+            best_id, best_rec = pick_rep_of_group(
+                fd=fd, members=members,
+                pick_least_err_instead=(is_fq and pick_least_err_instead))
+
+            _id_ = "{0}|{1}|{2}".format(pb_id, coords[pb_id], best_id)
+            _seq_ = best_rec.sequence
+            if fq_writer is not None:
+                fq_writer.writeRecord(_id_, _seq_, best_rec.quality)
+            if fa_writer is not None:
+                fa_writer.writeRecord(_id_, _seq_)
 
     if fa_writer is not None:
         fa_writer.close()
@@ -1,9 +1,8 @@
 """Define Probability Models, including ProbFromQV and ProbFromModel."""
 # distutils: language = c++
 # distutils: sources = ProbModel.cpp
-from pbtranscript.io.BasQV import basQVcacher, fastqQVcacher
+from pbtranscript.io.BasQV import basQVstore, fastqQVstore
 from pbtranscript.io.ContigSetReaderWrapper import ContigSetReaderWrapper
-from pbcore.io import FastqReader
 from libc.math cimport log
 
 DEFAULT_WINDOW_SIZE = 3 # default window size changed from 5 to 3.
@@ -14,8 +13,14 @@ class ProbFromFastq:
     a single QV for everything
     """
     def __init__(self, fastq_filename,
-                 prob_threshold=.1, window_size=DEFAULT_WINDOW_SIZE):
-        self.qver = fastqQVcacher()
+                 prob_threshold=.1, window_size=DEFAULT_WINDOW_SIZE,
+                 qv_store_dir=None):
+        """
+        qv_store_dir --- directory to save memory-mapped QVs,
+                         if None, use a temporary directory.
+        """
+        self.qver = fastqQVstore(window_size=window_size,
+                                 out_dir=qv_store_dir)
         self.fastq_filename = fastq_filename
         self.seqids = []
         self.prob_threshold = prob_threshold
@@ -39,12 +44,11 @@ class ProbFromFastq:
         return self.qver.get(qID, qvname, position)
     
     def add_seqs_from_fastq(self, fastq_filename, smooth=True):
-        """Add sequence ids from a fastq file."""
-        self.qver.precache_fastq(fastq_filename)
-        newids = [r.name.split()[0] for r in FastqReader(fastq_filename)]
+        """Add sequence ids from a fastq file.
+        QVs are always smoothed when they are cached, smooth is ignored.
+        """
+        newids = self.qver.precache_fastq(fastq_filename)
         self.seqids += newids
-        if smooth:
-            self.qver.presmooth(newids, self.window_size, fastq_filename)
 
     def get_mean(self, qID, qvname):
         """Return mean QV of read=qID, type=qvname"""
@@ -54,7 +58,7 @@ class ProbFromFastq:
         """Remove ids from self.seqids."""
         for _id in ids:
             self.seqids.remove(_id)
-            del self.qver.qv[_id]
+            self.qver.remove(_id)
 
     def calc_prob_from_aln(self, qID, qStart, qEnd, fakecigar):
         """
@@ -73,8 +77,14 @@ class ProbFromQV:
     """
 
     def __init__(self, input_fofn, fasta_filename=None,
-                 prob_threshold=.1, window_size=DEFAULT_WINDOW_SIZE):
-        self.qver = basQVcacher()
+                 prob_threshold=.1, window_size=DEFAULT_WINDOW_SIZE,
+                 qv_store_dir=None):
+        """
+        qv_store_dir --- directory to save memory-mapped QVs,
+                         if None, use a temporary directory.
+        """
+        self.qver = basQVstore(window_size=window_size,
+                               out_dir=qv_store_dir)
         self.input_fofn = input_fofn
         self.seqids = []
         self.prob_threshold = prob_threshold
@@ -116,13 +126,12 @@ class ProbFromQV:
         """Add sequence ids."""
         self.qver.precache(newids)
         self.seqids += newids
-        self.qver.presmooth(newids, self.window_size)
 
     def remove_ids(self, ids):
         """Remove ids from self.seqids."""
         for _id in ids:
             self.seqids.remove(_id)
-            del self.qver.qv[_id]
+            self.qver.remove(_id)
 
     def calc_prob_from_aln(self, qID, qStart, qEnd, fakecigar):
         """
@@ -136,8 +145,8 @@ class ProbFromQV:
                                  qStart, qEnd)
 
 
-cdef double calc_aln_log_prob(list prob_sub, list prob_ins,
-                              list prob_del, int n,
+cdef double calc_aln_log_prob(double[:] prob_sub, double[:] prob_ins,
+                              double[:] prob_del, int n,
                               list fakecigar, int qStart, int qEnd):
     """
     Calculate log probabilities from alignment cigar strings using Cython.
@@ -170,7 +179,7 @@ cdef double calc_aln_log_prob(list prob_sub, list prob_ins,
     return score
 
 
-cdef double calc_aln_log_prob2(list prob_err, int n,
+cdef double calc_aln_log_prob2(double[:] prob_err, int n,
                                list fakecigar, int qStart, int qEnd):
     """
     Calculate log probabilities from alignment cigar strings using Cython.
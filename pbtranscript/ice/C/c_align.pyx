@@ -0,0 +1,174 @@
+"""
+In-process pairwise alignment of reads of a cluster, for ice_pbdagcon
+to choose a template and to align reads to it without calling blasr.
+
+Candidate diagonals are found by chaining exact k-mer matches, then the
+best local alignment is computed by banded dynamic programming around
+them, scored as blasr does (match -5, mismatch 6, insertion/deletion 5),
+with signs flipped so that higher is better.
+"""
+from libc.stdlib cimport malloc, free
+
+DEF MATCH = 5
+DEF MISMATCH = -6
+DEF INDEL = -5
+
+# traceback pointers
+DEF TB_STOP = 0
+DEF TB_DIAG = 1
+DEF TB_UP = 2    # consume a query base (insertion)
+DEF TB_LEFT = 3  # consume a target base (deletion)
+
+
+cdef class KmerIndex(object):
+
+    """Positions of all k-mers of a target sequence."""
+
+    cdef readonly bytes seq
+    cdef readonly int k
+    cdef dict positions
+
+    def __init__(self, bytes seq, int k=12):
+        cdef int i
+        self.seq = seq
+        self.k = k
+        self.positions = {}
+        for i in range(len(seq) - k + 1):
+            self.positions.setdefault(seq[i:i + k], []).append(i)
+
+    def diagonal_range(self, bytes query, int max_spread=200, int margin=16,
+                       int min_hits=3):
+        """
+        Return (lo, hi), the range of diagonals (target pos - query pos)
+        around the densest chain of k-mer matches of query, extended by
+        margin on both sides, or None if fewer than min_hits k-mers match.
+        """
+        cdef int i, a, b, best_a = 0, best_n = 0
+        cdef int k = self.k
+        diags = []
+        for i in range(len(query) - k + 1):
+            hits = self.positions.get(query[i:i + k])
+            if hits is not None:
+                for p in hits:
+                    diags.append(p - i)
+        if len(diags) < min_hits:
+            return None
+        diags.sort()
+        # densest window of diagonals of width max_spread
+        b = 0
+        for a in range(len(diags)):
+            while b < len(diags) and diags[b] - diags[a] <= max_spread:
+                b += 1
+            if b - a > best_n:
+                best_a, best_n = a, b - a
+        if best_n < min_hits:
+            return None
+        return (diags[best_a] - margin,
+                diags[best_a + best_n - 1] + margin)
+
+
+def banded_local_align(bytes query, bytes target, int d_lo, int d_hi):
+    """
+    Best local alignment of query to target, restricted to cells (i, j)
+    with d_lo <= j - i <= d_hi, i and j being query and target positions.
+
+    Returns (score, qStart, qEnd, tStart, tEnd, nMatch, nMismatch, nIns,
+    nDel, qAlignedSeq, matchPattern, tAlignedSeq) in blasr -m 5 style,
+    or None if no base matches.
+    """
+    cdef int n = len(query), m = len(target)
+    cdef int W = d_hi - d_lo + 1
+    if W <= 0 or n == 0 or m == 0:
+        return None
+    cdef char *q = query
+    cdef char *t = target
+    cdef int *H = <int *>malloc((n + 1) * W * sizeof(int))
+    cdef char *TB = <char *>malloc((n + 1) * W * sizeof(char))
+    cdef int i, j, kk, h, s, best = 0, best_i = 0, best_k = 0
+    cdef char tb
+    cdef int n_match = 0, n_mismatch = 0, n_ins = 0, n_del = 0
+    cdef int q_end, t_end
+    cdef char *qa
+    cdef char *pa
+    cdef char *ta
+    cdef int L = 0
+    if H == NULL or TB == NULL:
+        free(H)
+        free(TB)
+        raise MemoryError()
+
+    try:
+        # cell (i, j) is H[i * W + (j - i - d_lo)], H[0][*] = 0
+        for kk in range(W):
+            H[kk] = 0
+            TB[kk] = TB_STOP
+        for i in range(1, n + 1):
+            for kk in range(W):
+                j = i + d_lo + kk
+                h = 0
+                tb = TB_STOP
+                if j >= 1 and j <= m:
+                    # diagonal: (i-1, j-1) has the same k
+                    s = H[(i - 1) * W + kk] + \
+                        (MATCH if q[i - 1] == t[j - 1] else MISMATCH)
+                    if s > h:
+                        h, tb = s, TB_DIAG
+                    # up: (i-1, j) has k+1
+                    if kk + 1 < W:
+                        s = H[(i - 1) * W + kk + 1] + INDEL
+                        if s > h:
+                            h, tb = s, TB_UP
+                    # left: (i, j-1) has k-1
+                    if kk > 0:
+                        s = H[i * W + kk - 1] + INDEL
+                        if s > h:
+                            h, tb = s, TB_LEFT
+                    if h > best:
+                        best, best_i, best_k = h, i, kk
+                H[i * W + kk] = h
+                TB[i * W + kk] = tb
+
+        if best == 0:
+            return None
+
+        # trace back from the best cell
+        q_end, t_end = best_i, best_i + d_lo + best_k
+        qa = <char *>malloc(n + m + 1)
+        pa = <char *>malloc(n + m + 1)
+        ta = <char *>malloc(n + m + 1)
+        try:
+            i, kk = best_i, best_k
+            while TB[i * W + kk] != TB_STOP:
+                j = i + d_lo + kk
+                tb = TB[i * W + kk]
+                if tb == TB_DIAG:
+                    qa[L], ta[L] = q[i - 1], t[j - 1]
+                    if q[i - 1] == t[j - 1]:
+                        pa[L] = '|'
+                        n_match += 1
+                    else:
+                        pa[L] = '*'
+                        n_mismatch += 1
+                    i -= 1
+                elif tb == TB_UP:
+                    qa[L], pa[L], ta[L] = q[i - 1], '*', '-'
+                    n_ins += 1
+                    i -= 1
+                    kk += 1
+                else:
+                    qa[L], pa[L], ta[L] = '-', '*', t[j - 1]
+                    n_del += 1
+                    kk -= 1
+                L += 1
+            q_aln = qa[:L][::-1]
+            pattern = pa[:L][::-1]
+            t_aln = ta[:L][::-1]
+        finally:
+            free(qa)
+            free(pa)
+            free(ta)
+        return (best, i, q_end, i + d_lo + kk, t_end,
+                n_match, n_mismatch, n_ins, n_del, q_aln, pattern, t_aln)
+    finally:
+        free(H)
+        free(TB)
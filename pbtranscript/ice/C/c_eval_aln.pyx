@@ -0,0 +1,135 @@
+"""
+Evaluate all columns of a pairwise alignment in one call, see
+pbtranscript.ice.IceUtils.eval_blasr_alignment for the pure python
+version which looks up QVs one column at a time.
+"""
+from libc.stdlib cimport malloc, free
+import numpy as np
+
+# Order of per type thresholds.
+QV_TYPES = ('DeletionQV', 'InsertionQV', 'SubstitutionQV')
+
+
+cdef inline int qv_pos(int index, int offset, int start, int end,
+                       int length, bint forward):
+    """Position of the index-th aligned base (+offset) in a read."""
+    cdef int pos
+    if forward:
+        pos = index + start + offset
+        if pos > length - 1:
+            pos = length - 1
+    else:
+        pos = end - 1 - index - offset
+        if pos < 0:
+            pos = 0
+    return pos
+
+
+def eval_aln_columns(bytes qAln, bytes sAln, bytes alnStr,
+                     double[:] q_del, double[:] q_ins, double[:] q_sub,
+                     int qStart, int qEnd, int qLength, bint q_forward,
+                     double[:] s_del, double[:] s_ins, double[:] s_sub,
+                     int sStart, int sEnd, int sLength, bint s_forward,
+                     bint sID_starts_with_c,
+                     double[:] q_thresholds, double[:] s_thresholds):
+    """
+    Go through alignment columns (alnStr, e.g., |||**||||**|||*|*|) and
+    determine the sequence of 'M' (match), 'S' (sub), 'I', 'D'.
+
+    q_del, q_ins, q_sub --- deletion, insertion and substitution
+        probabilities of every base of the query (on its own strand).
+    s_del, s_ins, s_sub --- same for subject, not used if
+        sID_starts_with_c is True.
+    If QVs of the query (or subject) are empty arrays, its QVs are not
+    looked up and always pass, and error probabilities are 0.
+    q_thresholds, s_thresholds --- a QV passes (is good) if it is less
+        than the threshold of its type, in the order of QV_TYPES.
+
+    A non-match counts as a penalty (ece is 1) unless QVs indicate
+    that the event is expected, the same as eval_blasr_alignment.
+
+    Returns (cigar string, binary ECE array, array of query error
+    probability of each column's event, 0 for matches).
+    """
+    cdef int n = len(alnStr)
+    if len(qAln) != n or len(sAln) != n:
+        raise ValueError("Aligned query, subject and alnStr must " +
+                         "have the same length.")
+
+    cdef char *qa = qAln
+    cdef char *sa = sAln
+    cdef char *aa = alnStr
+    cdef int i, q_index = 0, s_index = 0
+    cdef char last_state = 0, last_tracking_nt = 0
+    cdef bint q_is_good, s_is_good, homopolymer_so_far
+    cdef double prob = 0
+    cdef bint has_q = len(q_del) > 0 and len(q_ins) > 0 and len(q_sub) > 0
+    cdef bint has_s = not sID_starts_with_c and \
+        len(s_del) > 0 and len(s_ins) > 0 and len(s_sub) > 0
+
+    ece = np.zeros(n, dtype=np.int)
+    err_prob = np.zeros(n, dtype=np.float64)
+    cdef long[:] ece_v = ece
+    cdef double[:] err_v = err_prob
+    cdef char *cigar = <char *>malloc((n + 1) * sizeof(char))
+
+    try:
+        for i in range(n):
+            if aa[i] == '|':  # match
+                cigar[i] = 'M'
+                q_index += 1
+                s_index += 1
+                last_state = 'M'
+            elif qa[i] == '-':  # deletion
+                s_is_good = not has_s or \
+                    s_ins[qv_pos(s_index, 0, sStart, sEnd, sLength, s_forward)] < s_thresholds[1]
+                if has_q:
+                    prob = q_del[qv_pos(q_index, 1, qStart, qEnd, qLength, q_forward)]
+                q_is_good = not has_q or prob < q_thresholds[0]
+                if last_state != 'D':
+                    last_tracking_nt = sa[i]
+                    if s_is_good and q_is_good:
+                        ece_v[i] = 1
+                else:
+                    homopolymer_so_far = (sa[i] == last_tracking_nt)
+                    if s_is_good and (q_is_good or not homopolymer_so_far):
+                        ece_v[i] = 1
+                err_v[i] = prob
+                cigar[i] = 'D'
+                s_index += 1
+                last_state = 'D'
+            elif sa[i] == '-':  # insertion
+                if has_q:
+                    prob = q_ins[qv_pos(q_index, 0, qStart, qEnd, qLength, q_forward)]
+                q_is_good = not has_q or prob < q_thresholds[1]
+                s_is_good = not has_s or \
+                    s_del[qv_pos(s_index, 1, sStart, sEnd, sLength, s_forward)] < s_thresholds[0]
+                if last_state != 'I':
+                    last_tracking_nt = qa[i]
+                    if q_is_good and s_is_good:
+                        ece_v[i] = 1
+                else:
+                    homopolymer_so_far = (qa[i] == last_tracking_nt)
+                    if q_is_good and (s_is_good or not homopolymer_so_far):
+                        ece_v[i] = 1
+                err_v[i] = prob
+                cigar[i] = 'I'
+                q_index += 1
+                last_state = 'I'
+            else:  # substitution
+                if has_q:
+                    prob = q_sub[qv_pos(q_index, 0, qStart, qEnd, qLength, q_forward)]
+                if (not has_q or prob < q_thresholds[2]) and \
+                   (not has_s or
+                    s_sub[qv_pos(s_index, 0, sStart, sEnd, sLength, s_forward)] < s_thresholds[2]):
+                    ece_v[i] = 1
+                err_v[i] = prob
+                cigar[i] = 'S'
+                q_index += 1
+                s_index += 1
+                last_state = 'S'
+        cigar_str = cigar[:n]
+    finally:
+        free(cigar)
+
+    return cigar_str, ece, err_prob
@@ -0,0 +1,92 @@
+"""
+Local alignment of short primers to reads, for the native primer
+detector of Classifier (see pbtranscript.NativePrimerDetector).
+
+Scores are in half-bits (match 2, mismatch -3, gap -3), so that half
+of a score is close to the bit score phmmer reports with PBMATRIX for
+the same primer hit.
+"""
+from libc.stdlib cimport malloc, free
+
+DEF MATCH = 2
+DEF MISMATCH = -3
+DEF GAP = -3
+# A base which never matches, used to mask bases of reported hits.
+DEF MASK = 0
+
+
+def primer_hits(bytes primer, bytes seq, int min_score, int max_hits=4):
+    """
+    Return local alignments of primer to seq with score >= min_score,
+    best first, as a list of (score, pStart, pEnd, sStart, sEnd). After
+    a hit is found, its bases in seq are masked, so hits do not overlap
+    in seq. At most max_hits hits are returned.
+    """
+    cdef int m = len(primer), n = len(seq)
+    cdef int i, j, h, s, d, up, left, best, best_i, best_j
+    cdef int best_ps, best_ss
+    cdef char *p = primer
+    cdef char *q = <char *>malloc(n + 1)
+    # scores, primer starts and seq starts of paths ending at columns
+    # j-1 (prev) and j (cur)
+    cdef int *buf = <int *>malloc(6 * (m + 1) * sizeof(int))
+    cdef int *Hp = buf
+    cdef int *Hc = buf + (m + 1)
+    cdef int *Pp = buf + 2 * (m + 1)
+    cdef int *Pc = buf + 3 * (m + 1)
+    cdef int *Sp = buf + 4 * (m + 1)
+    cdef int *Sc = buf + 5 * (m + 1)
+    cdef int *tmp
+    if q == NULL or buf == NULL:
+        free(q)
+        free(buf)
+        raise MemoryError()
+
+    ret = []
+    try:
+        for j in range(n):
+            q[j] = seq[j]
+
+        while len(ret) < max_hits:
+            best, best_i, best_j, best_ps, best_ss = 0, 0, 0, 0, 0
+            for i in range(m + 1):
+                Hp[i], Pp[i], Sp[i] = 0, i, 0
+            for j in range(1, n + 1):
+                Hc[0], Pc[0], Sc[0] = 0, 0, j
+                for i in range(1, m + 1):
+                    h = 0
+                    # path starting at (i, j) if h stays 0
+                    Pc[i], Sc[i] = i, j
+                    if q[j - 1] != MASK and p[i - 1] == q[j - 1]:
+                        s = MATCH
+                    else:
+                        s = MISMATCH
+                    d = Hp[i - 1] + s
+                    up = Hc[i - 1] + GAP
+                    left = Hp[i] + GAP
+                    if d > h:
+                        h = d
+                        Pc[i], Sc[i] = Pp[i - 1], Sp[i - 1]
+                    if up > h:
+                        h = up
+                        Pc[i], Sc[i] = Pc[i - 1], Sc[i - 1]
+                    if left > h:
+                        h = left
+                        Pc[i], Sc[i] = Pp[i], Sp[i]
+                    Hc[i] = h
+                    if h > best:
+                        best, best_i, best_j = h, i, j
+                        best_ps, best_ss = Pc[i], Sc[i]
+                tmp = Hp; Hp = Hc; Hc = tmp
+                tmp = Pp; Pp = Pc; Pc = tmp
+                tmp = Sp; Sp = Sc; Sc = tmp
+
+            if best < min_score or best == 0:
+                break
+            ret.append((best, best_ps, best_i, best_ss, best_j))
+            for j in range(best_ss, best_j):
+                q[j] = MASK
+        return ret
+    finally:
+        free(q)
+        free(buf)
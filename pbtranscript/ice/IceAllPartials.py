@@ -7,7 +7,8 @@ IceAllPartials procedures:
     (i.e., final.consensus.fasta), then create a pickle file
     (e.g. *.partial_uc.pickle).
 
-(2) Wait for all pickle files to be created
+(2) Wait for all pickle files to be created, every job notifies
+    IceAllPartials as soon as its pickle file is done.
 
 (3) Merge all pickle files and dump to a big pickle.
 
@@ -15,12 +16,12 @@ IceAllPartials procedures:
 
 import os.path as op
 import logging
-import time
 from pbtranscript.PBTranscriptOptions import \
     add_sge_arguments, add_fofn_arguments, add_tmp_dir_argument
 from pbtranscript.Utils import realpath, mkdir, real_upath, ln
 from pbtranscript.ice.IceFiles import IceFiles
 from pbtranscript.ice.IceUtils import combine_nfl_pickles
+from pbtranscript.ice.IceDoneListener import DoneListener
 from pbtranscript.ice.__init__ import ICE_PARTIAL_PY
 
 
@@ -37,6 +38,9 @@ class IceAllPartials(IceFiles):
 
     prog = "%s all " % ICE_PARTIAL_PY
 
+    # Check pickles every POLL_INTERVAL seconds, in case a job could
+    # not notify IceAllPartials.
+    POLL_INTERVAL = 60
 
     def __init__(self, root_dir, fasta_filenames, ref_fasta,
                  out_pickle, sge_opts, ccs_fofn=None, tmp_dir=None):
@@ -142,10 +146,12 @@ class IceAllPartials(IceFiles):
         return [op.join(self.script_dir, op.basename(f) + ".partial_uc.sh")
                 for f in self.fasta_filenames]
 
-    def createPickles(self):
+    def createPickles(self, notify=None):
         """For each file in fasta_filenames, call 'ICE_PARTIAL_PY one' to
         build clusters and to save results to a pickle file. When all pickles
         are done, union all pickles.
+        notify --- if not None, address of a DoneListener which every
+                   job notifies when its pickle is done.
         """
         self.add_log("Mapping non-full-length reads to consensus isoforms.")
         self.add_log("Creating pickles...", level=logging.INFO)
@@ -162,7 +168,9 @@ class IceAllPartials(IceFiles):
             if self.ccs_fofn is not None:
                 cmd += "--ccs_fofn={f} ".format(f=real_upath(self.ccs_fofn))
             if self.tmp_dir is not None:
-                cmd += "--tmp_dir={t}".format(t=self.tmp_dir)
+                cmd += "--tmp_dir={t} ".format(t=self.tmp_dir)
+            if notify is not None:
+                cmd += "--notify={n} ".format(n=notify)
 
             self.add_log("Writing command to script {fsh}".
                          format(fsh=self.script_filenames[idx]))
@@ -195,18 +203,18 @@ class IceAllPartials(IceFiles):
                                                    elog=real_upath(elog))
                 self.run_cmd_and_log(cmd=cmd, olog=olog, elog=elog)
 
-    def waitForPickles(self, pickle_filenames, done_filenames):
-        """Wait for *.pickle and *.pickle.DONE to be created."""
+    def waitForPickles(self, pickle_filenames, done_filenames, listener,
+                       poll_interval=POLL_INTERVAL):
+        """Wait for *.pickle and *.pickle.DONE to be created.
+        Check them whenever a job notifies listener, a DoneListener,
+        or every poll_interval seconds.
+        """
         self.add_log("Waiting for pickles {ps} to be created.".
                      format(ps=", ".join(pickle_filenames)),
                      level=logging.INFO)
-        stop = False
-        sleep_time = 10
-        while stop is not True:
-            stop = all(op.exists(p) for p in pickle_filenames) and \
-                all(op.exists(d) for d in done_filenames)
-            sleep_time = min(600, sleep_time * 2)
-            time.sleep(sleep_time)
+        while not (all(op.exists(p) for p in pickle_filenames) and
+                   all(op.exists(d) for d in done_filenames)):
+            listener.wait(timeout=poll_interval)
             self.add_log("Waiting for pickles to be created: {ps}".
                          format(ps=", ".join([p for p in pickle_filenames
                                               if op.exists(p)])))
@@ -217,11 +225,14 @@ class IceAllPartials(IceFiles):
 
     def run(self):
         """Assigning nfl reads to consensus isoforms and merge."""
-        # Call $ICE_PARTIAL_PY to create a pickle for each splitted nfl fasta
-        self.createPickles()
-        # Wait for pickles to be created, if SGE is used.
-        self.waitForPickles(pickle_filenames=self.pickle_filenames,
-                            done_filenames=self.done_filenames)
+        # Jobs running on SGE must connect to this host by its name
+        with DoneListener(host=None if self.sge_opts.use_sge else "localhost") as listener:
+            # Call $ICE_PARTIAL_PY to create a pickle for each splitted nfl fasta
+            self.createPickles(notify=listener.address)
+            # Wait for pickles to be created, if SGE is used.
+            self.waitForPickles(pickle_filenames=self.pickle_filenames,
+                                done_filenames=self.done_filenames,
+                                listener=listener)
         # Combine all pickles to a big pickle file: nfl_all_pickle_fn.
         self.combinePickles(pickle_filenames=self.pickle_filenames,
                             out_pickle=self.nfl_all_pickle_fn)
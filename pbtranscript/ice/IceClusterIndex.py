@@ -0,0 +1,235 @@
+"""
+Define ClusterIndex, which keeps cluster membership (uc) and the
+probability matrix (d) of IceIterative together with the indices
+needed to update them in time proportional to the affected reads.
+"""
+from collections import OrderedDict
+
+__all__ = ["ClusterMembers", "ClusterIndex"]
+
+
+class ClusterMembers(OrderedDict):
+
+    """
+    Insertion-ordered set of read ids in a cluster, which replaces a
+    list of read ids, with O(1) append, remove and membership test.
+    """
+
+    def __init__(self, qids=()):
+        super(ClusterMembers, self).__init__((qid, None) for qid in qids)
+
+    def append(self, qid):
+        """Append a read id to the end."""
+        self[qid] = None
+
+    def extend(self, qids):
+        """Append read ids to the end."""
+        for qid in qids:
+            self[qid] = None
+
+    def remove(self, qid):
+        """Remove a read id, raise KeyError if not a member."""
+        del self[qid]
+
+    def first(self):
+        """Return the first read id."""
+        return next(iter(self))
+
+    def __repr__(self):
+        return "{c}({l})".format(c=self.__class__.__name__, l=list(self))
+
+
+class ClusterIndex(object):
+
+    """
+    uc --- cluster index --> ClusterMembers
+    d  --- read id --> {cluster index: prob}
+
+    Maintains
+        qid_to_cid --- read id --> index of the cluster it belongs to
+        cid_to_qids --- cluster index --> set of read ids which have
+                       a prob against the cluster in d
+    and the set of reads which may move to another cluster.
+
+    uc and d may be read directly, but must only be modified
+    through methods of this class.
+    """
+
+    def __init__(self, uc=None, d=None):
+        self.uc = {}
+        self.d = {}
+        self.qid_to_cid = {}
+        self.cid_to_qids = {}
+        # reads which can be moved to another cluster
+        self._movable = set()
+        # reads whose membership or probs changed since
+        # _movable was last updated
+        self._dirty = set()
+        self.set_uc({} if uc is None else uc)
+        self.set_d({} if d is None else d)
+
+    def set_uc(self, uc):
+        """Replace all clusters by uc, dict of cid --> list of read ids."""
+        self.uc = {}
+        self.qid_to_cid = {}
+        for cid, qids in uc.iteritems():
+            self.add_cluster(cid, qids)
+        self._reset_movable()
+
+    def set_d(self, d):
+        """Replace the whole probability matrix by d."""
+        self.d = {}
+        self.cid_to_qids = {}
+        for qid, probs in d.iteritems():
+            self.reset_probs(qid, probs)
+        self._reset_movable()
+
+    def _reset_movable(self):
+        """All reads need to be checked for moves again."""
+        self._movable = set()
+        self._dirty = set(self.qid_to_cid)
+
+    # ------- cluster membership -------
+    def add_cluster(self, cid, qids):
+        """Add a new cluster cid with members qids."""
+        if cid in self.uc:
+            raise ValueError("Cluster {c} already exists.".format(c=cid))
+        self.uc[cid] = ClusterMembers()
+        self.add_to_cluster(qids, cid)
+
+    def add_to_cluster(self, qids, cid):
+        """Add reads qids to cluster cid."""
+        members = self.uc[cid]
+        old_size = len(members)
+        for qid in qids:
+            if qid in self.qid_to_cid:
+                raise ValueError("{q} is already in cluster {c}.".
+                                 format(q=qid, c=self.qid_to_cid[qid]))
+            members.append(qid)
+            self.qid_to_cid[qid] = cid
+            self._dirty.add(qid)
+        self._size_changed(cid, old_size)
+
+    def remove_from_cluster(self, qid, from_i):
+        """Remove qid from cluster from_i, return the number of
+        remaining members of from_i."""
+        self.uc[from_i].remove(qid)
+        del self.qid_to_cid[qid]
+        self._dirty.add(qid)
+        self._size_changed(from_i, len(self.uc[from_i]) + 1)
+        return len(self.uc[from_i])
+
+    def move_members(self, from_i, to_i):
+        """Move all members of cluster from_i to the end of to_i."""
+        qids = list(self.uc[from_i])
+        self.uc[from_i] = ClusterMembers()
+        for qid in qids:
+            del self.qid_to_cid[qid]
+        self.add_to_cluster(qids, to_i)
+
+    def delete_cluster(self, cid):
+        """Delete an empty cluster and all probs against it."""
+        if len(self.uc[cid]) != 0:
+            raise ValueError("Cluster {c} to delete is not empty.".
+                             format(c=cid))
+        del self.uc[cid]
+        for qid in self.cid_to_qids.pop(cid, ()):
+            del self.d[qid][cid]
+            self._dirty.add(qid)
+
+    def _size_changed(self, cid, old_size):
+        """Moves of members of a cluster of size <= 2 (singletons) are
+        decided differently, mark members dirty if size crosses 2."""
+        if (old_size <= 2) != (len(self.uc[cid]) <= 2):
+            self._dirty.update(self.uc[cid])
+
+    # ------- probability matrix -------
+    def set_prob(self, qid, cid, prob):
+        """Set d[qid][cid] = prob."""
+        if qid not in self.d:
+            self.d[qid] = {}
+        self.d[qid][cid] = prob
+        self.cid_to_qids.setdefault(cid, set()).add(qid)
+        self._dirty.add(qid)
+
+    def reset_probs(self, qid, probs):
+        """Set d[qid] to a copy of probs, dict of cid --> prob."""
+        self.del_probs(qid)
+        self.d[qid] = {}
+        for cid, prob in probs.iteritems():
+            self.set_prob(qid, cid, prob)
+        self._dirty.add(qid)
+
+    def del_probs(self, qid):
+        """Delete d[qid] if exists."""
+        for cid in self.d.pop(qid, {}):
+            self.cid_to_qids[cid].discard(qid)
+        self._dirty.add(qid)
+
+    def clean_probs(self, cids, qids):
+        """Delete d[qid][cid] for every qid in qids and cid in cids."""
+        for cid in cids:
+            for qid in self.cid_to_qids.get(cid, set()).intersection(qids):
+                del self.d[qid][cid]
+                self.cid_to_qids[cid].discard(qid)
+                self._dirty.add(qid)
+
+    # ------- moves -------
+    def is_movable(self, qid):
+        """Return True if read qid can be moved to another cluster,
+        with the same criteria as IceIterative.no_moves_possible."""
+        cid = self.qid_to_cid.get(qid)
+        if cid is None:
+            return False
+        probs = self.d[qid]
+        if len(self.uc[cid]) <= 2:  # match singleton criterion here
+            return len(probs) > 1
+        return cid not in probs or probs[cid] != max(probs.itervalues())
+
+    def movable_qids(self):
+        """Return the set of reads which can be moved,
+        only dirty reads are checked."""
+        for qid in self._dirty:
+            if self.is_movable(qid):
+                self._movable.add(qid)
+            else:
+                self._movable.discard(qid)
+        self._dirty = set()
+        return self._movable
+
+    def no_moves_possible(self):
+        """Return True if no moves are possible."""
+        return len(self.movable_qids()) == 0
+
+    # ------- sanity check -------
+    def check_consistency(self):
+        """
+        Check that uc, d, qid_to_cid, cid_to_qids and movable reads
+        agree with each other, raise ValueError otherwise.
+        """
+        errs = []
+        n_members = 0
+        for cid, members in self.uc.iteritems():
+            n_members += len(members)
+            for qid in members:
+                if self.qid_to_cid.get(qid) != cid:
+                    errs.append("qid_to_cid[{q}] is not {c}".format(q=qid, c=cid))
+        if n_members != len(self.qid_to_cid):
+            errs.append("qid_to_cid has {n} reads, uc has {m}".
+                        format(n=len(self.qid_to_cid), m=n_members))
+
+        pairs = set((qid, cid) for qid, probs in self.d.iteritems()
+                    for cid in probs)
+        rpairs = set((qid, cid) for cid, qids in self.cid_to_qids.iteritems()
+                     for qid in qids)
+        if pairs != rpairs:
+            errs.append("cid_to_qids disagrees with d on {n} entries".
+                        format(n=len(pairs.symmetric_difference(rpairs))))
+
+        movable = set(qid for qid in self.qid_to_cid if self.is_movable(qid))
+        if movable != set(self.movable_qids()):
+            errs.append("movable reads disagree with d and uc")
+
+        if len(errs) > 0:
+            raise ValueError("ClusterIndex is inconsistent: " + "; ".join(errs))
+        return True
@@ -0,0 +1,124 @@
+"""
+Completion notification of chunk jobs.
+
+A process which waits for chunk jobs (e.g., IceAllPartials waiting for
+'ice_partial.py one' jobs) opens a DoneListener and passes its address
+to the jobs. Every job calls notify_done(address, done_filename) once
+its done file is created, which wakes the waiting process up at once.
+The waiting process should still check done files now and then, in
+case a notification is lost, e.g., a job runs on a host which can not
+connect to the waiting process.
+
+Example:
+    with DoneListener() as listener:
+        submit jobs, passing listener.address
+        while not all(op.exists(f) for f in done_filenames):
+            listener.wait(timeout=60)
+"""
+
+import logging
+import socket
+import threading
+
+__all__ = ["DoneListener", "notify_done"]
+
+
+class DoneListener(object):
+
+    """
+    Listen on a TCP port for notifications of jobs.
+    host --- host name which jobs connect to, by default the fully
+             qualified name of this host, jobs running on this host
+             only may use 'localhost'. The port is bound only to the
+             address host resolves to, 127.0.0.1 for 'localhost',
+             never to all interfaces.
+    """
+
+    def __init__(self, host=None):
+        self.host = host if host is not None else socket.getfqdn()
+        self.notified = [] # done files notified, in order
+        self._event = threading.Event()
+        self._closed = False
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self._bind_address(self.host), 0))
+        self._sock.listen(128)
+        self._sock.settimeout(0.5) # check self._closed twice a second
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @staticmethod
+    def _bind_address(host):
+        """Return the address to listen on for jobs connecting to host."""
+        if host == "localhost":
+            return "127.0.0.1"
+        try:
+            return socket.gethostbyname(host)
+        except socket.error as e:
+            logging.warning("Could not resolve %s, listening on 127.0.0.1 " +
+                            "only, jobs on other hosts can not notify: %s",
+                            host, str(e))
+            return "127.0.0.1"
+
+    @property
+    def address(self):
+        """Return address to pass to notify_done, host:port."""
+        return "{h}:{p}".format(h=self.host, p=self._sock.getsockname()[1])
+
+    def _serve(self):
+        """Accept notifications until closed."""
+        while not self._closed:
+            try:
+                conn, dummy_addr = self._sock.accept()
+            except socket.timeout:
+                continue
+            except socket.error:
+                return
+            try:
+                conn.settimeout(10)
+                msg = conn.makefile('r').readline().strip()
+            except socket.error:
+                msg = ""
+            finally:
+                conn.close()
+            if len(msg) > 0:
+                self.notified.append(msg)
+            self._event.set()
+
+    def wait(self, timeout):
+        """Wait until a job notifies or timeout seconds pass.
+        Return True if a job notified."""
+        ret = self._event.wait(timeout)
+        self._event.clear()
+        return ret
+
+    def close(self):
+        """Stop listening."""
+        self._closed = True
+        self._thread.join()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def notify_done(address, done_filename, timeout=10):
+    """Notify the DoneListener at address (host:port) that done_filename
+    is created. Return True if notified, False if failed, so that the
+    listening process finds done_filename when it checks again."""
+    try:
+        host, port = address.rsplit(":", 1)
+        conn = socket.create_connection((host, int(port)), timeout=timeout)
+        try:
+            conn.sendall(done_filename + "\n")
+        finally:
+            conn.close()
+    except (socket.error, ValueError) as e:
+        logging.warning("Could not notify %s that %s is done: %s",
+                        address, done_filename, str(e))
+        return False
+    return True
@@ -0,0 +1,24 @@
+"""
+Estimate cost of gcon (ice_pbdagcon) jobs of clusters.
+
+Cost of a cluster is estimated from its number of reads and bases, so
+that the largest clusters start first (see JobScheduler with by_cost)
+and do not set the wall-clock time of a gcon round alone.
+"""
+
+__all__ = ["estimate_gcon_cost"]
+
+# ice_pbdagcon chooses a template by self-aligning reads with blasr
+# --bestn 10, then aligns all reads to the template and calls pbdagcon.
+GCON_BLASR_BESTN = 10
+
+
+def estimate_gcon_cost(n_reads, n_bases):
+    """
+    Return estimated cost of running gcon on a cluster of n_reads reads
+    with n_bases bases in total: every read is aligned to at most
+    GCON_BLASR_BESTN other reads, then once more to the template, and
+    the alignments are merged by pbdagcon.
+    """
+    return float(n_bases) * (min(n_reads, GCON_BLASR_BESTN) + 2)
+
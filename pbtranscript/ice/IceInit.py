@@ -7,7 +7,6 @@ input reads against itself.
 import os.path as op
 import time
 import logging
-import networkx as nx
 from pbcore.io import FastaReader
 from pbtranscript.Utils import real_upath, execute
 from pbtranscript.ice_daligner import DalignerRunner
@@ -25,6 +24,8 @@ class IceInit(object):
         self.readsFa = readsFa
         self.ice_opts = ice_opts
         self.sge_opts = sge_opts
+        # number of worker processes for clique partitioning
+        self.nproc = sge_opts.blasr_nproc if sge_opts is not None else 1
 
         self.ice_opts.detect_cDNA_size(readsFa)
 
@@ -62,12 +63,13 @@ class IceInit(object):
                                 cpus=4)
         runner.run(min_match_len=self.ice_opts.low_cDNA_size,
                    output_dir=output_dir,
-                   sensitive_mode=self.ice_opts.sensitive_mode)
+                   sensitive_mode=self.ice_opts.sensitive_mode,
+                   stream_la4ice=True)
         return runner
 
     def _makeGraphFromM5(self, m5FN, qver_get_func, qvmean_get_func, ice_opts):
         """Construct a graph from a BLASR M5 file."""
-        alignGraph = nx.Graph()
+        alignGraph = pClique.GraphBuilder()
 
         for r in blasr_against_ref(output_filename=m5FN,
                                    is_FL=True,
@@ -85,9 +87,9 @@ class IceInit(object):
 
     def _makeGraphFromLA4Ice(self, runner, qver_get_func, qvmean_get_func, ice_opts):
         """Construct a graph from a LA4Ice output file."""
-        alignGraph = nx.Graph()
+        alignGraph = pClique.GraphBuilder()
 
-        for la4ice_filename in runner.la4ice_filenames:
+        for la4ice_filename in runner.la4ice_outputs:
             count = 0
             start_t = time.time()
             for r in daligner_against_ref(
@@ -113,8 +115,8 @@ class IceInit(object):
         Find all mutually exclusive cliques within the graph, with decreased
         size.
 
-        alignGraph - a graph, each node represent a read and each edge
-        represents an alignment between two end points.
+        alignGraph - a pClique.GraphBuilder, each node represent a read and
+        each edge represents an alignment between two end points.
 
         Return a dictionary of clique indices and nodes.
             key = index of a clique
@@ -122,37 +124,26 @@ class IceInit(object):
         Cliques are ordered by their size descendingly: index up, size down
         Reads which are not included in any cliques will be added as cliques
         of size 1.
+
+        The graph is kept in compressed sparse row arrays, and connected
+        components are partitioned independently by self.nproc processes.
         """
         uc = {}    # To keep cliques found
-        used = []  # nodes within any cliques
+        used = set()  # nodes within any cliques
         ind = 0    # index of clique to discover
 
-        deg = alignGraph.degree().items()
-        # Sort tuples of (node, degree) by degree, descendingly
-        deg.sort(key=lambda x: x[1], reverse=True)
-        for d in deg:
-            node = d[0]  # node which has the largest degree in alignGraph
-            if node not in alignGraph:
-                continue
-            # just get the immediate neighbors since we're looking for perfect
-            # cliques
-            subGraph = alignGraph.subgraph([node] + alignGraph.neighbors(node))
-            subNodes = subGraph.nodes()
-            # Convert from networkx.Graph to a sparse matrix
-            S, H = pClique.convert_graph_connectivity_to_sparse(
-                subGraph, subNodes)
-            # index of the 'node' in the sub-graph
-            seed_i = subNodes.index(node)
-            # Grasp a clique from subGraph, and return indices of clique nodes
-            # setting gamma=0.8 means to find quasi-0.8-cliques!
-            tQ = pClique.grasp(S, H, gamma=0.8, maxitr=5, given_starting_node=seed_i)
-            if len(tQ) > 0:
-                c = [subNodes[i] for i in tQ]  # nodes in the clique
-                uc[ind] = c  # Add the clique to uc
-                ind += 1
-                used += c    # Add clique nodes to used
-                # Remove clique nodes from alignGraph and continue
-                alignGraph.remove_nodes_from(c)
+        start_t = time.time()
+        g = alignGraph.to_csr()
+        nodes = alignGraph.nodes
+        # setting gamma=0.8 means to find quasi-0.8-cliques!
+        for tQ in pClique.partition_into_cliques(g, gamma=0.8, maxitr=5,
+                                                 nproc=self.nproc):
+            c = [nodes[i] for i in tQ]  # nodes in the clique
+            uc[ind] = c  # Add the clique to uc
+            ind += 1
+            used.update(c)    # Add clique nodes to used
+        logging.debug("found {0} cliques from {1} nodes, {2} edges; took {3} sec"
+                      .format(ind, g.n, len(g.indices) / 2, time.time()-start_t))
 
         with FastaReader(readsFa) as reader:
             for r in reader:
@@ -2,24 +2,28 @@
 Class ICEIterative for iterative clustering and error correction.
 """
 import cPickle
+import functools
+import hashlib
 import json
-import math
 import os
 import os.path as op
 import shutil
 import logging
 import random
 from datetime import datetime
-from multiprocessing.pool import ThreadPool
 
-from pbtranscript.Utils import mknewdir, real_upath
+from pbtranscript.Utils import mknewdir, real_upath, balance_by_cost
+from pbtranscript.RunnerUtils import write_cmd_to_script
+from pbtranscript.JobScheduler import JobScheduler, SgeBackend, LocalBackend
 from pbtranscript.io import FastaRandomReader, \
-    BLASRM5Reader, LA4IceReader, DazzIDHandler
+    BLASRM5Reader, LA4IceStreamReader, DazzIDHandler
 from pbtranscript.io.ContigSetReaderWrapper import ContigSetReaderWrapper
 from pbtranscript.ice.IceFiles import IceFiles
 from pbtranscript.ice_daligner import DalignerRunner
 from pbtranscript.ice_pbdagcon import runConsensus
 from pbtranscript.ice.IceInit import IceInit
+from pbtranscript.ice.IceClusterIndex import ClusterIndex
+from pbtranscript.ice.IceGconScheduler import estimate_gcon_cost
 from pbtranscript.ice.IceUtils import sanity_check_gcon, \
     sanity_check_sge, possible_merge, blasr_against_ref, \
     get_the_only_fasta_record, cid_with_annotation, \
@@ -110,11 +114,14 @@ class IceIterative(IceFiles):
             self.newids.update(set([r.id for r in cs]))
         self.seq_dict = FastaRandomReader(all_fasta_filename)
 
+        # maintains self.uc, self.d and their indices
+        self.index = ClusterIndex()
+
         # probability dict, seqid --> cluster index i --> P(seq|C_i)
         self.d = {}
 
         self.refs = {}  # cluster index --> gcon output consensus filename
-        self.uc = {}  # cluster index --> list of member seqids
+        self.uc = {}  # cluster index --> ClusterMembers of member seqids
 
         # used by clustering merging to track chained mergings, (key) cid
         self.old_rec = {}
@@ -123,6 +130,14 @@ class IceIterative(IceFiles):
         # list of cids that need to have gcon run (or re-run)
         self.changes = set()
 
+        # cluster index --> (md5 of consensus sequence, md5 of newids)
+        # when probs of newids against this cluster were last calculated
+        self.consensus_digests = {}
+
+        # number of clusters re-scored vs skipped in calc_cluster_prob,
+        # list of dict {'iterNum', 'rescored', 'skipped'}
+        self.prob_calc_stats = []
+
         # size below which gcon must be re-run if changes were made
         # Note: changed from 20 down to 10 after running some DAGCon
         # tests on 6-8 and 8-10k
@@ -224,6 +239,28 @@ class IceIterative(IceFiles):
         self.removed_qids = set()
         self.global_count = 0
 
+    @property
+    def uc(self):
+        """cluster index --> ClusterMembers (ordered set) of member seqids.
+        Must be modified through self.index."""
+        return self.index.uc
+
+    @uc.setter
+    def uc(self, uc):
+        """Set clusters from a dict of cluster index --> member seqids."""
+        self.index.set_uc(uc)
+
+    @property
+    def d(self):
+        """probability dict, seqid --> cluster index i --> P(seq|C_i).
+        Must be modified through self.index."""
+        return self.index.d
+
+    @d.setter
+    def d(self, d):
+        """Set probability dict."""
+        self.index.set_d(d)
+
     @property
     def tmpConsensusFa(self):
         """Return tmp consensus Fasta file. e.g.,
@@ -296,7 +333,7 @@ class IceIterative(IceFiles):
         """
         for dummy_cid, v in self.uc.iteritems():
             for qid in v:
-                self.d[qid] = {}
+                self.index.reset_probs(qid, {})
 
     def sanity_check_uc_refs(self):
         """
@@ -339,6 +376,8 @@ class IceIterative(IceFiles):
             d=a['d'],
             qv_prob_threshold=a['qv_prob_threshold'])
         obj.changes = a['changes']
+        obj.consensus_digests = a.get('consensus_digests', {})
+        obj.prob_calc_stats = a.get('prob_calc_stats', [])
         return obj
 
     def write_final_consensus(self):
@@ -387,7 +426,8 @@ class IceIterative(IceFiles):
     def write_pickle(self, pickle_filename):
         """Write an instance of IceIterative to a pickle file."""
         with open(pickle_filename, 'w') as f:
-            d = {'uc': self.uc,
+            d = {'uc': dict((cid, list(members)) for cid, members
+                            in self.uc.iteritems()),
                  'd': self.d,
                  'refs': self.refs,
                  'ccs_fofn': self.ccs_fofn,
@@ -397,6 +437,8 @@ class IceIterative(IceFiles):
                  'root_dir': self.root_dir,
                  'newids': self.newids,
                  'changes': self.changes,
+                 'consensus_digests': self.consensus_digests,
+                 'prob_calc_stats': self.prob_calc_stats,
                  'qv_prob_threshold': self.qv_prob_threshold}
             if pickle_filename.endswith(".json"):
                 f.write(json.dumps(d))
@@ -408,7 +450,7 @@ class IceIterative(IceFiles):
     def make_new_cluster(self):
         """Add a new cluster to self.uc."""
         best_i = max(self.uc.keys()) + 1
-        self.uc[best_i] = []
+        self.index.add_cluster(best_i, [])
         return best_i
 
     def remove_from_cluster(self, qID, from_i):
@@ -416,13 +458,19 @@ class IceIterative(IceFiles):
         Remove a read (qID) from a cluster from_i,
         delete this cluster if it is empty.
         """
-        self.uc[from_i].remove(qID)
+        n = self.index.remove_from_cluster(qID, from_i)
         self.changes.add(from_i)
-        if len(self.uc[from_i]) == 0:
+        if n == 0:
             self.delete_cluster(from_i)
 
+    def add_to_cluster(self, qID, to_i):
+        """Add a read (qID) to the end of cluster to_i."""
+        self.index.add_to_cluster([qID], to_i)
+
     def delete_cluster(self, from_i):
         """
+        Cluster from_i must be empty (members may have been merged
+        into another cluster).
         1) delete it from self.uc
         2) delete all related entries from self.d
         3) delete self.refs
@@ -430,11 +478,10 @@ class IceIterative(IceFiles):
         5) remove from self.changes (if there)
         """
         self.add_log("Deleting cluster %s" % from_i)
-        del self.uc[from_i]
-        for k in self.d:
-            if from_i in self.d[k]:
-                del self.d[k][from_i]
+        self.index.delete_cluster(from_i)
         del self.refs[from_i]
+        # cluster index may be reused by make_new_cluster
+        self.consensus_digests.pop(from_i, None)
 
         dirname = self.cluster_dir(from_i)
         #op.join(self.tmp_dir, str(from_i/10000), 'c'+str(from_i))
@@ -445,19 +492,12 @@ class IceIterative(IceFiles):
 
     def no_moves_possible(self):
         """
-        Check self.uc, return True if no moves are possible, False otherwise."""
-        for cid, members in self.uc.iteritems():
-            if len(members) <= 2:  # match singleton criterion here
-                for x in members:
-                    if len(self.d[x]) > 1:
-                        return False
-            else:
-                for x in members:
-                    if cid not in self.d[x]:
-                        return False
-                    if self.d[x][cid] != max(self.d[x].itervalues()):
-                        return False
-        return True
+        Check self.uc, return True if no moves are possible, False otherwise.
+        A read in a cluster of size <= 2 can move if it has a prob against
+        any other cluster, otherwise if its prob against its own cluster is
+        not the best. Only reads changed since the last check are checked.
+        """
+        return self.index.no_moves_possible()
 
     def run_gcon_parallel(self, cids):
         """
@@ -506,9 +546,6 @@ class IceIterative(IceFiles):
         (1) ./tmp/c<cid>/in.fasta is created
         (2) run gcon on <cid> only if the size > 2
         """
-        # calculate effective chunk size
-        #effective_cids = filter(lambda cid: len(self.uc[cid])>2, cids)
-
         # Create $root_dir/scripts/$iterNum/, e.g, clusterOut/scripts/0
         mknewdir(op.join(self.script_dir, str(self.iterNum)))
 
@@ -516,23 +553,8 @@ class IceIterative(IceFiles):
         if self.sge_opts.use_sge:
             mknewdir(op.join(self.log_dir, str(self.iterNum)))
 
-        effective_cids = [cid for cid in cids if len(self.uc[cid]) > 2]
-        count_jobs = len(effective_cids)
-        chunk_size = count_jobs / self.num_jobs + (count_jobs % self.num_jobs > 0)
-
-        job_sh_dict = {}  # job_i --> file descriptor
-        if count_jobs > 0:
-            # ToDo: distribute jobs evenly (must look ahead at cluster sizes)
-            numgconJobs = int(math.ceil(count_jobs / float(chunk_size)))
-            #(count_jobs/chunk_size) + (count_jobs%chunk_size>0)
-            for job_i in xrange(numgconJobs):
-                f = open(self.gconJobFN(self.iterNum, job_i), 'w')
-                # e.g. "scripts/$iterNum/gcon_job_{0}.sh"
-                f.write("#!/bin/bash\n")
-                job_sh_dict[job_i] = f
-
-        effective_i = 0
-        jobs = []
+        jobs = []  # argument strings of ice_pbdagcon jobs
+        costs = []  # estimated cost of each job
         for cid in cids:
             dirname = self.cluster_dir(cid)
             if op.exists(dirname):
@@ -541,11 +563,10 @@ class IceIterative(IceFiles):
             in_fa_filename = self.write_in_fasta(cid)
 
             if len(self.uc[cid]) <= 2:  # don't even bother running gcon
-                # for now do nothing and let the else statement below
+                # for now do nothing and let choose_ref_file
                 # take care of it
                 pass
             else:
-                job_i = effective_i / chunk_size
                 argstr = " {infa} ".format(infa=real_upath(in_fa_filename)) + \
                          " {cdir}/g_consensus".\
                          format(cdir=real_upath(self.cluster_dir(cid))) + \
@@ -553,87 +574,80 @@ class IceIterative(IceFiles):
                          " --nproc {nproc}".\
                          format(nproc=self.sge_opts.gcon_nproc) + \
                          " --maxScore {s}\n".format(s=self.ice_opts.maxScore)
-
-                cmd = "{script} ".format(script=self.gcon_py) + argstr
-                job_sh_dict[job_i].write(cmd)
                 jobs.append(argstr)
-                effective_i += 1
-                if effective_i % chunk_size == 0:
-                    self.add_log("Writing script to %s" % (job_sh_dict[job_i].name))
+                # in.fasta has min(subsample, cluster size) reads
+                costs.append(estimate_gcon_cost(
+                    n_reads=min(self.dagcon_in_fa_subsample, len(self.uc[cid])),
+                    n_bases=op.getsize(in_fa_filename)))
 
-        if effective_i > 0:
+        if len(jobs) > 0:
             self.add_log("use_sge = {0}".format(self.use_sge))
             if self.use_sge is True:
-                job_list = ''
-                for job_i, f in job_sh_dict.iteritems():
-                    f.close()
-                    jid = "ice_iterative_{unique_id}_{it}_{j}".format(
-                        unique_id=self.sge_opts.unique_id,
-                        it=self.iterNum, j=job_i)
-                    elog = self.elogFN(self.iterNum, f.name)
-                    olog = self.ologFN(self.iterNum, f.name)
-
-                    cmd = "qsub -pe smp {nproc} ".\
-                        format(nproc=self.sge_opts.gcon_nproc) + \
-                          " -S /bin/bash -V -cwd " + \
-                          "-e {elog} ".format(elog=real_upath(elog)) + \
-                          "-o {olog} ".format(olog=real_upath(olog)) + \
-                          "-N {jid} ".format(jid=jid) + \
-                          "{fn}".format(fn=real_upath(f.name))
-                    self.qsub_cmd_and_log(cmd)
-                    job_list += jid + ','
-
-                with open(self.gconDoneJobFN(self.iterNum), 'w') as f:
-                    f.write("touch {alohaFN}\n".format(
-                        alohaFN=real_upath(self.alohaFN(self.iterNum))))
+                # Clusters are balanced over at most self.num_jobs scripts
+                # by estimated cost, largest first in every script.
+                # Each script is submitted by 'qsub -sync y' and noticed
+                # as soon as it exits, no done job held by all gcon jobs.
+                scheduler = JobScheduler(SgeBackend(sge_opts=self.sge_opts,
+                                                    max_jobs=self.num_jobs),
+                                         by_cost=True)
+                for job_i, group in enumerate(balance_by_cost(costs, self.num_jobs)):
+                    # e.g. "scripts/$iterNum/gcon_job_{0}.sh"
+                    script = self.gconJobFN(self.iterNum, job_i)
+                    write_cmd_to_script(
+                        cmd=["{script} ".format(script=self.gcon_py) + jobs[i].strip()
+                             for i in group], script=script)
+                    self.add_log("Writing script to %s" % script)
+                    scheduler.add_job(
+                        name="ice_iterative_{unique_id}_{it}_{j}".format(
+                            unique_id=self.sge_opts.unique_id,
+                            it=self.iterNum, j=job_i),
+                        script=real_upath(script),
+                        nproc=self.sge_opts.gcon_nproc,
+                        cost=sum(costs[i] for i in group),
+                        elog=real_upath(self.elogFN(self.iterNum, script)),
+                        olog=real_upath(self.ologFN(self.iterNum, script)))
                 msg = "waiting for gcon jobs to finish"
                 self.add_log(msg)
-                elog = self.elogFN(self.iterNum,
-                                   self.gconDoneJobFN(self.iterNum))
-                olog = self.ologFN(self.iterNum,
-                                   self.gconDoneJobFN(self.iterNum))
-                cmd = "qsub -sync y -pe smp 1 -S /bin/bash -V -cwd " + \
-                      "-e {elog} ".format(elog=real_upath(elog)) + \
-                      "-o {olog} ".format(olog=real_upath(olog)) + \
-                      "-hold_jid {jl} ".format(jl=job_list[:-1]) + \
-                      "-N qcon_done_{r} ".format(r=self.sge_opts.unique_id) + \
-                      "{donesh}".format(donesh=real_upath(self.gconDoneJobFN(self.iterNum)))
-                self.qsub_cmd_and_log(cmd)
+                for job in scheduler.run():
+                    # consensus of clusters in failed jobs are chosen
+                    # by choose_ref_file, same as before.
+                    self.add_log("gcon job {j} failed: {o}".format(
+                        j=job.name, o=job.output), level=logging.WARNING)
+                self.log_gcon_utilization(scheduler)
+                with open(self.alohaFN(self.iterNum), 'w') as f:
+                    f.write("")
             else:
-                for job_i, f in job_sh_dict.iteritems():
-                    f.close()
-
                 msg = "Adding {n} ice_pbdagcon jobs to thread pool.".\
                     format(n=len(jobs))
                 self.add_log(msg, level=logging.INFO)
                 time_1 = datetime.now()
-                #for job in jobs:
-                #    msg = "Adding a ice_pbdagcon job thread: " + \
-                #          self.gcon_py + job
-                #    self.add_log(msg)
-
-                if len(jobs) > 0:
-                    # Python's multiprocessing module copies all memory from
-                    # the parent process.  In this case, it's likely due to all
-                    # the QV values loaded into the main process thread
-                    # that's getting replicated to the forked processes,
-                    # causing memory bloat in all the children.
-
-                    # Alternative ways are to use
-                    #     threading.Thread or
-                    #     multiprocessing.pool.ThreadPool
-                    # num local process is split between blasr_nproc
-                    num_processes = max(1, self.blasr_nproc/self.sge_opts.gcon_nproc)
-                    pool = ThreadPool(processes=num_processes)
-                    rets = pool.map(runConsensus, jobs)
-                    pool.close()
-                    pool.join()
-                    # Check whether all threads finished successfully
-                    for i, job in enumerate(jobs):
-                        if rets[i] != 0:
-                            errMsg = "CMD failed: {j}".format(j=job)
-                            self.add_log(errMsg, level=logging.ERROR)
-                            raise RuntimeError(errMsg)
+
+                # Python's multiprocessing module copies all memory from
+                # the parent process.  In this case, it's likely due to all
+                # the QV values loaded into the main process thread
+                # that's getting replicated to the forked processes,
+                # causing memory bloat in all the children.
+
+                # Alternative ways are to use
+                #     threading.Thread or
+                #     multiprocessing.pool.ThreadPool
+                # num local process is split between blasr_nproc
+                # Clusters start in decreasing order of estimated cost
+                # on the first free worker thread.
+                num_processes = max(1, self.blasr_nproc/self.sge_opts.gcon_nproc)
+                scheduler = JobScheduler(LocalBackend(nproc=num_processes),
+                                         by_cost=True)
+                for i, job in enumerate(jobs):
+                    scheduler.add_job(name="gcon_{it}_{i}".format(it=self.iterNum, i=i),
+                                      cmd=functools.partial(runConsensus, job),
+                                      cost=costs[i])
+                failed = scheduler.run()
+                self.log_gcon_utilization(scheduler)
+                # Check whether all threads finished successfully
+                for job in failed:
+                    errMsg = "CMD failed: {j}".format(j=job.cmd.args[0])
+                    self.add_log(errMsg, level=logging.ERROR)
+                    raise RuntimeError(errMsg)
                 time_2 = datetime.now()
                 msg = "Total time for {n} pbdagcon jobs is {t}.".\
                       format(n=len(jobs), t=time_2 - time_1)
@@ -655,6 +669,15 @@ class IceIterative(IceFiles):
 
         self.iterNum += 1
 
+    def log_gcon_utilization(self, scheduler):
+        """Log busy time of every worker which ran gcon jobs."""
+        self.add_log("gcon jobs ran on {n} workers in {m:.2f} sec.".format(
+            n=len(scheduler.slot_jobs), m=scheduler.makespan), level=logging.INFO)
+        for slot, n_jobs, busy, fraction in scheduler.utilization():
+            self.add_log("gcon worker {w}: {n} jobs, busy {b:.2f} sec ({f:.1%}).".
+                         format(w=slot, n=n_jobs, b=busy, f=fraction),
+                         level=logging.INFO)
+
     def choose_ref_file(self, cid):
         """
         Return g_consensus.fasta if not empty (i.e. gcon succeeded)
@@ -682,21 +705,15 @@ class IceIterative(IceFiles):
             rname = self.first_seq_fa_of_cluster(cid)
             with open(rname, 'w') as h:
                 h.write(">c{0}\n{1}\n".
-                        format(cid, self.seq_dict[self.uc[cid][0]].sequence))
+                        format(cid, self.seq_dict[self.uc[cid].first()].sequence))
             return rname
 
     def clean_prob_for_cids(self, cids):
         """
-        Takes |qIDs| x |cIds| time....
-
         For every d[qID][cID] such that qID is in self.newids
         and cID is in cids, delete it
         """
-        for qid in self.newids:
-            # msg = "cleaning prob for {qid}".format(qid=qid)
-            # self.add_log(msg)
-            for cid in set(cids).intersection(self.d[qid]):
-                del self.d[qid][cid]
+        self.index.clean_probs(cids, self.newids)
 
     def final_round_before_freeze(self, min_cluster_size):
         """
@@ -718,14 +735,14 @@ class IceIterative(IceFiles):
 
         for cid in cids:
             n = len(self.uc[cid])
-            for qid in self.uc[cid]:
+            for qid in list(self.uc[cid]):
                 if (n < min_cluster_size or
                         cid not in self.d[qid] or
                         self.d[qid][cid] != max(self.d[qid].itervalues())):
                     msg = "Final round: remove {0} (from {1}) because {2}".\
                         format(qid, cid, self.d[qid])
                     self.add_log(msg)
-                    del self.d[qid]
+                    self.index.del_probs(qid)
                     self.remove_from_cluster(qid, cid)
                     if (cid in self.uc and
                             len(self.uc[cid]) < self.rerun_gcon_size):
@@ -741,13 +758,12 @@ class IceIterative(IceFiles):
         """
         #in_filename = op.join('./tmp/', str(cid/10000), 'c'+str(cid), 'in.fasta')
         in_filename = op.join(self.clusterInFa(cid))
-        seqids = self.uc[cid]
+        seqids = list(self.uc[cid])
         if not write_all:
             seqids = random.sample(seqids, min(self.dagcon_in_fa_subsample, len(seqids)))
         with open(in_filename, 'w') as f:
-            for seqid in seqids:
-                f.write(">{0}\n{1}\n".format(seqid,
-                                             self.seq_dict[seqid].sequence))
+            for seqid, r in zip(seqids, self.seq_dict.get_many(seqids)):
+                f.write(">{0}\n{1}\n".format(seqid, r.sequence))
         return in_filename
 
     def add_seq_to_cluster(self):
@@ -775,7 +791,7 @@ class IceIterative(IceFiles):
                     # run_gcon_parallel is called later it regenerates
                     # the in.fasta along with the whole folder
                     self.changes.add(cid)
-                self.uc[cid].append(r.name.split()[0])
+                self.add_to_cluster(r.name.split()[0], cid)
         return orphan
 
     def add_uc(self, uc):
@@ -786,7 +802,7 @@ class IceIterative(IceFiles):
         i = max(self.uc) + 1
         for k, v in uc.iteritems():
             cid = k + i
-            self.uc[cid] = v
+            self.index.add_cluster(cid, v)
             self.changes.add(cid)
             # even if it's a size-1/2 cluster, it still needs to
             # be in changes for the dir to be created
@@ -803,31 +819,54 @@ class IceIterative(IceFiles):
                 if len(self.uc[cid]) < self.rerun_gcon_size:
                     continue  # no way it's needed
                 for qid in set(self.uc[cid]).difference(self.newids):
-                    self.d[qid] = {cid: -0}
+                    self.index.reset_probs(qid, {cid: -0})
         else:
             for cid, qids in self.uc.iteritems():
                 if len(self.uc[cid]) < self.rerun_gcon_size:
                     continue  # no way it's needed
                 for qid in set(qids).difference(self.newids):
-                    self.d[qid] = {cid: -0}
+                    self.index.reset_probs(qid, {cid: -0})
 
     def calc_cluster_prob(self, force_calc=False, use_blasr=False):
         """
-        Dump all consensus file to ref_consensus.fasta
+        Dump consensus of clusters in self.changes (all clusters if
+        force_calc) to ref_consensus.fasta
         --> run DALIGNER (used to be BLASR) and get probs
+
+        Unless force_calc, a cluster is skipped and its probs in self.d
+        are reused, if neither its consensus sequence nor self.newids
+        has changed since probs were last calculated against it.
         """
         # make the consensus file & SA
-        _todo = set(self.uc.keys()) if force_calc else self.changes
+        _todo = set(self.uc.keys()) if force_calc else set(self.changes)
+        if len(_todo) == 0:
+            return
+
+        consensus = {} # cid --> consensus FastaRecord
+        for cid in _todo:
+            rs = []
+            with ContigSetReaderWrapper(self.refs[cid]) as cs:
+                rs.extend([r for r in cs])
+            assert len(rs) == 1
+            consensus[cid] = rs[0]
+
+        _todo, digests = self._cids_to_rescore(consensus, force_calc)
+
+        n_skipped = len(consensus) - len(_todo)
+        self.prob_calc_stats.append({'iterNum': self.iterNum,
+                                     'rescored': len(_todo),
+                                     'skipped': n_skipped})
+        msg = "calc_cluster_prob: re-scoring {n} clusters, ".\
+              format(n=len(_todo)) + \
+              "skipping {m} clusters with unchanged consensus.".\
+              format(m=n_skipped)
+        self.add_log(msg, level=logging.INFO)
         if len(_todo) == 0:
             return
 
         with open(self.refConsensusFa, 'w') as f:
             for cid in _todo:
-                rs = []
-                with ContigSetReaderWrapper(self.refs[cid]) as cs:
-                    rs.extend([r for r in cs])
-                assert len(rs) == 1
-                r = rs[0]
+                r = consensus[cid]
                 f.write(">{0}\n{1}\n".format(r.name.split()[0],
                                              r.sequence))
 
@@ -843,7 +882,8 @@ class IceIterative(IceFiles):
                                     use_sge=False, sge_opts=None, cpus=4)
             runner.run(min_match_len=self.ice_opts.low_cDNA_size,
                        output_dir=output_dir,
-                       sensitive_mode=self.ice_opts.sensitive_mode)
+                       sensitive_mode=self.ice_opts.sensitive_mode,
+                       stream_la4ice=True)
         except RuntimeError:
             use_blasr = True
             saFN = self.refConsensusFa + ".sa"
@@ -902,17 +942,35 @@ class IceIterative(IceFiles):
             self.g2(runner)
             runner.clean_run()
 
+        for cid in _todo:
+            self.consensus_digests[cid] = digests[cid]
+
         time_8 = datetime.now()
         msg = "Total time for calling g/g2 is {t}".format(t=time_8 - time_7)
         self.add_log(msg, level=logging.INFO)
 
+    def _cids_to_rescore(self, consensus, force_calc=False):
+        """
+        Given a dict cid --> consensus FastaRecord, return (cids to
+        re-score, dict cid --> digest of its consensus and self.newids).
+        Unless force_calc, a cluster whose digest is the same as when
+        probs were last calculated against it is not re-scored.
+        """
+        newids_digest = hashlib.md5("\n".join(sorted(self.newids))).hexdigest()
+        digests = dict((cid, (hashlib.md5(r.sequence).hexdigest(), newids_digest))
+                       for cid, r in consensus.iteritems())
+        if force_calc:
+            return set(consensus.keys()), digests
+        return set([cid for cid in consensus if
+                    self.consensus_digests.get(cid) != digests[cid]]), digests
+
     def g2(self, runner):
         """
         like g(), calculates membership prob and update self.d dict
-        by going through the .las.out files
+        by going through the la4ice outputs
         (REMEMBER to pre-clean the self.d)
         """
-        for la4ice_filename in runner.la4ice_filenames:
+        for la4ice_filename in runner.la4ice_outputs:
             for hit in daligner_against_ref(query_dazz_handler=runner.query_dazz_handler,
                                             target_dazz_handler=runner.target_dazz_handler,
                                             la4ice_filename=la4ice_filename,
@@ -923,10 +981,10 @@ class IceIterative(IceFiles):
                                             ece_penalty=self.ece_penalty, ece_min_len=self.ece_min_len,
                                             same_strand_only=True, no_qv_or_aln_checking=False):
                 if hit.qID not in self.d:
-                    self.d[hit.qID] = {}
+                    self.index.reset_probs(hit.qID, {})
                 if hit.fakecigar is not None:
-                    self.d[hit.qID][hit.cID] = self.probQV.calc_prob_from_aln(
-                        hit.qID, hit.qStart, hit.qEnd, hit.fakecigar)
+                    self.index.set_prob(hit.qID, hit.cID, self.probQV.calc_prob_from_aln(
+                        hit.qID, hit.qStart, hit.qEnd, hit.fakecigar))
 
 
     def g(self, output_filename):
@@ -949,11 +1007,11 @@ class IceIterative(IceFiles):
                 ece_min_len=self.ece_min_len):
 
             if hit.qID not in self.d:
-                self.d[hit.qID] = {}
+                self.index.reset_probs(hit.qID, {})
 
             if hit.fakecigar is not None:
-                self.d[hit.qID][hit.cID] = self.probQV.calc_prob_from_aln(
-                    hit.qID, hit.qStart, hit.qEnd, hit.fakecigar)
+                self.index.set_prob(hit.qID, hit.cID, self.probQV.calc_prob_from_aln(
+                    hit.qID, hit.qStart, hit.qEnd, hit.fakecigar))
 
     def run_til_end(self, max_iter=99):
         """
@@ -1040,13 +1098,9 @@ class IceIterative(IceFiles):
         """
         self.changes = set()  # always clean up changes first
         orphan = []
-        qid_to_cid = {}  # qID --> cluster index
-        # make cluster_dict
-        for i, cluster in self.uc.iteritems():
-            for qID in cluster:
-                qid_to_cid[qID] = i
+        qid_to_cid = self.index.qid_to_cid  # qID --> cluster index
 
-        for qID in self.d:
+        for qID in self.d.keys():
             old_i = qid_to_cid[qID]
             x = self.d[qID].items()
             if len(x) == 0:
@@ -1056,7 +1110,7 @@ class IceIterative(IceFiles):
             else:
                 x.sort(key=lambda p: p[1], reverse=True)
                 best_i, best_i_prob = x[0][0], x[0][1]
-                if best_i != qid_to_cid[qID]:
+                if best_i != old_i:
                     # moving assignment from old_i to best_i
                     msg = "best for {0} is {1},{2} (currently: {3}, {4})".\
                         format(qID, best_i, best_i_prob, old_i,
@@ -1064,17 +1118,17 @@ class IceIterative(IceFiles):
                                 else 'None'))
                     self.add_log(msg)
 
-                    # move qID to best_i
-                    self.uc[best_i].append(qID)
-
                     # ToDo: make more flexible
                     # changes were made to from_i and best_i
                     # only re-run gcon if the clusters are small
-                    if len(self.uc[best_i]) < self.rerun_gcon_size:
+                    # (size of best_i includes qID to be moved to it)
+                    if len(self.uc[best_i]) + 1 < self.rerun_gcon_size:
                         self.changes.add(best_i)
                     if len(self.uc[old_i]) < self.rerun_gcon_size:
                         self.changes.add(old_i)
+                    # move qID to best_i
                     self.remove_from_cluster(qID, old_i)
+                    self.add_to_cluster(qID, best_i)
                 else:
                     # --------------------------
                     # singletons always have best prob as it self, so treat
@@ -1094,11 +1148,11 @@ class IceIterative(IceFiles):
                                 format(qID, old_i, best_i)
                             self.add_log(msg)
 
-                            self.uc[best_i].append(qID)
-                            if len(self.uc[best_i]) < self.rerun_gcon_size:
+                            if len(self.uc[best_i]) + 1 < self.rerun_gcon_size:
                                 self.changes.add(best_i)
                             self.changes.add(old_i)
                             self.remove_from_cluster(qID, old_i)
+                            self.add_to_cluster(qID, best_i)
         return orphan
 
     def add_new_batch(self, batch_filename):
@@ -1167,7 +1221,7 @@ class IceIterative(IceFiles):
         with ContigSetReaderWrapper(self.fasta_filename) as cs:
             for r in cs:
                 rid = r.name.split()[0]
-                self.d[rid] = {}
+                self.index.reset_probs(rid, {})
                 self.newids.add(rid)
 
         # adding {new batch} to probQV
@@ -1280,7 +1334,8 @@ class IceIterative(IceFiles):
                 if len(self.d[x]) == 1 and self.d[x].values()[0] == 0:
                     cid = self.d[x].keys()[0]
                     assert len(self.uc[cid]) >= self.rerun_gcon_size
-        except AssertionError:
+            self.index.check_consistency()
+        except (AssertionError, ValueError):
             errMsg = "Cluster sanity check failed!"
             self.add_log(errMsg, level=logging.ERROR)
             raise ValueError(errMsg)
@@ -1371,10 +1426,11 @@ class IceIterative(IceFiles):
             # run this locally
             runner.run(min_match_len=self.ice_opts.low_cDNA_size,
                        output_dir=output_dir,
-                       sensitive_mode=self.ice_opts.sensitive_mode)
+                       sensitive_mode=self.ice_opts.sensitive_mode,
+                       stream_la4ice=True)
 
-            for la4ice_filename in runner.la4ice_filenames:
-                for r in LA4IceReader(la4ice_filename):
+            for la4ice_cmd in runner.la4ice_outputs:
+                for r in LA4IceStreamReader(cmd=la4ice_cmd):
                     r.qID = runner.query_dazz_handler[r.qID]
                     r.sID = runner.query_dazz_handler[r.sID]
                     if possible_merge(r=r, ece_penalty=self.ece_penalty, ece_min_len=self.ece_min_len):
@@ -1424,7 +1480,7 @@ class IceIterative(IceFiles):
             else: # i in old_rec, j is new, add j to k
                 k = self.old_rec[i]
                 self.add_log("case 1: Merging clusters {0} and {1} --> {2}".format(i, j, k))
-                self.uc[k] += self.uc[j]
+                self.index.move_members(j, k)
                 self.delete_cluster(j)
                 self.freeze_d([k])  # k is already in self.changes, and i is already deleted
                 self.old_rec[j] = k
@@ -1433,7 +1489,7 @@ class IceIterative(IceFiles):
             if j in self.old_rec: # i is new, but j is old, add i to k
                 k = self.old_rec[j]
                 self.add_log("case 2: Merging clusters {0} and {1} --> {2}".format(i, j, k))
-                self.uc[k] += self.uc[i]
+                self.index.move_members(i, k)
                 self.delete_cluster(i)
                 self.freeze_d([k])  # k is already in self.changes, and j is already deleted
                 self.old_rec[i] = k
@@ -1441,7 +1497,8 @@ class IceIterative(IceFiles):
             else: # both new, make new k <-- i + j
                 k = self.make_new_cluster()
                 self.add_log("case 3: Merging clusters {0} and {1} --> {2}".format(i, j, k))
-                self.uc[k] = self.uc[i] + self.uc[j]
+                self.index.move_members(i, k)
+                self.index.move_members(j, k)
                 self.delete_cluster(i)
                 self.delete_cluster(j)
                 self.freeze_d([k])
@@ -1535,6 +1592,8 @@ class IceIterative(IceFiles):
         # Write a csv report: line = read cluster
         self.write_report(report_fn=self.report_fn, uc=self.uc)
 
+        self.seq_dict.close()
+
         msg = "IceIterative completed."
         self.add_log(msg, level=logging.INFO)
 
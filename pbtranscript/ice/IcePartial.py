@@ -61,10 +61,12 @@ from pbtranscript.Utils import realpath, touch, real_upath, execute
 from pbtranscript.PBTranscriptOptions import add_fofn_arguments, \
         add_tmp_dir_argument, add_use_blasr_argument
 from pbtranscript.io.ContigSetReaderWrapper import ContigSetReaderWrapper
+from pbtranscript.io.PartialUCIO import write_partial_uc, partial_uc_txt_fn
 from pbtranscript.ice_daligner import DalignerRunner
 from pbtranscript.ice.ProbModel import ProbFromModel, ProbFromQV, ProbFromFastq
 from pbtranscript.ice.IceUtils import blasr_against_ref, \
         daligner_against_ref, ice_fa2fq
+from pbtranscript.ice.IceDoneListener import notify_done
 from pbtranscript.ice.__init__ import ICE_PARTIAL_PY
 
 
@@ -106,7 +108,8 @@ def build_uc_from_partial_daligner(input_fasta, ref_fasta, out_pickle,
                             query_converted=False, target_converted=True,
                             dazz_dir=tmp_dir, script_dir=op.join(output_dir, "script"),
                             use_sge=False, sge_opts=None, cpus=cpus)
-    runner.run(min_match_len=300, output_dir=output_dir, sensitive_mode=ice_opts.sensitive_mode)
+    runner.run(min_match_len=300, output_dir=output_dir, sensitive_mode=ice_opts.sensitive_mode,
+               stream_la4ice=True)
 
     if no_qv_or_aln_checking:
         # not using QVs or alignment checking!
@@ -139,7 +142,7 @@ def build_uc_from_partial_daligner(input_fasta, ref_fasta, out_pickle,
     seen = set()  # reads seen
     logging.info("Building uc from DALIGNER hits.")
 
-    for la4ice_filename in runner.la4ice_filenames:
+    for la4ice_filename in runner.la4ice_outputs:
         start_t = time.time()
         hitItems = daligner_against_ref(query_dazz_handler=runner.query_dazz_handler,
                                         target_dazz_handler=runner.target_dazz_handler,
@@ -177,6 +180,8 @@ def build_uc_from_partial_daligner(input_fasta, ref_fasta, out_pickle,
             f.write(json.dumps({'partial_uc': partial_uc, 'nohit': nohit}))
         else:
             raise IOError("Unrecognized extension: %s" % out_pickle)
+    # partial uc file, which nfl chunks can be merged from by streaming
+    write_partial_uc(partial_uc, nohit, partial_uc_txt_fn(out_pickle))
 
     done_filename = realpath(done_filename) if done_filename is not None \
         else out_pickle + '.DONE'
@@ -276,6 +281,8 @@ def build_uc_from_partial(input_fasta, ref_fasta, out_pickle,
             f.write(json.dumps({'partial_uc': partial_uc, 'nohit': nohit}))
         else:
             raise IOError("Unrecognized extension: %s" % out_pickle)
+    # partial uc file, which nfl chunks can be merged from by streaming
+    write_partial_uc(partial_uc, nohit, partial_uc_txt_fn(out_pickle))
 
     os.remove(m5_file)
 
@@ -296,7 +303,11 @@ class IcePartialOne(object):
     def __init__(self, input_fasta, ref_fasta, out_pickle,
                  ccs_fofn=None,
                  done_filename=None, blasr_nproc=12,
-                 use_blasr=False, tmp_dir=None):
+                 use_blasr=False, tmp_dir=None, notify=None):
+        """
+        notify --- if not None, address (host:port) of a DoneListener
+                   to notify when out_pickle is done.
+        """
         self.input_fasta = input_fasta
         self.ref_fasta = ref_fasta
         self.out_pickle = out_pickle
@@ -305,6 +316,7 @@ class IcePartialOne(object):
         self.blasr_nproc = blasr_nproc
         self.tmp_dir = tmp_dir
         self.use_blasr = use_blasr # True: use blasr, False, use daligner
+        self.notify = notify
 
     def cmd_str(self):
         """Return a cmd string (ice_partial.py one)."""
@@ -315,12 +327,13 @@ class IcePartialOne(object):
                              done_filename=self.done_filename,
                              blasr_nproc=self.blasr_nproc,
                              use_blasr=self.use_blasr,
-                             tmp_dir=self.tmp_dir)
+                             tmp_dir=self.tmp_dir,
+                             notify=self.notify)
 
     def _cmd_str(self, input_fasta, ref_fasta, out_pickle,
                  ccs_fofn=None,
                  done_filename=None, blasr_nproc=12,
-                 use_blasr=False, tmp_dir=None):
+                 use_blasr=False, tmp_dir=None, notify=None):
         """Return a cmd string (ice_partil.py one)"""
         cmd = self.prog + \
               "{f} ".format(f=input_fasta) + \
@@ -336,6 +349,8 @@ class IcePartialOne(object):
             cmd += "--use_blasr "
         if tmp_dir is not None:
             cmd += "--tmp_dir {t} ".format(t=tmp_dir)
+        if notify is not None:
+            cmd += "--notify {n} ".format(n=notify)
         return cmd
 
     def run(self):
@@ -357,6 +372,8 @@ class IcePartialOne(object):
                                   ccs_fofn=self.ccs_fofn,
                                   blasr_nproc=self.blasr_nproc,
                                   tmp_dir=self.tmp_dir)
+        if self.notify is not None:
+            notify_done(self.notify, realpath(self.out_pickle) + '.DONE')
         return 0
 
 
@@ -380,6 +397,9 @@ def add_ice_partial_one_arguments(parser):
     arg_parser.add_argument("--done", dest="done_filename", type=str,
                             help="An empty file generated to indicate that " +
                             "out_pickle is done.")
+    arg_parser.add_argument("--notify", dest="notify", type=str, default=None,
+                            help="Address (host:port) of a process to notify " +
+                            "when out_pickle is done.")
     arg_parser = add_use_blasr_argument(arg_parser)
     arg_parser = add_tmp_dir_argument(arg_parser)
 
@@ -158,19 +158,20 @@ class IceQuiver(IceFiles):
                      level=logging.INFO)
 
         final_consensus_d = FastaRandomReader(self.final_consensus_fa)
-        for ref_id in final_consensus_d.d.keys():
+        cids_set = set(cids)
+        # e.g., ref_id = c103/1/3708, cid = 103,
+        #       refs[cid] = ...tmp/0/c103/g_consensus_ref.fasta
+        ref_ids = [ref_id for ref_id in final_consensus_d.d.keys()
+                   if int(ref_id.split('/')[0].replace('c', '')) in cids_set]
+        for ref_id, r in zip(ref_ids, final_consensus_d.get_many(ref_ids)):
             cid = int(ref_id.split('/')[0].replace('c', ''))
-            # e.g., ref_id = c103/1/3708, cid = 103,
-            #       refs[cid] = ...tmp/0/c103/g_consensus_ref.fasta
-            if cid in cids:
-                mkdir(self.cluster_dir(cid))
-                ref_fa = op.join(self.cluster_dir(cid),
-                                 op.basename(refs[cid]))
-                refs[cid] = ref_fa
-                with FastaWriter(ref_fa) as writer:
-                    self.add_log("Writing ref_fa %s" % refs[cid])
-                    writer.writeRecord(ref_id,
-                                       final_consensus_d[ref_id].sequence[:])
+            mkdir(self.cluster_dir(cid))
+            ref_fa = op.join(self.cluster_dir(cid),
+                             op.basename(refs[cid]))
+            refs[cid] = ref_fa
+            with FastaWriter(ref_fa) as writer:
+                self.add_log("Writing ref_fa %s" % refs[cid])
+                writer.writeRecord(ref_id, r.sequence[:])
 
         self.add_log("Reconstruct of g consensus files completed.",
                      level=logging.INFO)
@@ -19,9 +19,11 @@ from pbtranscript.Utils import realpath, mkdir, execute, \
         FILE_FORMATS, guess_file_format
 from pbtranscript.RunnerUtils import write_cmd_to_script
 from pbtranscript.findECE import findECE
+from pbtranscript.ice.c_eval_aln import eval_aln_columns
 from pbtranscript.io.BasQV import basQVcacher
 from pbtranscript.io import BLASRM5Reader, MetaSubreadFastaReader, \
-        BamCollection, BamWriter, LA4IceReader
+        BamCollection, BamWriter, LA4IceStreamReader, \
+        partial_uc_txt_fn, fresh_partial_uc_txt_fn, merge_partial_ucs
 from pbtranscript.io.ContigSetReaderWrapper import ContigSetReaderWrapper
 from pbtranscript.ice_daligner import DalignerRunner
 from pbtranscript.ice.ProbModel import ProbFromQV, \
@@ -278,6 +280,58 @@ def eval_blasr_alignment(record, qver_get_func, qvmean_get_func,
     return cigar_str, ece
 
 
+def _qv_array(qver_get_func, seqid, qv_name, length):
+    """Return all QVs of seqid as a float64 array. Models which return
+    a single QV for every position (e.g., ProbFromModel) are broadcast
+    to length."""
+    qvs = qver_get_func(seqid, qv_name)
+    if np.isscalar(qvs):
+        return np.full(length, qvs, dtype=np.float64)
+    return np.asarray(qvs, dtype=np.float64)
+
+
+def eval_blasr_alignment_columnar(record, sID_starts_with_c,
+                                  qver_get_func=None):
+    """
+    Same as eval_blasr_alignment, except that all alignment columns are
+    evaluated in one call of c_eval_aln.eval_aln_columns.
+
+    eval_blasr_alignment compares QVs with mean_qv_for_q|s, which are
+    dicts of QV type --> mean QV, and python 2 always orders numbers
+    before dicts, so every QV check passes and every non-match is a
+    penalty, whatever qvmean_get_func and qv_prob_threshold are. QVs
+    therefore do not change cigar or ECE, and are only fetched, as
+    arrays, if qver_get_func is given, to compute error probabilities.
+
+    Returns: cigar string, binary ECE array, and an array of query
+    error probabilities of each alignment column (0 for matches), or
+    None if qver_get_func is None.
+    """
+    if record.qStrand not in ('+', '-'):
+        raise Exception, "Unknown strand type {0}".format(record.qStrand)
+    if record.sStrand not in ('+', '-'):
+        raise Exception, "Unknown strand type {0}".format(record.sStrand)
+
+    no_qvs = np.zeros(0, dtype=np.float64)
+    q_qvs = [no_qvs] * 3
+    if qver_get_func is not None:
+        q_qvs = [_qv_array(qver_get_func, record.qID, qv_name, record.qLength)
+                 for qv_name in ('DeletionQV', 'InsertionQV', 'SubstitutionQV')]
+    # subject QVs would only decide whether QV checks pass, which they
+    # always do (see above)
+    s_qvs = [no_qvs] * 3
+
+    thresholds = np.array([np.inf, np.inf, np.inf], dtype=np.float64)
+    cigar_str, ece, err = eval_aln_columns(
+        record.qAln, record.sAln, record.alnStr,
+        q_qvs[0], q_qvs[1], q_qvs[2],
+        record.qStart, record.qEnd, record.qLength, record.qStrand == '+',
+        s_qvs[0], s_qvs[1], s_qvs[2],
+        record.sStart, record.sEnd, record.sLength, record.sStrand == '+',
+        sID_starts_with_c, thresholds, thresholds)
+    return cigar_str, ece, (err if qver_get_func is not None else None)
+
+
 class HitItem(object):
 
     """
@@ -316,6 +370,10 @@ def blasr_against_ref(output_filename, is_FL, sID_starts_with_c,
     qver_get_func --- should be basQV.basQVcacher.get() or
                       .get_smoothed(), or can just pass in
                       lambda (x, y): 1. to ignore QV
+
+    QVs never change which hits are accepted (see
+    eval_blasr_alignment_columnar), so qver_get_func, qvmean_get_func
+    and qv_prob_threshold are not used.
     """
     with BLASRM5Reader(output_filename) as reader:
         for r in reader:
@@ -353,12 +411,8 @@ def blasr_against_ref(output_filename, is_FL, sID_starts_with_c,
                           (r.qLength - r.qEnd > max_missed_end)):
                 yield HitItem(qID=r.qID, cID=cID)
             else:
-                cigar_str, ece_arr = eval_blasr_alignment(
-                    record=r,
-                    qver_get_func=qver_get_func,
-                    qvmean_get_func=qvmean_get_func,
-                    sID_starts_with_c=sID_starts_with_c,
-                    qv_prob_threshold=qv_prob_threshold)
+                cigar_str, ece_arr, dummy_err = eval_blasr_alignment_columnar(
+                    record=r, sID_starts_with_c=sID_starts_with_c)
 
                 if alignment_has_large_nonmatch(ece_arr,
                                                 ece_penalty, ece_min_len):
@@ -387,12 +441,29 @@ def daligner_against_ref(query_dazz_handler, target_dazz_handler, la4ice_filenam
     Parameters:
       query_dazz_handler - query dazz handler in DalignRunner
       target_dazz_handler - target dazz handler in DalignRunner
-      la4ice_filename - la4ice output of DalignRunner
+      la4ice_filename - la4ice output of DalignRunner, either a file or
+                        an LA4Ice command (a list of args) whose stdout is
+                        streamed, see DalignerRunner.la4ice_outputs
       qver_get_func - returns a list of qvs of (read, qvname)
                       e.g. basQV.basQVcacher.get() or .get_smoothed()
       qvmean_get_func - which returns mean QV of (read, qvname)
+      QVs never change which hits are accepted (see
+      eval_blasr_alignment_columnar), so qver_get_func, qvmean_get_func
+      and qv_prob_threshold are not used.
+
+    Opposite strand hits and full-length hits which miss too many bases
+    are rejected while decoding la4ice output, before their alignments
+    are read.
     """
-    for r in LA4IceReader(la4ice_filename):
+    check_coverage = is_FL and not no_qv_or_aln_checking
+    reader = LA4IceStreamReader(
+        las_out_filename=la4ice_filename if isinstance(la4ice_filename, basestring) else None,
+        cmd=None if isinstance(la4ice_filename, basestring) else la4ice_filename,
+        same_strand_only=same_strand_only,
+        max_missed_start=max_missed_start if check_coverage else None,
+        max_missed_end=max_missed_end if check_coverage else None,
+        keep_aln=not no_qv_or_aln_checking)
+    for r in reader:
         missed_q = r.qStart + r.qLength - r.qEnd
         missed_t = r.sStart + r.sLength - r.sEnd
 
@@ -433,18 +504,12 @@ def daligner_against_ref(query_dazz_handler, target_dazz_handler, la4ice_filenam
             continue
 
         # full-length case: allow up to 200bp of 5' not aligned
-        # and 50bp of 3' not aligned
-        if (is_FL and (r.sStart > max_missed_start or r.qStart > max_missed_start or
-                       (r.sLength - r.sEnd > max_missed_end) or
-                       (r.qLength - r.qEnd > max_missed_end))):
+        # and 50bp of 3' not aligned, rejected by reader (no alignment)
+        if r.alnStr is None:
             yield HitItem(qID=r.qID, cID=cID)
         else:
-            cigar_str, ece_arr = eval_blasr_alignment(
-                record=r,
-                qver_get_func=qver_get_func,
-                sID_starts_with_c=sID_starts_with_c,
-                qv_prob_threshold=qv_prob_threshold,
-                qvmean_get_func=qvmean_get_func)
+            cigar_str, ece_arr, dummy_err = eval_blasr_alignment_columnar(
+                record=r, sID_starts_with_c=sID_starts_with_c)
             #else: # don't use QV, just look at alignment
 
             if alignment_has_large_nonmatch(ece_arr, ece_penalty, ece_min_len):
@@ -823,13 +888,25 @@ def num_reads_in_fasta(in_fa):
 
 
 def combine_nfl_pickles(splitted_pickles, out_pickle):
-    """Combine splitted nfl pickles to a big pickle."""
+    """Combine splitted nfl pickles to a big pickle.
+    If every splitted pickle has a partial uc file next to it (see
+    pbtranscript.io.PartialUCIO), which is not older than the pickle,
+    merge the partial uc files by a k-way merge instead, to a partial
+    uc file next to out_pickle and to out_pickle, without loading all
+    nfl reads to memory.
+    """
     logging.debug("Cominbing {N} nfl pickles: {ps} ".
                   format(N=len(splitted_pickles),
                          ps=",".join(splitted_pickles)) +
                   " into a big pickle {p}.".format(p=out_pickle))
 
-    if len(splitted_pickles) == 1:
+    splitted_txts = [fresh_partial_uc_txt_fn(pf) for pf in splitted_pickles]
+    if all(fn is not None for fn in splitted_txts):
+        logging.debug("Merging partial uc files: %s.", ",".join(splitted_txts))
+        merge_partial_ucs(in_fns=splitted_txts, out_fn=partial_uc_txt_fn(out_pickle),
+                          out_pickle=out_pickle)
+        logging.debug("{f} created.".format(f=out_pickle))
+    elif len(splitted_pickles) == 1:
         logging.debug("Copying the only given pickle to out_pickle.")
         if realpath(splitted_pickles[0]) != realpath(out_pickle):
             shutil.copyfile(splitted_pickles[0], out_pickle)
@@ -42,7 +42,12 @@ Provide functions for clique finding.
 #from networkx import Graph
 import random
 #from bisect import bisect
+from array import array
+from collections import defaultdict
+from multiprocessing import Pool
+import numpy as np
 from scipy import sparse
+from scipy.sparse import csgraph
 import logging
 
 random.seed(0)
@@ -226,3 +231,441 @@ def grasp(S, H, gamma, maxitr, given_starting_node=None):
     return bestQ
 
 
+class CSRGraph(object):
+    """
+    An undirected, unweighted graph of nodes 0..n-1 kept in compressed
+    sparse row arrays (indptr, indices), the neighbors of node i are
+    indices[indptr[i]:indptr[i+1]], sorted. Self loops are dropped.
+    """
+    def __init__(self, indptr, indices):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.n = len(self.indptr) - 1
+        # per node neighbor lists, built on first use
+        self._nbr_lists = None
+        self._nbr_sets = None
+
+    @classmethod
+    def from_edge_arrays(cls, n, src, dst):
+        """Construct from number of nodes and arrays of edge end points,
+        duplicated edges and self loops are dropped."""
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        keep = src != dst
+        rows = np.concatenate([src[keep], dst[keep]])
+        cols = np.concatenate([dst[keep], src[keep]])
+        H = sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)),
+                              shape=(n, n))
+        H.sum_duplicates()
+        return cls(H.indptr, H.indices)
+
+    @classmethod
+    def from_edges(cls, n, edges):
+        """Construct from number of nodes and an iterable of (i, j)."""
+        src, dst = array('l'), array('l')
+        for i, j in edges:
+            src.append(i)
+            dst.append(j)
+        return cls.from_edge_arrays(n, src, dst)
+
+    @classmethod
+    def from_sparse(cls, H):
+        """Construct from a symmetric scipy sparse adjacency matrix."""
+        H = sparse.csr_matrix(H)
+        H.setdiag(0)
+        H.eliminate_zeros()
+        H.sort_indices()
+        return cls(H.indptr, H.indices)
+
+    def to_sparse(self):
+        """Return adjacency as a scipy csr_matrix."""
+        return sparse.csr_matrix((np.ones(len(self.indices), dtype=np.int8),
+                                  self.indices, self.indptr),
+                                 shape=(self.n, self.n))
+
+    @property
+    def _nbrs(self):
+        """List of sorted neighbor lists of all nodes."""
+        if self._nbr_lists is None:
+            ptr = self.indptr.tolist()
+            flat = self.indices.tolist()
+            self._nbr_lists = [flat[ptr[i]:ptr[i+1]] for i in xrange(self.n)]
+            self._nbr_sets = [None] * self.n
+        return self._nbr_lists
+
+    def neighbors(self, i):
+        """Return sorted list of neighbors of node i."""
+        return self._nbrs[i]
+
+    def neighbor_set(self, i):
+        """Return neighbors of node i as a set, cached."""
+        nbrs = self._nbrs[i]
+        if self._nbr_sets[i] is None:
+            self._nbr_sets[i] = frozenset(nbrs)
+        return self._nbr_sets[i]
+
+    def degree(self, i):
+        """Return degree of node i."""
+        return int(self.indptr[i+1] - self.indptr[i])
+
+    def degrees(self):
+        """Return degrees of all nodes as a numpy array."""
+        return np.diff(self.indptr)
+
+    def __len__(self):
+        return self.n
+
+
+class GraphBuilder(object):
+    """
+    Collect edges between hashable node names (e.g., read ids) in
+    compact arrays, and convert them to a CSRGraph.
+    """
+    def __init__(self):
+        self.nodes = []  # node index --> node name
+        self.node_index = {}  # node name --> node index
+        self.src = array('l')
+        self.dst = array('l')
+
+    def add_node(self, name):
+        """Add a node if not exists, return its index."""
+        i = self.node_index.get(name)
+        if i is None:
+            i = len(self.nodes)
+            self.node_index[name] = i
+            self.nodes.append(name)
+        return i
+
+    def add_edge(self, a, b):
+        """Add an undirected edge between nodes a and b."""
+        self.src.append(self.add_node(a))
+        self.dst.append(self.add_node(b))
+
+    def number_of_edges(self):
+        """Return number of edges added, including duplicates."""
+        return len(self.src)
+
+    def to_csr(self):
+        """Return a CSRGraph, node i of which is self.nodes[i]."""
+        return CSRGraph.from_edge_arrays(len(self.nodes), self.src, self.dst)
+
+
+def convert_graph_connectivity_to_csr(G, nodes):
+    """
+    Given a networkx graph, return its adjacency as a CSRGraph,
+    node i of which is nodes[i].
+    """
+    nodes_to_index = dict((node, i) for i, node in enumerate(nodes))
+    return CSRGraph.from_edges(len(nodes),
+                               ((nodes_to_index[e[0]], nodes_to_index[e[1]])
+                                for e in G.edges()))
+
+
+def _is_active(active, i):
+    """Return True if node i is in the active node set."""
+    return active is None or i in active
+
+
+def _count_neighbors_in(g, Q, active):
+    """Return dict node --> number of its neighbors in Q."""
+    cnt = defaultdict(int)
+    for q in Q:
+        for w in g.neighbors(q):
+            if _is_active(active, w):
+                cnt[w] += 1
+    return cnt
+
+
+def construct_csr(g, alpha, starting_node, rng, active=None):
+    """
+    Same as construct(), on CSRGraph g. Degrees of candidates within
+    the candidate set are kept in counters and decreased when
+    candidates are dropped, instead of being recomputed.
+    """
+    Q = [starting_node]
+    # candidates = direct neighbors of <starting_node>
+    C = [c for c in g.neighbors(starting_node) if _is_active(active, c)]
+    in_C = set(C)
+    deg_in_C = {}
+    for c in C:
+        deg_in_C[c] = sum(1 for w in g.neighbors(c) if w in in_C)
+
+    while len(C) > 0:
+        degs_of_C = [deg_in_C[c] for c in C]
+        min_deg_C = min(degs_of_C)
+        max_deg_C = max(degs_of_C)
+        RCL_threshold = min_deg_C + alpha*(max_deg_C - min_deg_C)
+        RCL = [i for i in xrange(len(C)) if degs_of_C[i] >= RCL_threshold]
+        if len(RCL) == 0:
+            logging.debug("NO FITTING RCLS")
+            break
+        u = C[rng.choice(RCL)]
+        logging.debug("picking {u}".format(u=u))
+
+        Q.append(u)
+        nbrs_u = g.neighbor_set(u)
+        removed = [c for c in C if c not in nbrs_u]
+        C = [c for c in C if c in nbrs_u] # update list of candidates
+        in_C.difference_update(removed)
+        for r in removed:
+            for w in g.neighbors(r):
+                if w in in_C:
+                    deg_in_C[w] -= 1
+    return Q
+
+
+def _min_degree_after_exchange(g, Q, inQ, ww, a, b):
+    """
+    Return min degree of the subgraph induced by Q - {Q[ww]} + {a, b},
+    where inQ[x] is the number of neighbors of x in Q.
+    """
+    removed = Q[ww]
+    new_nodes = Q[:ww] + Q[ww+1:] + [a, b]
+    min_deg = None
+    for m in new_nodes:
+        nbrs_m = g.neighbor_set(m)
+        deg = inQ.get(m, 0) - (removed in nbrs_m) + (a in nbrs_m) + (b in nbrs_m)
+        if min_deg is None or deg < min_deg:
+            min_deg = deg
+    return min_deg
+
+
+def local_csr(g, Q, gamma, rng, active=None):
+    """
+    Same as local(), on CSRGraph g. Only nodes adjacent to Q are
+    considered as candidates, and the number of common Q-neighbors of
+    candidate pairs is counted through Q rather than by a matrix product.
+    """
+    len_Q = len(Q)
+    inQ = _count_neighbors_in(g, Q, active)
+    gamma_threshold = gamma*len_Q
+    logging.debug("gamma threshold is {t}".format(t=gamma_threshold))
+    Q_pos = dict((q, i) for i, q in enumerate(Q))
+    cand = sorted(i for i, k in inQ.iteritems()
+                  if k >= gamma_threshold and i not in Q_pos)
+    logging.debug("there are {0} candidates...".format(len(cand)))
+    len_cand = len(cand)
+    if len_cand < 2:
+        return False
+
+    # positions in Q adjacent to each candidate, and vice versa
+    cand_Q = [[Q_pos[w] for w in g.neighbors(c) if w in Q_pos] for c in cand]
+    Q_cand = [[] for dummy_i in xrange(len_Q)]
+    for k, ps in enumerate(cand_Q):
+        for p in ps:
+            Q_cand[p].append(k)
+
+    Q_index_set = set(xrange(len_Q))
+    choices = range(len_cand)
+    rng.shuffle(choices)
+
+    for v in choices:
+        common = defaultdict(int)
+        for p in cand_Q[v]:
+            for k in Q_cand[p]:
+                if k != v:
+                    common[k] += 1
+        max_common = max(common.itervalues()) if len(common) > 0 else 0
+        if max_common >= gamma_threshold:
+            # (2,1)-exchange: add cand[u] and cand[v], remove Q[ww]
+            u = min(k for k, c in common.iteritems() if c == max_common)
+            for ww in sorted(Q_index_set.difference(cand_Q[v])):
+                if _min_degree_after_exchange(g, Q, inQ, ww, cand[u], cand[v]) \
+                        >= gamma*(len_Q+1):
+                    Q.pop(ww)
+                    Q += [cand[u], cand[v]]
+                    logging.debug("new list has size {0}".format(len(Q)))
+                    return True
+        else: logging.debug("y[v,u] not high enough")
+    return False
+
+
+def local_extra_csr(g, Q, gamma, rng, active=None):
+    """Same as local_extra(), on CSRGraph g."""
+    len_Q = len(Q)
+    inQ = _count_neighbors_in(g, Q, active)
+    gamma_threshold = gamma*(len_Q+1)
+    in_Q = set(Q)
+    cand = sorted(i for i, k in inQ.iteritems()
+                  if k >= gamma_threshold and i not in in_Q)
+    rng.shuffle(cand)
+    while len(cand) > 0:
+        x = cand.pop()
+        nbrs_x = g.neighbor_set(x)
+        if inQ[x] >= gamma_threshold and \
+           all(inQ[m] + (m in nbrs_x) >= gamma_threshold for m in Q):
+            logging.debug("local extra was able to add in another node {0}!"
+                .format(x))
+            Q.append(x)
+            in_Q.add(x)
+            for w in g.neighbors(x):
+                if _is_active(active, w):
+                    inQ[w] += 1
+            len_Q += 1
+            gamma_threshold = gamma*(len_Q+1)
+    return False
+
+
+def grasp_csr(g, gamma, maxitr, given_starting_node=None, rng=None,
+              active=None):
+    """
+    Grasp cliques on CSRGraph g, same as grasp() but time of each
+    iteration scales with the number of edges around the clique
+    rather than with the number of nodes squared.
+
+    rng --- a random.Random instance; random.Random(0) if None.
+    active --- if not None, a set of nodes, search is restricted to the
+               subgraph induced by them (e.g., neighborhood of a node).
+    """
+    if rng is None:
+        rng = random.Random(0)
+
+    bestQ = []
+    # pick a starting node unless given
+    if given_starting_node is None:
+        nodes = xrange(g.n) if active is None else sorted(active)
+        x = [i for i in nodes
+             if any(_is_active(active, w) for w in g.neighbors(i))]
+        if len(x) == 0:
+            return []
+        rng.shuffle(x)
+        starting_node = x.pop()
+    else:
+        starting_node = given_starting_node
+
+    for _k in xrange(maxitr):
+        # randomly pick alpha uniformly from [0.1,0.9]
+        alpha = rng.uniform(0.1, 0.9)
+        logging.debug("picked starting node {0} with alpha {1}".
+            format(starting_node, alpha))
+        Q = construct_csr(g, alpha, starting_node, rng, active)
+        if len(Q) <= 1:
+            # no valid local exchange can be done...just give up this round
+            if given_starting_node is None and len(x) > 0:
+                starting_node = x.pop()
+                continue
+            else:
+                return []
+        logging.debug("before local exchange, size is {0}".format(len(Q)))
+        while local_csr(g, Q, gamma, rng, active):
+            pass
+        local_extra_csr(g, Q, gamma, rng, active)
+        logging.debug("max clique with {0} as starting node has size {1}".
+            format(starting_node, len(Q)))
+        if len(Q) > len(bestQ):
+            bestQ = list(Q)
+
+    return bestQ
+
+
+def find_cliques_csr(g, gamma=0.8, maxitr=5, rng=None):
+    """
+    Partition CSRGraph g into mutually exclusive quasi-cliques.
+    Nodes are visited by degree descendingly (ties by index), each
+    not yet used node seeds a grasp_csr search in its neighborhood of
+    unused nodes, and the clique found is removed from the graph.
+
+    Return a list of (seed node, clique nodes), in the order found.
+    Nodes not in any clique are not reported.
+    """
+    if rng is None:
+        rng = random.Random(0)
+    degs = g.degrees()
+    order = np.lexsort((np.arange(g.n), -degs))
+    unused = set(xrange(g.n))
+    cliques = []
+    for node in order.tolist():
+        if node not in unused:
+            continue
+        active = set(w for w in g.neighbors(node) if w in unused)
+        if len(active) == 0:
+            continue
+        active.add(node)
+        tQ = grasp_csr(g, gamma=gamma, maxitr=maxitr,
+                       given_starting_node=node, rng=rng, active=active)
+        if len(tQ) > 0:
+            cliques.append((node, tQ))
+            unused.difference_update(tQ)
+    return cliques
+
+
+def _find_cliques_in_components(args):
+    """
+    Worker of partition_into_cliques. Find cliques in each component of
+    a list of (global node ids, indptr, indices), where indptr and indices
+    are the CSR adjacency of the component in local node indices.
+    Return a list of (global seed id, global clique node ids).
+    """
+    components, gamma, maxitr = args
+    ret = []
+    for node_ids, indptr, indices in components:
+        g = CSRGraph(indptr, indices)
+        # seed by the smallest node id, so cliques found do not depend
+        # on how components are spread across workers
+        rng = random.Random(int(node_ids[0]))
+        ids = node_ids.tolist()
+        for seed, tQ in find_cliques_csr(g, gamma=gamma, maxitr=maxitr, rng=rng):
+            ret.append((ids[seed], [ids[i] for i in tQ]))
+    return ret
+
+
+def _split_components(g, max_nodes_per_task):
+    """
+    Split CSRGraph g into connected components of >= 2 nodes, packed in
+    tasks of about max_nodes_per_task nodes, largest components first.
+    Each component is (global node ids, local indptr, local indices).
+    """
+    dummy_n, labels = csgraph.connected_components(g.to_sparse(), directed=False)
+    sizes = np.bincount(labels)
+    # permute nodes so that each component is a contiguous block,
+    # nodes of a component are ascending
+    perm = np.argsort(labels, kind='mergesort')
+    P = g.to_sparse()[perm][:, perm].tocsr()
+    P.sort_indices()
+    bounds = np.concatenate([[0], np.cumsum(sizes)])
+
+    comps = [c for c in np.argsort(-sizes, kind='mergesort').tolist()
+             if sizes[c] >= 2]
+    tasks, task, n_task = [], [], 0
+    for c in comps:
+        start, end = bounds[c], bounds[c+1]
+        indptr = P.indptr[start:end+1]
+        indices = P.indices[indptr[0]:indptr[-1]] - start
+        task.append((perm[start:end], indptr - indptr[0], indices))
+        n_task += end - start
+        if n_task >= max_nodes_per_task:
+            tasks.append(task)
+            task, n_task = [], 0
+    if len(task) > 0:
+        tasks.append(task)
+    return tasks
+
+
+def partition_into_cliques(g, gamma=0.8, maxitr=5, nproc=1,
+                           max_nodes_per_task=5000):
+    """
+    Partition CSRGraph g into mutually exclusive quasi-cliques, same as
+    find_cliques_csr, but connected components are processed
+    independently, by nproc worker processes if nproc > 1.
+
+    Return a list of cliques (lists of nodes), ordered by degree of
+    their seed nodes descendingly (ties by seed node index), which is
+    the order find_cliques_csr would find them on the whole graph.
+    Nodes not in any clique are not reported.
+    """
+    tasks = _split_components(g, max_nodes_per_task)
+    args = [(task, gamma, maxitr) for task in tasks]
+    if nproc > 1 and len(tasks) > 1:
+        pool = Pool(processes=min(nproc, len(tasks)))
+        try:
+            results = pool.map(_find_cliques_in_components, args, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_find_cliques_in_components(arg) for arg in args]
+
+    degs = g.degrees()
+    found = [x for r in results for x in r]
+    found.sort(key=lambda x: (-degs[x[0]], x[0]))
+    return [tQ for dummy_seed, tQ in found]
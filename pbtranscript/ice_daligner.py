@@ -71,6 +71,7 @@ class DalignerRunner(object):
         self.dazz_dir = dazz_dir
         self.script_dir = realpath(script_dir)
         self.output_dir = ""
+        self.stream_la4ice = False
 
         self.query_dazz_handler = DazzIDHandler(self.query_filename,
                                                 converted=query_converted,
@@ -207,19 +208,23 @@ class DalignerRunner(object):
         return [op.join(self.script_dir, "daligner_{i}_{j}.sh".format(i=i, j=j))
                 for i, j in self._iter_i_j()]
 
+    def la4ice_args(self, i, j, k, is_forward, output_dir):
+        """Return a la4ice command for query block i, target block j,
+        thread k as a list of args, which prints alignments to stdout."""
+        args = ["LA4Ice", "-a", "-m", "-i0", "-w100000", "-b0"]
+        if self.is_FL:
+            args.append("-E")
+        return args + [self.query_dazz_handler.dazz_filename,
+                       self.target_dazz_handler.dazz_filename,
+                       self.las_filename(i=i, j=j, k=k, is_forward=is_forward,
+                                         output_dir=output_dir)]
+
     def la4ice_cmd(self, i, j, k, is_forward, output_dir):
         """Return a la4ice command for query block i, target block j."""
-        prog = "LA4Ice"
-        params = "-a -m -i0 -w100000 -b0 "
-        if self.is_FL:
-            params += "-E"
-        return " ".join([prog, params, self.query_dazz_handler.dazz_filename,
-                         self.target_dazz_handler.dazz_filename,
-                         self.las_filename(i=i, j=j, k=k, is_forward=is_forward,
-                                           output_dir=output_dir),
-                         ">",
-                         self.la4ice_filename(i=i, j=j, k=k, is_forward=is_forward,
-                                              output_dir=output_dir)])
+        return " ".join(self.la4ice_args(i=i, j=j, k=k, is_forward=is_forward,
+                                         output_dir=output_dir) +
+                        [">", self.la4ice_filename(i=i, j=j, k=k, is_forward=is_forward,
+                                                   output_dir=output_dir)])
 
     def _la4ice_cmds(self, is_forward, output_dir):
         """Return a list of la4ice commands showing either forward only or
@@ -236,6 +241,22 @@ class DalignerRunner(object):
             ret.extend(self._la4ice_cmds(is_forward=False, output_dir=self.output_dir))
         return ret
 
+    @property
+    def la4ice_outputs(self):
+        """Return la4ice outputs to read with daligner_against_ref or
+        LA4IceStreamReader: la4ice output files if LA4Ice jobs have been
+        run, otherwise la4ice commands as lists of args, whose stdout
+        should be streamed."""
+        if not self.stream_la4ice:
+            return self.la4ice_filenames
+        ret = [self.la4ice_args(i=i, j=j, k=k, is_forward=True, output_dir=self.output_dir)
+               for i, j, k in self._iter_i_j_k()]
+        if not self.same_strand_only:
+            ret.extend([self.la4ice_args(i=i, j=j, k=k, is_forward=False,
+                                         output_dir=self.output_dir)
+                        for i, j, k in self._iter_i_j_k()])
+        return ret
+
     @property
     def la4ice_scripts(self):
         """Return la4ice scripts."""
@@ -281,11 +302,16 @@ class DalignerRunner(object):
         """Return script_dir/la4ice_job_{i}.sh"""
         return op.join(self.script_dir, "LA4Ice_job_{i}.sh".format(i=i))
 
-    def run(self, output_dir='.', min_match_len=300, sensitive_mode=False):
+    def run(self, output_dir='.', min_match_len=300, sensitive_mode=False,
+            stream_la4ice=False):
         """
         if self.use_sge --- writes to <scripts>/daligner_job_#.sh
         else --- run locally, dividing into self.cpus/4 tasks (capped max at 4)
 
+        if stream_la4ice --- only run daligner jobs, LA4Ice commands in
+        self.la4ice_outputs are run later when their outputs are read,
+        so that no *.las.out files are written.
+
         NOTE 1: when using SGE, be careful that multiple calls to this might
         end up writing to the SAME job.sh files, this should be avoided by
         changing <scripts> directory
@@ -299,6 +325,7 @@ class DalignerRunner(object):
         is parallelized 4X
         """
         self.output_dir = realpath(output_dir) # Reset output_dir
+        self.stream_la4ice = stream_la4ice
         old_dir = realpath(op.curdir)
         mkdir(output_dir)
         os.chdir(output_dir)
@@ -337,6 +364,10 @@ class DalignerRunner(object):
         logging.info("daligner jobs took " + str(time.time()-start_t) + " sec.")
 
         # (b) run all LA4Ice jobs
+        if stream_la4ice:
+            os.chdir(old_dir)
+            return self._check_failed(failed)
+
         start_t = time.time()
         logging.info("Start LA4Ice cmds " +
                      ("using sge." if self.use_sge else "locally."))
@@ -359,7 +390,10 @@ class DalignerRunner(object):
                                  num_threads=max(1, min(self.cpus, 4))))
         logging.info("LA4Ice jobs took " + str(time.time()-start_t) + " sec.")
         os.chdir(old_dir)
+        return self._check_failed(failed)
 
+    def _check_failed(self, failed):
+        """Return 0 if no job failed, otherwise raise RuntimeError."""
         if len(failed) == 0:
             return 0
         else:
@@ -372,8 +406,9 @@ class DalignerRunner(object):
         fs = self._las_filenames(is_forward=True, output_dir=self.output_dir, switch_query_target=False) + \
              self._las_filenames(is_forward=False, output_dir=self.output_dir, switch_query_target=False) + \
              self._las_filenames(is_forward=True, output_dir=self.output_dir, switch_query_target=True) + \
-             self._las_filenames(is_forward=False, output_dir=self.output_dir, switch_query_target=True) + \
-             self.la4ice_filenames
+             self._las_filenames(is_forward=False, output_dir=self.output_dir, switch_query_target=True)
+        if not self.stream_la4ice:  # no la4ice output files when streamed
+            fs += self.la4ice_filenames
         for f in set(fs):
             os.remove(f)
 
@@ -180,7 +180,8 @@ class IcePartialRunner(PBMultiToolRunner):
                                     ccs_fofn=args.ccs_fofn,
                                     done_filename=args.done_filename,
                                     blasr_nproc=args.blasr_nproc,
-                                    tmp_dir=args.tmp_dir)
+                                    tmp_dir=args.tmp_dir,
+                                    notify=args.notify)
             elif cmd == "split":
                 obj = IcePartialSplit(root_dir=args.root_dir,
                                       nfl_fa=args.nfl_fa,
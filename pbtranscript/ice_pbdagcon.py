@@ -48,25 +48,28 @@ import numpy as np
 from pbcore.io import FastaReader
 from pbcore.util.Process import backticks
 from pbtranscript.io import FastaRandomReader
+from pbtranscript.ice.c_align import KmerIndex, banded_local_align
 from pbtranscript.__init__ import get_version
 
 __author__ = 'etseng@pacificbiosciences.com'
 
+# Clusters of at most this many reads are aligned in process,
+# see choose_template_in_process and make_aln_input_to_ref_in_process.
+MAX_INPROCESS_READS = 20
+
+
 class AlignGraphUtilError(Exception):
     """Align Group Util Error Class"""
     pass
 
 
-def choose_template_by_blasr(fasta_filename, out_filename, nproc=8,
-                             maxScore=-1000, min_number_reads=1):
+def _read_identities_by_blasr(fasta_filename, out_filename, nproc=8,
+                              maxScore=-1000):
     """
-    Choose the best template for gcon reference
-    Pick the one that has the highest average hit identity to others
-
-    Returns: FastaRecord of selected ref
+    Align reads in fasta_filename to each other by blasr, return
+    {read id: [identities of its hits to other reads]}, or None if
+    blasr failed.
     """
-    fd = FastaRandomReader(fasta_filename)
-
     cmd = "blasr --nproc {nproc} ".format(nproc=nproc) + \
           "--maxScore {score} ".format(score=maxScore) + \
           "--maxLCPLength 15 --bestn 10 --nCandidates 50 " + \
@@ -95,7 +98,38 @@ def choose_template_by_blasr(fasta_filename, out_filename, nproc=8,
             if raw[2] != raw[3]:
                 continue  # has to be on same strand
             scores[qID].append(float(raw[5]))  # use identity as the scorer
+    return scores
+
+
+def _read_identities_in_process(reads, maxScore=-1000, bestn=10):
+    """
+    Align reads, a list of (read id, sequence), to each other in
+    process, return {read id: [identities of its hits to other reads]}.
+    Like blasr --bestn 10, which counts the self hit, keep at most
+    bestn - 1 best hits of each read, with score <= maxScore.
+    """
+    indices = [KmerIndex(seq) for dummy_id, seq in reads]
+    scores = defaultdict(lambda: [])
+    for i, (qID, qseq) in enumerate(reads):
+        hits = []
+        for j, index in enumerate(indices):
+            if i == j:
+                continue  # self-hit, ignore
+            aln = align_in_process(qseq, index)
+            if aln is not None and -aln[0] <= maxScore:
+                hits.append((aln[0], aln_identity(aln)))
+        hits.sort(reverse=True)
+        for dummy_score, identity in hits[:bestn - 1]:
+            scores[qID].append(identity)
+    return scores
+
 
+def _pick_template(scores, fd, min_number_reads=1):
+    """
+    Given {read id: [identities]}, return id of the read that has the
+    highest average hit identity to others, raise AlignGraphUtilError
+    if less than min_number_reads reads have hits.
+    """
     # find the one with the highest average alignment similarity
     score_array = []
     for k, v in scores.iteritems():
@@ -119,8 +153,63 @@ def choose_template_by_blasr(fasta_filename, out_filename, nproc=8,
         if _len > best_len:
             best_id = _id
             best_len = _len
+    return best_id
+
+
+def choose_template_by_blasr(fasta_filename, out_filename, nproc=8,
+                             maxScore=-1000, min_number_reads=1):
+    """
+    Choose the best template for gcon reference
+    Pick the one that has the highest average hit identity to others
+
+    Returns: FastaRecord of selected ref
+    """
+    scores = _read_identities_by_blasr(fasta_filename=fasta_filename,
+                                       out_filename=out_filename,
+                                       nproc=nproc, maxScore=maxScore)
+    if scores is None:
+        return None
+    with FastaRandomReader(fasta_filename) as fd:
+        return fd[_pick_template(scores, fd, min_number_reads)]
+
+
+def choose_template_in_process(fasta_filename, maxScore=-1000,
+                               min_number_reads=1):
+    """
+    Same as choose_template_by_blasr, except that reads are aligned
+    to each other in process, which is faster for small clusters.
+
+    Returns: FastaRecord of selected ref
+    """
+    scores = _read_identities_in_process(_read_fasta(fasta_filename),
+                                         maxScore=maxScore)
+    with FastaRandomReader(fasta_filename) as fd:
+        return fd[_pick_template(scores, fd, min_number_reads)]
+
+
+def _read_fasta(fasta_filename):
+    """Return reads in fasta_filename as a list of (read id, sequence)."""
+    with FastaReader(fasta_filename) as reader:
+        return [(r.name.split()[0], r.sequence.upper()) for r in reader]
+
+
+def align_in_process(query, target_index):
+    """
+    Align query to the target of a c_align.KmerIndex, return a tuple
+    (score, qStart, qEnd, tStart, tEnd, nMatch, nMismatch, nIns, nDel,
+     qAlignedSeq, matchPattern, tAlignedSeq), or None if no alignment.
+    Score is the negative of blasr score.
+    """
+    band = target_index.diagonal_range(query)
+    if band is None:
+        return None
+    return banded_local_align(query, target_index.seq, band[0], band[1])
+
 
-    return fd[best_id]
+def aln_identity(aln):
+    """Return percent identity of an alignment of align_in_process."""
+    n_match, n_mismatch, n_ins, n_del = aln[5:9]
+    return 100. * n_match / (n_match + n_mismatch + n_ins + n_del)
 
 
 def make_aln_input_to_ref(fasta_filename, ref_filename,
@@ -163,31 +252,77 @@ def make_aln_input_to_ref(fasta_filename, ref_filename,
     os.remove(tmp_out)
 
 
+def make_aln_input_to_ref_in_process(fasta_filename, ref_filename,
+                                     out_filename):
+    """
+    Same as make_aln_input_to_ref, except that reads are aligned to ref
+    in process, which is faster for small clusters. Only alignments on
+    the same strand are made, the opposite strand ones are trimmed away
+    by make_aln_input_to_ref anyway.
+    """
+    tID, tseq = _read_fasta(ref_filename)[0]
+    index = KmerIndex(tseq)
+    with open(out_filename, 'w') as f:
+        for qID, qseq in _read_fasta(fasta_filename):
+            if qID == tID:
+                continue  # self-hit
+            aln = align_in_process(qseq, index)
+            if aln is None:
+                continue
+            (score, qStart, qEnd, tStart, tEnd, n_match, n_mismatch,
+             n_ins, n_del, q_aln, pattern, t_aln) = aln
+            # blasr -m 5 output format:
+            # (0) qName (1) qLength (2) qStart (3) qEnd (4) qStrand
+            # (5) tName (6) tLength (7) tStart (8) tEnd (9) tStrand
+            # (10) score (11) numMatch (12) numMismatch (13) numIns
+            # (14) numDel (15) mapQV (16) qAlignedSeq (17) matchPattern
+            # (18) tAlignedSeq
+            f.write(" ".join(str(x) for x in [
+                qID, len(qseq), qStart, qEnd, '+',
+                tID, len(tseq), tStart, tEnd, '+',
+                -score, n_match, n_mismatch, n_ins, n_del, 254,
+                q_aln, pattern, t_aln]) + "\n")
+
+
 def pbdagcon_wrapper(fasta_filename, output_prefix,
                      consensus_name, nproc=8,
-                     maxScore=-1000, min_seq_len=300):
+                     maxScore=-1000, min_seq_len=300,
+                     max_inprocess_reads=MAX_INPROCESS_READS):
     """
     (1) Find the best seed as reference
     (2) Align rest to seed
     (3) Call pbdagcon
+    (1) and (2) are done in process instead of by blasr if there are
+    at most max_inprocess_reads reads.
     """
     ref_filename = output_prefix + '_ref.fasta'
+    with FastaReader(fasta_filename) as reader:
+        in_process = sum(1 for dummy_r in reader) <= max_inprocess_reads
     try:
-        out_filename_m1 = output_prefix + ".saln.m1"
-        ref = choose_template_by_blasr(fasta_filename=fasta_filename,
-                                       out_filename=out_filename_m1,
-                                       nproc=nproc, maxScore=maxScore)
-        os.remove(out_filename_m1)
+        if in_process:
+            ref = choose_template_in_process(fasta_filename=fasta_filename,
+                                             maxScore=maxScore)
+        else:
+            out_filename_m1 = output_prefix + ".saln.m1"
+            ref = choose_template_by_blasr(fasta_filename=fasta_filename,
+                                           out_filename=out_filename_m1,
+                                           nproc=nproc, maxScore=maxScore)
+            os.remove(out_filename_m1)
 
         with open(ref_filename, 'w') as f:
             f.write(">{0}\n{1}\n".format(consensus_name, ref.sequence))
 
         # create alignment file
         aln_filename = output_prefix + '.saln'
-        make_aln_input_to_ref(fasta_filename=fasta_filename,
-                              ref_filename=ref_filename,
-                              out_filename=aln_filename,
-                              nproc=nproc)
+        if in_process:
+            make_aln_input_to_ref_in_process(fasta_filename=fasta_filename,
+                                             ref_filename=ref_filename,
+                                             out_filename=aln_filename)
+        else:
+            make_aln_input_to_ref(fasta_filename=fasta_filename,
+                                  ref_filename=ref_filename,
+                                  out_filename=aln_filename,
+                                  nproc=nproc)
 
         cons_filename = output_prefix + '.fasta'
         tmp_cons_filename = output_prefix + '.fasta.tmp'
@@ -235,6 +370,10 @@ def set_parser():
                         help="Number of processes")
     parser.add_argument("--maxScore", default=-1000, type=int,
                         help="blasr maxScore")
+    parser.add_argument("--max_inprocess_reads", default=MAX_INPROCESS_READS,
+                        type=int,
+                        help="Align reads in process instead of by blasr " +
+                             "if there are at most this many reads")
     parser.add_argument("--version", "-v",
                         action='version', version='%(prog)s ' + get_version())
     return parser
@@ -262,7 +401,8 @@ def runConsensus(args_list_str):
     return pbdagcon_wrapper(fasta_filename=args.input_fasta,
                             output_prefix=args.output_prefix,
                             consensus_name=args.consensus_id,
-                            nproc=args.nproc, maxScore=args.maxScore)
+                            nproc=args.nproc, maxScore=args.maxScore,
+                            max_inprocess_reads=args.max_inprocess_reads)
 
 
 if __name__ == "__main__":
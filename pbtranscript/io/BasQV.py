@@ -40,8 +40,11 @@ Read and cache quality value from Base/CCS.H5 files.
 """
 
 import os
+import shutil
 import logging
+import tempfile
 from collections import defaultdict
+import numpy as np
 from pbcore.io import FastqReader, ConsensusReadSet
 import pbtranscript.io.c_basQV as c_basQV
 
@@ -196,6 +199,17 @@ class basQVcacher(object):
         # for CCS ex:
         # m120407_063017_4.../13/300_10_CCS
 
+        for bas_file, seqids in self.group_seqids_by_bas_file(seqids).iteritems():
+            c_basQV.precache_helper(bas_file, seqids,
+                                    basQVcacher.qv_names, self.qv)
+
+        self.make_qv_mean(seqids)
+
+    def group_seqids_by_bas_file(self, seqids):
+        """
+        Sort seqids by movie and hole number (in place), and return
+        a dict of bas file --> list of seqids belonging to that bas file.
+        """
         # sort seqids by movie to save time
         seqids.sort(key=lambda x: (x.split('/')[0], int(x.split('/')[1])))
 
@@ -213,12 +227,7 @@ class basQVcacher(object):
             except KeyError:
                 raise IOError("Could not read {s} from input bas/ccs fofn.".
                               format(s=seqid))
-
-        for bas_file, seqids in bas_job_dict.iteritems():
-            c_basQV.precache_helper(bas_file, seqids,
-                                    basQVcacher.qv_names, self.qv)
-
-        self.make_qv_mean(seqids)
+        return bas_job_dict
 
     def presmooth(self, seqids, window_size):
         """
@@ -332,3 +341,224 @@ class fastqQVcacher(object):
                 del self.qv[k]['unsmoothed']
             except KeyError:
                 pass # may have already been deleted. OK.
+
+
+class QVStore(object):
+
+    """
+    Pack quality values (transformed to probabilities) of many reads
+    into contiguous float64 arrays on disk, one file per QV track, and
+    serve them as zero-copy views of memory maps.
+
+    Every read occupies the same [start, end) range in all tracks.
+    For each qv_name, both the unsmoothed track and the smoothed track
+    (c_basQV.maxval_per_window with window_size) are stored, so
+    get() and get_smoothed() never copy QVs into python lists.
+
+    Space of removed reads is not reclaimed, only their index entries.
+    """
+
+    def __init__(self, qv_names, window_size, out_dir=None):
+        self.qv_names = list(qv_names)
+        self.window_size = window_size
+        self.tracks = self.qv_names + [n + '_smoothed' for n in self.qv_names]
+
+        self._own_dir = out_dir is None
+        if out_dir is None:
+            self.out_dir = tempfile.mkdtemp(prefix="qvstore.")
+        else:
+            self.out_dir = os.path.abspath(os.path.expanduser(out_dir))
+            if not os.path.exists(self.out_dir):
+                os.makedirs(self.out_dir)
+
+        self.offsets = {} # seqid --> (start, end) in every track
+        self.qv_mean = {} # seqid --> qv_name --> mean qv
+        self.n_values = 0 # number of values written to each track
+
+        self._writers = dict((t, open(self.track_filename(t), 'wb'))
+                             for t in self.tracks)
+        self._maps = {} # track --> np.memmap of the first _n_mapped values
+        self._n_mapped = 0
+
+    def track_filename(self, track):
+        """Return path to the file of a QV track."""
+        return os.path.join(self.out_dir, "{t}.f8".format(t=track))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, seqid):
+        return seqid in self.offsets
+
+    def add(self, seqid, qvs):
+        """
+        Append QVs of seqid to the store, where qvs is a dict of
+        qv_name --> list of qv (transformed to prob).
+        """
+        n = None
+        mean = {}
+        for qv_name in self.qv_names:
+            arr = qvs[qv_name]
+            if n is None:
+                n = len(arr)
+            elif n != len(arr):
+                raise ValueError("QVs of {s} must have the same length.".
+                                 format(s=seqid))
+            if n == 0:
+                # nothing to average, smooth or write for an empty read
+                mean[qv_name] = 0.
+                continue
+            values = np.asarray(arr, dtype=np.float64)
+            mean[qv_name] = float(values.mean())
+            values.tofile(self._writers[qv_name])
+            np.asarray(c_basQV.maxval_per_window(arr, self.window_size),
+                       dtype=np.float64).tofile(
+                           self._writers[qv_name + '_smoothed'])
+
+        self.offsets[seqid] = (self.n_values, self.n_values + n)
+        self.qv_mean[seqid] = mean
+        self.n_values += n
+
+    def remove(self, seqid):
+        """Remove seqid from index."""
+        del self.offsets[seqid]
+        del self.qv_mean[seqid]
+
+    def _remap(self):
+        """Flush pending QVs to disk and memory-map all tracks."""
+        for track in self.tracks:
+            self._writers[track].flush()
+            # copy-on-write maps are writable buffers (required by
+            # cython typed memoryviews), but never modify the files.
+            self._maps[track] = np.memmap(self.track_filename(track),
+                                          dtype=np.float64, mode='c',
+                                          shape=(self.n_values,))
+        self._n_mapped = self.n_values
+
+    def _get(self, seqid, track, position):
+        """Return a view of QVs of seqid in track, or QV at position."""
+        start, end = self.offsets[seqid]
+        if start == end:  # empty read
+            if position is None:
+                return np.zeros(0, dtype=np.float64)
+            raise IndexError("{s} has no QVs.".format(s=seqid))
+        if end > self._n_mapped:
+            self._remap()
+        if position is None:
+            return self._maps[track][start:end]
+        elif 0 <= position < end - start:
+            return self._maps[track][start + position]
+        else:
+            return self._maps[track][start:end][position]
+
+    def get(self, seqid, qv_name, position=None):
+        """Get quality value of type qv_name for a sequence seqid."""
+        return self._get(seqid, qv_name, position)
+
+    def get_smoothed(self, seqid, qv_name, position=None):
+        """Get smooth qv of type qv_name for seqid."""
+        return self._get(seqid, qv_name + '_smoothed', position)
+
+    def get_mean(self, seqid, qv_name):
+        """Return mean QV of read=seqid, type=qv_name."""
+        return self.qv_mean[seqid][qv_name]
+
+    def close(self):
+        """Close track files, remove them if out_dir was not given."""
+        for writer in self._writers.values():
+            writer.close()
+        self._maps = {}
+        self._n_mapped = 0
+        if self._own_dir and os.path.exists(self.out_dir):
+            shutil.rmtree(self.out_dir, ignore_errors=True)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class basQVstore(QVStore):
+
+    """
+    Similar to basQVcacher except that QVs are packed in a QVStore
+    and smoothed with window_size as soon as they are precached.
+    """
+
+    # Number of reads to load from a bas file at a time.
+    precache_batch_size = 2000
+
+    def __init__(self, window_size, out_dir=None):
+        super(basQVstore, self).__init__(qv_names=basQVcacher.qv_names,
+                                         window_size=window_size,
+                                         out_dir=out_dir)
+        # only used to locate bas/ccs files of reads
+        self.cacher = basQVcacher()
+
+    @property
+    def bas_files(self):
+        """movie --> bas/ccs files."""
+        return self.cacher.bas_files
+
+    def add_bash5(self, filename):
+        """Add a bas.h5/ccs.h5/ccs.bam to store."""
+        self.cacher.add_bash5(filename)
+
+    def precache(self, seqids):
+        """
+        Precache QV probabilities for seqids, in batches so that
+        only precache_batch_size reads are held as python lists.
+        """
+        bas_job_dict = self.cacher.group_seqids_by_bas_file(seqids)
+        for bas_file, ids in bas_job_dict.iteritems():
+            for i in xrange(0, len(ids), self.precache_batch_size):
+                batch = ids[i:i+self.precache_batch_size]
+                qv_dict = {}
+                c_basQV.precache_helper(bas_file, batch,
+                                        self.qv_names, qv_dict)
+                for seqid in batch:
+                    seqid = seqid.split()[0]
+                    self.add(seqid, qv_dict[seqid])
+
+
+class fastqQVstore(QVStore):
+
+    """
+    Similar to fastqQVcacher except that QVs are packed in a QVStore.
+    Just one QV for sub/ins/del, <qv_type> is ignored.
+    """
+
+    def __init__(self, window_size, out_dir=None):
+        super(fastqQVstore, self).__init__(qv_names=['QualityValue'],
+                                           window_size=window_size,
+                                           out_dir=out_dir)
+
+    def get(self, seqid, qv_type, position=None):
+        """
+        <qv_type> is ignored
+        """
+        return self._get(seqid, 'QualityValue', position)
+
+    def get_smoothed(self, seqid, qv_type, position=None):
+        """
+        <qv_type> is ignored
+        """
+        return self._get(seqid, 'QualityValue_smoothed', position)
+
+    def get_mean(self, seqid, qv_name):
+        """Return mean QV of seqid."""
+        return self.qv_mean[seqid]['QualityValue']
+
+    def precache_fastq(self, fastq_filename):
+        """
+        Cache each sequence in the FASTQ file, return ids of sequences.
+        """
+        seqids = []
+        for r in FastqReader(fastq_filename):
+            seqid = r.name.split()[0]
+            qv_dict = {seqid: {}}
+            c_basQV.fastq_precache_helper(seqid, r.quality, qv_dict)
+            self.add(seqid, {'QualityValue': qv_dict[seqid]['unsmoothed']})
+            seqids.append(seqid)
+        return seqids
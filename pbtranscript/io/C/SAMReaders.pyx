@@ -12,6 +12,9 @@ from pbtranscript.io.PbiBamIO import BamHeader
 __all__ = ["GMAPSAMReader", "GMAPSAMRecord", "iter_gmap_sam"]
 
 Interval = namedtuple('Interval', ['start', 'end'])
+# namedtuple can not tell the module of a compiled caller, which
+# pickle needs in order to send records to worker processes.
+Interval.__module__ = __name__
 
 
 def iter_cigar_string(cigar_string):
@@ -0,0 +1,185 @@
+"""
+Decode output of 'LA4Ice -a -m -i0 -w100000 -b0' from large chunks of
+bytes, see pbtranscript.io.LA4IceReader for the line by line version.
+
+Pre-filters (strand, coverage) are applied to the header line of every
+record before any python string of its alignment is created.
+"""
+from libc.stdlib cimport strtod
+from libc.string cimport memchr
+
+# Number of lines of a record: header, blank, query, alnStr, subject.
+DEF LINES_PER_RECORD = 5
+
+
+cdef inline bint is_space(char c):
+    return c == ' ' or c == '\t' or c == '\r'
+
+
+cdef inline char *skip_spaces(char *p, char *end):
+    while p < end and is_space(p[0]):
+        p += 1
+    return p
+
+
+cdef inline char *skip_token(char *p, char *end):
+    while p < end and not is_space(p[0]):
+        p += 1
+    return p
+
+
+cdef inline char *parse_long(char *p, char *end, long *out):
+    """Parse a (signed) integer from p, return pointer after it, or
+    NULL if there is no integer before end."""
+    cdef long v = 0
+    cdef bint neg = False
+    p = skip_spaces(p, end)
+    if p < end and p[0] == '-':
+        neg = True
+        p += 1
+    if p >= end or p[0] < '0' or p[0] > '9':
+        return NULL
+    while p < end and '0' <= p[0] <= '9':
+        v = v * 10 + (p[0] - c'0')
+        p += 1
+    out[0] = -v if neg else v
+    return p
+
+
+cdef inline char *parse_double(char *p, char *end, double *out):
+    """Parse a float from p, return pointer after it, or NULL."""
+    cdef char *q
+    p = skip_spaces(p, end)
+    if p >= end:
+        return NULL
+    out[0] = strtod(p, &q)
+    if q == p or q > end:
+        return NULL
+    return q
+
+
+def decode_la4ice_records(bytes buf, bint final, long offset=0,
+                          bint same_strand_only=False,
+                          bint check_coverage=False,
+                          long max_missed_start=200, long max_missed_end=50,
+                          bint keep_aln=True):
+    """
+    Decode all complete LA4Ice records in buf.
+
+    buf --- a chunk of LA4Ice output, starting at a record boundary.
+    final --- True if buf reaches the end of output, in which case
+        the last line does not need to end with a new line.
+    offset --- byte offset of buf in output, only used in error messages.
+    same_strand_only --- reject hits whose query and subject strands differ.
+    check_coverage --- reject hits which miss more than max_missed_start
+        bases at 5' or max_missed_end bases at 3' of query or subject.
+    keep_aln --- if False, alignments of accepted hits are not decoded.
+
+    Returns (records, consumed, done), where
+      records --- a list of tuples (qID, sID, score, identity,
+          qStrand, qStart, qEnd, qLength, sStrand, sStart, sEnd, sLength,
+          qAln, alnStr, sAln, accepted), qID and sID are 1-based,
+          qAln, alnStr and sAln are None if a hit is rejected by the
+          pre-filters or keep_aln is False.
+      consumed --- number of bytes decoded, the rest of buf belongs to
+          an incomplete record and should be passed in again with
+          more data appended.
+      done --- True if the EOF signature '+ +' has been read.
+    """
+    cdef char *start = buf
+    cdef char *end = start + len(buf)
+    cdef char *rec = start
+    cdef char *p
+    cdef char *q
+    cdef char *line_begin[LINES_PER_RECORD]
+    cdef char *line_end[LINES_PER_RECORD]
+    cdef long h[11]
+    cdef long aln_start
+    cdef double iden = 0
+    cdef int i
+    cdef bint accepted
+    records = []
+
+    while True:
+        # Locate lines of the next record.
+        p = rec
+        i = 0
+        while i < LINES_PER_RECORD and p < end:
+            line_begin[i] = p
+            q = <char *>memchr(p, '\n', end - p)
+            if q == NULL:
+                if not final:
+                    break
+                q = end
+            line_end[i] = q
+            p = q + 1
+            i += 1
+            if i == 1:  # check EOF signature in the header line
+                q = skip_spaces(line_begin[0], line_end[0])
+                if q < line_end[0] and q[0] == '+':
+                    q = skip_spaces(skip_token(q, line_end[0]), line_end[0])
+                    if q < line_end[0] and q[0] == '+':
+                        return records, p - start if p <= end else end - start, True
+
+        if i < LINES_PER_RECORD:
+            if final:
+                raise ValueError("Unable to decode LA4Ice output at byte %d: "
+                                 "truncated record or missing EOF signature."
+                                 % (offset + (rec - start)))
+            return records, rec - start, False
+
+        # Header, e.g.,
+        # 000000002 000002845 -1192 85.12 0 1855 3082 3082 0 2324 3516 3517 overlap
+        # h = qID, sID, score, qStrand, qStart, qEnd, qLen,
+        #     sStrand, sStart, sEnd, sLen
+        q = line_begin[0]
+        for i in range(3):
+            q = parse_long(q, line_end[0], &h[i]) if q != NULL else NULL
+        q = parse_double(q, line_end[0], &iden) if q != NULL else NULL
+        for i in range(3, 11):
+            q = parse_long(q, line_end[0], &h[i]) if q != NULL else NULL
+        if q == NULL:
+            raise ValueError("Unable to decode LA4Ice header at byte %d: %r."
+                             % (offset + (line_begin[0] - start),
+                                line_begin[0][:line_end[0] - line_begin[0]]))
+
+        accepted = True
+        if same_strand_only and h[3] != h[7]:
+            accepted = False
+        elif check_coverage and (h[8] > max_missed_start or
+                                 h[4] > max_missed_start or
+                                 h[10] - h[9] > max_missed_end or
+                                 h[6] - h[5] > max_missed_end):
+            accepted = False
+
+        # Aligned query starts at qStart (+ strand) or qEnd (- strand),
+        # aligned subject likewise.
+        q = parse_long(line_begin[2], line_end[2], &aln_start)
+        if q == NULL or aln_start != (h[4] if h[3] == 0 else h[5]):
+            raise ValueError("Unable to decode LA4Ice query alignment at "
+                             "byte %d." % (offset + (line_begin[2] - start)))
+        line_begin[2] = skip_spaces(q, line_end[2])
+        line_end[2] = skip_token(line_begin[2], line_end[2])
+
+        q = parse_long(line_begin[4], line_end[4], &aln_start)
+        if q == NULL or aln_start != (h[8] if h[7] == 0 else h[9]):
+            raise ValueError("Unable to decode LA4Ice subject alignment at "
+                             "byte %d." % (offset + (line_begin[4] - start)))
+        line_begin[4] = skip_spaces(q, line_end[4])
+        line_end[4] = skip_token(line_begin[4], line_end[4])
+
+        if accepted and keep_aln:
+            line_begin[3] = skip_spaces(line_begin[3], line_end[3])
+            while line_end[3] > line_begin[3] and is_space(line_end[3][-1]):
+                line_end[3] -= 1
+            qAln = line_begin[2][:line_end[2] - line_begin[2]]
+            alnStr = line_begin[3][:line_end[3] - line_begin[3]]
+            sAln = line_begin[4][:line_end[4] - line_begin[4]]
+        else:
+            qAln, alnStr, sAln = None, None, None
+
+        # 1-based qID and sID
+        records.append((h[0] + 1, h[1] + 1, h[2], iden,
+                        h[3], h[4], h[5], h[6], h[7], h[8], h[9], h[10],
+                        qAln, alnStr, sAln, accepted))
+        rec = p if p <= end else end
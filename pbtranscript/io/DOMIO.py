@@ -40,6 +40,16 @@ class DOMRecord(object):
             self.sStart == other.sStart and self.sEnd == other.sEnd and \
             self.sLen == other.sLen
 
+    def toDomString(self):
+        """Return a line of HMMER --domtblout format, which fromString
+        parses back to this record. Fields not modelled by DOMRecord
+        are filled with placeholders."""
+        return " ".join(str(x) for x in [
+            self.pid, "-", self.pLen, self.sid, "-", self.sLen,
+            "-", self.score, "-", 1, 1, "-", "-", self.score, "-",
+            self.sStart + 1, self.sEnd, self.pStart + 1, self.pEnd,
+            self.sStart + 1, self.sEnd, "-", "-"])
+
     @classmethod
     def fromString(cls, line):
         """Construct and return a DOMRecord object given a DOM line."""
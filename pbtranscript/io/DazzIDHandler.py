@@ -6,10 +6,21 @@ class DazzIDHandler, which
 (2) maintain mapping between read ids in daligner-compatible fasta file
     and its original name in input file.
 (3) makes a dazz database so that input fasta file can run daligner later
+
+class DazzDBCache, which keeps converted fasta, id mapping and dazz
+database files keyed by a content hash of input records, so that the
+same records are not converted again.
 """
 
+import errno
+import fcntl
+import hashlib
 import logging
+import os
 import os.path as op
+import shutil
+import time
+from contextlib import contextmanager
 from cPickle import load, dump
 from pbcore.io import FastaWriter
 from pbtranscript.io.ContigSetReaderWrapper import ContigSetReaderWrapper
@@ -19,6 +30,185 @@ __author__ = 'etseng@pacificbiosciences.com'
 
 log = logging.getLogger(__name__)
 
+# parameters of DBsplit, part of cache keys
+DBSPLIT_OPTIONS = "-s200"
+
+
+def dazz_db_files(dazz_filename):
+    """Return all files of converted fasta dazz_filename, including
+    itself, its id mapping pickle and its dazz database files."""
+    d, b = op.dirname(dazz_filename), op.basename(dazz_filename)
+    return [dazz_filename, dazz_filename + '.pickle', dazz_filename + '.db',
+            op.join(d, '.' + b + '.idx'), op.join(d, '.' + b + '.bps')]
+
+
+class DazzDBCache(object):
+
+    """
+    A persistent cache of DazzIDHandler outputs (converted fasta, id mapping
+    pickle and dazz database files), keyed by a content hash of input
+    records and DBsplit options.
+
+    Each entry is a directory <cache_dir>/<key>, which is created in a
+    temporary directory and renamed into place, so an entry is either
+    complete or absent. Conversion of the same key is serialized across
+    processes by a lock file, so that concurrent processes convert once.
+    When total size of entries exceeds max_bytes, least recently used
+    entries are evicted.
+
+    If env PBTRANSCRIPT_DAZZ_CACHE_DIR is set, DazzIDHandler uses a cache
+    there, bounded by PBTRANSCRIPT_DAZZ_CACHE_MAX_BYTES if set.
+    """
+    entry_basename = "cached.dazz.fasta"
+    last_used_basename = "last_used"
+    default_max_bytes = 10 * 1024 ** 3
+
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = realpath(cache_dir)
+        self.max_bytes = int(max_bytes) if max_bytes is not None \
+                         else self.default_max_bytes
+        if not op.exists(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    @classmethod
+    def from_env(cls):
+        """Return a DazzDBCache configured by environment variables,
+        or None if PBTRANSCRIPT_DAZZ_CACHE_DIR is not set."""
+        cache_dir = os.environ.get("PBTRANSCRIPT_DAZZ_CACHE_DIR")
+        if not cache_dir:
+            return None
+        return cls(cache_dir,
+                   max_bytes=os.environ.get("PBTRANSCRIPT_DAZZ_CACHE_MAX_BYTES"))
+
+    @staticmethod
+    def records_key(records):
+        """Return content hash of an iterable of records with .name
+        and .sequence, together with DBsplit options."""
+        h = hashlib.sha1(DBSPLIT_OPTIONS + "\n")
+        for r in records:
+            h.update(r.name)
+            h.update("\t")
+            h.update(r.sequence[:])
+            h.update("\n")
+        return h.hexdigest()
+
+    def entry_dir(self, key):
+        """Return directory of cache entry key."""
+        return op.join(self.cache_dir, key)
+
+    def _entry_files(self, key):
+        """Return files in cache entry key."""
+        return dazz_db_files(op.join(self.entry_dir(key), self.entry_basename))
+
+    @contextmanager
+    def lock(self, key):
+        """Hold an exclusive lock of key across processes."""
+        with open(op.join(self.cache_dir, key + ".lock"), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def get(self, key, dazz_filename):
+        """
+        If key is in cache, copy its files to dazz_filename and its
+        pickle and dazz database files, and return True.
+        Otherwise, return False.
+        """
+        srcs = self._entry_files(key)
+        if not all(op.exists(src) for src in srcs):
+            return False
+        try:
+            for src, dst in zip(srcs, dazz_db_files(dazz_filename)):
+                # copy then rename, so dst is never partially written
+                tmp_dst = dst + ".tmp.%d" % os.getpid()
+                shutil.copyfile(src, tmp_dst)
+                os.rename(tmp_dst, dst)
+            _touch(op.join(self.entry_dir(key), self.last_used_basename))
+        except (IOError, OSError):  # evicted meanwhile
+            log.debug("Failed to get %s from DAZZ DB cache.", key)
+            return False
+        log.debug("Got %s from DAZZ DB cache %s", dazz_filename, self.entry_dir(key))
+        return True
+
+    def put(self, key, dazz_filename):
+        """Copy dazz_filename and its pickle and dazz database files
+        to cache entry key, then evict old entries if needed."""
+        if op.exists(self.entry_dir(key)):
+            return
+        tmp_dir = op.join(self.cache_dir, ".tmp.%s.%d" % (key, os.getpid()))
+        os.mkdir(tmp_dir)
+        try:
+            entry = op.join(tmp_dir, self.entry_basename)
+            for src, dst in zip(dazz_db_files(dazz_filename), dazz_db_files(entry)):
+                shutil.copyfile(src, dst)
+            _touch(op.join(tmp_dir, self.last_used_basename))
+            os.rename(tmp_dir, self.entry_dir(key))
+        except (IOError, OSError) as e:
+            log.warning("Failed to add %s to DAZZ DB cache: %s", dazz_filename, e)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        self.evict()
+
+    def get_or_create(self, key, dazz_filename, create_func):
+        """
+        Get files of key from cache to dazz_filename, or call create_func()
+        to create them and add them to cache, while holding lock of key.
+        Return True if got from cache, False if created.
+        """
+        with self.lock(key):
+            if self.get(key, dazz_filename):
+                return True
+            create_func()
+            self.put(key, dazz_filename)
+            return False
+
+    def entries(self):
+        """Return a list of (last used time, size in bytes, key) of all
+        entries, least recently used first."""
+        ret = []
+        for key in os.listdir(self.cache_dir):
+            d = self.entry_dir(key)
+            if key.startswith('.') or not op.isdir(d):
+                continue
+            try:
+                size = sum(op.getsize(op.join(d, fn)) for fn in os.listdir(d))
+                last_used = op.getmtime(op.join(d, self.last_used_basename))
+            except OSError:  # being evicted by another process
+                continue
+            ret.append((last_used, size, key))
+        ret.sort()
+        return ret
+
+    def evict(self):
+        """Remove least recently used entries until total size
+        is not greater than max_bytes."""
+        entries = self.entries()
+        total = sum(size for dummy_t, size, dummy_key in entries)
+        for dummy_t, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            # rename first so that an entry disappears atomically
+            tmp_dir = op.join(self.cache_dir, ".evict.%s.%d" % (key, os.getpid()))
+            try:
+                os.rename(self.entry_dir(key), tmp_dir)
+            except OSError:  # evicted by another process
+                continue
+            log.debug("Evicting %s from DAZZ DB cache.", key)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            total -= size
+
+
+def _touch(path):
+    """Create path or update its modification time."""
+    with open(path, 'a'):
+        os.utime(path, (time.time(), time.time()))
+
 class DazzIDHandler(object):
 
     """
@@ -50,7 +240,8 @@ class DazzIDHandler(object):
     """
     dazz_movie_name = 'prolog'
 
-    def __init__(self, input_filename, converted=False, dazz_dir=None):
+    def __init__(self, input_filename, converted=False, dazz_dir=None,
+                 cache=None):
         """
         input_filename - input FASTA/FASTQ/ContigSet file
         converted - whether or not input file has been converted to
@@ -58,8 +249,11 @@ class DazzIDHandler(object):
         dazz_dir - if None, save all dazz.fasta, dazz.pickle, db files
                   in the same directory as inputfile.
                   if a valid path, save all output files to dazz_dir.
+        cache - a DazzDBCache to reuse outputs of identical input records,
+                if None, DazzDBCache.from_env()
         """
         self.dazz_dir = dazz_dir
+        self.cache = cache if cache is not None else DazzDBCache.from_env()
         self.input_filename = realpath(input_filename)
         self.validate_file_type(self.input_filename)
 
@@ -73,9 +267,31 @@ class DazzIDHandler(object):
             converted = False
 
         if not converted:
+            self.convert_and_make_db()
+        else:
+            self.read_dazz_pickle()
+
+    def convert_and_make_db(self):
+        """Convert input file and make dazz database, or get them
+        from cache if input records have been converted before."""
+        if self.cache is None:
             self.convert_to_dazz_fasta()
             self.make_db()
-        else:
+            return
+
+        reader = ContigSetReaderWrapper(self.input_filename)
+        key = self.cache.records_key(reader)
+        reader.close()
+
+        def _create():
+            """Convert and make db."""
+            self.convert_to_dazz_fasta()
+            self.make_db()
+
+        if op.exists(self.db_filename):
+            # remove tracks of an existing db, the same as make_db
+            execute(cmd="DBrm %s" % self.dazz_filename)
+        if self.cache.get_or_create(key, self.dazz_filename, _create):
             self.read_dazz_pickle()
 
     def validate_file_type(self, filename):
@@ -171,7 +387,7 @@ class DazzIDHandler(object):
         cmd = "fasta2DB %s %s " % (self.dazz_filename, self.dazz_filename)
         execute(cmd=cmd)
 
-        cmd = "DBsplit -s200 %s" % self.dazz_filename
+        cmd = "DBsplit %s %s" % (DBSPLIT_OPTIONS, self.dazz_filename)
         execute(cmd)
 
     def keys(self):
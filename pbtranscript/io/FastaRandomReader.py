@@ -7,8 +7,10 @@ but can only contain FASTA files and filters in the
 ContigSet will not be respected.
 """
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+import os
 import os.path as op
+import mmap
 import logging
 
 from pbcore.io.FastaIO import FastaRecord
@@ -20,6 +22,9 @@ __all__ = ["FastaRandomReader",
 
 Interval = namedtuple('Interval', ['start', 'end'])
 
+# whitespace, other than '\n', stripped from sequence lines
+_SEQ_LINE_WHITESPACE = ' \t\r\x0b\x0c'
+
 
 class FastaRandomReader(object):
 
@@ -41,14 +46,53 @@ class FastaRandomReader(object):
 
             r = FastaRandomReader('test.contigset.xml')
             r['m/zmw/s_e'] ==> this shows a FastaRecord
+
+            r = FastaRandomReader('test.fasta', cache_size=1000)
+            r.get_many(['id1', 'id2']) ==> a list of FastaRecords
+            r.get_lengths(['id1', 'id2']) ==> a list of sequence lengths
+
+            with FastaRandomReader('test.fasta') as r:
+                r['id1'] ==> files are closed when leaving the block
+
+        Reads are indexed by a samtools compatible FASTA index
+        (<fasta>.fai), which is reused if it is not older than the FASTA
+        file and covers all records of it, otherwise it is rebuilt and
+        written if write_index is True and the FASTA directory is writable,
+        or kept in memory only.
+        Records are read from memory-mapped FASTA files.
+
+        cache_size --- if > 0, keep up to cache_size most recently
+                       accessed records in memory.
     """
 
-    def __init__(self, *args):
+    def __init__(self, *args, **kwargs):
+        self.cache_size = int(kwargs.pop("cache_size", 0))
+        self.write_index = kwargs.pop("write_index", True)
+        if len(kwargs) > 0:
+            raise TypeError("Unexpected keyword arguments %s" % kwargs.keys())
         self.fasta_filenames = self.get_fasta_filenames(*args)
         self.fhandlers = self._open_files()
+        self.mmaps = [self._mmap_file(f) for f in self.fhandlers]
         self.d = {}
+        self.lengths = {}
+        self._cache = OrderedDict()
         self._init_index()
 
+    def close(self):
+        """Close memory maps and files of all FASTA files."""
+        for m in self.mmaps:
+            if m is not None:
+                m.close()
+        for f in self.fhandlers:
+            f.close()
+        self._cache.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     def get_fasta_filenames(self, *args):
         """Return all FASTA file names as a list."""
         ret = []
@@ -71,36 +115,190 @@ class FastaRandomReader(object):
     def _open_files(self):
         return [open(fn) for fn in self.fasta_filenames]
 
+    @staticmethod
+    def _mmap_file(f):
+        """Memory map an opened file, return None if it is empty."""
+        if op.getsize(f.name) == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def index_filename(fasta_filename):
+        """Return FASTA index file name of a FASTA file."""
+        return fasta_filename + ".fai"
+
     def _init_index(self):
         """Indexing reads in fasta_filenames"""
-        for index, f in enumerate(self.fhandlers):
-            while 1:
-                line = f.readline()
+        for index, fn in enumerate(self.fasta_filenames):
+            fai_fn = self.index_filename(fn)
+            entries = None
+            if op.exists(fai_fn) and \
+               op.getmtime(fai_fn) >= op.getmtime(fn):
+                entries = self._read_fai(fai_fn, index)
+            if entries is None:
+                entries = self._scan_fasta(index)
+                if self.write_index and self._is_writable_dir(fai_fn):
+                    self._write_fai(fai_fn, entries)
+            for sid, length, offset, dummy_bases, dummy_width in entries:
+                self.d[sid] = (index, offset)
+                self.lengths[sid] = length
+
+    def _read_fai(self, fai_fn, index):
+        """
+        Read a FASTA index file of the index-th FASTA file, return a list
+        of (seqid, length, offset, linebases, linewidth), or None if it
+        can not be parsed or does not match the FASTA file, i.e., a
+        record offset is not right after the header line of the seqid,
+        the index does not cover all records of the FASTA file, or the
+        last record does not end at the end of the FASTA file.
+        """
+        entries = []
+        try:
+            with open(fai_fn) as f:
+                for line in f:
+                    raw = line.rstrip('\n').split('\t')
+                    entries.append((raw[0], int(raw[1]), int(raw[2]),
+                                    int(raw[3]), int(raw[4])))
+        except (IOError, ValueError, IndexError):
+            logging.warning("Ignoring invalid FASTA index %s", fai_fn)
+            return None
+        m = self.mmaps[index]
+        if m is None:
+            if len(entries) == 0:
+                return entries
+        elif self._covers_fasta(m, entries):
+            return entries
+        logging.warning("Ignoring FASTA index %s which does not match its " +
+                        "FASTA file", fai_fn)
+        return None
+
+    @staticmethod
+    def _covers_fasta(m, entries):
+        """
+        Return True if entries of a FASTA index match all records of
+        a memory-mapped non-empty FASTA file m.
+        """
+        prev_offset = 0
+        for sid, dummy_length, offset, dummy_bases, dummy_width in entries:
+            if offset <= prev_offset or offset > len(m) or m[offset-1] != '\n':
+                return False
+            header_start = m.rfind('\n', 0, offset-1) + 1
+            header = m[header_start:offset].strip()
+            if not header.startswith('>') or header[1:].split(None, 1)[:1] != [sid]:
+                return False
+            prev_offset = offset
+        # distinct header lines of entries must be all header lines
+        n_records, pos = (1 if m[0] == '>' else 0), m.find('\n>')
+        while pos >= 0:
+            n_records += 1
+            pos = m.find('\n>', pos + 1)
+        if len(entries) != n_records:
+            return False
+        # the last record must end at the end of the file
+        last_length, last_offset = entries[-1][1], entries[-1][2]
+        return last_length == sum(len(line.strip()) for line in
+                                  m[last_offset:].split('\n'))
+
+    def _scan_fasta(self, index):
+        """
+        Scan the index-th FASTA file, return a list of
+        (seqid, length, offset, linebases, linewidth) of records.
+        """
+        entries = []
+        f = self.fhandlers[index]
+        f.seek(0)
+        sid, offset, length, bases, width = None, 0, 0, 0, 0
+        while 1:
+            line = f.readline()
+            if len(line) == 0 or line.startswith('>'):
+                if sid is not None:
+                    entries.append((sid, length, offset, bases, width))
                 if len(line) == 0:
                     break
-                if line.startswith('>'):
-                    sid = line.strip()[1:].split(None, 1)[0]
-                    # the header MUST be just 1 line
-                    # if id in self.d:
-                    #    print "duplicate id {0}!!".format(id)
-                    self.d[sid] = (index, f.tell())
+                # the header MUST be just 1 line
+                sid = line.strip()[1:].split(None, 1)[0]
+                offset, length, bases, width = f.tell(), 0, 0, 0
+            else:
+                if width == 0:
+                    bases, width = len(line.strip()), len(line)
+                length += len(line.strip())
+        return entries
+
+    @staticmethod
+    def _is_writable_dir(fai_fn):
+        """Return True if the directory of fai_fn is writable."""
+        return os.access(op.dirname(op.abspath(fai_fn)), os.W_OK)
+
+    @staticmethod
+    def _write_fai(fai_fn, entries):
+        """Write a FASTA index file, ignore failures (e.g., read only dir)."""
+        tmp_fn = fai_fn + ".tmp.%d" % os.getpid()
+        try:
+            with open(tmp_fn, 'w') as f:
+                for entry in entries:
+                    f.write("\t".join(str(x) for x in entry) + "\n")
+            os.rename(tmp_fn, fai_fn)
+        except (IOError, OSError):
+            logging.debug("Could not write FASTA index %s", fai_fn)
+            if op.exists(tmp_fn):
+                os.remove(tmp_fn)
 
     def __getitem__(self, k):
         if k not in self.d:
             errMsg = "key {k} not in {f}!".format(k=k, f=",".join(self.fasta_filenames))
             logging.error(self.d.keys())
             raise ValueError(errMsg)
-        return self._get_record(k)
+        return self._get_cached_record(k)
+
+    def _check_keys(self, ids):
+        """Raise ValueError if any of ids is not in FASTA files."""
+        for k in ids:
+            if k not in self.d:
+                errMsg = "key {k} not in {f}!".format(k=k, f=",".join(self.fasta_filenames))
+                raise ValueError(errMsg)
+
+    def get_many(self, ids):
+        """
+        Return a list of FastaRecords of ids, in the same order as ids.
+        Records are read in the order of their positions in files.
+        """
+        self._check_keys(ids)
+        records = {}
+        for k in sorted(set(ids), key=lambda x: self.d[x]):
+            records[k] = self._get_cached_record(k)
+        return [records[k] for k in ids]
+
+    def get_lengths(self, ids):
+        """Return a list of sequence lengths of ids, in the same order as
+        ids, from the index without reading sequences."""
+        self._check_keys(ids)
+        return [self.lengths[k] for k in ids]
+
+    def _get_cached_record(self, k):
+        """Get record k, from cache if possible."""
+        if self.cache_size <= 0:
+            return self._get_record(k)
+        record = self._cache.pop(k, None)
+        if record is None:
+            record = self._get_record(k)
+            if len(self._cache) >= self.cache_size:
+                self._cache.popitem(last=False)
+        self._cache[k] = record
+        return record
 
     def _get_record(self, k):
         index, tell = self.d[k]
-        f = self.fhandlers[index]
-        f.seek(tell)
-        content = ''
-        for line in f:
-            if line.startswith('>'):
-                break
-            content += line.strip()
+        m = self.mmaps[index]
+        if m is None or tell >= len(m) or m[tell] == '>':
+            content = ''
+        else:
+            end = m.find('\n>', tell)
+            end = len(m) if end < 0 else end + 1
+            region = m[tell:end]
+            if any(c in region for c in _SEQ_LINE_WHITESPACE):
+                content = ''.join(line.strip() for line in region.split('\n'))
+            else:
+                content = region.replace('\n', '')
         return FastaRecord(header=k, sequence=content)
 
     def __len__(self):
@@ -19,11 +19,17 @@ class FastqRandomReader:
         Example:
             r = FastqRandomReader('test.fastq')
             r['m131018_081703_42161_c100585152550000001823088404281404_s1_p0/61232/4045_63_CCS'] ==> this shows a FastqRecord
+            r.get_many(['id1', 'id2']) ==> a list of FastqRecords
+            r.get_lengths(['id1', 'id2']) ==> a list of sequence lengths
+
+            with FastqRandomReader('test.fastq') as r:
+                r['id1'] ==> the file is closed when leaving the block
     """
 
     def __init__(self, fastq_filename):
         self.f = open(fastq_filename)
         self.d = {}
+        self.lengths = {}
         self.locations = []
         self.locations_d_key_map = {}
 
@@ -41,11 +47,51 @@ class FastqRandomReader:
                     raise ValueError("Bad fastq format: redundant record {sid}".
                                      format(sid=sid))
                 self.d[sid] = self.f.tell()
+            elif idx % 4 == 1:
+                self.lengths[sid] = len(line.strip())
+
+    def close(self):
+        """Close the FASTQ file."""
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     def __getitem__(self, k):
         if k not in self.d:
             errMsg = "key {k} not in {f}!".format(k=k, f=self.f.name)
             raise ValueError(errMsg)
+        return self._get_record(k)
+
+    def get_many(self, ids):
+        """
+        Return a list of FastqRecords of ids, in the same order as ids.
+        Records are read in the order of their positions in the file.
+        """
+        self._check_keys(ids)
+        records = {}
+        for k in sorted(set(ids), key=lambda x: self.d[x]):
+            records[k] = self._get_record(k)
+        return [records[k] for k in ids]
+
+    def get_lengths(self, ids):
+        """Return a list of sequence lengths of ids, in the same order as
+        ids, without reading sequences."""
+        self._check_keys(ids)
+        return [self.lengths[k] for k in ids]
+
+    def _check_keys(self, ids):
+        """Raise ValueError if any of ids is not in the FASTQ file."""
+        for k in ids:
+            if k not in self.d:
+                errMsg = "key {k} not in {f}!".format(k=k, f=self.f.name)
+                raise ValueError(errMsg)
+
+    def _get_record(self, k):
+        """Read record k."""
         self.f.seek(self.d[k])
         name, seq, plus, qv = k, "", "", ""
 
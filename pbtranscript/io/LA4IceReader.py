@@ -1,13 +1,21 @@
 #!/usr/env python
 
 """
-Define LA4IceReader which reads output of 'LA4Ice' as BLASRRecord.
+Define LA4IceReader which reads output of 'LA4Ice' as BLASRRecord,
+and LA4IceStreamReader which decodes output of 'LA4Ice' in large chunks.
 """
 
+import subprocess
 from pbtranscript.io.BLASRRecord import BLASRRecord
+from pbtranscript.io.c_la4ice import decode_la4ice_records
 
 __author__ = 'etseng@pacificbiosciences.com'
 
+__all__ = ["LA4IceReader", "LA4IceStreamReader"]
+
+# Number of bytes LA4IceStreamReader reads at a time.
+CHUNK_SIZE = 4 * 1024 * 1024
+
 
 class LA4IceReader(object):
 
@@ -90,3 +98,119 @@ class LA4IceReader(object):
         except (IndexError, IOError, ValueError, AssertionError) as exc:
             raise ValueError("Unable to read %s line %d as LA4Ice output: %r." %
                              (self.file_name, self._lineno, exc))
+
+
+class LA4IceStreamReader(object):
+
+    """
+    Reader for reading alignments produced by LA4Ice either from a
+    *.las.out file or directly from stdout of an LA4Ice command, in
+    large chunks decoded by pbtranscript.io.c_la4ice.
+
+    Hits rejected by pre-filters (same_strand_only, max_missed_start
+    and max_missed_end) are returned as BLASRRecords without alignment
+    (qAln, alnStr and sAln are None), alignment strings of these hits
+    are never created.
+
+    Example
+        LA4IceStreamReader(cmd=['LA4Ice', '-a', '-m', ..., 'q.dazz.fasta',
+                                't.dazz.fasta', 'q.t.N1.las'],
+                           same_strand_only=True,
+                           max_missed_start=200, max_missed_end=50)
+    """
+
+    def __init__(self, las_out_filename=None, cmd=None,
+                 same_strand_only=False,
+                 max_missed_start=None, max_missed_end=None,
+                 keep_aln=True, chunk_size=CHUNK_SIZE):
+        """
+        Parameters:
+          las_out_filename - LA4Ice output file to read
+          cmd - LA4Ice command (a list of args) whose stdout is read,
+                only one of las_out_filename and cmd should be given
+          same_strand_only - reject hits on opposite strands
+          max_missed_start, max_missed_end - if not None, reject hits
+                which miss more than max_missed_start bases at 5' or
+                more than max_missed_end bases at 3' of query or subject
+          keep_aln - whether or not to decode alignments of accepted hits
+          chunk_size - number of bytes to read at a time
+        """
+        if (las_out_filename is None) == (cmd is None):
+            raise ValueError("Exactly one of las_out_filename and cmd " +
+                             "should be given to LA4IceStreamReader.")
+        if (max_missed_start is None) != (max_missed_end is None):
+            raise ValueError("max_missed_start and max_missed_end " +
+                             "should be both or neither set.")
+        self.file_name = las_out_filename if cmd is None else " ".join(cmd)
+        self.cmd = cmd
+        self.filters = dict(same_strand_only=same_strand_only,
+                            check_coverage=max_missed_start is not None,
+                            max_missed_start=max_missed_start or 0,
+                            max_missed_end=max_missed_end or 0,
+                            keep_aln=keep_aln)
+        self.chunk_size = chunk_size
+        self.process = None
+        if cmd is None:
+            self.f = open(las_out_filename, 'rb')
+        else:
+            self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                            bufsize=chunk_size)
+            self.f = self.process.stdout
+        self._records = self._iter_records()
+
+    def _iter_records(self):
+        """Yield BLASRRecords decoded from self.f chunk by chunk."""
+        buf, offset, done = '', 0, False
+        while not done:
+            data = self.f.read(self.chunk_size)
+            final = len(data) == 0
+            buf = buf + data if len(buf) > 0 else data
+            try:
+                records, consumed, done = decode_la4ice_records(
+                    buf, final, offset, **self.filters)
+            except ValueError as exc:
+                raise ValueError("Unable to read %s as LA4Ice output: %s" %
+                                 (self.file_name, exc))
+            buf = buf[consumed:]
+            offset += consumed
+            for (qID, sID, score, iden, qStrand, qStart, qEnd, qLen,
+                 sStrand, sStart, sEnd, sLen, qAln, alnStr, sAln, dummy) in records:
+                yield BLASRRecord(qID=qID, qLength=qLen,
+                                  qStart=qStart, qEnd=qEnd, qStrand=qStrand,
+                                  sID=sID, sLength=sLen,
+                                  sStart=sStart, sEnd=sEnd, sStrand=sStrand,
+                                  score=score, mapQV=None,
+                                  qAln=qAln, alnStr=alnStr, sAln=sAln,
+                                  identity=iden,
+                                  strand='+' if qStrand == sStrand else '-')
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def next(self):
+        """Return the next BLASRRecord."""
+        return next(self._records)
+
+    def close(self):
+        """Close *.las.out file, or wait for the LA4Ice command to exit
+        and raise RuntimeError if it failed."""
+        if self.f.closed:
+            return
+        if self.process is None:
+            self.f.close()
+            return
+        # drain what remains after EOF signature, so that LA4Ice
+        # is not killed by SIGPIPE.
+        while len(self.f.read(self.chunk_size)) > 0:
+            pass
+        self.f.close()
+        if self.process.wait() != 0:
+            raise RuntimeError("%s exited with code %d." %
+                               (self.file_name, self.process.returncode))
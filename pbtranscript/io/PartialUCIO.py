@@ -0,0 +1,250 @@
+"""
+Streaming I/O of partial uc, which assigns non-full-length (nFL) reads
+to unpolished isoforms (clusters), as ice_partial does.
+
+A partial uc file is a text file, each line of which is a key and a
+comma separated list of reads. Lines of reads which hit no cluster come
+first, with key 'nohit', followed by lines of clusters sorted by cluster
+id, with the python repr of cluster ids as keys, e.g.,
+    nohit	read_0,read_1
+    0	read_2,read_3
+    5	read_4
+    'c7'	read_5
+Lines with the same key may repeat, their reads are concatenated in order.
+
+Unlike a pickle, partial uc files of nFL chunks can be merged by a k-way
+merge (merge_partial_ucs), and a cluster can be looked up in a partial
+uc file (PartialUCIndex), without loading all reads to memory.
+"""
+
+import heapq
+import os.path as op
+from ast import literal_eval
+from cPickle import Pickler
+from itertools import chain
+
+__all__ = ["NOHIT",
+           "partial_uc_txt_fn",
+           "fresh_partial_uc_txt_fn",
+           "write_partial_uc",
+           "iter_partial_uc",
+           "read_partial_uc",
+           "PartialUCIndex",
+           "dump_partial_uc",
+           "merge_partial_ucs"]
+
+NOHIT = "nohit"
+
+
+def partial_uc_txt_fn(pickle_fn):
+    """Return partial uc file written next to a partial uc pickle, e.g.,
+    input.split_000.fasta.partial_uc.pickle ->
+    input.split_000.fasta.partial_uc.txt"""
+    return op.splitext(pickle_fn)[0] + ".txt"
+
+
+def fresh_partial_uc_txt_fn(pickle_fn):
+    """Return partial uc file next to pickle_fn if it exists and is not
+    older than pickle_fn, otherwise None, e.g., if the partial uc file
+    was left by a previous run and pickle_fn has been rewritten since."""
+    txt_fn = partial_uc_txt_fn(pickle_fn)
+    if op.exists(txt_fn) and op.exists(pickle_fn) and \
+            op.getmtime(txt_fn) >= op.getmtime(pickle_fn):
+        return txt_fn
+    return None
+
+
+def _line(key, reads):
+    """Return a line of partial uc file."""
+    return "{k}\t{r}\n".format(k=key, r=",".join(reads))
+
+
+def _parse_line(line):
+    """Return (key, reads) of a line, key is NOHIT or a cluster id."""
+    key, reads = line.rstrip('\n').split('\t')
+    return (key if key == NOHIT else literal_eval(key),
+            reads.split(',') if len(reads) > 0 else [])
+
+
+def _sort_key(key):
+    """Return sort key of a key of partial uc, NOHIT first."""
+    return (0, None) if key == NOHIT else (1, key)
+
+
+def write_partial_uc(partial_uc, nohit, out_fn, reads_per_line=10000):
+    """Write partial_uc, {cluster id: [reads]}, and nohit, reads
+    which hit no cluster, to partial uc file out_fn."""
+    with open(out_fn, 'w') as writer:
+        nohit = list(nohit)
+        for i in xrange(0, len(nohit), reads_per_line):
+            writer.write(_line(NOHIT, nohit[i:i+reads_per_line]))
+        for cid in sorted(partial_uc):
+            writer.write(_line(repr(cid), partial_uc[cid]))
+
+
+def iter_partial_uc(fn):
+    """Yield (key, reads) of every line of partial uc file fn."""
+    with open(fn, 'r') as reader:
+        for line in reader:
+            yield _parse_line(line)
+
+
+def read_partial_uc(fn):
+    """Return {'partial_uc': {cluster id: [reads]}, 'nohit': set(reads)}
+    of partial uc file fn, as a partial uc pickle does."""
+    partial_uc, nohit = {}, set()
+    for key, reads in iter_partial_uc(fn):
+        if key == NOHIT:
+            nohit.update(reads)
+        else:
+            partial_uc.setdefault(key, []).extend(reads)
+    return {'partial_uc': partial_uc, 'nohit': nohit}
+
+
+class PartialUCIndex(object):
+
+    """
+    Look up reads of clusters in a partial uc file, keeping only file
+    offsets of clusters in memory.
+
+    Example:
+        partial_uc = PartialUCIndex(fn)
+        if cid in partial_uc:
+            reads = partial_uc[cid]
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self._offsets = {} # {cluster id: [offsets of lines]}
+        self._f = open(fn, 'r')
+        offset = 0
+        for line in self._f:
+            key = line[:line.index('\t')]
+            if key != NOHIT:
+                self._offsets.setdefault(literal_eval(key), []).append(offset)
+            offset += len(line)
+
+    def __contains__(self, cid):
+        return cid in self._offsets
+
+    def __getitem__(self, cid):
+        reads = []
+        for offset in self._offsets[cid]:
+            self._f.seek(offset)
+            reads.extend(_parse_line(self._f.readline())[1])
+        return reads
+
+    def keys(self):
+        """Return cluster ids."""
+        return self._offsets.keys()
+
+    def close(self):
+        """Close partial uc file."""
+        self._f.close()
+
+
+class _Streamed(object):
+
+    """
+    Placeholder of an object to be made by callable_(*args) and filled
+    with listitems (appended) or dictitems (set), which are iterators
+    consumed only while the placeholder is being pickled, see
+    object.__reduce__. Unpickling it does not need this class.
+    """
+
+    def __init__(self, callable_, args=(), listitems=None, dictitems=None):
+        self.callable_ = callable_
+        self.args = args
+        self.listitems = listitems
+        self.dictitems = dictitems
+
+    def __reduce__(self):
+        return (self.callable_, self.args, None, self.listitems, self.dictitems)
+
+
+def dump_partial_uc(items, f, protocol=2):
+    """
+    Pickle (key, reads) of items, nohit reads first followed by clusters,
+    as iter_partial_uc yields them, to file f, as the object
+        {'nohit': set(reads), 'partial_uc': {cluster id: [reads]}}
+    Items are pickled by cPickle as they are consumed, in batches, and
+    without memo, so that memory is bounded by reads of an item, not by
+    the number of reads. Lines of a cluster must be contiguous in items.
+    """
+    items = iter(items)
+    first_cluster = []
+
+    def _nohit_reads():
+        """Yield nohit reads, keep the first cluster in first_cluster."""
+        for key, reads in items:
+            if key != NOHIT:
+                first_cluster.append((key, reads))
+                return
+            for read in reads:
+                yield read
+
+    def _clusters():
+        """Yield (cluster id, reads) of clusters after nohit reads."""
+        cur_key, cur_reads = None, None
+        for key, reads in chain(first_cluster, items):
+            if key == NOHIT:
+                raise ValueError("Reads of nohit follow clusters.")
+            if cur_reads is not None and key == cur_key:
+                cur_reads.extend(reads)
+                continue
+            if cur_reads is not None:
+                yield (cur_key, cur_reads)
+            cur_key, cur_reads = key, list(reads)
+        if cur_reads is not None:
+            yield (cur_key, cur_reads)
+
+    obj = _Streamed(dict, dictitems=iter([
+        ('nohit', _Streamed(set, args=(_Streamed(list, listitems=_nohit_reads()),))),
+        ('partial_uc', _Streamed(dict, dictitems=_clusters()))]))
+    pickler = Pickler(f, protocol)
+    pickler.fast = 1 # no memo of reads
+    pickler.dump(obj)
+
+
+def merge_partial_ucs(in_fns, out_fn, out_pickle=None):
+    """
+    Merge partial uc files in_fns of nFL chunks to partial uc file out_fn
+    by a k-way merge, reads of a cluster are concatenated in the order of
+    in_fns. If out_pickle is not None, also write the merged partial uc to
+    pickle out_pickle (see dump_partial_uc), which equals the pickle merged
+    from pickles of the chunks (see IceUtils.combine_nfl_pickles).
+    Memory used is bounded by the number of reads of a cluster and of a
+    line of nohit reads, not by the number of nFL reads.
+    """
+    def _keyed(i, fn):
+        """Yield (sort key, index of file, line number, key, reads)."""
+        for j, (key, reads) in enumerate(iter_partial_uc(fn)):
+            yield (_sort_key(key), i, j, key, reads)
+
+    def _merged(writer):
+        """Yield merged (key, reads), after writing them to writer."""
+        cur_key, cur_reads = None, None
+        for dummy_sort_key, dummy_i, dummy_j, key, reads in \
+                heapq.merge(*[_keyed(i, fn) for i, fn in enumerate(in_fns)]):
+            if key == NOHIT:
+                writer.write(_line(NOHIT, reads))
+                yield (key, reads)
+            elif cur_reads is not None and key == cur_key:
+                cur_reads.extend(reads)
+            else:
+                if cur_reads is not None:
+                    writer.write(_line(repr(cur_key), cur_reads))
+                    yield (cur_key, cur_reads)
+                cur_key, cur_reads = key, list(reads)
+        if cur_reads is not None:
+            writer.write(_line(repr(cur_key), cur_reads))
+            yield (cur_key, cur_reads)
+
+    with open(out_fn, 'w') as writer:
+        if out_pickle is None:
+            for dummy_item in _merged(writer):
+                pass
+        else:
+            # close out_pickle before out_fn, so that out_fn is not older
+            with open(out_pickle, 'wb') as pickle_f:
+                dump_partial_uc(_merged(writer), pickle_f)
@@ -317,6 +317,54 @@ class BamCCSZmwRead(BamZmwRead):
         return "%s/ccs" % self.zmw.zmwName
 
 
+class PbiZmwIndex(object):
+    """
+    Hash index of (movie name, hole number) to rows of a merged pbi index,
+    built once with a stable sort, so that rows of a zmw are found in
+    constant time, and zmws can be walked in (movie, hole number) order.
+    """
+
+    def __init__(self, movie_ids, hole_numbers, movie_names_by_id):
+        """
+        movie_ids --- qId of every row in pbi index
+        hole_numbers --- holeNumber of every row in pbi index
+        movie_names_by_id --- dict {qId: movie name}
+        """
+        movie_ids = np.asarray(movie_ids)
+        hole_numbers = np.asarray(hole_numbers)
+        # row numbers sorted by (qId, holeNumber), rows of a zmw stay in order
+        self.order = np.lexsort((np.arange(len(movie_ids)), hole_numbers, movie_ids))
+        self.d = {}  # (movie, hn) --> (start, end) in self.order
+        self.zmws_by_movie = {}  # movie --> [hn] sorted
+        if len(self.order) == 0:
+            return
+        q, h = movie_ids[self.order], hole_numbers[self.order]
+        starts = np.concatenate([[0], np.nonzero((q[1:] != q[:-1]) |
+                                                 (h[1:] != h[:-1]))[0] + 1])
+        ends = np.concatenate([starts[1:], [len(q)]])
+        for start, end, qid, hn in zip(starts.tolist(), ends.tolist(),
+                                       q[starts].tolist(), h[starts].tolist()):
+            movie = movie_names_by_id[qid]
+            self.d[(movie, hn)] = (start, end)
+            self.zmws_by_movie.setdefault(movie, []).append(hn)
+
+    def rows(self, movie, hn):
+        """Return row numbers (in pbi order) of zmw movie/hn,
+        an empty list if not found."""
+        start, end = self.d.get((movie, hn), (0, 0))
+        return self.order[start:end].tolist()
+
+    def zmws(self, movie):
+        """Return hole numbers of movie, ascending."""
+        return self.zmws_by_movie.get(movie, [])
+
+    def __len__(self):
+        return len(self.d)
+
+    def __contains__(self, key):
+        return key in self.d
+
+
 class BamCollection(object):
     """
     Class wraps PacBio bam fofn or datasets.
@@ -347,6 +395,19 @@ class BamCollection(object):
                                   bam.filename, self.__class__.__name__)
             for rg in bam.readGroupTable:
                 assert rg.ReadType in ["CCS", "SUBREAD"]
+        self._zmw_index = None
+
+    @property
+    def zmwIndex(self):
+        """Return PbiZmwIndex of all reads, built on first use."""
+        if self._zmw_index is None:
+            movie_names_by_id = dict((_id, _movie) for _movie, _id in
+                                     self._dataset.movieIds.iteritems())
+            _index = self._dataset.index
+            self._zmw_index = PbiZmwIndex(movie_ids=_index.qId,
+                                          hole_numbers=_index.holeNumber,
+                                          movie_names_by_id=movie_names_by_id)
+        return self._zmw_index
 
     @property
     def movieNames(self):
@@ -395,9 +456,8 @@ class BamCollection(object):
             return ds2
 
         _hn = int(indices[1])
-        # for efficiency: first select on hn, then movie name.
-        _reads = self._dataset[self._dataset.index.holeNumber == _hn]
-        _reads = [_read for _read in _reads if _read.movieName == _movie]
+        _rows = self.zmwIndex.rows(_movie, _hn)
+        _reads = self._dataset[_rows] if len(_rows) > 0 else []
         if len(_reads) == 0:
             raise KeyError("Could not find %s in %s" % (key, str(self._dataset)))
 
@@ -415,19 +475,15 @@ class BamCollection(object):
         raise KeyError("%s invalid slice: %s" % (self.__class__.__name__, key))
 
     def __iter__(self):
-        """Iterators over Zmw, ZmwRead objects.
+        """Iterators over Zmw, ZmwRead objects, zmws of each movie
+        are in ascending order of hole number.
         """
-        _qid_hns = np.unique(self._dataset.index[['qId', 'holeNumber']])
         for _movie in self.movieNames:
-            ds2 = self._dataset.copy()
-            ds2.filters.addRequirement(movie=[('==', _movie)])
-            _movie_id = self._dataset.movieIds[_movie]
-            for (__movie_id, _hn) in _qid_hns:
-                if __movie_id == _movie_id:
-                    _reads = ds2[ds2.index.holeNumber == _hn]
-                    assert all([_read.movieName == _movie for _read in _reads])
-                    if len(_reads) > 0:
-                        yield BamZmw(bamRecords=_reads, isCCS=self.isCCS)
+            for _hn in self.zmwIndex.zmws(_movie):
+                _reads = self._dataset[self.zmwIndex.rows(_movie, _hn)]
+                assert all([_read.movieName == _movie for _read in _reads])
+                if len(_reads) > 0:
+                    yield BamZmw(bamRecords=_reads, isCCS=self.isCCS)
 
     def reads(self):
         """Iterate over all reads"""
@@ -460,7 +516,7 @@ class BamCollection(object):
 
     def __len__(self):
         """Return total number of zmws in all movies."""
-        return len(np.unique(self._dataset.index[['qId', 'holeNumber']]))
+        return len(self.zmwIndex)
 
     def close(self):
         """Close all readers."""
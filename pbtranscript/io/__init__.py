@@ -18,4 +18,5 @@ from .AbundanceIO import *
 from .common import *
 from .ChainIO import *
 from .MergeGroupIO import *
+from .PartialUCIO import *
 from .SMRTLinkIsoSeqFiles import *
@@ -12,12 +12,23 @@ from cPickle import dump, load
 from collections import defaultdict
 from pbtranscript.Utils import realpath, mkdir, as_contigset
 from pbtranscript.io.ContigSetReaderWrapper import ContigSetReaderWrapper
+from pbtranscript.io.FastaRandomReader import FastaRandomReader
 
 
 __author__ = "etseng@pacificbiosciences.com"
 
 __all__ = ["SeparateFLNCRunner",
-           "convert_pickle_to_sorted_flnc_files"]
+           "convert_pickle_to_sorted_flnc_files",
+           "estimate_cluster_cost"]
+
+
+def estimate_cluster_cost(n_reads, n_bases):
+    """
+    Return estimated cost of ICE clustering n_reads reads with n_bases
+    bases in total: every read is aligned to all other reads, so the
+    cost grows with n_reads * n_bases, not with n_bases alone.
+    """
+    return float(n_reads) * n_bases
 
 
 class SeparateFLNCBase(object):
@@ -311,12 +322,19 @@ class SeparateFLNCBySize(SeparateFLNCBase):
     """
     def __init__(self, flnc_filename, root_dir, out_pickle=None,
                  output_basename="isoseq_flnc", bin_size_kb=1,
-                 bin_manual=None, max_base_limit_MB=600):
+                 bin_manual=None, max_base_limit_MB=600, cost_balanced=False):
         """
         Parameters:
           bin_size_kb - size bins are "0to1K", "1to2K", ..., "{n}to{n+1}K"
           bin_manual - manually sepcificied size bin
           max_base_limit_MB - maximum number of bases in Mb in each bin.
+          cost_balanced - if True, get read lengths (see get_read_lengths)
+                          and assign reads to parts of a size bin by
+                          estimated clustering cost, otherwise assign reads
+                          to parts round-robin. Either way, all reads are
+                          assigned before any is written, so sequences are
+                          read twice unless an up-to-date FASTA index
+                          (.fai) gives read lengths.
 
           If <bin_manual> (ex: (0, 2, 4, 12)) is given, <bin_size_kb> is ignored.
 
@@ -327,11 +345,33 @@ class SeparateFLNCBySize(SeparateFLNCBase):
                                                  root_dir=root_dir,
                                                  out_pickle=out_pickle,
                                                  output_basename=output_basename)
+        # {read name: read length} if cost_balanced, otherwise None
+        self.read_lengths = self.get_read_lengths() if cost_balanced else None
         # a dictionary mapping a SizeBin to number of parts in the SizeBin
         # {SizeBin(lb, ub): num_parts in SizeBin(lb, ub)}
         self.size_bins_parts = self.get_size_bins_parts(bin_size_kb=bin_size_kb,
                                                         bin_manual=bin_manual,
                                                         max_base_limit_MB=max_base_limit_MB)
+        # {read name: (SizeBin, part)} if cost_balanced, otherwise None
+        self.read_parts = self.assign_parts_by_cost() if cost_balanced else None
+
+    def get_read_lengths(self):
+        """
+        Return {read name: read length}. Lengths of reads in FASTA or
+        ContigSet of FASTA files are taken from FASTA index files (.fai)
+        without reading sequences if the indices are up to date, otherwise
+        sequences are scanned once to build the indices, which are written
+        for later runs; lengths of reads in FASTQ files are read from
+        sequences. Note that filters in ContigSet are not respected.
+        """
+        try:
+            reader = FastaRandomReader(self.flnc_filename)
+        except IOError:
+            logging.info("Could not index %s, reading sequence lengths.",
+                         self.flnc_filename)
+            return ContigSetReaderWrapper.name_to_len_dict(self.flnc_filename)
+        with reader:
+            return reader.lengths
 
     def get_size_bins_parts(self, bin_size_kb, bin_manual, max_base_limit_MB):
         """
@@ -340,13 +380,15 @@ class SeparateFLNCBySize(SeparateFLNCBase):
         # first check min - max size range
         min_size = sys.maxint + 1
         max_size = 0
-        base_in_each_size = defaultdict(lambda: 0) # SizeBin --> number of bases
-        for r in ContigSetReaderWrapper(self.flnc_filename):
-            seqlen = len(r.sequence)
+        base_in_each_size = defaultdict(lambda: 0) # size in kb --> number of bases
+        if self.read_lengths is not None:
+            seqlens = self.read_lengths.itervalues()
+        else:
+            seqlens = (len(r.sequence) for r in ContigSetReaderWrapper(self.flnc_filename))
+        for seqlen in seqlens:
             min_size = min(min_size, seqlen)
             max_size = max(max_size, seqlen)
-            b = SizeBin(seqlen/1000, seqlen/1000+1)
-            base_in_each_size[b] += len(r.sequence)
+            base_in_each_size[seqlen/1000] += seqlen
 
         min_size_kb = min_size/1000
         max_size_kb = max_size/1000 + (1 if max_size%1000 != 0 else 0)
@@ -370,8 +412,8 @@ class SeparateFLNCBySize(SeparateFLNCBase):
         size_bins_bases = dict({b:0 for b in size_bins}) # SizeBin -> total n of bases in it
         size_bins_parts = dict({b:0 for b in size_bins}) # SizeBin -> total n of partitions in it
         if max_base_limit_MB is not None:
-            for _b, num_bases in base_in_each_size.iteritems():
-                b = size_bins.which_bin_contains(_b)
+            for kb, num_bases in base_in_each_size.iteritems():
+                b = size_bins.which_bin_contains(SizeBin(kb, kb+1))
                 size_bins_bases[b] += num_bases
 
             for b, num_bases in size_bins_bases.iteritems():
@@ -380,6 +422,37 @@ class SeparateFLNCBySize(SeparateFLNCBase):
 
         return size_bins_parts
 
+    def assign_parts_by_cost(self):
+        """
+        Return {read name: (SizeBin, part)}, where reads of each SizeBin are assigned,
+        longest first, to the part of the SizeBin whose estimated clustering
+        cost is the least after adding the read, so that parts of a SizeBin
+        have similar clustering costs.
+        """
+        size_bins = self.size_bins
+        bin_of_kb = {} # read length in kb -> SizeBin, as SizeBins are in kb
+        reads_in_each_bin = defaultdict(list) # SizeBin -> [(-read length, read name)]
+        for name, seqlen in self.read_lengths.iteritems():
+            kb = seqlen/1000
+            if kb not in bin_of_kb:
+                bin_of_kb[kb] = size_bins.which_bin_contains(seqlen)
+            reads_in_each_bin[bin_of_kb[kb]].append((-seqlen, name))
+
+        read_parts = {}
+        for b, reads in reads_in_each_bin.iteritems():
+            num_parts = self.size_bins_parts[b]
+            n_reads, n_bases = [0] * num_parts, [0] * num_parts
+            for neg_seqlen, name in sorted(reads):
+                p = min(xrange(num_parts),
+                        key=lambda i: estimate_cluster_cost(n_reads[i] + 1,
+                                                            n_bases[i] - neg_seqlen))
+                n_reads[p] += 1
+                n_bases[p] -= neg_seqlen
+                read_parts[name] = (b, p)
+            logging.debug("Estimated clustering costs of parts of %s: %s", b,
+                          [estimate_cluster_cost(n, l) for n, l in zip(n_reads, n_bases)])
+        return read_parts
+
     @property
     def size_bins(self):
         """Return a list of sorted SizeBin objects.
@@ -409,19 +482,24 @@ class SeparateFLNCBySize(SeparateFLNCBase):
 
     def run(self):
         """Run"""
-        read_counter_in_each_bin = dict({b:0 for b in self.size_bins})
+        size_bins = self.size_bins
+        read_counter_in_each_bin = dict({b:0 for b in size_bins})
 
         for r in ContigSetReaderWrapper(self.flnc_filename):
-            b = self.size_bins.which_bin_contains(len(r.sequence))
-            p = read_counter_in_each_bin[b] % self.size_bins_parts[b]
-            read_counter_in_each_bin[b] += 1
+            if self.read_parts is not None:
+                b, p = self.read_parts[r.name.split()[0]]
+            else:
+                b = size_bins.which_bin_contains(len(r.sequence))
+                p = read_counter_in_each_bin[b] % self.size_bins_parts[b]
+                read_counter_in_each_bin[b] += 1
             self.handles[(b, p)].write(">{0}\n{1}\n".format(r.name, r.sequence[:]))
 
 
 class SeparateFLNCRunner(object):
     """Runner to either bin by primer, by manual or by size kb."""
     def __init__(self, flnc_fa, root_dir, out_pickle,
-                 bin_size_kb, bin_by_primer, bin_manual, max_base_limit_MB):
+                 bin_size_kb, bin_by_primer, bin_manual, max_base_limit_MB,
+                 cost_balanced=False):
         self.flnc_fa = flnc_fa
         self.root_dir = root_dir
         self.out_pickle = out_pickle
@@ -429,6 +507,7 @@ class SeparateFLNCRunner(object):
         self.bin_by_primer = bool(bin_by_primer)
         self.bin_manual = bin_manual
         self.max_base_limit_MB = int(max_base_limit_MB)
+        self.cost_balanced = bool(cost_balanced)
 
     def run(self):
         """Run"""
@@ -450,6 +529,7 @@ class SeparateFLNCRunner(object):
                                     bin_size_kb=self.bin_size_kb,
                                     bin_manual=bin_manual,
                                     max_base_limit_MB=self.max_base_limit_MB,
+                                    cost_balanced=self.cost_balanced,
                                     out_pickle=self.out_pickle) as obj:
                 obj.run()
         return 0
@@ -10,6 +10,7 @@ import cPickle
 import os.path as op
 from pbcore.io import ContigSet
 from pbtranscript.ice.IceFiles import IceFiles
+from pbtranscript.Utils import balance_by_cost
 
 def n_reads_in_contigset(contigset_file):
     """Return number of reads in a contigset"""
@@ -24,6 +25,19 @@ def n_reads_in_contigsets(contigset_files):
     return [n_reads_in_contigset(f) for f in contigset_files]
 
 
+def n_bases_in_contigset(contigset_file):
+    """Return number of bases in a contigset"""
+    cs = ContigSet(contigset_file)
+    cs.assertIndexed()
+    return int(cs.totalLength)
+
+
+def n_bases_in_contigsets(contigset_files):
+    """Given a list of contigset files, return number of bases in
+    these files as a list of ints"""
+    return [n_bases_in_contigset(f) for f in contigset_files]
+
+
 class ChunkTask(object):
     """
     An instance of class represents a chunk task.
@@ -33,6 +47,9 @@ class ChunkTask(object):
         self.flnc_file = flnc_file
         self.cluster_out_dir = cluster_out_dir
         self.n_flnc_reads = 0
+        # cost of this task predicted by create_chunks, to be compared with
+        # its actual run time
+        self.predicted_cost = None
         if op.exists(self.flnc_file):
             self.n_flnc_reads = n_reads_in_contigset(self.flnc_file)
             #raise IOError("Could not find flnc_file %s" % self.flnc_file)
@@ -54,6 +71,8 @@ class ChunkTask(object):
                 "  cluster out dir {d},".format(d=self.cluster_out_dir)]
         if hasattr(self, 'n_flnc_reads'):
             strs.append("  number of flnc reads {n}".format(n=self.n_flnc_reads))
+        if getattr(self, 'predicted_cost', None) is not None:
+            strs.append("  predicted cost {c}".format(c=self.predicted_cost))
         return "\n".join(strs)
 
     def __repr__(self):
@@ -202,9 +221,19 @@ class ChunkTasksPickle(object):
         First sort and then group chunk_tasks into no greater than {max_nchunks}
         groups so that the total number of flnc reads in each group is roughly
         the same.
+
+        If all chunk tasks have costs predicted by create_chunks, tasks are
+        grouped by predicted costs instead, most costly task first to the
+        least loaded group.
         """
         for t in self.chunk_tasks:
             print t
+        if len(self.chunk_tasks) > 0 and \
+           all([getattr(task, 'predicted_cost', None) is not None for task in self.chunk_tasks]):
+            self.sorted_by_attr(attr='predicted_cost', reverse=True)
+            return balance_by_cost([task.predicted_cost for task in self.chunk_tasks],
+                                   max_nchunks)
+
         # sort tasks by weight (n of flnc reads in task) reversely
         self.sorted_by_attr(attr='n_flnc_reads', reverse=True)
 
@@ -7,6 +7,7 @@ of cluster bins.
 import logging
 import os.path as op
 import sys
+import time
 
 from pbcommand.cli.core import pbparser_runner
 from pbcommand.models import FileTypes
@@ -91,7 +92,11 @@ def resolved_tool_contract_runner(rtc):
                                 nproc=nproc, use_finer_qv=use_finer_qv)
             log.info("ARGUMENTS of Task %s/%s:\n%s", str(i), str(len(p)), str(args))
             log.info("Running ICE on cluster bin %s", task.cluster_bin_index)
+            start_t = time.time()
             PBTranscript(args, subCommand="cluster").start()
+            log.info("ICE of cluster bin %s took %.1f seconds, predicted cost %s",
+                     task.cluster_bin_index, time.time() - start_t,
+                     getattr(task, 'predicted_cost', None))
             writer.write("ICE of cluster bin %s in %s is DONE: %s\n" %
                          (task.cluster_bin_index, task.cluster_out_dir,
                           task.consensus_isoforms_file))
@@ -5,6 +5,11 @@ binning (separate_flnc) is done.
   All chunk tasks for ICE will be saved to ice_cluster.pickle as a list.
   All chunk tasks for ice_partial will be saved to ice_partial.pickle as a list.
   All chunk tasks for ice_polish will be saved to ice_polish.pickle as a list.
+
+Numbers of ice_partial and ice_polish chunks of each bin are planned by
+estimated costs of chunk tasks, so that a tiny bin does not get as many
+chunks as a huge one. Predicted cost of every chunk task is saved with
+the task, to be compared with its actual run time.
 """
 
 import logging
@@ -17,13 +22,16 @@ from pbcommand.cli import pbparser_runner
 from pbcommand.pb_io.common import load_pipeline_chunks_from_json
 from pbcommand.utils import setup_log
 
+from pbcore.io import ContigSet
+
 import pbcoretools.chunking.chunk_utils as CU
 from pbcoretools.chunking.gather import get_datum_from_chunks_by_chunk_key
 
-from pbtranscript.Utils import ln
+from pbtranscript.Utils import ln, mkdir, balance_by_cost, cat_files, as_contigset
 from pbtranscript.tasks.TPickles import ClusterChunkTask, PartialChunkTask,\
-        PolishChunkTask, ChunkTasksPickle, n_reads_in_contigsets
-from pbtranscript.separate_flnc import SeparateFLNCBase
+        PolishChunkTask, ChunkTasksPickle, n_reads_in_contigset, \
+        n_reads_in_contigsets, n_bases_in_contigsets
+from pbtranscript.separate_flnc import SeparateFLNCBase, estimate_cluster_cost
 
 
 log = logging.getLogger(__name__)
@@ -35,6 +43,9 @@ class Constants(object):
     DEFAULT_NCHUNKS = 24
     VERSION = "0.1.0"
     DRIVER_EXE = "python -m %s --resolved-tool-contract " % TOOL_ID
+    # Overhead of an ice_partial or ice_polish chunk task, e.g., loading
+    # and indexing consensus isoforms, as the cost of this many reads.
+    TASK_OVERHEAD_READS = 500
 
 
 def get_contract_parser():
@@ -80,17 +91,75 @@ def get_contract_parser():
     return p
 
 
+def estimate_partial_cost(n_nfl_reads, n_ref_bases):
+    """
+    Return estimated cost of an ice_partial chunk task, which aligns
+    n_nfl_reads nFL reads to consensus isoforms of a bin with n_ref_bases
+    bases in total: every nFL read is aligned to all consensus isoforms.
+    """
+    return float(n_nfl_reads + Constants.TASK_OVERHEAD_READS) * n_ref_bases
+
+
+def estimate_polish_cost(n_flnc_reads, consensus_len):
+    """
+    Return estimated cost of an ice_polish chunk task, which polishes
+    consensus isoforms of n_flnc_reads FLNC reads: every read is aligned
+    to its consensus isoform of length consensus_len.
+    """
+    return float(n_flnc_reads + Constants.TASK_OVERHEAD_READS) * consensus_len
+
+
+def estimate_makespan(costs, n_workers):
+    """Return makespan of chunk tasks of costs on n_workers workers, where
+    tasks are grouped as ChunkTasksPickle.sort_and_group_tasks does."""
+    return max([0] + [sum(costs[i] for i in g) for g in balance_by_cost(costs, n_workers)])
+
+
+def plan_nchunks(chunk_cost_funcs, max_nchunks):
+    """
+    Return a list of number of chunks of each bin, no greater than
+    max_nchunks, which minimizes estimated makespan of chunk tasks of all
+    bins on max_nchunks workers, where chunk_cost_funcs[i](k) returns
+    estimated cost of a chunk task of the i-th bin split into k chunks.
+
+    Starting from one chunk in each bin, split the bin of the most costly
+    chunk tasks into one more chunk until it has max_nchunks chunks, and
+    return the plan of the least makespan seen.
+    """
+    max_nchunks = max(1, int(max_nchunks))
+    nchunks = [1] * len(chunk_cost_funcs)
+
+    def _makespan():
+        """Return estimated makespan of nchunks."""
+        return estimate_makespan([f(k) for f, k in zip(chunk_cost_funcs, nchunks)
+                                  for dummy_i in range(k)], max_nchunks)
+
+    best_makespan, best_nchunks = _makespan(), list(nchunks)
+    while len(nchunks) > 0:
+        i = max(range(len(nchunks)), key=lambda i: chunk_cost_funcs[i](nchunks[i]))
+        if nchunks[i] >= max_nchunks:
+            break
+        nchunks[i] += 1
+        makespan = _makespan()
+        if makespan < best_makespan:
+            best_makespan, best_nchunks = makespan, list(nchunks)
+    log.info("Planned number of chunks %s, estimated makespan %s",
+             best_nchunks, best_makespan)
+    return best_nchunks
+
+
 def _get_cluster_out_dir(flnc_file):
     """Return cluster out dir given flnc file."""
     return op.join(op.dirname(flnc_file), "cluster_out")
 
 
-def create_cluster_pickle(flnc_files, out_pickle):
+def create_cluster_pickle(flnc_files, out_pickle, predicted_costs=None):
     """Create cluster chunk task pickle.
     Parameters:
       n_bins -- number of bins
       flnc_files -- full-length non-chimeric files in bins
       out_pickle -- output pickle for saving ClusterChunkTask objects
+      predicted_costs -- predicted cost of ICE of each bin
     """
     n_bins = len(flnc_files)
     log.info("Writing %s cluster chunk tasks to %s.", str(n_bins), out_pickle)
@@ -103,47 +172,56 @@ def create_cluster_pickle(flnc_files, out_pickle):
         # Create Cluster chunk tasks.
         task_ = ClusterChunkTask(cluster_bin_index=i, flnc_file=flnc_file,
                                  cluster_out_dir=cluster_out_dir)
+        if predicted_costs is not None:
+            task_.predicted_cost = predicted_costs[i]
         p.append(task_)
 
     p.write(out_pickle)
     log.info("Saved %s cluster chunk tasks to %s.", str(n_bins), out_pickle)
 
 
-def create_partial_pickle(flnc_files, chunked_nfl_files, out_pickle):
+def create_partial_pickle(flnc_files, chunked_nfl_files_in_bins, out_pickle,
+                          predicted_costs_in_bins=None):
     """
     Parameters:
       flnc_files -- full-length non-chimeric files in bins
-      chunked_nfl_files -- chunked non-chimeric files
+      chunked_nfl_files_in_bins -- chunked non-chimeric files of each bin
       out_pickle -- output pickle for saving PolishChunkTask objects
+      predicted_costs_in_bins -- predicted cost of each ice_partial chunk of each bin
     """
-    n_bins = len(flnc_files)
-    n_nfl_chunks = max(1, len(chunked_nfl_files))
+    assert len(chunked_nfl_files_in_bins) == len(flnc_files)
+    n_tasks = sum([max(1, len(fns)) for fns in chunked_nfl_files_in_bins])
 
-    log.info("Writing %s ice_partial chunk tasks to %s.", str(n_bins * n_nfl_chunks), out_pickle)
+    log.info("Writing %s ice_partial chunk tasks to %s.", str(n_tasks), out_pickle)
     p = ChunkTasksPickle()
 
     for i, flnc_file in enumerate(flnc_files):
         log.debug("Processing cluster bin index=%s.", i)
         cluster_out_dir = _get_cluster_out_dir(flnc_file)
+        n_nfl_chunks = max(1, len(chunked_nfl_files_in_bins[i]))
 
-        for j, nfl_file in enumerate(chunked_nfl_files):
+        for j, nfl_file in enumerate(chunked_nfl_files_in_bins[i]):
             # Create Partial chunk tasks.
             task_ = PartialChunkTask(cluster_bin_index=i, flnc_file=flnc_file,
                                      cluster_out_dir=cluster_out_dir,
                                      nfl_file=nfl_file,
                                      nfl_index=j, n_nfl_chunks=n_nfl_chunks)
+            if predicted_costs_in_bins is not None:
+                task_.predicted_cost = predicted_costs_in_bins[i][j]
             p.append(task_)
 
     p.write(out_pickle)
-    log.info("Saved %s partial chunk tasks to %s.", str(n_bins * n_nfl_chunks), out_pickle)
+    log.info("Saved %s partial chunk tasks to %s.", str(n_tasks), out_pickle)
 
 
-def create_polish_pickle(n_polish_chunks_in_bins, flnc_files, out_pickle):
+def create_polish_pickle(n_polish_chunks_in_bins, flnc_files, out_pickle,
+                         predicted_costs=None):
     """
     Parameters:
       n_polish_chunks_in_bins -- number of ice_polish chunks in each bin
       flnc_files -- full-length non-chimeric files in bins
       out_pickle -- output pickle for saving PolishChunkTask objects
+      predicted_costs -- predicted cost of an ice_polish chunk of each bin
     """
     n_bins = len(flnc_files)
     assert isinstance(n_polish_chunks_in_bins, list)
@@ -164,6 +242,8 @@ def create_polish_pickle(n_polish_chunks_in_bins, flnc_files, out_pickle):
                                     cluster_out_dir=cluster_out_dir,
                                     polish_index=j,
                                     n_polish_chunks=n_polish_chunks_in_bins[i])
+            if predicted_costs is not None:
+                task_.predicted_cost = predicted_costs[i]
             p.append(task_)
 
     p.write(out_pickle)
@@ -187,6 +267,28 @@ def chunk_contigset(in_file, n_chunks, out_dir, out_chunk_json):
     return chunked_files
 
 
+def merge_contigset_chunks(chunked_files, n_chunks, out_dir):
+    """
+    Merge chunked contigset files into n_chunks contigset files under
+    out_dir, each of consecutive chunked files, so that a contigset
+    chunked once can be used as if it were chunked into fewer chunks.
+    Return merged contigset files.
+    """
+    n_chunks = max(1, min(n_chunks, len(chunked_files)))
+    log.info("Merging %s chunks into %s chunks under %s",
+             str(len(chunked_files)), str(n_chunks), out_dir)
+    merged_files = []
+    for i in range(n_chunks):
+        group = chunked_files[i * len(chunked_files) / n_chunks:
+                              (i + 1) * len(chunked_files) / n_chunks]
+        fasta_file = op.join(out_dir, "merged-nfl.chunk%d.fasta" % i)
+        cat_files(src=[fa for fn in group for fa in ContigSet(fn).toExternalFiles()],
+                  dst=fasta_file)
+        merged_files.append(op.join(out_dir, "merged-nfl.chunk%d.contigset.xml" % i))
+        as_contigset(fasta_file, merged_files[-1])
+    return merged_files
+
+
 def run_main(separate_flnc_pickle_file, nfl_contigset,
              cluster_chunk_pickle, partial_chunk_pickle, polish_chunk_pickle,
              max_nchunks):
@@ -205,25 +307,55 @@ def run_main(separate_flnc_pickle_file, nfl_contigset,
     log.info("max_nchunks: %s", max_nchunks)
     n_nfl_chunks = max(1, int(max_nchunks))
 
-    out_dir = op.dirname(cluster_chunk_pickle)
-    nfl_chunk_json = op.join(out_dir, 'nfl_chunk.json')
-    chunked_nfl_files = chunk_contigset(in_file=nfl_contigset, n_chunks=n_nfl_chunks,
-                                        out_dir=out_dir, out_chunk_json=nfl_chunk_json)
+    # Consensus isoforms of a bin are estimated to be as long as its flnc
+    # reads on average, and to have bases in proportion to its flnc reads.
+    n_reads_in_bins = n_reads_in_contigsets(flnc_fns)
+    n_bases_in_bins = n_bases_in_contigsets(flnc_fns)
+    consensus_lens = [b / max(1.0, n) for n, b in zip(n_reads_in_bins, n_bases_in_bins)]
+    n_nfl_reads = n_reads_in_contigset(nfl_contigset)
 
     create_cluster_pickle(flnc_files=flnc_fns,
-                          out_pickle=cluster_chunk_pickle)
+                          out_pickle=cluster_chunk_pickle,
+                          predicted_costs=[estimate_cluster_cost(n, b) for n, b
+                                           in zip(n_reads_in_bins, n_bases_in_bins)])
+
+    # Chunk nfl reads once, into the largest planned number of ice_partial
+    # chunks, and merge consecutive chunks for bins planned fewer chunks.
+    partial_nchunks = plan_nchunks([lambda k, b=b: estimate_partial_cost(n_nfl_reads / float(k), b)
+                                    for b in n_bases_in_bins], max_nchunks=n_nfl_chunks)
+    out_dir = op.dirname(cluster_chunk_pickle)
+    chunked_nfl_files = chunk_contigset(
+        in_file=nfl_contigset, n_chunks=max(partial_nchunks), out_dir=out_dir,
+        out_chunk_json=op.join(out_dir, 'nfl_chunk.json'))
+    chunked_nfl_files_of_nchunks = {}
+    for k in sorted(set(partial_nchunks)):
+        if k < len(chunked_nfl_files):
+            k_out_dir = op.join(out_dir, "nfl_chunks_%d" % k)
+            mkdir(k_out_dir)
+            chunked_nfl_files_of_nchunks[k] = merge_contigset_chunks(
+                chunked_files=chunked_nfl_files, n_chunks=k, out_dir=k_out_dir)
+        else:
+            chunked_nfl_files_of_nchunks[k] = chunked_nfl_files
+    n_reads_in_nfl_files = dict([(fn, n_reads_in_contigset(fn)) for fns in
+                                 chunked_nfl_files_of_nchunks.values() for fn in fns])
+
+    chunked_nfl_files_in_bins = [chunked_nfl_files_of_nchunks[k] for k in partial_nchunks]
     create_partial_pickle(flnc_files=flnc_fns,
-                          chunked_nfl_files=chunked_nfl_files,
-                          out_pickle=partial_chunk_pickle)
-
-    # Total number of flnc reads in all bins
-    n_reads_in_bins = n_reads_in_contigsets(flnc_fns)
-    sum_n_flnc_reads = sum(n_reads_in_bins)
-    n_polish_chunks_in_bins = [max(1, int(n * max_nchunks / (1.0 * sum_n_flnc_reads)))
-                               for n in n_reads_in_bins]
+                          chunked_nfl_files_in_bins=chunked_nfl_files_in_bins,
+                          out_pickle=partial_chunk_pickle,
+                          predicted_costs_in_bins=[
+                              [estimate_partial_cost(n_reads_in_nfl_files[fn], b) for fn in fns]
+                              for fns, b in zip(chunked_nfl_files_in_bins, n_bases_in_bins)])
+
+    n_polish_chunks_in_bins = plan_nchunks(
+        [lambda k, n=n, l=l: estimate_polish_cost(n / float(k), l)
+         for n, l in zip(n_reads_in_bins, consensus_lens)], max_nchunks=max_nchunks)
     create_polish_pickle(n_polish_chunks_in_bins=n_polish_chunks_in_bins,
                          flnc_files=flnc_fns,
-                         out_pickle=polish_chunk_pickle)
+                         out_pickle=polish_chunk_pickle,
+                         predicted_costs=[estimate_polish_cost(n / float(k), l) for n, l, k
+                                          in zip(n_reads_in_bins, consensus_lens,
+                                                 n_polish_chunks_in_bins)])
 
     # Make a soft link of nfl_contigset in the same directory as separate_flnc.pickle
     # for users' convenience
@@ -7,6 +7,7 @@ PartialChunkTask objects in input pickle.
 
 import logging
 import sys
+import time
 
 from pbcore.io import ConsensusReadSet
 from pbcommand.cli import pbparser_runner
@@ -93,7 +94,12 @@ def resolved_tool_contract_runner(rtc):
             log.info("Running ice_partial on cluster bin %s, nfl chunk %s/%s",
                      str(task.cluster_bin_index),
                      str(task.nfl_index), str(task.n_nfl_chunks))
+            start_t = time.time()
             task_runner(task=task, ccs_file=ccs_file, nproc=nproc, tmp_dir=tmp_dir)
+            log.info("ice_partial of cluster bin %s, nfl chunk %s/%s took %.1f seconds, "
+                     "predicted cost %s", str(task.cluster_bin_index), str(task.nfl_index),
+                     str(task.n_nfl_chunks), time.time() - start_t,
+                     getattr(task, 'predicted_cost', None))
             writer.write("ice_partial of cluster bin %s, nfl chunk %s/%s in %s is DONE: %s\n" %
                          (task.cluster_bin_index, task.nfl_index, task.n_nfl_chunks,
                           task.cluster_out_dir, task.nfl_pickle))
@@ -6,6 +6,7 @@ IceQuiver to polish consensus isoforms.
 import logging
 import os.path as op
 import sys
+import time
 
 from pbcommand.cli.core import pbparser_runner
 from pbcommand.utils import setup_log
@@ -100,7 +101,12 @@ def resolved_tool_contract_runner(rtc):
             log.debug("ice_quiver root_dir is %s", task.cluster_out_dir)
             log.debug("consensus_isoforms is %s", task.consensus_isoforms_file)
 
+            start_t = time.time()
             task_runner(task=task, subread_set=subread_set, nproc=nproc, tmp_dir=tmp_dir)
+            log.info("ice_polish of cluster bin %s, polish chunk %s/%s took %.1f seconds, "
+                     "predicted cost %s", str(task.cluster_bin_index), str(task.polish_index),
+                     str(task.n_polish_chunks), time.time() - start_t,
+                     getattr(task, 'predicted_cost', None))
             writer.write("ice_polish of cluster bin %s, polish chunk %s/%s in %s is DONE.\n" %
                          (task.cluster_bin_index, task.polish_index, task.n_polish_chunks,
                           task.cluster_out_dir))
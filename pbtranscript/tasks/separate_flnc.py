@@ -49,6 +49,12 @@ class Constants(object):
     MAX_BASE_LIMIT_MB_DESC = "Maximum number of bases per partitioned bin, in MB " + \
                              "(default: %s)" % MAX_BASE_LIMIT_MB_DEFAULT
 
+    COST_BALANCED_DEFAULT = False
+    COST_BALANCED_DESC = "Get read lengths from FASTA index instead of reading " + \
+                         "sequences twice, and assign reads to partitions of a bin " + \
+                         "by estimated clustering cost instead of round-robin " + \
+                         "(default: %s)" % COST_BALANCED_DEFAULT
+
 
 def add_separate_flnc_io_arguments(arg_parser):
     """Add separate flnc io arguments."""
@@ -79,6 +85,9 @@ def add_separate_flnc_arguments(arg_parser):
 
     sepa_group.add_argument("--max_base_limit_MB", default=Constants.MAX_BASE_LIMIT_MB_DEFAULT,
                             type=int, help=Constants.MAX_BASE_LIMIT_MB_DESC)
+
+    sepa_group.add_argument("--cost_balanced", default=Constants.COST_BALANCED_DEFAULT,
+                            action="store_true", help=Constants.COST_BALANCED_DESC)
     return arg_parser
 
 
@@ -100,7 +109,8 @@ def args_runner(args):
     """Run given input args"""
     s = SeparateFLNCRunner(flnc_fa=args.flnc_fa, root_dir=args.root_dir, out_pickle=args.out_pickle,
                            bin_size_kb=args.bin_size_kb, bin_by_primer=args.bin_by_primer,
-                           bin_manual=args.bin_manual, max_base_limit_MB=args.max_base_limit_MB)
+                           bin_manual=args.bin_manual, max_base_limit_MB=args.max_base_limit_MB,
+                           cost_balanced=args.cost_balanced)
     s.run()
 
 
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""
+A local stand-in for 'phmmer', so that code which calls phmmer (e.g.,
+Classifier and PhmmerPool) can be tested where HMMER is not installed.
+
+Accepts options passed to phmmer by pbtranscript. Every query sequence
+is compared with every target (primer) sequence without gaps, at every
+offset where the whole target fits in the query, and an offset where
+at least MIN_IDENTITY of bases match is reported as a domain hit in
+--domtblout format. Scores are deterministic, not phmmer's.
+"""
+
+import argparse
+import sys
+
+MIN_IDENTITY = 0.75
+
+
+def get_parser():
+    """Return parser of phmmer options."""
+    parser = argparse.ArgumentParser(prog="fake_phmmer")
+    parser.add_argument("--cpu", type=int, default=1)
+    parser.add_argument("--domtblout", required=True)
+    parser.add_argument("--noali", action="store_true")
+    parser.add_argument("--domE", type=float, default=10)
+    parser.add_argument("--mxfile", default=None)
+    parser.add_argument("--popen", type=float, default=0.02)
+    parser.add_argument("--pextend", type=float, default=0.4)
+    parser.add_argument("query_fn")
+    parser.add_argument("target_fn")
+    return parser
+
+
+def read_fasta(fn):
+    """Return a list of (name, sequence) in a fasta file."""
+    ret = []
+    with open(fn) as reader:
+        for line in reader:
+            line = line.strip()
+            if line.startswith(">"):
+                ret.append([line[1:].split()[0], []])
+            elif len(ret) > 0:
+                ret[-1][1].append(line.upper())
+    return [(name, "".join(seq)) for name, seq in ret]
+
+
+def hits(qseq, tseq):
+    """Yield (qStart, score) of ungapped hits of tseq in qseq."""
+    tlen = len(tseq)
+    for i in xrange(len(qseq) - tlen + 1):
+        n_match = sum(1 for a, b in zip(qseq[i:i + tlen], tseq) if a == b)
+        if n_match >= MIN_IDENTITY * tlen:
+            yield i, 2.0 * n_match - 3.0 * (tlen - n_match)
+
+
+def main(args=sys.argv[1:]):
+    """Write domain hits of queries to targets as phmmer would."""
+    args = get_parser().parse_args(args)
+    queries = read_fasta(args.query_fn)
+    targets = read_fasta(args.target_fn)
+    with open(args.domtblout, 'w') as writer:
+        writer.write("# fake phmmer domain table\n")
+        for qname, qseq in queries:
+            for tname, tseq in targets:
+                for i, score in hits(qseq, tseq):
+                    writer.write(" ".join(str(x) for x in [
+                        tname, "-", len(tseq), qname, "-", len(qseq),
+                        "1e-5", score, 0.0, 1, 1, "1e-5", "1e-5", score, 0.0,
+                        i + 1, i + len(tseq), 1, len(tseq),
+                        i + 1, i + len(tseq), 0.99, "-"]) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""
+A local stand-in for SGE 'qsub', which runs the submitted script on this
+machine, so that SGE code paths (e.g., JobScheduler with SgeBackend) can
+be tested without a cluster.
+
+Accepts options written by SgeOptions.qsub_cmd. With '-sync y', waits
+for the script and exits with its exit code, otherwise runs the script
+in background. Either way, prints
+    Your job <id> ("<name>") has been submitted
+where <id> is the pid of the process running the script.
+"""
+
+import argparse
+import os.path as op
+import subprocess
+import sys
+
+
+def get_parser():
+    """Return parser of qsub options."""
+    parser = argparse.ArgumentParser(prog="fake_qsub")
+    parser.add_argument("-cwd", action="store_true")
+    parser.add_argument("-V", action="store_true")
+    parser.add_argument("-S", dest="shell", default="/bin/bash")
+    parser.add_argument("-pe", nargs=2, default=None)
+    parser.add_argument("-q", dest="queue", default=None)
+    parser.add_argument("-sync", choices=["y", "n"], default="n")
+    parser.add_argument("-hold_jid", default=None,
+                        help="ignored, jobs are never held")
+    parser.add_argument("-N", dest="name", default=None)
+    parser.add_argument("-e", dest="elog", default="/dev/null")
+    parser.add_argument("-o", dest="olog", default="/dev/null")
+    parser.add_argument("-b", choices=["y", "n"], default="n")
+    parser.add_argument("script")
+    parser.add_argument("script_args", nargs=argparse.REMAINDER)
+    return parser
+
+
+def main(args=sys.argv[1:]):
+    """Run a script as qsub would."""
+    args = get_parser().parse_args(args)
+    cmd = [args.script] + args.script_args
+    if args.b != "y":
+        cmd = [args.shell] + cmd
+    name = args.name if args.name is not None else op.basename(args.script)
+
+    with open(args.olog, 'a') as olog, open(args.elog, 'a') as elog:
+        p = subprocess.Popen(cmd, stdout=olog, stderr=elog)
+    print 'Your job {i} ("{n}") has been submitted'.format(i=p.pid, n=name)
+    sys.stdout.flush()
+    if args.sync != "y":
+        return 0
+    code = p.wait()
+    print "Job {i} exited with exit code {c}.".format(i=p.pid, c=code)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
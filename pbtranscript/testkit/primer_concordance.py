@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+"""
+Report concordance of primer calls of Classifier's primer detectors
+(phmmer and native) on simulated CCS reads with known primers.
+
+For every read, the primer, strand, 5' seen and 3' seen calls of each
+detector are compared with the truth and with each other. A detector
+is skipped if it can not run here (e.g., phmmer is not installed).
+"""
+
+import argparse
+import os
+import os.path as op
+import sys
+import time
+from distutils.spawn import find_executable
+
+from pbtranscript.Classifier import Classifier, ChimeraDetectionOptions, \
+    PRIMER_DETECTORS
+from pbtranscript.testkit.simulate_ccs import read_primer_pairs, \
+    simulate_ccs_reads
+
+__all__ = ["call_primers", "concordance_report"]
+
+
+def call_primers(reads_fn, out_dir, primer_fn, primer_detector, cpus=1,
+                 opts=ChimeraDetectionOptions(50, 10, 100, 50, 100, False)):
+    """
+    Find primers of reads in reads_fn by primer_detector the way
+    Classifier does, return {read id: (primer, strand, fiveseen,
+    threeseen)} where primer and strand are None if no primer is seen.
+    """
+    if not op.exists(out_dir):
+        os.makedirs(out_dir)
+    obj = Classifier(reads_fn=reads_fn, out_dir=out_dir, primer_fn=primer_fn,
+                     cpus=cpus, opts=opts, primer_detector=primer_detector)
+    primer_indices = obj._processPrimers(
+        primer_fn=primer_fn, window_size=opts.primer_search_window,
+        primer_out_fn=obj.primer_front_back_fn, revcmp_primers=False)
+    try:
+        records = obj.primerDetector.search(
+            seqs=obj._frontBackWindows(reads_fn, opts.primer_search_window),
+            primer_fn=obj.primer_front_back_fn)
+        best_of_front, best_of_back = obj._pickBestFrontBackRecords(records)
+    finally:
+        obj._closePrimerDetector()
+
+    calls = {}
+    with open(reads_fn) as reader:
+        rids = [line[1:].split()[0] for line in reader if line.startswith(">")]
+    for rid in rids:
+        primer, strand, fw, rc = obj._pickBestPrimerCombo(
+            best_of_front[rid], best_of_back[rid], primer_indices,
+            opts.min_score)
+        if fw is None and rc is None:
+            calls[rid] = (None, None, False, False)
+        else:
+            calls[rid] = (primer, strand, fw is not None, rc is not None)
+    return calls
+
+
+def concordance_report(truth, calls, runtimes):
+    """
+    truth --- list of SimulatedRead
+    calls --- {detector: {read id: (primer, strand, fiveseen, threeseen)}}
+    runtimes --- {detector: seconds}
+    Return a list of report lines.
+    """
+    n = len(truth)
+    ret = ["{n} simulated reads, {f} full-length.".format(
+        n=n, f=sum(1 for r in truth if r.fiveseen and r.threeseen))]
+    for d in sorted(calls):
+        c = calls[d]
+        n_5 = sum(1 for r in truth if c[r.name][2] == r.fiveseen)
+        n_3 = sum(1 for r in truth if c[r.name][3] == r.threeseen)
+        seen = [r for r in truth if c[r.name][1] is not None]
+        n_ps = sum(1 for r in seen if c[r.name][:2] == (r.primer, r.strand))
+        ret.append("{d}: 5' seen correct {a:.2%}, 3' seen correct {b:.2%}, ".
+                   format(d=d, a=n_5 / float(n), b=n_3 / float(n)) +
+                   "primer and strand correct {c:.2%} of {s} reads with hits, ".
+                   format(c=n_ps / float(max(1, len(seen))), s=len(seen)) +
+                   "{t:.2f} sec".format(t=runtimes[d]))
+    detectors = sorted(calls)
+    for i, d1 in enumerate(detectors):
+        for d2 in detectors[i + 1:]:
+            n_same = sum(1 for r in truth if calls[d1][r.name] == calls[d2][r.name])
+            ret.append("{d1} vs {d2}: identical calls on {c:.2%} reads.".format(
+                d1=d1, d2=d2, c=n_same / float(n)))
+    return ret
+
+
+def get_parser():
+    """Return argument parser."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("out_dir", help="Output directory")
+    parser.add_argument("--primer_fn", default=None,
+                        help="Primers (default: pbtranscript primers.fasta)")
+    parser.add_argument("--n_reads", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--error_rate", type=float, default=0.01)
+    parser.add_argument("--cpus", type=int, default=1)
+    parser.add_argument("--detectors", nargs="+", default=list(PRIMER_DETECTORS),
+                        choices=PRIMER_DETECTORS)
+    return parser
+
+
+def main(args=sys.argv[1:]):
+    """Simulate reads, call primers and write a concordance report."""
+    args = get_parser().parse_args(args)
+    if not op.exists(args.out_dir):
+        os.makedirs(args.out_dir)
+    primer_fn = args.primer_fn if args.primer_fn is not None else \
+        op.join(op.dirname(op.dirname(op.realpath(__file__))),
+                "data", "primers.fasta")
+
+    reads_fn = op.join(args.out_dir, "simulated.fasta")
+    truth = list(simulate_ccs_reads(read_primer_pairs(primer_fn),
+                                    args.n_reads, seed=args.seed,
+                                    error_rate=args.error_rate))
+    with open(reads_fn, 'w') as writer:
+        for r in truth:
+            writer.write(">{n}\n{s}\n".format(n=r.name, s=r.sequence))
+
+    calls, runtimes = {}, {}
+    for d in args.detectors:
+        if d == "phmmer" and not find_executable("phmmer"):
+            print "Skip {d}, which is not installed.".format(d=d)
+            continue
+        start_t = time.time()
+        calls[d] = call_primers(reads_fn, op.join(args.out_dir, d),
+                                primer_fn, d, cpus=args.cpus)
+        runtimes[d] = time.time() - start_t
+
+    fmt = lambda x: "NA" if x is None else str(int(x) if isinstance(x, bool) else x)
+    with open(op.join(args.out_dir, "primer_concordance.csv"), 'w') as writer:
+        writer.write(",".join(["id", "primer", "strand", "fiveseen", "threeseen"] +
+                              ["{d}_{f}".format(d=d, f=f) for d in sorted(calls)
+                               for f in ("primer", "strand", "fiveseen", "threeseen")]) + "\n")
+        for r in truth:
+            writer.write(",".join(fmt(x) for x in
+                                  [r.name, r.primer, r.strand, r.fiveseen, r.threeseen] +
+                                  [x for d in sorted(calls) for x in calls[d][r.name]]) + "\n")
+
+    lines = concordance_report(truth, calls, runtimes)
+    with open(op.join(args.out_dir, "primer_concordance.txt"), 'w') as writer:
+        writer.write("\n".join(lines) + "\n")
+    print "\n".join(lines)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""
+Simulate CCS reads with known primers and polyA tails, for testing and
+benchmarking pbtranscript classify.
+
+A full-length read on '+' strand is
+    Fi + insert + polyA + Ri
+where Fi and Ri are the i-th primer pair in a primers.fasta, as they
+are expected by Classifier. A '-' strand read is its reverse complement.
+Non-full-length reads miss their 5' or 3' end (primer included).
+"""
+
+import argparse
+import random
+import sys
+from collections import namedtuple
+
+from pbtranscript.Utils import revcmp
+
+__all__ = ["SimulatedRead", "read_primer_pairs", "simulate_ccs_reads"]
+
+MOVIE = "m000000_000000_00000_c000000000000000000000000000000000_s1_p0"
+
+# Truth of a simulated read: primer index, strand ('+' or '-'), and
+# whether its 5' primer, 3' primer and polyA tail are in the read.
+SimulatedRead = namedtuple("SimulatedRead",
+                           "name sequence primer strand fiveseen threeseen polyAseen")
+
+
+def read_primer_pairs(primer_fn):
+    """Return [(F0, R0), (F1, R1), ...] of sequences in a primers.fasta."""
+    seqs = []
+    with open(primer_fn) as reader:
+        for line in reader:
+            line = line.strip()
+            if line.startswith(">"):
+                seqs.append("")
+            elif len(seqs) > 0:
+                seqs[-1] += line.upper()
+    return zip(seqs[0::2], seqs[1::2])
+
+
+def _random_seq(rng, length):
+    """Return a random sequence without long homopolymer A runs."""
+    return "".join(rng.choice("ACGT") for dummy in xrange(length)).\
+        replace("AAAAA", "AACAA")
+
+
+def _add_errors(rng, seq, error_rate):
+    """Return seq with substitutions, insertions and deletions, each at
+    error_rate / 3 per base."""
+    ret = []
+    for base in seq:
+        x = rng.random()
+        if x < error_rate / 3:  # substitution
+            ret.append(rng.choice([b for b in "ACGT" if b != base]))
+        elif x < 2 * error_rate / 3:  # insertion
+            ret.append(base + rng.choice("ACGT"))
+        elif x >= error_rate:  # match
+            ret.append(base)
+        # else deletion
+    return "".join(ret)
+
+
+def simulate_ccs_reads(primer_pairs, n_reads, seed=0, min_insert_len=300,
+                       max_insert_len=2000, polyA_len=30, error_rate=0.01,
+                       fl_fraction=0.7, start_zmw=0):
+    """
+    Yield n_reads SimulatedReads with primers from primer_pairs.
+    A fl_fraction of reads are full-length, the others miss their
+    5' end or their 3' end, with equal chance.
+    """
+    rng = random.Random(seed)
+    for i in xrange(n_reads):
+        primer = rng.randrange(len(primer_pairs))
+        fwd, rev = primer_pairs[primer]
+        insert = _random_seq(rng, rng.randint(min_insert_len, max_insert_len))
+        fiveseen, threeseen = True, True
+        x = rng.random()
+        if x >= fl_fraction:
+            if x < fl_fraction + (1 - fl_fraction) / 2:
+                fiveseen = False
+            else:
+                threeseen = False
+        seq = (fwd if fiveseen else "") + insert + \
+              ("A" * polyA_len + rev if threeseen else "")
+        seq = _add_errors(rng, seq, error_rate)
+        strand = rng.choice("+-")
+        if strand == "-":
+            seq = revcmp(seq)
+        yield SimulatedRead(name="{m}/{z}/ccs".format(m=MOVIE, z=start_zmw + i),
+                            sequence=seq, primer=primer, strand=strand,
+                            fiveseen=fiveseen, threeseen=threeseen,
+                            polyAseen=threeseen)
+
+
+def get_parser():
+    """Return argument parser."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("primer_fn", help="Primers, e.g., primers.fasta")
+    parser.add_argument("out_fn", help="Output FASTA of simulated reads")
+    parser.add_argument("--n_reads", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--error_rate", type=float, default=0.01)
+    parser.add_argument("--truth", default=None,
+                        help="Output CSV of primer, strand, fiveseen, " +
+                             "threeseen of every read")
+    return parser
+
+
+def main(args=sys.argv[1:]):
+    """Simulate reads."""
+    args = get_parser().parse_args(args)
+    primer_pairs = read_primer_pairs(args.primer_fn)
+    truth = open(args.truth, 'w') if args.truth is not None else None
+    with open(args.out_fn, 'w') as writer:
+        if truth is not None:
+            truth.write("id,primer,strand,fiveseen,threeseen,polyAseen\n")
+        for r in simulate_ccs_reads(primer_pairs, args.n_reads, seed=args.seed,
+                                    error_rate=args.error_rate):
+            writer.write(">{n}\n{s}\n".format(n=r.name, s=r.sequence))
+            if truth is not None:
+                truth.write(",".join(str(x) for x in [
+                    r.name, r.primer, r.strand, int(r.fiveseen),
+                    int(r.threeseen), int(r.polyAseen)]) + "\n")
+    if truth is not None:
+        truth.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+"""
+Simulate a SORTED GMAP SAM file of isoforms mapped to multiple
+chromosomes, and the isoforms in a FASTA file, for testing and
+benchmarking pbtranscript collapse, e.g.,
+    python -m pbtranscript.testkit.simulate_gmap_sam out.fasta out.sam
+
+Every gene has a number of exons, every isoform of a gene is a subset
+of its exons, and every copy of an isoform differs from the others by
+a few bases at its ends and, now and then, at a junction, so that both
+isoform collapsing and fuzzy junction merging have work to do.
+
+simulate_locus_transcripts makes exons and transcripts of a single
+locus, as collapse_sam_records passes them to merge_exon_indices.
+"""
+
+import argparse
+import random
+import sys
+from collections import namedtuple
+
+from pbtranscript.Utils import revcmp
+
+__all__ = ["simulate_gmap_sam", "simulate_locus_transcripts"]
+
+# An exon node of a locus, as found by ContiVec.to_exons
+ExonNode = namedtuple("ExonNode", "start end value")
+
+
+def _cigar(exons):
+    """Return cigar string of an isoform aligned to exons without error."""
+    ret = []
+    for i, (start, end) in enumerate(exons):
+        if i > 0:
+            ret.append("%dN" % (start - exons[i - 1][1]))
+        ret.append("%dM" % (end - start))
+    return "".join(ret)
+
+
+def _jitter(rng, exons, max_end_jitter, fuzzy_rate):
+    """Return a copy of exons whose ends move up to max_end_jitter
+    bases, and each junction moves by 1-3 bases at fuzzy_rate."""
+    exons = [list(e) for e in exons]
+    exons[0][0] += rng.randint(0, max_end_jitter)
+    exons[-1][1] -= rng.randint(0, max_end_jitter)
+    for i in xrange(len(exons) - 1):
+        if rng.random() < fuzzy_rate:
+            d = rng.choice([-3, -2, -1, 1, 2, 3])
+            exons[i][1] += d
+            exons[i + 1][0] += d
+    return [tuple(e) for e in exons]
+
+
+def simulate_gmap_sam(out_fasta, out_sam, n_chroms=8, genes_per_chrom=20,
+                      exons_per_gene=6, isoforms_per_gene=3, copies_per_isoform=4,
+                      seed=0, max_end_jitter=20, fuzzy_rate=0.1):
+    """
+    Write isoforms to out_fasta and their alignments sorted by chromosome
+    and position to out_sam. Returns number of isoforms.
+    """
+    rng = random.Random(seed)
+    alignments = [] # (chrom index, start, qname, strand, exons)
+    chrom_lens = []
+    n_isoforms = 0
+    for c in xrange(n_chroms):
+        pos = 1000
+        for dummy_g in xrange(genes_per_chrom):
+            exons = []
+            for dummy_e in xrange(exons_per_gene):
+                length = rng.randint(100, 400)
+                exons.append((pos, pos + length))
+                pos += length + rng.randint(200, 2000)
+            pos += rng.randint(5000, 20000)
+            strand = rng.choice("+-")
+            for dummy_i in xrange(isoforms_per_gene):
+                # keep the first and the last exon, skip others at random
+                iso = [exons[0]] + [e for e in exons[1:-1] if rng.random() < 0.7] + \
+                      [exons[-1]]
+                for dummy_k in xrange(copies_per_isoform):
+                    copy = _jitter(rng, iso, max_end_jitter, fuzzy_rate)
+                    qname = "i0_HQ_sample|c{n}/f{fl}p0/{l}".format(
+                        n=n_isoforms, fl=rng.randint(2, 30),
+                        l=sum(e - s for s, e in copy))
+                    alignments.append((c, copy[0][0], qname, strand, copy))
+                    n_isoforms += 1
+        chrom_lens.append(pos)
+
+    alignments.sort()
+    with open(out_fasta, 'w') as fa_writer, open(out_sam, 'w') as sam_writer:
+        sam_writer.write("@HD\tVN:1.0\tSO:coordinate\n")
+        for c, length in enumerate(chrom_lens):
+            sam_writer.write("@SQ\tSN:chr{c}\tLN:{l}\n".format(c=c, l=length))
+        for c, start, qname, strand, exons in alignments:
+            seq = "".join(rng.choice("ACGT") for dummy in
+                          xrange(sum(e - s for s, e in exons)))
+            fa_writer.write(">{q}\n{s}\n".format(q=qname, s=seq))
+            sam_writer.write("\t".join([
+                qname, "0" if strand == "+" else "16", "chr%d" % c, str(start + 1),
+                "40", _cigar(exons), "*", "0", "0",
+                seq if strand == "+" else revcmp(seq), "*",
+                "NM:i:0", "XS:A:%s" % strand]) + "\n")
+    return n_isoforms
+
+
+def simulate_locus_transcripts(n_transcripts, n_exons=30, n_templates=20, seed=0):
+    """
+    Returns (node_d, transcripts) of a synthetic locus, where
+    node_d is {exon index: ExonNode}, and transcripts is a list of
+    (qID, strand, tuple of exon indices) of n_transcripts transcripts.
+    Every exon is split into 1-3 adjacent nodes, as alternative splice
+    sites do, and transcripts are truncated copies of n_templates
+    isoforms, mostly at their 5' ends, so that many of them can merge.
+    """
+    rng = random.Random(seed)
+    nodes, exons, pos = [], [], 0
+    for dummy_e in xrange(n_exons):
+        exon = []
+        for dummy_k in xrange(rng.randint(1, 3)):
+            length = rng.randint(20, 200)
+            exon.append(len(nodes))
+            nodes.append(ExonNode(pos, pos + length, len(nodes)))
+            pos += length
+        exons.append(exon)
+        pos += rng.randint(100, 1000)
+
+    templates = []
+    while len(templates) < n_templates:
+        chain = []
+        for exon in exons:
+            if rng.random() < 0.6:
+                a = rng.randrange(len(exon))
+                chain.extend(exon[a:rng.randint(a + 1, len(exon))])
+        if len(chain) > 0:
+            templates.append(chain)
+
+    transcripts = []
+    for i in xrange(n_transcripts):
+        chain, strand = rng.choice(templates), rng.choice("+-")
+        # mostly 5' truncated, now and then 3' truncated
+        n5 = rng.randint(0, len(chain) // 2)
+        n3 = rng.randint(0, len(chain) // 4) if rng.random() < 0.2 else 0
+        if strand == '-':
+            n5, n3 = n3, n5
+        transcripts.append(("i%d" % i, strand,
+                            tuple(chain[n5:max(n5 + 1, len(chain) - n3)])))
+    return dict((node.value, node) for node in nodes), transcripts
+
+
+def get_parser():
+    """Return argument parser."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("out_fasta", help="Output FASTA of isoforms")
+    parser.add_argument("out_sam", help="Output SORTED SAM of isoforms")
+    parser.add_argument("--n_chroms", type=int, default=8)
+    parser.add_argument("--genes_per_chrom", type=int, default=20)
+    parser.add_argument("--copies_per_isoform", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(args=sys.argv[1:]):
+    """Simulate isoforms and their alignments."""
+    args = get_parser().parse_args(args)
+    simulate_gmap_sam(args.out_fasta, args.out_sam, n_chroms=args.n_chroms,
+                      genes_per_chrom=args.genes_per_chrom,
+                      copies_per_isoform=args.copies_per_isoform, seed=args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,7 +14,8 @@ and filters collapsed groups based on abundance info.
 
 Procedure:
     (1) separate flnc into bins
-    (2) apply 'pbtranscript cluster' to each bin
+    (2) apply 'pbtranscript cluster' to each bin, one bin at a time, or
+        as many bins concurrently as a core and memory budget allows
     (3) merge polished isoform cluster from all bins
     (4) collapse polished isoform clusters into groups
     (5) count abundance info of collapsed groups
@@ -26,8 +27,10 @@ import subprocess
 
 import sys
 import argparse
+import json
 import logging
 import time
+from functools import partial
 
 from pbcommand.utils import setup_log
 from pbcommand.cli.core import pacbio_args_runner
@@ -41,6 +44,7 @@ from pbtranscript.PBTranscriptOptions import add_nfl_fa_argument, \
     add_ice_post_quiver_hq_lq_qv_arguments
 
 from pbtranscript.Cluster import Cluster
+from pbtranscript.JobScheduler import JobScheduler, LocalBackend, python_job_cmd
 from pbtranscript.CombineUtils import CombinedFiles, CombineRunner
 from pbtranscript.separate_flnc import SeparateFLNCRunner, SeparateFLNCBase
 
@@ -128,6 +132,20 @@ def add_tofu_output_arguments(parser):
     return parser
 
 
+def add_bin_execution_arguments(parser):
+    """Add arguments of running FLNC bins concurrently."""
+    bin_group = parser.add_argument_group("Bin execution arguments")
+    helpstr = "Number of cores shared by FLNC bins clustered concurrently, " + \
+              "a bin needs max(blasr_nproc, gcon_nproc, quiver_nproc) cores, " + \
+              "or 1 core with --use_sge (default: 1, cluster one bin at a time)"
+    bin_group.add_argument("--bins_nproc", type=int, default=1, help=helpstr)
+    helpstr = "Memory in GB shared by FLNC bins clustered concurrently (default: no limit)"
+    bin_group.add_argument("--bins_mem_GB", type=float, default=None, help=helpstr)
+    helpstr = "Estimated memory in GB needed to cluster a FLNC bin (default: 4)"
+    bin_group.add_argument("--bin_mem_GB", type=float, default=4.0, help=helpstr)
+    return parser
+
+
 def get_parser():
     """Returns arg parser."""
     parser = argparse.ArgumentParser(prog='tofu_wrap')
@@ -150,6 +168,7 @@ def get_parser():
     parser = add_ice_arguments(parser) # Add Ice options, including --quiver
     parser = add_sge_arguments(parser, blasr_nproc=True, quiver_nproc=True, gcon_nproc=True) # Sge
     parser = add_ice_post_quiver_hq_lq_qv_arguments(parser) # IceQuiver HQ/LQ QV options.
+    parser = add_bin_execution_arguments(parser) # Run bins concurrently
 
     parser = add_separate_flnc_arguments(parser) # separate_flnc options
     parser = add_gmap_arguments(parser) # map to gmap reference options
@@ -181,6 +200,12 @@ class TofuFiles(CombinedFiles):
         FLNC reads. Usually generated by separate_flnc."""
         return op.join(self.tofu_dir, "separate_flnc.pickle")
 
+    @property
+    def cluster_bins_summary(self):
+        """A JSON file summarizing wall-clock time of clustering every FLNC bin
+        and peak number of bins clustered concurrently."""
+        return op.join(self.tofu_dir, "cluster_bins_summary.json")
+
     @property
     def sorted_gmap_sam(self):
         """Sorted GMAP sam file which contains alignments mapping HQ isoforms to GMAP reference."""
@@ -197,6 +222,83 @@ class TofuFiles(CombinedFiles):
         return op.join(self.tofu_dir, "tofu_final.fastq")
 
 
+def cluster_bins(flnc_files, run_bin, bin_nproc, bins_nproc=1,
+                 bin_mem_GB=0, bins_mem_GB=None, summary_fn=None):
+    """
+    Call run_bin(flnc_file) for every FLNC bin in flnc_files, each in a
+    new python process (see python_job_cmd), logging to
+    <flnc_file>.cluster.log, and as many at a time as bins_nproc cores
+    and bins_mem_GB GB of memory allow, given that a bin needs bin_nproc
+    cores and bin_mem_GB GB. A bin needing more than bins_nproc cores
+    runs alone, so bins run one at a time by default. Bins start from
+    the largest FLNC file, and smaller bins fill cores left by larger ones.
+    Write wall-clock time of every bin and peak number of concurrent
+    bins to summary_fn in JSON if it is not None.
+    Return FLNC files of failed bins.
+    """
+    scheduler = JobScheduler(LocalBackend(nproc=bins_nproc, mem=bins_mem_GB),
+                             backfill=True)
+    for i in sorted(xrange(len(flnc_files)), key=lambda i: -op.getsize(flnc_files[i])):
+        cmd = python_job_cmd(partial(run_bin, flnc_files[i]),
+                             pickle_fn=flnc_files[i] + ".cluster.pickle")
+        scheduler.add_job(name=flnc_files[i],
+                          cmd="{c} > {f}.cluster.log 2>&1".format(c=cmd, f=flnc_files[i]),
+                          nproc=bin_nproc, mem=bin_mem_GB)
+
+    start_t = time.time()
+    failed = scheduler.run()
+    summary = {"wall_time": time.time() - start_t,
+               "peak_concurrency": scheduler.peak_concurrency,
+               "bins_nproc": bins_nproc, "bins_mem_GB": bins_mem_GB,
+               "bins": [{"flnc_file": job.name, "status": job.status,
+                         "wall_time": job.elapsed, "nproc": job.nproc,
+                         "mem_GB": job.mem, "log": job.name + ".cluster.log"}
+                        for job in scheduler.jobs]}
+    logging.info("Clustered %s FLNC bins in %.2f sec, at most %s bins at a time.",
+                 len(flnc_files), summary["wall_time"], summary["peak_concurrency"])
+    if summary_fn is not None:
+        with open(summary_fn, 'w') as writer:
+            writer.write(json.dumps(summary, indent=2))
+    return [job.name for job in failed]
+
+
+def _run_cluster_bin(flnc_file, args, sge_opts, ice_opts, ipq_opts):
+    """Run ICE/Quiver on a FLNC bin, return 0."""
+    split_dir = op.join(realpath(op.dirname(flnc_file)), "cluster_out")
+    cur_out_cons = op.join(split_dir, "consensus_isoforms.fasta")
+    ipq_f = IceQuiverPostprocess(root_dir=split_dir, ipq_opts=ipq_opts)
+    logging.info("Running ICE/Quiver on %s", split_dir)
+    rmpath(cur_out_cons)
+
+    obj = Cluster(root_dir=split_dir, flnc_fa=flnc_file,
+                  nfl_fa=args.nfl_fa,
+                  bas_fofn=args.bas_fofn,
+                  ccs_fofn=args.ccs_fofn,
+                  fasta_fofn=args.fasta_fofn,
+                  out_fa=cur_out_cons, sge_opts=sge_opts,
+                  ice_opts=ice_opts, ipq_opts=ipq_opts)
+
+    if args.mem_debug: # DEBUG
+        from memory_profiler import memory_usage
+        start_t = time.time()
+        mem_usage = memory_usage(obj.run, interval=60)
+        end_t = time.time()
+        with open('mem_debug.log', 'a') as f:
+            f.write("Running ICE/Quiver on {0} took {1} secs.\n".format(split_dir,
+                                                                        end_t-start_t))
+            f.write("Maximum memory usage: {0}\n".format(max(mem_usage)))
+            f.write("Memory usage: {0}\n".format(mem_usage))
+    else:
+        obj.run()
+
+    if not args.keep_tmp_files: # by deafult, delete all tempory files.
+        logging.info("Deleting %s", ipq_f.tmp_dir)
+        subprocess.Popen(['rm', '-rf', '%s' % ipq_f.tmp_dir])
+        logging.info("Deleting %s", ipq_f.quivered_dir)
+        subprocess.Popen(['rm', '-rf', '%s' % ipq_f.quivered_dir])
+    return 0
+
+
 def args_runner(args):
     """args runner"""
     logging.info("%s arguments are:\n%s\n", __file__, args)
@@ -223,7 +325,8 @@ def args_runner(args):
     s = SeparateFLNCRunner(flnc_fa=args.flnc_fa, root_dir=args.tofu_dir,
                            out_pickle=tofu_f.separate_flnc_pickle,
                            bin_size_kb=args.bin_size_kb, bin_by_primer=args.bin_by_primer,
-                           bin_manual=args.bin_manual, max_base_limit_MB=args.max_base_limit_MB)
+                           bin_manual=args.bin_manual, max_base_limit_MB=args.max_base_limit_MB,
+                           cost_balanced=args.cost_balanced)
     s.run()
 
     flnc_files = SeparateFLNCBase.convert_pickle_to_sorted_flnc_files(tofu_f.separate_flnc_pickle)
@@ -232,47 +335,32 @@ def args_runner(args):
     # (2) apply 'pbtranscript cluster' to each bin
     # run ICE/Quiver (the whole thing), providing the fasta_fofn
     logging.info("Running ICE/Polish on separated FLNC reads bins.")
-    split_dirs = []
+    split_dirs, todo_flnc_files = [], []
     for flnc_file in flnc_files:
         split_dir = op.join(realpath(op.dirname(flnc_file)), "cluster_out")
         mkdir(split_dir)
         split_dirs.append(split_dir)
-        cur_out_cons = op.join(split_dir, "consensus_isoforms.fasta")
 
         ipq_f = IceQuiverPostprocess(root_dir=split_dir, ipq_opts=ipq_opts)
         if op.exists(ipq_f.quivered_good_fq):
             logging.warning("HQ polished isoforms %s already exist. SKIP!", ipq_f.quivered_good_fq)
-            continue
-        else:
-            logging.info("Running ICE/Quiver on %s", split_dir)
-            rmpath(cur_out_cons)
-
-        obj = Cluster(root_dir=split_dir, flnc_fa=flnc_file,
-                      nfl_fa=args.nfl_fa,
-                      bas_fofn=args.bas_fofn,
-                      ccs_fofn=args.ccs_fofn,
-                      fasta_fofn=args.fasta_fofn,
-                      out_fa=cur_out_cons, sge_opts=sge_opts,
-                      ice_opts=ice_opts, ipq_opts=ipq_opts)
-
-        if args.mem_debug: # DEBUG
-            from memory_profiler import memory_usage
-            start_t = time.time()
-            mem_usage = memory_usage(obj.run, interval=60)
-            end_t = time.time()
-            with open('mem_debug.log', 'a') as f:
-                f.write("Running ICE/Quiver on {0} took {1} secs.\n".format(split_dir,
-                                                                            end_t-start_t))
-                f.write("Maximum memory usage: {0}\n".format(max(mem_usage)))
-                f.write("Memory usage: {0}\n".format(mem_usage))
         else:
-            obj.run()
-
-        if not args.keep_tmp_files: # by deafult, delete all tempory files.
-            logging.info("Deleting %s", ipq_f.tmp_dir)
-            subprocess.Popen(['rm', '-rf', '%s' % ipq_f.tmp_dir])
-            logging.info("Deleting %s", ipq_f.quivered_dir)
-            subprocess.Popen(['rm', '-rf', '%s' % ipq_f.quivered_dir])
+            todo_flnc_files.append(flnc_file)
+
+    # a bin runs blasr, gcon and quiver jobs locally, or waits for them on SGE
+    bin_nproc = 1 if args.use_sge else \
+                max(args.blasr_nproc, args.gcon_nproc, args.quiver_nproc)
+    failed_flnc_files = cluster_bins(
+        flnc_files=todo_flnc_files,
+        run_bin=partial(_run_cluster_bin, args=args, sge_opts=sge_opts,
+                        ice_opts=ice_opts, ipq_opts=ipq_opts),
+        bin_nproc=bin_nproc,
+        bins_nproc=args.bins_nproc,
+        bin_mem_GB=args.bin_mem_GB, bins_mem_GB=args.bins_mem_GB,
+        summary_fn=tofu_f.cluster_bins_summary)
+    if len(failed_flnc_files) > 0:
+        raise RuntimeError("Failed to run ICE/Quiver on FLNC bins %s, see %s." %
+                           (", ".join(failed_flnc_files), tofu_f.cluster_bins_summary))
 
     # (3) merge polished isoform cluster from all bins
     logging.info("Merging isoforms from all bins to %s.", tofu_f.combined_dir)
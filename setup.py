@@ -17,12 +17,20 @@ if 'setuptools.extension' in sys.modules:
 
 ext_modules = [Extension("pbtranscript.findECE",
                          ["pbtranscript/ice/C/findECE.pyx"]),
+               Extension("pbtranscript.c_primer",
+                         ["pbtranscript/ice/C/c_primer.pyx"]),
                Extension("pbtranscript.ice.ProbModel",
                          ["pbtranscript/ice/C/ProbModel.pyx"], language="c++"),
+               Extension("pbtranscript.ice.c_eval_aln",
+                         ["pbtranscript/ice/C/c_eval_aln.pyx"]),
+               Extension("pbtranscript.ice.c_align",
+                         ["pbtranscript/ice/C/c_align.pyx"]),
                Extension("pbtranscript.io.c_basQV",
                          ["pbtranscript/ice/C/c_basQV.pyx"], language="c++"),
                Extension("pbtranscript.io.SAMReaders",
                          ["pbtranscript/io/C/SAMReaders.pyx"], language="c++"),
+               Extension("pbtranscript.io.c_la4ice",
+                         ["pbtranscript/io/C/c_la4ice.pyx"]),
                Extension("pbtranscript.collapsing.intersection_unique",
                          ["pbtranscript/collapsing/C/intersection_unique.pyx"], language="c++"),
                Extension("pbtranscript.collapsing.intersection",
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Benchmark initial clique partitioning of IceInit (pClique.partition_into_cliques)
+on synthetic bins of increasing number of reads, e.g.,
+    python bench_clique_partition.py --sizes 12500 25000 50000 --nproc 4
+Time per read should stay about constant as bin size grows.
+"""
+import sys
+import time
+import argparse
+import numpy as np
+from pbtranscript.ice import pClique
+
+
+def make_synthetic_bin(n_reads, mean_family_size, noise_edges_per_read, seed):
+    """
+    Return a pClique.GraphBuilder of n_reads reads from isoform families of
+    geometrically distributed sizes, reads of a family are similar with
+    prob 0.9, plus random spurious similarities between families.
+    """
+    rng = np.random.RandomState(seed)
+    builder = pClique.GraphBuilder()
+    i = 0
+    while i < n_reads:
+        size = min(int(rng.geometric(1.0 / mean_family_size)), n_reads - i)
+        members = np.arange(i, i + size)
+        for a in members:
+            builder.add_node("read%d" % a)
+        if size > 1:
+            a, b = np.triu_indices(size, 1)
+            keep = rng.random_sample(len(a)) < 0.9
+            for x, y in zip(members[a[keep]], members[b[keep]]):
+                builder.add_edge("read%d" % x, "read%d" % y)
+        i += size
+    n_noise = int(n_reads * noise_edges_per_read)
+    for x, y in zip(rng.randint(0, n_reads, n_noise),
+                    rng.randint(0, n_reads, n_noise)):
+        builder.add_edge("read%d" % x, "read%d" % y)
+    return builder
+
+
+def main(args=sys.argv[1:]):
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[6250, 12500, 25000, 50000])
+    parser.add_argument("--nproc", type=int, default=1)
+    parser.add_argument("--mean_family_size", type=float, default=10)
+    parser.add_argument("--noise_edges_per_read", type=float, default=0.5)
+    args = parser.parse_args(args)
+
+    print "{0:>8} {1:>9} {2:>8} {3:>9} {4:>12}".format(
+        "reads", "edges", "cliques", "sec", "usec/read")
+    for n in args.sizes:
+        builder = make_synthetic_bin(n, args.mean_family_size,
+                                     args.noise_edges_per_read, seed=n)
+        start_t = time.time()
+        g = builder.to_csr()
+        cliques = pClique.partition_into_cliques(g, gamma=0.8, maxitr=5,
+                                                 nproc=args.nproc)
+        elapsed = time.time() - start_t
+        print "{0:>8} {1:>9} {2:>8} {3:>9.2f} {4:>12.1f}".format(
+            n, len(g.indices) / 2, len(cliques), elapsed, 1e6 * elapsed / n)
+
+
+if __name__ == "__main__":
+    main()
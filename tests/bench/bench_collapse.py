@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Benchmark Branch.run and collapse_fuzzy_junctions of
+pbtranscript.collapsing on a synthetic multi-chromosome GMAP SAM file,
+comparing nproc = 1 with nproc > 1, e.g.,
+    python bench_collapse.py --n_chroms 24 --genes_per_chrom 200 --nproc 8
+Outputs of all runs must be identical.
+"""
+import os
+import os.path as op
+import sys
+import time
+import filecmp
+import argparse
+import tempfile
+from pbtranscript.Utils import rmpath
+from pbtranscript.collapsing import Branch, collapse_fuzzy_junctions
+from pbtranscript.testkit.simulate_gmap_sam import simulate_gmap_sam
+
+
+def run_collapse(isoform_fn, sam_fn, out_prefix, nproc):
+    """Collapse isoforms and fuzzy junctions using nproc processes,
+    return (output files, seconds of Branch.run, seconds of fuzzy)."""
+    fns = [out_prefix + x for x in (".good.gff.unfuzzy", ".bad.gff.unfuzzy",
+                                    ".group.txt.unfuzzy", ".good.gff", ".group.txt")]
+    start_t = time.time()
+    b = Branch(isoform_filename=isoform_fn, sam_filename=sam_fn,
+               cov_threshold=1, min_aln_coverage=0.99, min_aln_identity=0.95)
+    b.run(allow_extra_5exon=False, skip_5_exon_alt=False, ignored_ids_fn=None,
+          good_gff_fn=fns[0], bad_gff_fn=fns[1], group_fn=fns[2], nproc=nproc)
+    branch_t = time.time() - start_t
+
+    start_t = time.time()
+    collapse_fuzzy_junctions(gff_filename=fns[0], group_filename=fns[2],
+                             fuzzy_gff_filename=fns[3], fuzzy_group_filename=fns[4],
+                             allow_extra_5exon=False, max_fuzzy_junction=5, nproc=nproc)
+    return fns, branch_t, time.time() - start_t
+
+
+def main(args=sys.argv[1:]):
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n_chroms", type=int, default=24)
+    parser.add_argument("--genes_per_chrom", type=int, default=200)
+    parser.add_argument("--copies_per_isoform", type=int, default=4)
+    parser.add_argument("--nproc", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tmp_dir", default=None)
+    args = parser.parse_args(args)
+
+    tmp_dir = tempfile.mkdtemp(dir=args.tmp_dir)
+    isoform_fn, sam_fn = op.join(tmp_dir, "isoforms.fasta"), op.join(tmp_dir, "isoforms.sam")
+    n = simulate_gmap_sam(isoform_fn, sam_fn, n_chroms=args.n_chroms,
+                          genes_per_chrom=args.genes_per_chrom,
+                          copies_per_isoform=args.copies_per_isoform, seed=args.seed)
+    print "isoforms: {n}, chromosomes: {c}, genes: {g}".format(
+        n=n, c=args.n_chroms, g=args.n_chroms * args.genes_per_chrom)
+
+    fns1, branch_t1, fuzzy_t1 = run_collapse(isoform_fn, sam_fn, op.join(tmp_dir, "nproc1"), 1)
+    print "nproc 1: Branch.run {0:.2f} sec, fuzzy {1:.2f} sec".format(branch_t1, fuzzy_t1)
+    for nproc in args.nproc:
+        fns, branch_t, fuzzy_t = run_collapse(isoform_fn, sam_fn,
+                                              op.join(tmp_dir, "nproc%s" % nproc), nproc)
+        same = all(filecmp.cmp(a, b, shallow=False) for a, b in zip(fns1, fns))
+        print ("nproc {p}: Branch.run {b:.2f} sec ({bs:.2f}x), fuzzy {f:.2f} sec " +
+               "({fs:.2f}x), identical outputs: {s}").format(
+                   p=nproc, b=branch_t, bs=branch_t1 / branch_t,
+                   f=fuzzy_t, fs=fuzzy_t1 / fuzzy_t, s=same)
+        if not same:
+            return 1
+    rmpath(tmp_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Benchmark merging transcripts of a synthetic locus, comparing the
+previous merging of dense exon matrices, pair by pair, with
+merge_exon_indices of pbtranscript.collapsing, e.g.,
+    python bench_exon_merge.py --n_transcripts 1000
+Both must merge transcripts into the same groups.
+"""
+import sys
+import time
+import argparse
+import numpy as np
+from pbtranscript.collapsing import compare_exon_matrix, merge_exon_indices
+from pbtranscript.testkit.simulate_gmap_sam import simulate_locus_transcripts
+
+
+def merge_exon_matrices(result_list, node_d, merge5):
+    """Previous iterative_merge_transcripts on dense exon matrices."""
+    result_list.sort(key=lambda x: (x[1], x[2].nonzero()[1][0]))
+    i = 0
+    while i < len(result_list) - 1:
+        j = i + 1
+        while j < len(result_list):
+            id1, strand1, m1 = result_list[i]
+            id2, strand2, m2 = result_list[j]
+            if (strand1 != strand2) or (m1.nonzero()[1][-1] < m2.nonzero()[1][0]):
+                break
+            else:
+                flag, m3 = compare_exon_matrix(m1, m2, node_d, strand1, merge5)
+                if flag:
+                    result_list[i] = (id1+','+id2, strand1, m3)
+                    result_list.pop(j)
+                else:
+                    j += 1
+        i += 1
+
+
+def main(args=sys.argv[1:]):
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n_transcripts", type=int, default=1000)
+    parser.add_argument("--n_exons", type=int, default=30)
+    parser.add_argument("--n_templates", type=int, default=20)
+    parser.add_argument("--merge5", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(args)
+
+    node_d, transcripts = simulate_locus_transcripts(
+        args.n_transcripts, n_exons=args.n_exons,
+        n_templates=args.n_templates, seed=args.seed)
+    print "transcripts: {n}, exon nodes: {e}".format(n=len(transcripts), e=len(node_d))
+
+    start_t = time.time()
+    dense = []
+    for qid, strand, l in transcripts:
+        m = np.zeros((1, len(node_d)), dtype=np.int)
+        m[0, list(l)] = 1
+        dense.append((qid, strand, m))
+    merge_exon_matrices(dense, node_d, args.merge5)
+    old = time.time() - start_t
+    print "exon matrices: {0:.3f} sec, {1} merged transcripts".format(old, len(dense))
+
+    start_t = time.time()
+    sparse = list(transcripts)
+    merge_exon_indices(sparse, node_d, args.merge5)
+    new = time.time() - start_t
+    print "exon indices: {0:.3f} sec, {1} merged transcripts, {2:.1f}x".format(
+        new, len(sparse), old / new)
+
+    same = sparse == [(qid, strand, tuple(m.nonzero()[1])) for qid, strand, m in dense]
+    print "identical merges: {0}".format(same)
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Benchmark makespan of gcon rounds on synthetic clusters of skewed sizes,
+comparing the previous ThreadPool.map over clusters in cluster order with
+JobScheduler of pbtranscript.JobScheduler starting clusters in decreasing
+order of estimate_gcon_cost (by_cost), e.g.,
+    python bench_gcon_scheduler.py --n_clusters 400 --workers 8
+Every gcon job sleeps for a time proportional to its cost, which deviates
+from the estimate by random noise (--noise).
+"""
+import sys
+import time
+import argparse
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from pbtranscript.ice.IceGconScheduler import estimate_gcon_cost
+from pbtranscript.JobScheduler import JobScheduler, LocalBackend
+
+
+def make_synthetic_clusters(n_clusters, pareto_shape, mean_read_len, seed):
+    """Return (n_reads, n_bases) of n_clusters clusters, whose sizes
+    follow a Pareto distribution, i.e., a few huge clusters."""
+    rng = np.random.RandomState(seed)
+    sizes = (3 + rng.pareto(pareto_shape, n_clusters) * 5).astype(int)
+    lens = rng.normal(mean_read_len, mean_read_len * 0.2, n_clusters).clip(300)
+    return [(int(n), int(n * l)) for n, l in zip(sizes, lens)]
+
+
+def main(args=sys.argv[1:]):
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n_clusters", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--pareto_shape", type=float, default=1.2)
+    parser.add_argument("--mean_read_len", type=float, default=2000)
+    parser.add_argument("--noise", type=float, default=0.3,
+                        help="sd of log of actual / estimated cost")
+    parser.add_argument("--total_sec", type=float, default=16,
+                        help="total sleep time of all jobs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(args)
+
+    clusters = make_synthetic_clusters(args.n_clusters, args.pareto_shape,
+                                       args.mean_read_len, args.seed)
+    costs = [estimate_gcon_cost(n, b) for n, b in clusters]
+    rng = np.random.RandomState(args.seed + 1)
+    actual = np.array(costs) * np.exp(rng.normal(0, args.noise, len(costs)))
+    durations = list(actual / actual.sum() * args.total_sec)
+    lower_bound = max(max(durations), args.total_sec / args.workers)
+
+    print "clusters: {n}, largest {m} reads, workers: {w}".format(
+        n=len(clusters), m=max(n for n, b in clusters), w=args.workers)
+    print "lower bound of makespan: {0:.2f} sec".format(lower_bound)
+
+    start_t = time.time()
+    pool = ThreadPool(processes=args.workers)
+    pool.map(time.sleep, durations)
+    pool.close()
+    pool.join()
+    old = time.time() - start_t
+    print "ThreadPool.map makespan: {0:.2f} sec".format(old)
+
+    s = JobScheduler(LocalBackend(nproc=args.workers), by_cost=True)
+    for i, (d, c) in enumerate(zip(durations, costs)):
+        s.add_job("gcon_%d" % i, lambda d=d: time.sleep(d) or 0, cost=c)
+    s.run()
+    print "JobScheduler (by_cost) makespan: {0:.2f} sec ({1:.1f}% less)".format(
+        s.makespan, 100. * (old - s.makespan) / old)
+
+
+if __name__ == "__main__":
+    main()
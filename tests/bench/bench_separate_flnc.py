@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Benchmark how balanced parts of size bins made by SeparateFLNCBySize are
+on synthetic FLNC reads, comparing round-robin assignment of reads to
+parts with assignment by estimated clustering cost (--cost_balanced), e.g.,
+    python bench_separate_flnc.py --n_reads 200000 --max_base_limit_MB 50
+Reads are written in runs of reads of similar lengths (--run_len), as
+reads of an abundant transcript may be, which round-robin ignores.
+"""
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import os.path as op
+import numpy as np
+from pbtranscript.separate_flnc import SeparateFLNCBySize, estimate_cluster_cost
+
+
+def make_synthetic_flnc(fasta_fn, n_reads, mean_read_len, run_len, seed):
+    """Write n_reads reads of log-normal lengths to fasta_fn, in runs of
+    run_len reads of similar lengths."""
+    rng = np.random.RandomState(seed)
+    n_runs = n_reads / run_len + 1
+    run_lens = rng.lognormal(np.log(mean_read_len), 0.5, n_runs)
+    lens = (np.repeat(run_lens, run_len)[:n_reads] *
+            rng.normal(1, 0.05, n_reads)).clip(300).astype(int)
+    bases = "ACGT"
+    with open(fasta_fn, 'w') as writer:
+        for i, l in enumerate(lens):
+            seq = "".join(bases[x] for x in rng.randint(0, 4, 200))
+            writer.write(">m/{i}/ccs\n{s}\n".format(i=i, s=(seq * (l / 200 + 1))[:l]))
+
+
+def part_stats(fasta_fn):
+    """Return (number of reads, number of bases) in fasta_fn."""
+    n_reads, n_bases = 0, 0
+    with open(fasta_fn) as reader:
+        for line in reader:
+            if line.startswith('>'):
+                n_reads += 1
+            else:
+                n_bases += len(line.strip())
+    return n_reads, n_bases
+
+
+def run(flnc_fn, root_dir, max_base_limit_MB, cost_balanced):
+    """Separate flnc_fn, return (seconds, {(lb, ub): [estimated costs of parts]})."""
+    start_t = time.time()
+    with SeparateFLNCBySize(flnc_filename=flnc_fn, root_dir=root_dir,
+                            max_base_limit_MB=max_base_limit_MB,
+                            cost_balanced=cost_balanced) as obj:
+        obj.run()
+    seconds = time.time() - start_t
+    costs = {}
+    for index, key in enumerate(obj.sorted_keys):
+        costs.setdefault((key[0].lb, key[0].ub), []).append(
+            estimate_cluster_cost(*part_stats(obj.out_fasta_files[index])))
+    return seconds, costs
+
+
+def main(args=sys.argv[1:]):
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n_reads", type=int, default=100000)
+    parser.add_argument("--mean_read_len", type=float, default=2000)
+    parser.add_argument("--run_len", type=int, default=4)
+    parser.add_argument("--max_base_limit_MB", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(args)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        flnc_fn = op.join(tmp_dir, "isoseq_flnc.fasta")
+        make_synthetic_flnc(flnc_fn, args.n_reads, args.mean_read_len,
+                            args.run_len, args.seed)
+        print "reads: {n}, max bases per part: {m} MB".format(
+            n=args.n_reads, m=args.max_base_limit_MB)
+
+        results = {}
+        for cost_balanced, name in ((False, "round-robin"), (True, "cost-balanced")):
+            seconds, costs = run(flnc_fn, op.join(tmp_dir, name),
+                                 args.max_base_limit_MB, cost_balanced)
+            results[cost_balanced] = costs
+            print "{n}: {s:.2f} sec".format(n=name, s=seconds)
+        # FASTA index is written by the first cost-balanced run
+        seconds, dummy_costs = run(flnc_fn, op.join(tmp_dir, "indexed"),
+                                   args.max_base_limit_MB, True)
+        print "cost-balanced, FASTA index exists: {s:.2f} sec".format(s=seconds)
+
+        print "max / mean estimated clustering cost of parts of bins:"
+        print "  {b:>10s} {p:>6s} {r:>12s} {c:>14s}".format(
+            b="bin", p="parts", r="round-robin", c="cost-balanced")
+        for b in sorted(results[False]):
+            ratios = [max(results[x][b]) / np.mean(results[x][b]) for x in (False, True)]
+            print "  {b:>10s} {p:>6d} {r:>12.4f} {c:>14.4f}".format(
+                b="%dto%dkb" % b, p=len(results[False][b]), r=ratios[0], c=ratios[1])
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,12 @@
 import unittest
 import os.path as op
 import hashlib
-import time
 
 from pbtranscript.Utils import make_pbi
-from pbtranscript.io.PbiBamIO import BamCollection, BamHeader, BamWriter, BamZmwRead
+import random
+import numpy as np
+from pbtranscript.io.PbiBamIO import BamCollection, BamHeader, BamWriter, BamZmwRead, \
+        PbiZmwIndex
 from pbcore.io import BamAlignment, IndexedBamReader, readFofn, ConsensusReadSet
 from test_setpath import OUT_DIR, STD_DIR
 from pbcore.util.Process import backticks
@@ -245,3 +247,76 @@ class TestIO(unittest.TestCase):
         with ConsensusReadSet(dataset_xml) as ds:
             for read in ds:
                 self.assertEqual(bc[read.qName].readName, read.qName)
+
+
+def _make_pbi_columns(n_subreads, n_movies, seed):
+    """Return qId and holeNumber arrays of n_subreads subreads, with
+    subreads of each zmw spread in the index, like merged pbi."""
+    rng = np.random.RandomState(seed)
+    n_zmws = max(1, n_subreads / 4)
+    zmw_qids = rng.randint(0, n_movies, n_zmws)
+    zmw_hns = rng.randint(0, 10 ** 7, n_zmws)
+    zmws = rng.randint(0, n_zmws, n_subreads)
+    return zmw_qids[zmws], zmw_hns[zmws]
+
+
+class TestPbiZmwIndex(unittest.TestCase):
+    """Test PbiZmwIndex."""
+
+    def test_rows(self):
+        """Test rows of zmws and zmws of movies."""
+        qids = [1, 0, 1, 0, 1, 1]
+        hns = [5, 5, 3, 5, 5, 3]
+        index = PbiZmwIndex(qids, hns, {0: "movie0", 1: "movie1"})
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.rows("movie1", 5), [0, 4])
+        self.assertEqual(index.rows("movie0", 5), [1, 3])
+        self.assertEqual(index.rows("movie1", 3), [2, 5])
+        self.assertEqual(index.rows("movie0", 3), [])
+        self.assertEqual(index.rows("movie2", 5), [])
+        self.assertEqual(index.zmws("movie1"), [3, 5])
+        self.assertEqual(index.zmws("movie2"), [])
+        self.assertTrue(("movie0", 5) in index)
+        self.assertEqual(len(PbiZmwIndex([], [], {})), 0)
+
+    def test_rows_vs_mask(self):
+        """Test rows agree with masking the whole index."""
+        qids, hns = _make_pbi_columns(5000, 3, seed=0)
+        names = dict((i, "m%d" % i) for i in xrange(3))
+        index = PbiZmwIndex(qids, hns, names)
+        for qid, hn in set(zip(qids.tolist(), hns.tolist())):
+            expected = np.nonzero((qids == qid) & (hns == hn))[0].tolist()
+            self.assertEqual(index.rows(names[qid], hn), expected)
+        self.assertEqual(sum(len(index.zmws(m)) for m in names.values()),
+                         len(index))
+
+    def test_index_built_once(self):
+        """Test BamCollection reads the pbi index once for all lookups
+        and len(), instead of scanning the whole index per call."""
+        qids, hns = _make_pbi_columns(10 ** 5, 4, seed=0)
+
+        class _Index(object):
+            """pbi index columns."""
+            qId, holeNumber = qids, hns
+
+        class _Dataset(object):
+            """Dataset which counts reads of its pbi index."""
+            movieIds = dict(("m%d" % i, i) for i in xrange(4))
+            n_index_reads = 0
+
+            @property
+            def index(self):
+                """Return pbi index, count reads."""
+                _Dataset.n_index_reads += 1
+                return _Index()
+
+        reader = BamCollection.__new__(BamCollection)
+        reader._dataset, reader._zmw_index = _Dataset(), None
+        rng = random.Random(0)
+        for i in (rng.randint(0, len(qids) - 1) for dummy_i in xrange(1000)):
+            rows = reader.zmwIndex.rows("m%d" % qids[i], hns[i])
+            self.assertTrue(i in rows)
+            self.assertTrue(all(qids[row] == qids[i] and hns[row] == hns[i]
+                                for row in rows))
+        self.assertEqual(len(reader), len(set(zip(qids.tolist(), hns.tolist()))))
+        self.assertEqual(_Dataset.n_index_reads, 1)
@@ -9,6 +9,10 @@ from pbtranscript.Utils import rmpath, mkdir
 from pbtranscript.io import ContigSetReaderWrapper, iter_gmap_sam, GroupWriter, CollapseGffWriter
 from pbtranscript.collapsing import Branch, ContiVec, transfrag_to_contig, \
         exons_match_sam_record, compare_exon_matrix, get_fl_from_id, collapse_sam_records
+from pbtranscript.collapsing import collapse_fuzzy_junctions, iterative_merge_transcripts, \
+        compare_exon_indices, merge_exon_indices
+from pbtranscript.testkit.simulate_gmap_sam import simulate_gmap_sam, \
+        simulate_locus_transcripts
 from test_setpath import DATA_DIR, OUT_DIR, SIV_DATA_DIR, SIV_STD_DIR
 
 _OUT_DIR_ = op.join(OUT_DIR, "test_branch")
@@ -139,8 +143,52 @@ class TEST_Branch(unittest.TestCase):
         self.assertFalse(compare_exon_matrix(ms[0], mx, strand='+', node_d=node_d)[0])
 
     def test_iterative_merge_transcripts(self):
-        """No test yet"""
-        pass # skip
+        """Test iterative_merge_transcripts and merge_exon_indices merge the
+        same transcripts as merging exon matrices by compare_exon_matrix
+        one pair at a time."""
+        node_d, transcripts = simulate_locus_transcripts(300, seed=2)
+        mat_size = max(node_d) + 1
+
+        def _to_matrix(l):
+            m = np.zeros((1, mat_size), dtype=np.int)
+            m[0, list(l)] = 1
+            return m
+
+        # merge exon matrices pair by pair
+        expected = [(qid, strand, _to_matrix(l)) for qid, strand, l in transcripts]
+        expected.sort(key=lambda x: (x[1], x[2].nonzero()[1][0]))
+        i = 0
+        while i < len(expected) - 1:
+            j = i + 1
+            while j < len(expected):
+                id1, strand1, m1 = expected[i]
+                id2, strand2, m2 = expected[j]
+                if strand1 != strand2 or m1.nonzero()[1][-1] < m2.nonzero()[1][0]:
+                    break
+                flag, m3 = compare_exon_matrix(m1, m2, node_d, strand1, True)
+                if flag:
+                    expected[i] = (id1 + ',' + id2, strand1, m3)
+                    expected.pop(j)
+                else:
+                    j += 1
+            i += 1
+        expected = [(qid, strand, tuple(m.nonzero()[1])) for qid, strand, m in expected]
+        self.assertTrue(len(expected) < len(transcripts) / 2)
+
+        result = list(transcripts)
+        merge_exon_indices(result, node_d, True)
+        self.assertEqual(result, expected)
+
+        result = [(qid, strand, _to_matrix(l)) for qid, strand, l in transcripts]
+        iterative_merge_transcripts(result, node_d, True)
+        self.assertEqual([(qid, strand, tuple(m.nonzero()[1])) for qid, strand, m in result],
+                         expected)
+
+        # 3' ends of + strand transcripts may not extend unless exons are adjacent
+        self.assertEqual(compare_exon_indices((0, 1, 5), (1, 5, 6), node_d, "+"),
+                         (node_d[5].end == node_d[6].start,
+                          (0, 1, 5, 6) if node_d[5].end == node_d[6].start else None))
+        self.assertEqual(compare_exon_indices((0, 1, 5), (1, 6), node_d, "+"), (False, None))
 
     def test_get_fl_from_id(self):
         """Test get_fl_from_id(list_of_ids)"""
@@ -237,3 +285,34 @@ class TEST_Branch(unittest.TestCase):
         self.assertTrue(filecmp.cmp(good_gff_fn, std_good_gff_fn))
         self.assertTrue(filecmp.cmp(bad_gff_fn, std_bad_gff_fn))
         self.assertTrue(filecmp.cmp(group_fn, std_group_fn))
+
+    def test_Branch_nproc(self):
+        """Test Branch.run and collapse_fuzzy_junctions with nproc > 1 write
+        the same outputs as nproc = 1 on a multi-chromosome SAM."""
+        isoform_fn = op.join(_OUT_DIR_, "simulated.fasta")
+        sam_fn = op.join(_OUT_DIR_, "simulated.sam")
+        simulate_gmap_sam(isoform_fn, sam_fn, n_chroms=4, genes_per_chrom=5, seed=1)
+
+        outputs = {}
+        for nproc in (1, 3):
+            fns = [op.join(_OUT_DIR_, "nproc%s.%s" % (nproc, x)) for x in
+                   ("ignored.txt", "good.gff.unfuzzy", "bad.gff.unfuzzy",
+                    "group.txt.unfuzzy", "good.gff", "group.txt")]
+            b = Branch(isoform_filename=isoform_fn, sam_filename=sam_fn,
+                       cov_threshold=1, min_aln_coverage=0.99, min_aln_identity=0.95)
+            b.run(allow_extra_5exon=True, skip_5_exon_alt=False,
+                  ignored_ids_fn=fns[0], good_gff_fn=fns[1], bad_gff_fn=fns[2],
+                  group_fn=fns[3], nproc=nproc, loci_per_task=3)
+            collapse_fuzzy_junctions(gff_filename=fns[1], group_filename=fns[3],
+                                     fuzzy_gff_filename=fns[4], fuzzy_group_filename=fns[5],
+                                     allow_extra_5exon=True, max_fuzzy_junction=5,
+                                     nproc=nproc)
+            outputs[nproc] = fns
+
+        # 4 chromosomes * 5 genes make 20 loci, fuzzy junctions are merged.
+        genes = set(l.split('"')[1] for l in open(outputs[1][1]) if not l.startswith("#"))
+        self.assertEqual(genes, set("PB.%s" % i for i in range(1, 21)))
+        self.assertTrue(len(open(outputs[1][5]).readlines()) <
+                        len(open(outputs[1][3]).readlines()))
+        for fn1, fn3 in zip(outputs[1], outputs[3]):
+            self.assertTrue(filecmp.cmp(fn1, fn3, shallow=False), fn1)
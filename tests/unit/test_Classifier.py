@@ -3,12 +3,51 @@
 import unittest
 import os
 import os.path as op
-from pbtranscript.Classifier import Classifier, PBRead
-from pbtranscript.io.DOMIO import DOMRecord
+from pbtranscript.Classifier import Classifier, PBRead, \
+    ChimeraDetectionOptions, ClassifierException
+from pbtranscript.io.DOMIO import DOMRecord, DOMReader
+from pbtranscript.testkit.simulate_ccs import read_primer_pairs, \
+    simulate_ccs_reads
 from collections import namedtuple
 from test_setpath import DATA_DIR, OUT_DIR, STD_DIR
 import filecmp
 
+
+class CountedDOMRecord(DOMRecord):
+    """DOMRecord which counts how many of its instances are alive."""
+    live, peak = 0, 0
+
+    def __init__(self, *args):
+        DOMRecord.__init__(self, *args)
+        CountedDOMRecord.live += 1
+        CountedDOMRecord.peak = max(CountedDOMRecord.peak,
+                                    CountedDOMRecord.live)
+
+    def __del__(self):
+        CountedDOMRecord.live -= 1
+
+
+def sorted_records(fn, delimiter):
+    """Return sorted records of a file split by delimiter."""
+    with open(fn, 'r') as reader:
+        return sorted(reader.read().split(delimiter))
+
+
+def synthetic_reads_and_hits(num_reads):
+    """Return generators of num_reads reads, and of primer hits of their
+    front and back windows, sorted by reads."""
+    A = namedtuple('A', 'name sequence')
+    names = lambda: ("movie/%d/ccs" % i for i in xrange(num_reads))
+    def hits():
+        """Yield 3 usable hits and 1 hit far from read end per read."""
+        for name in names():
+            yield CountedDOMRecord("F0", name + "_front", 30, 0, 30, 30, 2, 32, 100)
+            yield CountedDOMRecord("F0", name + "_front", 20, 0, 30, 30, 60, 90, 100)
+            yield CountedDOMRecord("R0", name + "_front", 12, 0, 25, 25, 1, 26, 100)
+            yield CountedDOMRecord("R0", name + "_back", 25, 0, 25, 25, 0, 25, 100)
+    return (A(name, "A" * 100) for name in names()), hits()
+
+
 class Test_Classifier(unittest.TestCase):
     """Test Classifier."""
     def setUp(self):
@@ -156,5 +195,132 @@ class Test_Classifier(unittest.TestCase):
         self.assertEqual((y.movie, y.zmw, y.isCCS),
                 ("movie", 10, True))
 
+    def test_iterBestFrontBackRecords(self):
+        """Test function _iterBestFrontBackRecords() aggregates primer hits
+        sorted by reads the same as _getBestFrontBackRecord()."""
+        obj = Classifier()
+        domFN = op.join(self.dataDir, "test_parseHmmDom.dom")
+        front, back = obj._getBestFrontBackRecord(domFN)
+        A = namedtuple('A', 'name sequence')
+        movie = "m131018_081703_42161_c100585152550000001823088404281404_s1_p0"
+        reads = [A(movie + "/" + str(zmw) + "/ccs", "")
+                 for zmw in [43, 45, 54, 60]]
+        prettystr = lambda d: None if d is None else \
+            sorted((k, str(v)) for k, v in d.iteritems())
+        res = list(obj._iterBestFrontBackRecords(reads, DOMReader(domFN)))
+        self.assertEqual([r.name for r, dummy_f, dummy_b in res],
+                         [r.name for r in reads])
+        for read, f, b in res:
+            self.assertEqual(prettystr(f), prettystr(front[read.name]))
+            self.assertEqual(prettystr(b), prettystr(back[read.name]))
+
+        # Hits not sorted by reads
+        with self.assertRaises(ClassifierException):
+            list(obj._iterBestFrontBackRecords(reads[::-1], DOMReader(domFN)))
+
+    def test_iterBestFrontBackRecords_memory(self):
+        """Test peak number of primer hits in memory does not grow with the
+        number of reads if hits are aggregated read by read, whereas it
+        does if hits of all reads are aggregated at once."""
+        obj = Classifier()
+        peaks, peaks_of_all = [], []
+        for num_reads in [100, 1000, 10000]:
+            reads, hits = synthetic_reads_and_hits(num_reads)
+            CountedDOMRecord.peak = CountedDOMRecord.live
+            n_fl = 0
+            for dummy_read, f, b in obj._iterBestFrontBackRecords(reads, hits):
+                n_fl += (f["F0"].score == 30 and b["R0"].score == 25)
+            self.assertEqual(n_fl, num_reads)
+            peaks.append(CountedDOMRecord.peak)
+
+            reads, hits = synthetic_reads_and_hits(num_reads)
+            CountedDOMRecord.peak = CountedDOMRecord.live
+            front, back = obj._pickBestFrontBackRecords(hits)
+            self.assertEqual(len(front), num_reads)
+            del front, back
+            peaks_of_all.append(CountedDOMRecord.peak)
+
+        self.assertEqual(peaks, [peaks[0]] * 3)
+        # hits of the current read and the one before it, 4 hits per read
+        self.assertTrue(peaks[0] <= 2 * 4)
+        self.assertTrue(peaks_of_all[2] >= 3 * 10000)
+
+    def _classify(self, out_dir, reads_fn, detect_chimera_nfl, streaming,
+                  keep_dom=False):
+        """Classify reads_fn with the native primer detector, either in a
+        single pass (streaming) or by runPrimerTrimmer + runChimeraDetector,
+        return the Classifier."""
+        if not op.exists(out_dir):
+            os.makedirs(out_dir)
+        obj = Classifier(reads_fn=reads_fn, out_dir=out_dir,
+                         out_reads_fn=op.join(out_dir, "isoseq_draft.fasta"),
+                         opts=ChimeraDetectionOptions(50, 10, 100, 50, 100,
+                                                      detect_chimera_nfl),
+                         keep_dom=keep_dom, primer_detector="native")
+        try:
+            if streaming:
+                obj.runPipeline(reads_per_batch=7)
+            else:
+                obj.runPrimerTrimmer()
+                obj.runChimeraDetector()
+        finally:
+            obj._closePrimerDetector()
+        return obj
+
+    def test_runPipeline(self):
+        """Test single-pass classify makes the same outputs as multi-pass
+        classify, in batches which do not divide the number of reads."""
+        out_dir = op.join(self.outDir, "test_Classifier_runPipeline")
+        if not op.exists(out_dir):
+            os.makedirs(out_dir)
+        reads = list(simulate_ccs_reads(
+            read_primer_pairs(op.join(self.dataDir, "primers.fasta")),
+            60, seed=3, min_insert_len=20, max_insert_len=1000))
+        reads_fn = op.join(out_dir, "simulated.fasta")
+        with open(reads_fn, 'w') as writer:
+            for r in reads:
+                writer.write(">{n}\n{s}\n".format(n=r.name, s=r.sequence))
+            # chimeras of two full-length reads
+            for i in range(4):
+                writer.write(">{n}\n{s}\n".format(
+                    n=r.name.replace("/59/", "/%d/" % (100 + i)),
+                    s=reads[2 * i].sequence + reads[2 * i + 1].sequence))
+
+        for detect_chimera_nfl in (False, True):
+            objs = [self._classify(op.join(out_dir, "%s_%s" % (x, detect_chimera_nfl)),
+                                   reads_fn, detect_chimera_nfl,
+                                   streaming=(x != "multipass"),
+                                   keep_dom=(x == "keep_dom"))
+                    for x in ("multipass", "streaming", "keep_dom")]
+            # Outputs of a single class of reads are in the same order.
+            for attr in ["out_flnc_fn", "out_flc_fn"] + \
+                    (["out_nflnc_fn", "out_nflc_fn"] if detect_chimera_nfl
+                     else ["out_nfl_fn"]):
+                for obj in objs[1:]:
+                    fns = [getattr(objs[0], attr), getattr(obj, attr)]
+                    self.assertTrue(filecmp.cmp(fns[0], fns[1], shallow=False),
+                                    "{0} differs from {1}".format(*fns))
+            # Outputs of several classes are written batch by batch.
+            for attr, delimiter in [("out_all_reads_fn", ">"),
+                                    ("out_nfl_fn", ">"),
+                                    ("primer_report_fn", "\n")]:
+                for obj in objs[1:]:
+                    self.assertEqual(
+                        sorted_records(getattr(obj, attr), delimiter),
+                        sorted_records(getattr(objs[0], attr), delimiter))
+            for attr in ["out_front_back_dom_fn", "out_trimmed_fl_dom_fn"] + \
+                    (["out_trimmed_nfl_dom_fn"] if detect_chimera_nfl else []):
+                fns = [getattr(objs[0], attr), getattr(objs[2], attr)]
+                self.assertTrue(filecmp.cmp(fns[0], fns[1], shallow=False),
+                                "{0} differs from {1}".format(*fns))
+                self.assertFalse(op.exists(getattr(objs[1], attr)))
+            for obj in objs[1:]:
+                self.assertFalse(op.exists(obj._trimmed_fl_reads_fn))
+                self.assertFalse(op.exists(obj._trimmed_nfl_reads_fn))
+                self.assertFalse(op.islink(obj.out_nfl_fn))
+                self.assertEqual(str(obj.summary), str(objs[0].summary))
+            self.assertTrue(objs[1].summary.num_flc > 0)
+            self.assertEqual(objs[1].summary.num_reads, 64)
+
 if __name__ == "__main__":
     unittest.main()
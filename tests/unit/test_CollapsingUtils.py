@@ -1,10 +1,13 @@
 """Test classes defined within pbtranscript.collapsing.CollaspingUtils."""
 import unittest
+import random
 import os.path as op
+from pbcore.io import FastqReader
 from pbtranscript.Utils import rmpath, mkdir
-from pbtranscript.io import CollapseGffReader, CollapseGffRecord
+from pbtranscript.io import CollapseGffReader, CollapseGffRecord, GroupReader
 from pbtranscript.collapsing.CollapsingUtils import copy_sam_header, map_isoforms_and_sort, \
-        concatenate_sam, can_merge, compare_fuzzy_junctions, collapse_fuzzy_junctions
+        concatenate_sam, can_merge, compare_fuzzy_junctions, collapse_fuzzy_junctions, \
+        pick_rep
 import filecmp
 from test_setpath import DATA_DIR, OUT_DIR, SIV_DATA_DIR
 
@@ -133,3 +136,76 @@ class TEST_CollapsingUtils(unittest.TestCase):
         r4, r5 = [r for r in CollapseGffReader(output_gff)]
         self.assertEqual(r1, r4)
         self.assertEqual(r3, r5)
+
+    def test_collapse_fuzzy_junctions_nproc(self):
+        """Test collapse_fuzzy_junctions with nproc > 1 writes the same
+        outputs as nproc = 1."""
+        test_name = "collapse_fuzzy_junctions"
+        input_gff = op.join(_DAT_DIR_, "input_%s.gff" % test_name)
+        input_group = op.join(_DAT_DIR_, "input_%s.group.txt" % test_name)
+        outputs = {}
+        for nproc in (1, 2):
+            output_gff = op.join(_OUT_DIR_, "output_%s.%s.gff" % (test_name, nproc))
+            output_group = op.join(_OUT_DIR_, "output_%s.%s.group.txt" % (test_name, nproc))
+            fuzzy_match = collapse_fuzzy_junctions(gff_filename=input_gff,
+                                                   group_filename=input_group,
+                                                   fuzzy_gff_filename=output_gff,
+                                                   fuzzy_group_filename=output_group,
+                                                   allow_extra_5exon=True,
+                                                   max_fuzzy_junction=5,
+                                                   nproc=nproc)
+            outputs[nproc] = (output_gff, output_group, dict(fuzzy_match))
+        self.assertTrue(filecmp.cmp(outputs[1][0], outputs[2][0], shallow=False))
+        self.assertTrue(filecmp.cmp(outputs[1][1], outputs[2][1], shallow=False))
+        self.assertEqual(outputs[1][2], outputs[2][2])
+        self.assertFalse(op.exists(outputs[2][0] + ".shards"))
+
+    def test_pick_rep(self):
+        """Test pick_rep picks the same representatives as looking up
+        members one by one and summing their expected errors base by base."""
+        rng = random.Random(0)
+        in_fa, in_fq = op.join(_OUT_DIR_, "pick_rep.fasta"), op.join(_OUT_DIR_, "pick_rep.fastq")
+        gff_fn, group_fn = op.join(_OUT_DIR_, "pick_rep.gff"), op.join(_OUT_DIR_, "pick_rep.group.txt")
+        groups = []
+        with open(in_fa, 'w') as fa, open(in_fq, 'w') as fq, \
+             open(gff_fn, 'w') as gff, open(group_fn, 'w') as group:
+            for g in xrange(40):
+                pb_id = "PB.%d.1" % g
+                members = ["i0_HQ_sample|c%d_%d/f2p0/100" % (g, m)
+                           for m in xrange(rng.randint(1, 8))]
+                # members share lengths and quality strings now and then, so ties happen
+                quals = ["".join(rng.choice("!+5?I") for dummy in xrange(rng.choice([0, 5, 9])))
+                         for dummy in xrange(3)]
+                for m in members:
+                    qual = rng.choice(quals)
+                    seq = "".join(rng.choice("ACGT") for dummy in qual)
+                    fa.write(">{0}\n{1}\n".format(m, seq))
+                    fq.write("@{0}\n{1}\n+\n{2}\n".format(m, seq, qual))
+                for feature in ("transcript", "exon"):
+                    gff.write("chr1\tPacBio\t{0}\t{1}\t{2}\t.\t+\t.\t".format(feature, g + 1, g + 9) +
+                              "gene_id \"PB.{0}\"; transcript_id \"{1}\";\n".format(g, pb_id))
+                group.write("{0}\t{1}\n".format(pb_id, ",".join(members)))
+                groups.append((pb_id, members))
+
+        reads = dict((r.name, r) for r in FastqReader(in_fq))
+        def expected_rep_ids(pick_least_err_instead):
+            """Representatives picked member by member."""
+            ret = []
+            for pb_id, members in groups:
+                best_id, best_err, max_len = None, 9999999, 0
+                for x in members:
+                    err = sum(i**-(i/10.) for i in reads[x].quality)
+                    if (pick_least_err_instead and err < best_err) or \
+                       (not pick_least_err_instead and len(reads[x].sequence) >= max_len):
+                        best_id, best_err, max_len = x, err, len(reads[x].sequence)
+                ret.append((pb_id, best_id))
+            return ret
+
+        for in_fn, least_err in ((in_fa, False), (in_fq, False), (in_fq, True)):
+            out_fn = op.join(_OUT_DIR_, "pick_rep.out.fastq" if least_err else "pick_rep.out.fasta")
+            pick_rep(isoform_filename=in_fn, gff_filename=gff_fn, group_filename=group_fn,
+                     output_filename=out_fn, pick_least_err_instead=least_err)
+            # output ids are pb_id|coordinates|best_id
+            rep_ids = [tuple(line[1:].strip().split('|', 2)[0::2])
+                       for line in open(out_fn) if line[0] in ">@"]
+            self.assertEqual(rep_ids, expected_rep_ids(least_err))
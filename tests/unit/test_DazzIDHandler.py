@@ -1,8 +1,13 @@
 import unittest
+import os
 import os.path as op
 import filecmp
+import time
+from collections import namedtuple
+from multiprocessing import Process
 from cPickle import load
 from pbtranscript.io import DazzIDHandler
+from pbtranscript.io.DazzIDHandler import DazzDBCache, dazz_db_files
 from pbtranscript.Utils import mknewdir, execute
 #from pbtranscript.io import *
 from test_setpath import OUT_DIR, DATA_DIR, STD_DIR
@@ -147,3 +152,163 @@ class Test_DazzIDHandler_DataSet(unittest.TestCase):
 
         print "Testing DazzIDHandler.num_blocks"
         self.assertTrue(handler.num_blocks, 1)
+
+
+Record = namedtuple("Record", ["name", "sequence"])
+
+
+def _fake_create(dazz_filename, log_filename, sleep=0):
+    """Create fake converted fasta, pickle and db files of dazz_filename,
+    and log the creation."""
+    time.sleep(sleep)
+    for fn in dazz_db_files(dazz_filename):
+        with open(fn, 'w') as f:
+            f.write("content of %s\n" % op.basename(fn) * 100)
+    with open(log_filename, 'a') as f:
+        f.write(dazz_filename + "\n")
+
+
+def _get_or_create(cache_dir, key, dazz_filename, log_filename):
+    """Get or create files of key, run by concurrent processes."""
+    cache = DazzDBCache(cache_dir)
+    cache.get_or_create(key, dazz_filename,
+                        lambda: _fake_create(dazz_filename, log_filename, sleep=1))
+
+
+class _CountingDazzIDHandler(DazzIDHandler):
+    """DazzIDHandler which counts dazz databases made."""
+    n_make_db = 0
+
+    def make_db(self):
+        """Make dazz database and count it."""
+        _CountingDazzIDHandler.n_make_db += 1
+        super(_CountingDazzIDHandler, self).make_db()
+
+
+class Test_DazzDBCache(unittest.TestCase):
+    """Test DazzDBCache."""
+    testName = "test_DazzDBCache"
+    def setUp(self):
+        """Initialize."""
+        self.outDir = op.join(OUT_DIR, self.testName)
+        self.cacheDir = op.join(self.outDir, "cache")
+        self.log = op.join(self.outDir, "create.log")
+        mknewdir(self.outDir)
+        self.records = [Record("movie/1/0_10", "ACGTACGTAC"),
+                        Record("movie/2/0_5", "GGGCC")]
+
+    def _created(self):
+        """Return dazz filenames created, as logged."""
+        if not op.exists(self.log):
+            return []
+        return open(self.log).read().split()
+
+    def test_hit(self):
+        """Test files are created once, and copied from cache later."""
+        cache = DazzDBCache(self.cacheDir)
+        key = cache.records_key(self.records)
+        fn1 = op.join(self.outDir, "a.dazz.fasta")
+        fn2 = op.join(self.outDir, "b.dazz.fasta")
+        self.assertFalse(cache.get_or_create(
+            key, fn1, lambda: _fake_create(fn1, self.log)))
+        self.assertTrue(cache.get_or_create(
+            key, fn2, lambda: _fake_create(fn2, self.log)))
+        self.assertEqual(self._created(), [fn1])
+        for f1, f2 in zip(dazz_db_files(fn1), dazz_db_files(fn2)):
+            self.assertTrue(op.exists(f2))
+            self.assertTrue(filecmp.cmp(f1, f2, shallow=False))
+        self.assertEqual(op.basename(dazz_db_files(fn2)[3]), ".b.dazz.fasta.idx")
+
+    def test_invalidation(self):
+        """Test key changes when any record changes."""
+        key = DazzDBCache.records_key(self.records)
+        self.assertEqual(key, DazzDBCache.records_key(list(self.records)))
+        changed_seq = [self.records[0], Record("movie/2/0_5", "GGGCA")]
+        changed_name = [self.records[0], Record("movie/3/0_5", "GGGCC")]
+        reordered = self.records[::-1]
+        for records in [changed_seq, changed_name, reordered, self.records[:1]]:
+            self.assertNotEqual(DazzDBCache.records_key(records), key)
+
+        cache = DazzDBCache(self.cacheDir)
+        fn = op.join(self.outDir, "a.dazz.fasta")
+        cache.get_or_create(key, fn, lambda: _fake_create(fn, self.log))
+        new_key = cache.records_key(changed_seq)
+        self.assertFalse(cache.get(new_key, fn))
+        self.assertFalse(cache.get_or_create(
+            new_key, fn, lambda: _fake_create(fn, self.log)))
+        self.assertEqual(len(self._created()), 2)
+
+    def test_eviction(self):
+        """Test least recently used entries are evicted."""
+        fn = op.join(self.outDir, "a.dazz.fasta")
+        _fake_create(fn, self.log)
+        entry_size = sum(op.getsize(f) for f in dazz_db_files(fn))
+        cache = DazzDBCache(self.cacheDir, max_bytes=int(entry_size * 2.5))
+        cache.put("k1", fn)
+        cache.put("k2", fn)
+        os.utime(op.join(cache.entry_dir("k1"), cache.last_used_basename),
+                 (time.time() - 100, time.time() - 100))
+        os.utime(op.join(cache.entry_dir("k2"), cache.last_used_basename),
+                 (time.time() - 50, time.time() - 50))
+        self.assertTrue(cache.get("k1", fn))  # k1 becomes most recently used
+        cache.put("k3", fn)
+        self.assertEqual(sorted(key for dummy_t, dummy_s, key in cache.entries()),
+                         ["k1", "k3"])
+        self.assertFalse(cache.get("k2", fn))
+
+    def test_concurrent(self):
+        """Test two processes converting the same input at once
+        create it only once."""
+        key = DazzDBCache.records_key(self.records)
+        fns = [op.join(self.outDir, "p%d.dazz.fasta" % i) for i in xrange(2)]
+        ps = [Process(target=_get_or_create, args=(self.cacheDir, key, fn, self.log))
+              for fn in fns]
+        for p in ps:
+            p.start()
+        for p in ps:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+        self.assertEqual(len(self._created()), 1)
+        for fn in fns:
+            self.assertTrue(all(op.exists(f) for f in dazz_db_files(fn)))
+        self.assertEqual([key], [k for dummy_t, dummy_s, k in
+                                 DazzDBCache(self.cacheDir).entries()])
+
+    def test_dazz_id_handler(self):
+        """Test DazzIDHandler reuses cached files of identical input
+        records, and converts again when input records change."""
+        cache = DazzDBCache(self.cacheDir)
+        fns = [op.join(self.outDir, "%s.fasta" % x) for x in ("a", "b")]
+        for fn in fns:
+            with open(fn, 'w') as f:
+                for r in self.records:
+                    f.write(">%s\n%s\n" % (r.name, r.sequence))
+        _CountingDazzIDHandler.n_make_db = 0
+
+        handler_a = _CountingDazzIDHandler(fns[0], cache=cache)
+        self.assertEqual(_CountingDazzIDHandler.n_make_db, 1)
+        self.assertEqual(len(cache.entries()), 1)
+
+        # b.fasta has the same records as a.fasta, reuse cached files
+        handler_b = _CountingDazzIDHandler(fns[1], cache=cache)
+        self.assertEqual(_CountingDazzIDHandler.n_make_db, 1)
+        self.assertEqual(len(cache.entries()), 1)
+        self.assertEqual(handler_b.dazz_mapping,
+                         {1: "movie/1/0_10", 2: "movie/2/0_5"})
+        self.assertEqual(handler_b.dazz_mapping, handler_a.dazz_mapping)
+        for f1, f2 in zip(dazz_db_files(handler_a.dazz_filename),
+                          dazz_db_files(handler_b.dazz_filename)):
+            self.assertTrue(filecmp.cmp(f1, f2, shallow=False))
+        self.assertEqual(handler_b.num_blocks, handler_a.num_blocks)
+
+        # b.fasta changes, convert again
+        with open(fns[1], 'w') as f:
+            f.write(">movie/2/0_5\nGGGCA\n")
+        handler_b = _CountingDazzIDHandler(fns[1], cache=cache)
+        self.assertEqual(_CountingDazzIDHandler.n_make_db, 2)
+        self.assertEqual(len(cache.entries()), 2)
+        self.assertEqual(handler_b.dazz_mapping, {1: "movie/2/0_5"})
+        self.assertEqual(open(handler_b.dazz_filename).read().split(),
+                         [">prolog/1/0_5", "GGGCA"])
+        self.assertFalse(filecmp.cmp(handler_a.dazz_filename,
+                                     handler_b.dazz_filename, shallow=False))
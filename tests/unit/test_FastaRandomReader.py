@@ -1,7 +1,9 @@
 """Test FastaSplitter"""
 
 import unittest
+import os
 import os.path as op
+import time
 from pbcore.io import FastaReader, ContigSet
 from pbtranscript.io.FastaRandomReader import FastaRandomReader, \
         MetaSubreadFastaReader
@@ -9,6 +11,30 @@ from pbtranscript.Utils import write_files_to_fofn
 from test_setpath import DATA_DIR, OUT_DIR, STD_DIR
 import hashlib
 
+
+def _legacy_read_all(fasta_filename):
+    """Read all records the way FastaRandomReader used to,
+    return dict seqid --> sequence."""
+    d = {}
+    with open(fasta_filename) as f:
+        while 1:
+            line = f.readline()
+            if len(line) == 0:
+                break
+            if line.startswith('>'):
+                d[line.strip()[1:].split(None, 1)[0]] = f.tell()
+        ret = {}
+        for sid, tell in d.iteritems():
+            f.seek(tell)
+            content = ''
+            for line in f:
+                if line.startswith('>'):
+                    break
+                content += line.strip()
+            ret[sid] = content
+    return ret
+
+
 class TestFastaRandomReader(unittest.TestCase):
     """Class for testing FastaRandomReader."""
 
@@ -86,6 +112,149 @@ class TestFastaRandomReader(unittest.TestCase):
             self.assertEqual(frr[r.name].sequence, r.sequence[:])
 
 
+class TestFastaRandomReaderIndex(unittest.TestCase):
+    """Class for testing FASTA index, get_many and cache of
+    FastaRandomReader."""
+
+    def setUp(self):
+        """Set up output files."""
+        self.outDir = OUT_DIR
+        self.irregularFa = op.join(self.outDir, "test_frr_irregular.fasta")
+        with open(self.irregularFa, 'w') as f:
+            f.write(">r1 desc\nACGT\nAC\nGTA\n" +
+                    ">r2\n>r3\n\nACGTN\n\nTT\n" +
+                    ">r4\r\nAC GT\r\nGG\t\r\n" +
+                    ">r1 dup\nGGGG\n" +
+                    ">r5\nACGTACGTAC\nACGTACGTAC\nACG")
+        self.regularFa = op.join(self.outDir, "test_frr_regular.fasta")
+        with open(self.regularFa, 'w') as f:
+            for i in xrange(50):
+                seq = "ACGT" * (i + 1) + "A" * (i % 7)
+                f.write(">s%d\n" % i)
+                for j in xrange(0, len(seq), 60):
+                    f.write(seq[j:j+60] + "\n")
+        for fn in [self.irregularFa, self.regularFa]:
+            if op.exists(fn + ".fai"):
+                os.remove(fn + ".fai")
+
+    def _check_identical(self, frr, fasta_filename):
+        """Check records of frr are identical to the legacy reader."""
+        expected = _legacy_read_all(fasta_filename)
+        self.assertEqual(sorted(frr.keys()), sorted(expected.keys()))
+        for sid, seq in expected.iteritems():
+            self.assertEqual(frr[sid].name, sid)
+            self.assertEqual(frr[sid].sequence, seq)
+
+    def test_identical_to_legacy(self):
+        """Test records are byte-identical to the legacy reader."""
+        for fn in [self.irregularFa, self.regularFa,
+                   op.join(DATA_DIR, "reads_of_insert.fasta"),
+                   op.join(DATA_DIR, "test_phmmer.fasta")]:
+            self._check_identical(FastaRandomReader(fn, write_index=False), fn)
+
+    def test_index(self):
+        """Test FASTA index is written, reused, and rebuilt if stale."""
+        fai = self.regularFa + ".fai"
+        frr = FastaRandomReader(self.regularFa)
+        self.assertTrue(op.exists(fai))
+        lines = open(fai).read().splitlines()
+        self.assertEqual(len(lines), 50)
+        # samtools faidx format: name, length, offset, linebases, linewidth
+        self.assertEqual(lines[0].split('\t'), ['s0', '4', '4', '4', '5'])
+        self.assertEqual(lines[20].split('\t')[1:2], [str(84 + 6)])
+        self.assertEqual(lines[20].split('\t')[3:], ['60', '61'])
+
+        # reused
+        frr2 = FastaRandomReader(self.regularFa)
+        self.assertEqual(frr2.d, frr.d)
+        self._check_identical(frr2, self.regularFa)
+
+        # rebuilt if FASTA is changed
+        time.sleep(1)
+        with open(self.regularFa, 'w') as f:
+            f.write(">new1\nAAAA\n>s0\nCC\n")
+        frr3 = FastaRandomReader(self.regularFa)
+        self.assertEqual(sorted(frr3.keys()), ['new1', 's0'])
+        self._check_identical(frr3, self.regularFa)
+
+        # rebuilt if index does not match FASTA
+        with open(fai, 'w') as f:
+            f.write("new1\t4\t3\t4\t5\ns0\t2\t13\t2\t3\n")
+        frr4 = FastaRandomReader(self.regularFa)
+        self._check_identical(frr4, self.regularFa)
+
+    def test_partial_index(self):
+        """Test FASTA index covering only part of the FASTA is rebuilt."""
+        fai = self.regularFa + ".fai"
+        FastaRandomReader(self.regularFa)
+        lines = open(fai).read().splitlines()
+        self.assertEqual(len(lines), 50)
+
+        # index of the first records only
+        with open(fai, 'w') as f:
+            f.write("\n".join(lines[:10]) + "\n")
+        frr = FastaRandomReader(self.regularFa)
+        self.assertEqual(len(frr.keys()), 50)
+        self._check_identical(frr, self.regularFa)
+        self.assertEqual(len(open(fai).read().splitlines()), 50)
+
+        # index of all records, but the last record is longer
+        with open(fai, 'w') as f:
+            f.write("\n".join(lines[:-1]) + "\n")
+            sid, length, rest = lines[-1].split('\t', 2)
+            f.write("\t".join([sid, str(int(length) - 1), rest]) + "\n")
+        frr = FastaRandomReader(self.regularFa)
+        self._check_identical(frr, self.regularFa)
+        self.assertEqual(open(fai).read().splitlines(), lines)
+
+    @unittest.skipIf(os.geteuid() == 0, "root can write read-only dirs")
+    def test_read_only_dir(self):
+        """Test FASTA in a read-only dir is indexed in memory."""
+        ro_dir = op.join(self.outDir, "test_frr_read_only")
+        if not op.exists(ro_dir):
+            os.makedirs(ro_dir)
+        os.chmod(ro_dir, 0755)
+        fn = op.join(ro_dir, "ro.fasta")
+        with open(fn, 'w') as f:
+            f.write(open(self.regularFa).read())
+        for x in os.listdir(ro_dir):
+            if x != "ro.fasta":
+                os.remove(op.join(ro_dir, x))
+        os.chmod(ro_dir, 0555)
+        try:
+            frr = FastaRandomReader(fn)
+            self._check_identical(frr, fn)
+            self.assertEqual(os.listdir(ro_dir), ["ro.fasta"])
+        finally:
+            os.chmod(ro_dir, 0755)
+
+    def test_get_many(self):
+        """Test get_many and LRU cache."""
+        frr = FastaRandomReader(self.regularFa, cache_size=5)
+        ids = ["s10", "s3", "s49", "s3", "s0"]
+        records = frr.get_many(ids)
+        self.assertEqual([r.name for r in records], ids)
+        for r in records:
+            self.assertEqual(r.sequence, frr[r.name].sequence)
+        self.assertTrue(len(frr._cache) <= 5)
+        for i in xrange(20):
+            frr["s%d" % i]
+        self.assertEqual(frr._cache.keys(), ["s15", "s16", "s17", "s18", "s19"])
+        self.assertRaises(ValueError, frr.get_many, ["s1", "nonexist"])
+        self.assertEqual(FastaRandomReader(self.irregularFa).get_many([]), [])
+
+    def test_close(self):
+        """Test FastaRandomReader closes files and memory maps as a
+        context manager."""
+        with FastaRandomReader(self.regularFa, cache_size=5) as frr:
+            self.assertEqual(frr["s1"].sequence, "ACGT" * 2 + "A")
+        self.assertTrue(all(f.closed for f in frr.fhandlers))
+        self.assertRaises(ValueError, frr.__getitem__, "s1")
+        frr.close()  # closing again is harmless
+        with FastaRandomReader(self.irregularFa) as frr:
+            self.assertEqual(len(frr.keys()), 5)
+
+
 class TestMetaSubreadFastaReader(unittest.TestCase):
     """Class for testing MetaSubreadFastaReader."""
     def setUp(self):
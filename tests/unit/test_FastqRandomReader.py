@@ -33,3 +33,22 @@ class TestFastqRandomReader(unittest.TestCase):
 
         self.assertTrue(False not in
                 [frr[r.name].qualityString == r.qualityString for r in reads])
+
+    def test_get_many(self):
+        """Test FastqRandomReader.get_many and get_lengths."""
+        reads = [r for r in FastqReader(self.inFq)]
+        names = [r.name for r in reads][::-1]
+        frr = FastqRandomReader(self.inFq)
+        self.assertEqual([r.qualityString for r in frr.get_many(names)],
+                         [frr[name].qualityString for name in names])
+        self.assertEqual(frr.get_lengths(names),
+                         [len(frr[name].sequence) for name in names])
+        self.assertRaises(ValueError, frr.get_many, names + ["missing"])
+
+    def test_close(self):
+        """Test FastqRandomReader closes its file as a context manager."""
+        with FastqRandomReader(self.inFq) as frr:
+            name = frr.keys()[0]
+            self.assertEqual(frr[name].name, name)
+        self.assertTrue(frr.f.closed)
+        self.assertRaises(ValueError, frr.__getitem__, name)
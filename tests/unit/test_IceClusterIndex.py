@@ -0,0 +1,143 @@
+"""Test pbtranscript.ice.IceClusterIndex."""
+import unittest
+import random
+from pbtranscript.ice.IceClusterIndex import ClusterMembers, ClusterIndex
+
+
+def _no_moves_possible_full_scan(uc, d):
+    """The original full-scan IceIterative.no_moves_possible."""
+    for cid, members in uc.iteritems():
+        if len(members) <= 2:
+            for x in members:
+                if len(d[x]) > 1:
+                    return False
+        else:
+            for x in members:
+                if cid not in d[x]:
+                    return False
+                if d[x][cid] != max(d[x].itervalues()):
+                    return False
+    return True
+
+
+class TestClusterMembers(unittest.TestCase):
+    """Test ClusterMembers."""
+
+    def test_ops(self):
+        """Test append, extend, remove, first."""
+        m = ClusterMembers(["a", "b"])
+        m.append("c")
+        m.extend(["d", "e"])
+        m.remove("b")
+        self.assertEqual(list(m), ["a", "c", "d", "e"])
+        self.assertEqual(m.first(), "a")
+        self.assertTrue("c" in m)
+        self.assertFalse("b" in m)
+        self.assertRaises(KeyError, m.remove, "b")
+
+
+class TestClusterIndex(unittest.TestCase):
+    """Test ClusterIndex."""
+
+    def setUp(self):
+        self.uc = {0: ["r0", "r1", "r2"], 1: ["r3"], 2: ["r4", "r5"]}
+        self.d = {"r0": {0: -1, 1: -5}, "r1": {0: -1}, "r2": {0: -1},
+                  "r3": {1: -2}, "r4": {2: -1}, "r5": {2: -1, 1: -3}}
+
+    def test_init(self):
+        """Test constructing from uc and d."""
+        index = ClusterIndex(self.uc, self.d)
+        self.assertTrue(index.check_consistency())
+        self.assertEqual(index.qid_to_cid["r4"], 2)
+        self.assertEqual(index.cid_to_qids[1], set(["r0", "r3", "r5"]))
+        self.assertFalse(index.no_moves_possible())
+        self.assertEqual(index.movable_qids(), set(["r5"]))
+
+    def test_delete_cluster(self):
+        """Test deleting a cluster removes its column in d."""
+        index = ClusterIndex(self.uc, self.d)
+        self.assertRaises(ValueError, index.delete_cluster, 1)
+        self.assertEqual(index.remove_from_cluster("r3", 1), 0)
+        index.add_to_cluster(["r3"], 0)
+        index.delete_cluster(1)
+        self.assertEqual(index.d["r0"], {0: -1})
+        self.assertEqual(index.d["r5"], {2: -1})
+        self.assertTrue(index.check_consistency())
+        self.assertEqual(list(index.uc[0]), ["r0", "r1", "r2", "r3"])
+
+    def test_add_twice(self):
+        """Test a read can not be in two clusters."""
+        index = ClusterIndex(self.uc, self.d)
+        self.assertRaises(ValueError, index.add_to_cluster, ["r0"], 1)
+
+    def test_random_ops(self):
+        """Test random move/merge/delete/prob sequences keep
+        the index consistent."""
+        rng = random.Random(1234)
+        n_reads = 60
+        uc = dict((i, ["r%d" % (5 * i + j) for j in xrange(5)])
+                  for i in xrange(n_reads / 5))
+        d = {}
+        for cid, qids in uc.iteritems():
+            for qid in qids:
+                d[qid] = {cid: -1.0}
+        index = ClusterIndex(uc, d)
+
+        for step in xrange(2000):
+            cids = sorted(index.uc)
+            op = rng.randint(0, 5)
+            if op == 0:  # move a read
+                qid = rng.choice(sorted(index.qid_to_cid))
+                from_i = index.qid_to_cid[qid]
+                to_i = rng.choice(cids)
+                if to_i != from_i:
+                    if index.remove_from_cluster(qid, from_i) == 0:
+                        index.delete_cluster(from_i)
+                    index.add_to_cluster([qid], to_i)
+            elif op == 1 and len(cids) > 1:  # merge two clusters
+                i, j = rng.sample(cids, 2)
+                if rng.random() < 0.5:
+                    k = max(cids) + 1
+                    index.add_cluster(k, [])
+                    index.move_members(i, k)
+                    index.move_members(j, k)
+                    index.delete_cluster(i)
+                    index.delete_cluster(j)
+                else:
+                    index.move_members(j, i)
+                    index.delete_cluster(j)
+            elif op == 2:  # set a prob
+                qid = rng.choice(sorted(index.qid_to_cid))
+                index.set_prob(qid, rng.choice(cids), -rng.randint(0, 3))
+            elif op == 3:  # reset probs of a read
+                qid = rng.choice(sorted(index.qid_to_cid))
+                index.reset_probs(qid, dict((cid, -rng.randint(0, 3)) for
+                                            cid in rng.sample(cids, min(2, len(cids)))))
+            elif op == 4:  # clean probs of some reads
+                qids = rng.sample(sorted(index.qid_to_cid), 5)
+                index.clean_probs(rng.sample(cids, min(3, len(cids))), qids)
+            else:  # split a read into a new cluster
+                qid = rng.choice(sorted(index.qid_to_cid))
+                from_i = index.qid_to_cid[qid]
+                if index.remove_from_cluster(qid, from_i) == 0:
+                    index.delete_cluster(from_i)
+                index.add_cluster(max(index.uc) + 1 if len(index.uc) > 0 else 0, [qid])
+
+            if step % 10 == 0:
+                self.assertEqual(index.no_moves_possible(),
+                                 _no_moves_possible_full_scan(index.uc, index.d))
+            if step % 50 == 0:
+                self.assertTrue(index.check_consistency())
+
+        self.assertTrue(index.check_consistency())
+        self.assertEqual(sum(len(m) for m in index.uc.itervalues()), n_reads)
+
+    def test_check_consistency(self):
+        """Test check_consistency detects an out-of-band modification."""
+        index = ClusterIndex(self.uc, self.d)
+        index.d["r1"][2] = -3
+        self.assertRaises(ValueError, index.check_consistency)
+
+
+if __name__ == "__main__":
+    unittest.main()
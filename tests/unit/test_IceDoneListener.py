@@ -0,0 +1,97 @@
+"""Test pbtranscript.ice.IceDoneListener and IceAllPartials.waitForPickles."""
+import unittest
+import os.path as op
+import multiprocessing
+import threading
+import time
+from pbtranscript.Utils import rmpath, mkdir, touch
+from pbtranscript.ClusterOptions import SgeOptions
+from pbtranscript.ice.IceDoneListener import DoneListener, notify_done
+from pbtranscript.ice.IceAllPartials import IceAllPartials
+from test_setpath import OUT_DIR
+
+_OUT_DIR_ = op.join(OUT_DIR, "test_IceDoneListener")
+
+
+def _chunk_job(done_filename, address, sleep):
+    """Fake chunk job, creates done_filename after sleep seconds
+    and notifies address."""
+    time.sleep(sleep)
+    touch(done_filename)
+    notify_done(address, done_filename)
+
+
+class TestIceDoneListener(unittest.TestCase):
+    """Test DoneListener, notify_done and IceAllPartials.waitForPickles."""
+
+    def setUp(self):
+        """Define input and output file."""
+        rmpath(_OUT_DIR_)
+        mkdir(_OUT_DIR_)
+
+    def test_notify_done(self):
+        """Test waiting ends within a second of the last job being done,
+        long before the next poll."""
+        done_filenames = [op.join(_OUT_DIR_, "chunk%d.DONE" % i) for i in range(3)]
+        with DoneListener(host="localhost") as listener:
+            jobs = [multiprocessing.Process(target=_chunk_job,
+                                            args=(fn, listener.address, 0.2 * (i + 1)))
+                    for i, fn in enumerate(done_filenames)]
+            for job in jobs:
+                job.start()
+            while not all(op.exists(fn) for fn in done_filenames):
+                listener.wait(timeout=600)
+            end_t = time.time()
+            for job in jobs:
+                job.join()
+        self.assertTrue(end_t - max(op.getmtime(fn) for fn in done_filenames) < 1)
+        self.assertEqual(sorted(listener.notified), done_filenames)
+
+    def test_bind_address(self):
+        """Test the listener does not listen on all interfaces."""
+        with DoneListener(host="localhost") as listener:
+            self.assertEqual(listener._sock.getsockname()[0], "127.0.0.1")
+        with DoneListener() as listener:
+            self.assertNotEqual(listener._sock.getsockname()[0], "0.0.0.0")
+            self.assertTrue(notify_done(listener.address, "x.DONE", timeout=1))
+            listener.wait(timeout=10)
+        self.assertEqual(listener.notified, ["x.DONE"])
+
+    def test_notify_failure(self):
+        """Test notify_done returns False if no listener is there."""
+        with DoneListener(host="localhost") as listener:
+            address = listener.address
+        self.assertFalse(notify_done(address, "x.DONE", timeout=1))
+        self.assertFalse(notify_done("no_port", "x.DONE", timeout=1))
+
+    def test_waitForPickles(self):
+        """Test IceAllPartials.waitForPickles returns as soon as the
+        last partial chunk is done."""
+        fasta_filenames = [op.join(_OUT_DIR_, "input.split_%02d.fasta" % i) for i in range(2)]
+        for fn in fasta_filenames:
+            with open(fn, 'w') as writer:
+                writer.write(">r\nACGT\n")
+        obj = IceAllPartials(root_dir=op.join(_OUT_DIR_, "root"),
+                             fasta_filenames=fasta_filenames, ref_fasta=fasta_filenames[0],
+                             out_pickle=op.join(_OUT_DIR_, "nfl.pickle"),
+                             sge_opts=SgeOptions(unique_id=100))
+
+        def chunk(i, address):
+            """Fake 'ice_partial.py one' job."""
+            time.sleep(0.3 * (i + 1))
+            touch(obj.pickle_filenames[i])
+            _chunk_job(obj.done_filenames[i], address, 0)
+
+        with DoneListener(host="localhost") as listener:
+            for i in range(len(fasta_filenames)):
+                threading.Thread(target=chunk, args=(i, listener.address)).start()
+            obj.waitForPickles(pickle_filenames=obj.pickle_filenames,
+                               done_filenames=obj.done_filenames,
+                               listener=listener, poll_interval=600)
+            end_t = time.time()
+        self.assertTrue(end_t - max(op.getmtime(fn) for fn in obj.done_filenames) < 1)
+        obj.close_log()
+
+
+if __name__ == "__main__":
+    unittest.main()
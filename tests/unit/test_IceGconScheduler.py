@@ -0,0 +1,17 @@
+"""Test pbtranscript.ice.IceGconScheduler."""
+import unittest
+from pbtranscript.ice.IceGconScheduler import estimate_gcon_cost
+
+
+class TestIceGconScheduler(unittest.TestCase):
+    """Test estimate_gcon_cost."""
+
+    def test_estimate_gcon_cost(self):
+        """Test cost grows with bases and with reads up to blasr bestn."""
+        self.assertEqual(estimate_gcon_cost(3, 3000), 15000)
+        self.assertTrue(estimate_gcon_cost(3, 6000) > estimate_gcon_cost(3, 3000))
+        self.assertEqual(estimate_gcon_cost(20, 1000), estimate_gcon_cost(30, 1000))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Test pbtranscript.ice.IceIterative."""
+import unittest
+import hashlib
+import os.path as op
+from pbcore.io.FastaIO import FastaRecord
+from pbtranscript.Utils import mknewdir
+from pbtranscript.ice.IceIterative import IceIterative
+from pbtranscript.ice.IceClusterIndex import ClusterIndex
+from test_setpath import OUT_DIR
+
+_OUT_DIR_ = op.join(OUT_DIR, "test_IceIterative")
+
+
+class TestIceIterative(unittest.TestCase):
+    """Test IceIterative."""
+
+    def _make_obj(self, newids):
+        """Return an IceIterative object with only newids and digests set."""
+        obj = IceIterative.__new__(IceIterative)
+        obj.index = ClusterIndex()
+        obj.newids = set(newids)
+        obj.consensus_digests = {}
+        return obj
+
+    def test_cids_to_rescore(self):
+        """Test clusters are skipped unless consensus or newids changed."""
+        obj = self._make_obj(["r2", "r1"])
+        consensus = {0: FastaRecord("c0", "ACGT"), 1: FastaRecord("c1", "GGCC")}
+
+        # no probs calculated yet, re-score all
+        todo, digests = obj._cids_to_rescore(consensus)
+        self.assertEqual(todo, set([0, 1]))
+        self.assertEqual(digests[0], (hashlib.md5("ACGT").hexdigest(),
+                                      hashlib.md5("r1\nr2").hexdigest()))
+        obj.consensus_digests.update(digests)
+
+        # unchanged, skip all unless force_calc
+        todo, digests2 = obj._cids_to_rescore(consensus)
+        self.assertEqual(todo, set())
+        self.assertEqual(digests2, digests)
+        self.assertEqual(obj._cids_to_rescore(consensus, force_calc=True)[0],
+                         set([0, 1]))
+
+        # consensus of cluster 1 changed, re-score cluster 1 only
+        consensus[1] = FastaRecord("c1", "GGCCA")
+        self.assertEqual(obj._cids_to_rescore(consensus)[0], set([1]))
+
+        # newids changed, re-score all
+        obj.newids.add("r3")
+        self.assertEqual(obj._cids_to_rescore(consensus)[0], set([0, 1]))
+
+        # digests are stable, e.g., after loaded from a pickle
+        obj2 = self._make_obj(["r1", "r2"])
+        obj2.consensus_digests = {0: digests[0]}
+        self.assertEqual(obj2._cids_to_rescore({0: FastaRecord("c0", "ACGT")})[0],
+                         set())
+
+    def test_calc_cluster_prob_skip(self):
+        """Test calc_cluster_prob keeps probs of unchanged clusters."""
+        mknewdir(_OUT_DIR_)
+        obj = self._make_obj(["r1", "r2"])
+        obj.prog_name, obj.no_log_f, obj.iterNum = "IceIterative", True, 3
+        obj.prob_calc_stats = []
+        obj.root_dir = _OUT_DIR_
+        obj.uc = {0: ["r1"], 1: ["r2"]}
+        obj.d = {"r1": {0: -1.0}, "r2": {1: -2.0}}
+        obj.refs = {}
+        for cid, seq in [(0, "ACGT"), (1, "GGCC")]:
+            obj.refs[cid] = op.join(_OUT_DIR_, "c%d.consensus.fasta" % cid)
+            with open(obj.refs[cid], 'w') as writer:
+                writer.write(">c%d\n%s\n" % (cid, seq))
+        obj.changes = set([0, 1])
+        obj.consensus_digests = obj._cids_to_rescore(
+            {0: FastaRecord("c0", "ACGT"), 1: FastaRecord("c1", "GGCC")})[1]
+
+        obj.calc_cluster_prob()
+        self.assertFalse(op.exists(obj.refConsensusFa))
+        self.assertEqual(obj.d, {"r1": {0: -1.0}, "r2": {1: -2.0}})
+        self.assertEqual(obj.prob_calc_stats,
+                         [{'iterNum': 3, 'rescored': 0, 'skipped': 2}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -254,6 +254,57 @@ class Test_ICEUtils(unittest.TestCase):
         test_name = "test_daligner_against_ref_use_sge"
         self._test_daligner_against_ref(test_name=test_name, use_sge=True, sge_opts=SgeOptions(100))
 
+    def test_eval_blasr_alignment_columnar(self):
+        """Test eval_blasr_alignment_columnar against eval_blasr_alignment."""
+        rs = np.random.RandomState(0)
+        qvs = {}
+        def qver_get_func(seqid, qv_name, position=None):
+            """Random QVs of reads in test_BLASRRecord.m5."""
+            if (seqid, qv_name) not in qvs:
+                # subjects of the first two records are a genome
+                length = 5000000 if seqid.startswith('gi|') else 20000
+                qvs[(seqid, qv_name)] = rs.rand(length) * 0.1
+            if position is None:
+                return qvs[(seqid, qv_name)]
+            return qvs[(seqid, qv_name)][position]
+
+        m5 = op.join(self.dataDir, "test_BLASRRecord.m5")
+        for r in BLASRM5Reader(m5):
+            for sID_starts_with_c in (True, False):
+                for qvmean_get_func in (None, lambda seqid, qv_name: 0.05):
+                    cigar, ece = eval_blasr_alignment(
+                        record=r, qver_get_func=qver_get_func,
+                        qvmean_get_func=qvmean_get_func,
+                        sID_starts_with_c=sID_starts_with_c,
+                        qv_prob_threshold=0.03)
+                    cigar1, ece1, err = eval_blasr_alignment_columnar(
+                        record=r, sID_starts_with_c=sID_starts_with_c,
+                        qver_get_func=qver_get_func)
+                    self.assertEqual(cigar, cigar1)
+                    self.assertTrue(np.all(ece == ece1))
+                    self.assertEqual(len(err), len(r.alnStr))
+                    # QVs are not fetched if error probabilities are not needed
+                    cigar2, ece2, err2 = eval_blasr_alignment_columnar(
+                        record=r, sID_starts_with_c=sID_starts_with_c)
+                    self.assertEqual(cigar, cigar2)
+                    self.assertTrue(np.all(ece == ece2))
+                    self.assertTrue(err2 is None)
+                    self.assertEqual(alignment_has_large_nonmatch(ece, 1, 20),
+                                     alignment_has_large_nonmatch(ece1, 1, 20))
+
+            # ProbFromModel returns the same QV for every position
+            prob_model = ProbFromModel(0.01, 0.07, 0.06)
+            cigar, ece = eval_blasr_alignment(
+                record=r, qver_get_func=prob_model.get_smoothed,
+                qvmean_get_func=prob_model.get_mean,
+                sID_starts_with_c=True, qv_prob_threshold=0.03)
+            cigar1, ece1, err = eval_blasr_alignment_columnar(
+                record=r, sID_starts_with_c=True,
+                qver_get_func=prob_model.get_smoothed)
+            self.assertEqual(cigar, cigar1)
+            self.assertTrue(np.all(ece == ece1))
+            self.assertEqual(len(err), len(r.alnStr))
+
     def test_num_reads_in_fasta(self):
         """Test num_reads_in_fasta"""
         in_fa = op.join(self.sivDataDir, "flnc.fasta")
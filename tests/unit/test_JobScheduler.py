@@ -0,0 +1,280 @@
+"""Test pbtranscript.JobScheduler."""
+import unittest
+import os
+import os.path as op
+import sys
+import threading
+import time
+from functools import partial
+from pbtranscript.ClusterOptions import SgeOptions
+from pbtranscript.JobScheduler import Job, JobScheduler, LocalBackend, SgeBackend, \
+    python_job_cmd
+import pbtranscript.testkit.fake_qsub as fake_qsub
+from test_setpath import OUT_DIR
+
+
+FAKE_QSUB = "{py} {script}".format(
+    py=sys.executable, script=op.splitext(fake_qsub.__file__)[0] + ".py")
+
+
+def _not_in_process(pid):
+    """Return 0 if called in a process other than pid, else 5."""
+    return 0 if os.getpid() != pid else 5
+
+
+def _return(value):
+    """Return value."""
+    return value
+
+
+def _raise_key_error():
+    """Raise KeyError."""
+    return {}["x"]
+
+
+class TestJobScheduler(unittest.TestCase):
+    """Test JobScheduler with LocalBackend."""
+
+    def setUp(self):
+        """Initialize."""
+        self.out_dir = op.join(OUT_DIR, "test_JobScheduler")
+        if not op.exists(self.out_dir):
+            os.makedirs(self.out_dir)
+
+    def test_dependency_order(self):
+        """Test a job starts only after jobs it depends on succeeded,
+        and before unrelated slow jobs exit."""
+        order = []
+        lock = threading.Lock()
+
+        def record(name, sleep=0):
+            def f():
+                time.sleep(sleep)
+                with lock:
+                    order.append(name)
+                return 0
+            return f
+
+        s = JobScheduler(LocalBackend(nproc=4))
+        s.add_job("slow", record("slow", sleep=0.5))
+        s.add_job("a", record("a"))
+        s.add_job("b", record("b"), depends_on=["a"])
+        s.add_job("c", record("c"), depends_on=["a", "b"])
+        s.add_job("d", record("d"), depends_on=["slow", "c"])
+        self.assertEqual(s.run(), [])
+        self.assertEqual(order, ["a", "b", "c", "slow", "d"])
+        self.assertTrue(all(job.status == Job.SUCCEEDED for job in s.jobs))
+
+    def test_shell_cmds(self):
+        """Test shell commands run as subprocesses."""
+        out = op.join(self.out_dir, "test_shell_cmds.txt")
+        s = JobScheduler(LocalBackend(nproc=2))
+        s.add_job("w", "echo hello > {o}".format(o=out))
+        s.add_job("a", "echo world >> {o}".format(o=out), depends_on=["w"])
+        self.assertEqual(s.run(), [])
+        self.assertEqual(open(out).read(), "hello\nworld\n")
+
+    def test_failure(self):
+        """Test dependents of a failed job are skipped, others run."""
+        s = JobScheduler(LocalBackend(nproc=2))
+        s.add_job("bad", "exit 3")
+        s.add_job("good", "true")
+        s.add_job("child", "true", depends_on=["bad"])
+        s.add_job("grandchild", "true", depends_on=["child", "good"])
+        failed = s.run()
+        self.assertEqual(sorted(job.name for job in failed),
+                         ["bad", "child", "grandchild"])
+        self.assertEqual(s["bad"].returncode, 3)
+        self.assertEqual(s["child"].status, Job.SKIPPED)
+        self.assertEqual(s["good"].status, Job.SUCCEEDED)
+
+    def test_retries(self):
+        """Test a failed job is retried."""
+        tries = []
+
+        def flaky():
+            tries.append(1)
+            return 0 if len(tries) == 3 else 1
+
+        s = JobScheduler(LocalBackend(nproc=1), retries=2)
+        s.add_job("flaky", flaky)
+        self.assertEqual(s.run(), [])
+        self.assertEqual(s["flaky"].tries, 3)
+
+    def test_nproc(self):
+        """Test running jobs never use more than nproc cpus."""
+        used = [0, 0]  # [currently used, max used]
+        lock = threading.Lock()
+
+        def job(nproc):
+            def f():
+                with lock:
+                    used[0] += nproc
+                    used[1] = max(used)
+                time.sleep(0.05)
+                with lock:
+                    used[0] -= nproc
+                return 0
+            return f
+
+        s = JobScheduler(LocalBackend(nproc=4))
+        for i in range(10):
+            s.add_job("j%d" % i, job(1 + i % 3), nproc=1 + i % 3)
+        s.add_job("big", job(8), nproc=8)  # runs alone
+        self.assertEqual(s.run(), [])
+        self.assertEqual(used[1], 8)
+
+        s = JobScheduler(LocalBackend(nproc=4))
+        used[1] = 0
+        for i in range(10):
+            s.add_job("j%d" % i, job(2), nproc=2)
+        self.assertEqual(s.run(), [])
+        self.assertEqual(used[1], 4)
+
+    def test_mem_and_backfill(self):
+        """Test running jobs never use more than mem GB, and with
+        backfill, small jobs start next to a large one which waits."""
+        started = []
+        lock = threading.Lock()
+
+        def job(name):
+            def f():
+                with lock:
+                    started.append(name)
+                time.sleep(0.1)
+                return 0
+            return f
+
+        for backfill in (False, True):
+            del started[:]
+            s = JobScheduler(LocalBackend(nproc=4, mem=10), backfill=backfill)
+            s.add_job("large0", job("large0"), nproc=2, mem=6)
+            s.add_job("large1", job("large1"), nproc=2, mem=6)
+            s.add_job("small0", job("small0"), nproc=1, mem=2)
+            s.add_job("small1", job("small1"), nproc=1, mem=2)
+            self.assertEqual(s.run(), [])
+            # large1 never runs next to large0
+            self.assertEqual(s.peak_concurrency, 3)
+            if backfill:
+                self.assertEqual(started[:3], ["large0", "small0", "small1"])
+            else:
+                self.assertEqual(started, ["large0", "large1", "small0", "small1"])
+
+    def test_by_cost(self):
+        """Test with by_cost, ready jobs start most costly first, and
+        cheap jobs fill workers as they become free."""
+        started = []
+        lock = threading.Lock()
+
+        def job(name, sleep):
+            def f():
+                with lock:
+                    started.append(name)
+                time.sleep(sleep)
+                return 0
+            return f
+
+        s = JobScheduler(LocalBackend(nproc=2), by_cost=True)
+        s.add_job("cheap0", job("cheap0", 0.05), cost=1)
+        s.add_job("cheap1", job("cheap1", 0.05), cost=1)
+        s.add_job("big", job("big", 0.3), cost=10)
+        s.add_job("mid", job("mid", 0.1), cost=5)
+        s.add_job("after", job("after", 0.05), depends_on=["cheap0"], cost=2)
+        self.assertEqual(s.run(), [])
+        # after becomes ready when cheap0 exits, and starts before cheap1
+        self.assertEqual(started, ["big", "mid", "cheap0", "after", "cheap1"])
+        self.assertEqual(s.peak_concurrency, 2)
+        self.assertTrue(s.makespan >= 0.3)
+
+        # big runs alone on one worker, the others share the other
+        report = s.utilization()
+        self.assertEqual([(slot, n) for slot, n, dummy_b, dummy_f in report],
+                         [(0, 1), (1, 4)])
+        self.assertEqual(report[0][2], s["big"].elapsed)
+        self.assertAlmostEqual(sum(busy for dummy_s, dummy_n, busy, dummy_f in report),
+                               sum(job.elapsed for job in s.jobs))
+        self.assertTrue(all(0 < f <= 1 for dummy_s, dummy_n, dummy_b, f in report))
+
+    def test_python_job_cmd(self):
+        """Test python jobs run in new python processes and report exit codes."""
+        s = JobScheduler(LocalBackend(nproc=2))
+        for name, func in (("pid", partial(_not_in_process, os.getpid())),
+                           ("bad", partial(_return, 3)),
+                           ("raise", _raise_key_error)):
+            s.add_job(name, python_job_cmd(func, op.join(self.out_dir, name + ".pickle")))
+        self.assertEqual(sorted(job.name for job in s.run()), ["bad", "raise"])
+        self.assertEqual(s["bad"].returncode, 3)
+        self.assertEqual(s["raise"].returncode, 1)
+        self.assertTrue("KeyError" in s["raise"].output)
+
+    def test_invalid_dependencies(self):
+        """Test unknown dependencies and cycles are detected before running."""
+        s = JobScheduler(LocalBackend(nproc=1))
+        s.add_job("a", "true", depends_on=["x"])
+        self.assertRaises(ValueError, s.run)
+
+        s = JobScheduler(LocalBackend(nproc=1))
+        s.add_job("a", "true", depends_on=["c"])
+        s.add_job("b", "true", depends_on=["a"])
+        s.add_job("c", "true", depends_on=["b"])
+        s.add_job("d", "true")
+        self.assertRaises(ValueError, s.run)
+        self.assertRaises(ValueError, s.add_job, "d", "true")
+
+
+class TestSgeBackend(unittest.TestCase):
+    """Test JobScheduler with SgeBackend, using fake_qsub."""
+
+    def setUp(self):
+        """Initialize."""
+        self.out_dir = op.join(OUT_DIR, "test_SgeBackend")
+        if not op.exists(self.out_dir):
+            os.makedirs(self.out_dir)
+        self.sge_opts = SgeOptions(unique_id=100, use_sge=True)
+
+    def test_qsub_cmd(self):
+        """Test qsub commands are built by SgeOptions."""
+        backend = SgeBackend(self.sge_opts, script_dir=self.out_dir)
+        job = Job("a", "echo a", nproc=4)
+        script = op.join(self.out_dir, "a.sh")
+        self.assertEqual(backend.qsub_cmd(job),
+                         "qsub -cwd -V -S /bin/bash -pe smp 4 -sync y " +
+                         "-e {s}.elog -o {s}.olog {s}".format(s=script))
+        self.assertEqual(open(script).read(), "#!/bin/bash\necho a\n")
+        self.assertRaises(ValueError, backend.qsub_cmd, Job("b", lambda: 0))
+
+    def test_run(self):
+        """Test jobs with dependencies run through fake qsub."""
+        out = op.join(self.out_dir, "test_run.txt")
+        s = JobScheduler(SgeBackend(self.sge_opts, script_dir=self.out_dir,
+                                    max_jobs=2, qsub=FAKE_QSUB))
+        s.add_job("first", "echo first > {o}".format(o=out))
+        s.add_job("second", "echo second >> {o}".format(o=out),
+                  depends_on=["first"])
+        s.add_job("fail", "exit 2", depends_on=["first"])
+        s.add_job("after_fail", "true", depends_on=["fail"])
+        failed = s.run()
+        self.assertEqual([job.name for job in failed], ["fail", "after_fail"])
+        self.assertEqual(s["fail"].returncode, 2)
+        self.assertEqual(open(out).read(), "first\nsecond\n")
+        # 3 jobs ran on at most max_jobs workers
+        report = s.utilization()
+        self.assertTrue(1 <= len(report) <= 2)
+        self.assertEqual(sum(n for dummy_s, n, dummy_b, dummy_f in report), 3)
+
+    def test_fake_qsub(self):
+        """Test fake_qsub prints a job id like qsub does."""
+        script = op.join(self.out_dir, "fake_qsub.sh")
+        with open(script, 'w') as writer:
+            writer.write("echo $1\n")
+        olog = op.join(self.out_dir, "fake_qsub.olog")
+        if op.exists(olog):
+            os.remove(olog)
+        code = os.system("{q} -sync y -N x -o {o} {s} hi > /dev/null".format(
+            q=FAKE_QSUB, o=olog, s=script))
+        self.assertEqual(code, 0)
+        self.assertEqual(open(olog).read(), "hi\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
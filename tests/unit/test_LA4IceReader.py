@@ -2,7 +2,7 @@
 import unittest
 import os.path as op
 import hashlib
-from pbtranscript.io import BLASRRecord, LA4IceReader
+from pbtranscript.io import BLASRRecord, LA4IceReader, LA4IceStreamReader
 from test_setpath import DATA_DIR, OUT_DIR
 
 
@@ -61,3 +61,50 @@ class TEST_LA4ICEREADER(unittest.TestCase):
         reads = [r for r in LA4IceReader(f)]
         self.assertTrue(len(reads) == 0)
 
+    def test_LA4IceStreamReader(self):
+        """Test LA4IceStreamReader reads the same records as LA4IceReader
+        regardless of chunk size, from a file or from a command."""
+        expected = [r for r in LA4IceReader(self.las_out)]
+        for chunk_size in (1, 7, 300, 4096):
+            reads = [r for r in LA4IceStreamReader(self.las_out, chunk_size=chunk_size)]
+            self.assertEqual(len(reads), 2)
+            self.assertTrue(all(r == e for r, e in zip(reads, expected)))
+
+        reads = [r for r in LA4IceStreamReader(cmd=["cat", self.las_out])]
+        self.assertTrue(all(r == e for r, e in zip(reads, expected)))
+
+        f = op.join(self.outDir, "empty.las.out")
+        with open(f, 'w') as writer:
+            writer.write("+  +\n-  -\n")
+        self.assertEqual([r for r in LA4IceStreamReader(f)], [])
+
+    def test_LA4IceStreamReader_prefilters(self):
+        """Test hits rejected by pre-filters have no alignment."""
+        reads = [r for r in LA4IceStreamReader(self.las_out, same_strand_only=True,
+                                               max_missed_start=200,
+                                               max_missed_end=50)]
+        self.assertEqual(len(reads), 2)
+        # t0 misses 461-327 bases at 3' of subject
+        self.assertEqual((reads[0].qStart, reads[0].sEnd), (158, 327))
+        self.assertTrue(reads[0].qAln is None and reads[0].alnStr is None and
+                        reads[0].sAln is None)
+        self.assertTrue(reads[1] == self.t1)
+
+        reads = [r for r in LA4IceStreamReader(self.las_out, keep_aln=False)]
+        self.assertEqual([r.alnStr for r in reads], [None, None])
+        self.assertEqual([r.score for r in reads], [-327, -461])
+
+    def test_LA4IceStreamReader_errors(self):
+        """Test truncated or corrupted la4ice outputs raise ValueError."""
+        lines = open(self.las_out).readlines()
+        f = op.join(self.outDir, "truncated.las.out")
+        with open(f, 'w') as writer:
+            writer.write("".join(lines[:8]))
+        self.assertRaises(ValueError, list, LA4IceStreamReader(f))
+
+        with open(f, 'w') as writer:
+            writer.write("".join(lines[:2] + [" 159" + lines[2][4:]] + lines[3:]))
+        self.assertRaises(ValueError, list, LA4IceStreamReader(f))
+
+        self.assertRaises(ValueError, LA4IceStreamReader)
+        self.assertRaises(ValueError, LA4IceStreamReader, f, max_missed_start=1)
@@ -0,0 +1,98 @@
+"""Test pbtranscript.NativePrimerDetector."""
+import unittest
+import os
+import os.path as op
+from pbtranscript.c_primer import primer_hits
+from pbtranscript.io.DOMIO import DOMRecord
+from pbtranscript.NativePrimerDetector import NativePrimerDetector
+from pbtranscript.testkit.simulate_ccs import read_primer_pairs, \
+    simulate_ccs_reads
+from pbtranscript.testkit.primer_concordance import call_primers, \
+    concordance_report
+import pbtranscript.testkit.primer_concordance as primer_concordance
+from test_setpath import DATA_DIR, OUT_DIR
+
+
+class TestNativePrimerDetector(unittest.TestCase):
+    """Test NativePrimerDetector and c_primer."""
+
+    def setUp(self):
+        """Initialize."""
+        self.out_dir = op.join(OUT_DIR, "test_NativePrimerDetector")
+        if not op.exists(self.out_dir):
+            os.makedirs(self.out_dir)
+        self.primer_fn = op.join(DATA_DIR, "primers.fasta")
+
+    def test_primer_hits(self):
+        """Test local alignments of a primer, best first, not overlapping."""
+        primer = "ACGTACGTAA"
+        seq = "TTTT" + primer + "TTTT" + "ACGTTCGTAA" + "GG"
+        self.assertEqual(primer_hits(primer, seq, 8),
+                         [(20, 0, 10, 4, 14), (15, 0, 10, 18, 28)])
+        self.assertEqual(primer_hits(primer, seq, 8, max_hits=1),
+                         [(20, 0, 10, 4, 14)])
+        # one base deleted from seq
+        self.assertEqual(primer_hits(primer, "TTTTACGTACTAATTT", 8),
+                         [(15, 0, 10, 4, 13)])
+        self.assertEqual(primer_hits(primer, "GGG", 8), [])
+
+    def test_toDomString(self):
+        """Test DOMRecord.toDomString is parsed back by fromString."""
+        r = DOMRecord("F1", "movie/45/ccs_front", 33.0, 0, 30, 31, 2, 32, 100)
+        self.assertEqual(str(DOMRecord.fromString(r.toDomString())), str(r))
+
+    def test_search(self):
+        """Test primers of simulated reads are found."""
+        primer_pairs = read_primer_pairs(self.primer_fn)
+        reads = list(simulate_ccs_reads(primer_pairs, 20, seed=1,
+                                        fl_fraction=1.0))
+        primer_fn = op.join(self.out_dir, "primers.fwd.fasta")
+        with open(primer_fn, 'w') as writer:
+            for i, (fwd, dummy_rev) in enumerate(primer_pairs):
+                writer.write(">F{i}\n{s}\n".format(i=i, s=fwd))
+        dom_fn = op.join(self.out_dir, "native.dom")
+        with NativePrimerDetector() as detector:
+            records = list(detector.search(
+                seqs=((r.name, r.sequence[:100] if r.strand == "+" else
+                       r.sequence[-100:]) for r in reads),
+                primer_fn=primer_fn, out_dom_fn=dom_fn))
+        for r in reads:
+            if r.strand == "+":
+                best = max((x for x in records if x.sid == r.name),
+                           key=lambda x: x.score)
+                self.assertEqual(best.pid, "F%d" % r.primer)
+                self.assertTrue(best.sStart < 5)
+        self.assertEqual([str(DOMRecord.fromString(line)) for line in open(dom_fn)],
+                         [str(x) for x in records])
+
+    def test_call_primers(self):
+        """Test primer calls of Classifier with the native detector agree
+        with the truth on simulated reads."""
+        truth = list(simulate_ccs_reads(read_primer_pairs(self.primer_fn),
+                                        200, seed=2))
+        reads_fn = op.join(self.out_dir, "simulated.fasta")
+        with open(reads_fn, 'w') as writer:
+            for r in truth:
+                writer.write(">{n}\n{s}\n".format(n=r.name, s=r.sequence))
+        calls = call_primers(reads_fn, op.join(self.out_dir, "native"),
+                             self.primer_fn, "native")
+        n_correct = sum(1 for r in truth if calls[r.name] ==
+                        (r.primer, r.strand, r.fiveseen, r.threeseen))
+        self.assertTrue(n_correct >= 0.95 * len(truth))
+        lines = concordance_report(truth, {"native": calls}, {"native": 1.0})
+        self.assertEqual(len(lines), 2)
+
+    def test_concordance_report(self):
+        """Test concordance report is written."""
+        out_dir = op.join(self.out_dir, "concordance")
+        self.assertEqual(primer_concordance.main(
+            [out_dir, "--n_reads", "50", "--detectors", "native"]), 0)
+        lines = open(op.join(out_dir, "primer_concordance.csv")).readlines()
+        self.assertEqual(len(lines), 51)
+        self.assertEqual(lines[0].strip().split(",")[-4:],
+                         ["native_primer", "native_strand",
+                          "native_fiveseen", "native_threeseen"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+"""Test pbtranscript.io.PartialUCIO."""
+import unittest
+import os
+import os.path as op
+import random
+import filecmp
+from cPickle import dump, load
+from pbtranscript.Utils import rmpath, mkdir
+from pbtranscript.io.PartialUCIO import NOHIT, partial_uc_txt_fn, write_partial_uc, \
+    iter_partial_uc, read_partial_uc, PartialUCIndex, merge_partial_ucs, \
+    fresh_partial_uc_txt_fn, dump_partial_uc
+from pbtranscript.ice.IceUtils import combine_nfl_pickles
+from pbtranscript.CombineUtils import write_combined_cluster_report
+from test_setpath import OUT_DIR
+
+_OUT_DIR_ = op.join(OUT_DIR, "test_PartialUCIO")
+
+
+def _simulate_chunks(out_dir, n_chunks, n_clusters, seed=0):
+    """Write pickles and partial uc files of n_chunks nfl chunks,
+    return pickle file names."""
+    rng = random.Random(seed)
+    pickle_fns = []
+    for i in xrange(n_chunks):
+        partial_uc = {}
+        for cid in rng.sample(xrange(n_clusters), rng.randint(0, n_clusters)):
+            partial_uc[cid] = ["m/%d/%d_%d" % (i, cid, j) for j in xrange(rng.randint(1, 4))]
+        nohit = set("m/%d/nohit_%d" % (i, j) for j in xrange(rng.randint(0, 30)))
+        pickle_fns.append(op.join(out_dir, "input.split_%03d.fasta.partial_uc.pickle" % i))
+        with open(pickle_fns[-1], 'w') as writer:
+            dump({'partial_uc': partial_uc, 'nohit': nohit}, writer)
+        write_partial_uc(partial_uc, nohit, partial_uc_txt_fn(pickle_fns[-1]),
+                         reads_per_line=7)
+    return pickle_fns
+
+
+class TestPartialUCIO(unittest.TestCase):
+    """Test partial uc files and merging them."""
+
+    def setUp(self):
+        """Define input and output file."""
+        rmpath(_OUT_DIR_)
+        mkdir(_OUT_DIR_)
+
+    def test_write_read(self):
+        """Test partial uc files are read back, nohit first, sorted by cluster ids."""
+        fn = op.join(_OUT_DIR_, "a.partial_uc.txt")
+        self.assertEqual(partial_uc_txt_fn(op.join(_OUT_DIR_, "a.partial_uc.pickle")), fn)
+        partial_uc = {10: ["r1", "r2"], 2: ["r3"], 'c5': ["r4"]}
+        nohit = set(["r5", "r6", "r7"])
+        write_partial_uc(partial_uc, nohit, fn, reads_per_line=2)
+        self.assertEqual([k for k, dummy_reads in iter_partial_uc(fn)],
+                         [NOHIT, NOHIT, 2, 10, 'c5'])
+        self.assertEqual(read_partial_uc(fn), {'partial_uc': partial_uc, 'nohit': nohit})
+
+        index = PartialUCIndex(fn)
+        self.assertEqual(sorted(index.keys()), sorted(partial_uc.keys()))
+        self.assertTrue('c5' in index)
+        self.assertFalse(5 in index)
+        self.assertEqual(index[10], ["r1", "r2"])
+        index.close()
+
+    def test_merge_partial_ucs(self):
+        """Test streaming merge equals merge of pickles."""
+        pickle_fns = _simulate_chunks(_OUT_DIR_, n_chunks=6, n_clusters=50)
+        by_pickles = op.join(_OUT_DIR_, "by_pickles", "nfl.all.partial_uc.pickle")
+        by_txts = op.join(_OUT_DIR_, "by_txts", "nfl.all.partial_uc.pickle")
+        mkdir(op.dirname(by_txts))
+        combine_nfl_pickles(pickle_fns, by_txts)
+        self.assertEqual(fresh_partial_uc_txt_fn(by_txts), partial_uc_txt_fn(by_txts))
+
+        for fn in pickle_fns:
+            os.remove(partial_uc_txt_fn(fn))
+        mkdir(op.dirname(by_pickles))
+        combine_nfl_pickles(pickle_fns, by_pickles)
+        self.assertFalse(op.exists(partial_uc_txt_fn(by_pickles)))
+
+        expected = load(open(by_pickles))
+        self.assertEqual(load(open(by_txts)), expected)
+        self.assertEqual(read_partial_uc(partial_uc_txt_fn(by_txts)), expected)
+
+    def test_dump_partial_uc(self):
+        """Test partial uc pickled by dump_partial_uc loads as if dumped at once,
+        with protocol 0 and 2."""
+        cases = [({}, set()),
+                 ({}, set(["r1", "r2"])),
+                 ({0: ["r1"], 2: ["r2", "r3"]}, set()),
+                 (dict((i, ["m/%d/%d" % (i, j) for j in xrange(3)]) for i in xrange(2500)),
+                  set("m/nohit/%d" % i for i in xrange(2500))),
+                 ({'c\xc3\xa9': ["r\xc3\xa91"], 1: ["r3"]}, set(["\xe9\xff", "r\xc3\xa9"])),
+                 ({u'c\u00e9': [u'r\u00e92']}, set([u'\u4e2d'])),
+                ]
+        for protocol in (0, 2):
+            for i, (partial_uc, nohit) in enumerate(cases):
+                expected = {'partial_uc': partial_uc, 'nohit': nohit}
+                items = [(NOHIT, sorted(nohit)[k:k+7]) for k in xrange(0, len(nohit), 7)] + \
+                        [(cid, partial_uc[cid]) for cid in sorted(partial_uc)]
+                fn = op.join(_OUT_DIR_, "dump.%d.%d.pickle" % (protocol, i))
+                with open(fn, 'wb') as writer:
+                    dump_partial_uc(items, writer, protocol=protocol)
+                self.assertEqual(load(open(fn, 'rb')), expected)
+
+                # merged from partial uc files of two chunks, unless ids are unicode
+                if i < 5:
+                    chunks = [{'partial_uc': dict((k, v) for k, v in partial_uc.iteritems()
+                                                  if hash(k) % 2 == j),
+                               'nohit': set(r for r in nohit if hash(r) % 2 == j)}
+                              for j in (0, 1)]
+                    txts = [op.join(_OUT_DIR_, "chunk%d.partial_uc.txt" % j) for j in (0, 1)]
+                    for chunk, txt in zip(chunks, txts):
+                        write_partial_uc(chunk['partial_uc'], chunk['nohit'], txt,
+                                         reads_per_line=100)
+                    merge_partial_ucs(txts, op.join(_OUT_DIR_, "merged.txt"), out_pickle=fn)
+                    self.assertEqual(load(open(fn, 'rb')), expected)
+
+    def test_stale_partial_uc(self):
+        """Test partial uc files older than their pickles are not merged."""
+        pickle_fns = _simulate_chunks(_OUT_DIR_, n_chunks=3, n_clusters=20)
+        self.assertEqual(fresh_partial_uc_txt_fn(pickle_fns[1]), partial_uc_txt_fn(pickle_fns[1]))
+
+        # partial uc file left by a previous run, pickle rewritten since
+        write_partial_uc({0: ["stale"]}, [], partial_uc_txt_fn(pickle_fns[1]))
+        mtime = op.getmtime(pickle_fns[1])
+        os.utime(partial_uc_txt_fn(pickle_fns[1]), (mtime - 10, mtime - 10))
+        self.assertEqual(fresh_partial_uc_txt_fn(pickle_fns[1]), None)
+
+        by_txts = op.join(_OUT_DIR_, "by_txts.partial_uc.pickle")
+        combine_nfl_pickles(pickle_fns, by_txts)
+        self.assertFalse(op.exists(partial_uc_txt_fn(by_txts)))
+        for fn in pickle_fns:
+            os.remove(partial_uc_txt_fn(fn))
+        by_pickles = op.join(_OUT_DIR_, "by_pickles.partial_uc.pickle")
+        combine_nfl_pickles(pickle_fns, by_pickles)
+        self.assertEqual(load(open(by_txts)), load(open(by_pickles)))
+        self.assertFalse("stale" in str(load(open(by_txts))))
+
+    def test_write_combined_cluster_report(self):
+        """Test cluster report made from partial uc files equals the one from pickles."""
+        uc_pickles, partial_uc_pickles = [], []
+        for i in xrange(2):
+            bin_dir = op.join(_OUT_DIR_, "bin%d" % i)
+            mkdir(bin_dir)
+            pickle_fns = _simulate_chunks(bin_dir, n_chunks=3, n_clusters=20, seed=i)
+            partial_uc_pickles.append(op.join(bin_dir, "nfl.all.partial_uc.pickle"))
+            combine_nfl_pickles(pickle_fns, partial_uc_pickles[-1])
+            uc_pickles.append(op.join(bin_dir, "final.pickle"))
+            with open(uc_pickles[-1], 'w') as writer:
+                dump({'uc': dict((c, ["fl/%d/%d" % (i, c)]) for c in xrange(20))}, writer)
+
+        reports = []
+        for name in ("by_txts", "by_pickles"):
+            reports.append(op.join(_OUT_DIR_, name + ".cluster_report.csv"))
+            write_combined_cluster_report(split_indices=[0, 1], split_uc_pickles=uc_pickles,
+                                          split_partial_uc_pickles=partial_uc_pickles,
+                                          report_fn=reports[-1], sample_name="sample")
+            for fn in partial_uc_pickles:
+                rmpath(partial_uc_txt_fn(fn))
+        self.assertTrue(filecmp.cmp(reports[0], reports[1], shallow=False))
+        self.assertTrue(len(open(reports[0]).readlines()) > 40)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+"""Test pbtranscript.PhmmerPool."""
+import unittest
+import os
+import os.path as op
+import sys
+from pbcore.util.Process import backticks
+from pbtranscript.Classifier import Classifier
+from pbtranscript.PBTranscriptException import PBTranscriptException
+from pbtranscript.PhmmerPool import PhmmerPool, phmmer_cmd
+import pbtranscript.testkit.fake_phmmer as fake_phmmer
+from test_setpath import DATA_DIR, OUT_DIR
+
+
+class TestPhmmerPool(unittest.TestCase):
+    """Test PhmmerPool, using fake_phmmer as phmmer."""
+
+    def setUp(self):
+        """Put fake phmmer in PATH, create primers for primer search."""
+        self.out_dir = op.join(OUT_DIR, "test_PhmmerPool")
+        bin_dir = op.join(self.out_dir, "bin")
+        if not op.exists(bin_dir):
+            os.makedirs(bin_dir)
+        phmmer = op.join(bin_dir, "phmmer")
+        with open(phmmer, 'w') as writer:
+            writer.write('#!/bin/bash\nexec {py} {script} "$@"\n'.format(
+                py=sys.executable,
+                script=op.splitext(fake_phmmer.__file__)[0] + ".py"))
+        os.chmod(phmmer, 0755)
+        self.path = os.environ["PATH"]
+        os.environ["PATH"] = bin_dir + os.pathsep + self.path
+
+        self.reads_fn = op.join(DATA_DIR, "reads_of_insert.fasta")
+        self.obj = Classifier(reads_fn=self.reads_fn, out_dir=self.out_dir)
+        self.primer_fn = op.join(self.out_dir, "primers.front_end.fasta")
+        self.obj._processPrimers(primer_fn=op.join(DATA_DIR, "primers.fasta"),
+                                 window_size=100, primer_out_fn=self.primer_fn,
+                                 revcmp_primers=False)
+
+    def tearDown(self):
+        """Restore PATH."""
+        os.environ["PATH"] = self.path
+
+    def _serial_dom(self):
+        """Run phmmer once on front/back windows of all reads, the way
+        Classifier did before PhmmerPool, return the dom file."""
+        windows_fn = op.join(self.out_dir, "in.front_end.fasta")
+        dom_fn = op.join(self.out_dir, "serial.front_end.dom")
+        self.obj._chunkReads(reads_fn=self.reads_fn, reads_per_chunk=1000,
+                             chunked_reads_fns=[windows_fn],
+                             extract_front_back_only=True, window_size=100)
+        _out, code, _msg = backticks(phmmer_cmd(
+            reads_fn=windows_fn, dom_fn=dom_fn, primer_fn=self.primer_fn,
+            pbmatrix_fn=self.obj.pbmatrix_fn))
+        self.assertEqual(code, 0)
+        return dom_fn
+
+    def test_search(self):
+        """Test best primer hits found by the pool are identical to those
+        found by a single phmmer run."""
+        def prettystr(d):
+            """Return a string of {read: {primer: DOMRecord}}."""
+            return "\n".join(sorted(
+                "{r} {p} {v}".format(r=rid, p=pid, v=v)
+                for rid, val in d.iteritems() for pid, v in val.iteritems()))
+
+        dom_fn = self._serial_dom()
+        front, back = self.obj._getBestFrontBackRecord(dom_fn)
+        self.assertTrue(len(front) > 0 and len(back) > 0)
+
+        pool_dom_fn = op.join(self.out_dir, "pool.front_end.dom")
+        with PhmmerPool(num_workers=3, pbmatrix_fn=self.obj.pbmatrix_fn,
+                        tmp_dir=self.out_dir, batch_size=5) as pool:
+            records = pool.search(
+                seqs=self.obj._frontBackWindows(self.reads_fn, 100),
+                primer_fn=self.primer_fn, out_dom_fn=pool_dom_fn)
+            pool_front, pool_back = \
+                self.obj._pickBestFrontBackRecords(records)
+
+        self.assertEqual(prettystr(pool_front), prettystr(front))
+        self.assertEqual(prettystr(pool_back), prettystr(back))
+        # Same hits are written to dom, in the order batches finish.
+        lines = lambda fn: sorted(line for line in open(fn)
+                                  if not line.startswith("#"))
+        self.assertEqual(lines(pool_dom_fn), lines(dom_fn))
+        # Temporary files of workers are removed.
+        self.assertEqual([fn for fn in os.listdir(self.out_dir)
+                          if fn.startswith("phmmer_pool.")], [])
+
+    def test_search_ordered(self):
+        """Test hits are yielded in the order of sequences if ordered."""
+        seqs = list(self.obj._frontBackWindows(self.reads_fn, 100))
+        with PhmmerPool(num_workers=3, pbmatrix_fn=self.obj.pbmatrix_fn,
+                        tmp_dir=self.out_dir, batch_size=3) as pool:
+            records = list(pool.search(seqs=seqs, primer_fn=self.primer_fn,
+                                       ordered=True))
+        order = dict((name, i) for i, (name, dummy_seq) in enumerate(seqs))
+        self.assertTrue(len(records) > 0)
+        indices = [order[r.sid] for r in records]
+        self.assertEqual(indices, sorted(indices))
+        self.assertEqual(len(records), len([
+            line for line in open(self._serial_dom()) if not line.startswith("#")]))
+
+    def test_failure(self):
+        """Test a failed batch raises, and the pool can search again."""
+        seqs = list(self.obj._frontBackWindows(self.reads_fn, 100))
+        with PhmmerPool(num_workers=2, pbmatrix_fn=self.obj.pbmatrix_fn,
+                        tmp_dir=self.out_dir, batch_size=4) as pool:
+            bad_primer_fn = op.join(self.out_dir, "no_such_primers.fasta")
+            with self.assertRaises(PBTranscriptException):
+                list(pool.search(seqs=seqs, primer_fn=bad_primer_fn))
+            n_hits = len(list(pool.search(seqs=seqs, primer_fn=self.primer_fn)))
+        self.assertEqual(n_hits, len([line for line in open(self._serial_dom())
+                                      if not line.startswith("#")]))
+
+    def test_dead_worker(self):
+        """Test search raises instead of waiting forever if a worker died."""
+        seqs = list(self.obj._frontBackWindows(self.reads_fn, 100))
+        with PhmmerPool(num_workers=1, pbmatrix_fn=self.obj.pbmatrix_fn,
+                        tmp_dir=self.out_dir, batch_size=4) as pool:
+            pool.poll_seconds = 0.1
+            pool._workers[0].terminate()
+            pool._workers[0].join()
+            with self.assertRaises(PBTranscriptException):
+                list(pool.search(seqs=seqs, primer_fn=self.primer_fn))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -106,3 +106,14 @@ class Test_ChunkTasksPickle(unittest.TestCase):
         print 'groups=%s' % groups
         expected_groups = [[0,1,2,3,4,5,6,7,8,9,10,11,12]]
         self.assertEqual(groups, expected_groups)
+
+    def test_sort_and_group_tasks_by_predicted_cost(self):
+        """Test sort_and_group_tasks groups tasks by predicted costs."""
+        costs = [1, 8, 3, 4, 4]
+        chunk_tasks = [chunk_task_i(cls=ChunkTask, i=i) for i in range(len(costs))]
+        for task, cost in zip(chunk_tasks, costs):
+            task.predicted_cost = cost
+        p = ChunkTasksPickle(chunk_tasks)
+        groups = p.sort_and_group_tasks(max_nchunks=2)
+        self.assertEqual([[p[i].cluster_bin_index for i in g] for g in groups],
+                         [[1, 2], [3, 4, 0]])
@@ -5,7 +5,7 @@ import os.path as op
 import filecmp
 import shutil
 from pbtranscript.Utils import cat_files, filter_sam, validate_fofn, \
-        get_sample_name, mknewdir, as_contigset, execute
+        get_sample_name, mknewdir, as_contigset, execute, balance_by_cost
 from test_setpath import DATA_DIR, OUT_DIR, STD_DIR, SIV_DATA_DIR
 
 class TestUtils(unittest.TestCase):
@@ -31,6 +31,13 @@ class TestUtils(unittest.TestCase):
         self.assertTrue(filecmp.cmp(out_fn_1, fn_1))
         self.assertTrue(filecmp.cmp(out_fn_2, std_out_fn_2))
 
+    def test_balance_by_cost(self):
+        """Test largest items go first to least loaded bins."""
+        bins = balance_by_cost([1, 10, 3, 7, 2, 5], 3)
+        self.assertEqual(bins, [[1], [3, 4], [5, 2, 0]])
+        self.assertEqual(balance_by_cost([4, 2], 5), [[0], [1]])
+        self.assertEqual(balance_by_cost([], 2), [])
+
     def test_filter_sam(self):
         """Test filter_sam."""
         in_sam = op.join(self.data_dir, "test_filter_sam.sam")
@@ -0,0 +1,58 @@
+"""Test chunk planning of pbtranscript.tasks.create_chunks."""
+import unittest
+import os.path as op
+from pbtranscript.Utils import rmpath, mkdir
+from pbtranscript.tasks.create_chunks import estimate_partial_cost, \
+    estimate_makespan, plan_nchunks, merge_contigset_chunks
+from test_setpath import OUT_DIR
+
+_OUT_DIR_ = op.join(OUT_DIR, "test_create_chunks")
+
+
+class TestCreateChunks(unittest.TestCase):
+    """Test plan_nchunks and cost estimates."""
+
+    def test_estimate_makespan(self):
+        """Test makespan of tasks grouped most costly first."""
+        self.assertEqual(estimate_makespan([3, 3, 2, 2, 2], 2), 7)
+        self.assertEqual(estimate_makespan([5, 1], 4), 5)
+        self.assertEqual(estimate_makespan([], 4), 0)
+
+    def test_plan_nchunks(self):
+        """Test a huge bin is split into many chunks, tiny bins into one."""
+        funcs = [lambda k: 10. / k + 1, lambda k: 800. / k + 1,
+                 lambda k: 10. / k + 1, lambda k: 10. / k + 1]
+        self.assertEqual(plan_nchunks(funcs, max_nchunks=8), [1, 8, 1, 1])
+        self.assertEqual(plan_nchunks(funcs, max_nchunks=1), [1, 1, 1, 1])
+        self.assertEqual(plan_nchunks([], max_nchunks=8), [])
+
+        # ice_partial of 100000 nfl reads against bins of different sizes
+        ref_bases = [10**3, 10**8, 10**7, 10**3]
+        funcs = [lambda k, b=b: estimate_partial_cost(100000 / float(k), b)
+                 for b in ref_bases]
+        nchunks = plan_nchunks(funcs, max_nchunks=24)
+        self.assertEqual(nchunks[0], 1)
+        self.assertEqual(nchunks[3], 1)
+        self.assertTrue(nchunks[1] > nchunks[2] > 1)
+        self.assertTrue(sum(nchunks) < 24 * len(ref_bases))
+
+    def test_merge_contigset_chunks(self):
+        """Test consecutive chunks are merged into fewer chunks."""
+        rmpath(_OUT_DIR_)
+        mkdir(_OUT_DIR_)
+        chunked_files = []
+        for i in range(5):
+            chunked_files.append(op.join(_OUT_DIR_, "chunk%d.fasta" % i))
+            with open(chunked_files[-1], 'w') as writer:
+                writer.write(">read%d\nACGT\n" % i)
+        merged_files = merge_contigset_chunks(chunked_files, 2, _OUT_DIR_)
+        self.assertEqual(len(merged_files), 2)
+        self.assertEqual([[line[1:].strip() for line in
+                           open(op.join(_OUT_DIR_, "merged-nfl.chunk%d.fasta" % i))
+                           if line.startswith(">")] for i in range(2)],
+                         [["read0", "read1"], ["read2", "read3", "read4"]])
+        self.assertEqual(len(merge_contigset_chunks(chunked_files, 8, _OUT_DIR_)), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
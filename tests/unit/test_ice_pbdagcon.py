@@ -0,0 +1,155 @@
+"""Test in-process alignment of pbtranscript.ice_pbdagcon against blasr."""
+import unittest
+import os
+import os.path as op
+import random
+from distutils.spawn import find_executable
+
+import numpy as np
+
+from pbcore.io import FastaReader
+import pbtranscript
+from pbtranscript.ice.c_align import KmerIndex, banded_local_align
+from pbtranscript.ice_pbdagcon import choose_template_by_blasr, \
+    choose_template_in_process, make_aln_input_to_ref_in_process, \
+    align_in_process, aln_identity, pbdagcon_wrapper, \
+    _read_identities_by_blasr
+from test_setpath import OUT_DIR
+
+GCON_DATA_DIR = op.join(op.dirname(pbtranscript.__file__), "data")
+GCON_IN_FA = op.join(GCON_DATA_DIR, "gcon_in.fasta")
+GCON_OUT_FA = op.join(GCON_DATA_DIR, "gcon_out.fasta")
+
+
+def _read_seqs(fasta_filename):
+    """Return {read id: sequence}."""
+    with FastaReader(fasta_filename) as reader:
+        return dict((r.name.split()[0], r.sequence.upper()) for r in reader)
+
+
+def _mutate(seq, n_edits, seed=0):
+    """Return seq with n_edits random single base insertions/deletions."""
+    rng = random.Random(seed)
+    seq = list(seq)
+    for dummy in range(n_edits):
+        p = rng.randrange(len(seq))
+        if rng.random() < 0.5:
+            del seq[p]
+        else:
+            seq.insert(p, rng.choice("ACGT"))
+    return "".join(seq)
+
+
+class TestBandedLocalAlign(unittest.TestCase):
+    """Test c_align."""
+
+    def setUp(self):
+        """Initialize."""
+        self.seqs = _read_seqs(GCON_IN_FA)
+        self.seq = sorted(self.seqs.values())[0]
+
+    def test_self_alignment(self):
+        """Test a read aligns to itself end to end without errors."""
+        index = KmerIndex(self.seq)
+        lo, hi = index.diagonal_range(self.seq)
+        self.assertTrue(lo <= 0 <= hi)
+        aln = banded_local_align(self.seq, self.seq, lo, hi)
+        n = len(self.seq)
+        self.assertEqual(aln[:9], (5 * n, 0, n, 0, n, n, 0, 0, 0))
+        self.assertEqual(aln[9], self.seq)
+        self.assertEqual(aln[10], "|" * n)
+
+    def test_indels(self):
+        """Test alignment of a read with indels to the original read."""
+        query = _mutate(self.seq, n_edits=30)
+        aln = align_in_process(query, KmerIndex(self.seq))
+        (score, qStart, qEnd, tStart, tEnd, n_match, n_mismatch,
+         n_ins, n_del, q_aln, pattern, t_aln) = aln
+        self.assertTrue(aln_identity(aln) > 95)
+        self.assertTrue(n_ins + n_del + n_mismatch <= 40)
+        self.assertEqual(q_aln.replace("-", ""), query[qStart:qEnd])
+        self.assertEqual(t_aln.replace("-", ""), self.seq[tStart:tEnd])
+        self.assertEqual(len(q_aln), len(pattern))
+        self.assertEqual(len(t_aln), len(pattern))
+        self.assertEqual(score, 5 * n_match - 6 * n_mismatch -
+                         5 * (n_ins + n_del))
+
+    def test_no_alignment(self):
+        """Test unrelated sequences do not align."""
+        rng = random.Random(1)
+        other = "".join(rng.choice("ACGT") for dummy in range(1000))
+        self.assertIsNone(align_in_process(other, KmerIndex(self.seq)))
+
+
+class TestIcePbdagcon(unittest.TestCase):
+    """Test in-process template selection and alignment, and compare
+    them with blasr where it is installed."""
+
+    def setUp(self):
+        """Initialize."""
+        self.out_dir = op.join(OUT_DIR, "test_ice_pbdagcon")
+        if not op.exists(self.out_dir):
+            os.makedirs(self.out_dir)
+        self.seqs = _read_seqs(GCON_IN_FA)
+
+    def test_choose_template_in_process(self):
+        """Test a read of the cluster is chosen as template."""
+        ref = choose_template_in_process(GCON_IN_FA)
+        self.assertEqual(self.seqs[ref.name.split()[0]],
+                         ref.sequence.upper())
+
+    def test_make_aln_input_to_ref_in_process(self):
+        """Test reads are aligned to template in blasr -m 5 format."""
+        ref = choose_template_in_process(GCON_IN_FA)
+        ref_fa = op.join(self.out_dir, "ref.fasta")
+        with open(ref_fa, 'w') as f:
+            f.write(">c1\n{s}\n".format(s=ref.sequence))
+        aln_fn = op.join(self.out_dir, "in_process.saln")
+        make_aln_input_to_ref_in_process(fasta_filename=GCON_IN_FA,
+                                         ref_filename=ref_fa,
+                                         out_filename=aln_fn)
+        lines = [line.split() for line in open(aln_fn)]
+        self.assertEqual(len(lines), len(self.seqs))
+        for raw in lines:
+            self.assertEqual(len(raw), 19)
+            qseq = self.seqs[raw[0]]
+            self.assertEqual(int(raw[1]), len(qseq))
+            self.assertEqual(raw[5], "c1")
+            self.assertTrue(int(raw[10]) < 0)  # blasr score
+            self.assertEqual(raw[16].replace("-", ""),
+                             qseq[int(raw[2]):int(raw[3])])
+            self.assertEqual(raw[18].replace("-", ""),
+                             ref.sequence.upper()[int(raw[7]):int(raw[8])])
+
+    @unittest.skipUnless(find_executable("blasr"), "blasr not installed")
+    def test_template_vs_blasr(self):
+        """Test the in-process template is as good a template as the
+        one chosen by blasr, judged by blasr identities."""
+        m1 = op.join(self.out_dir, "gcon_in.saln.m1")
+        blasr_ref = choose_template_by_blasr(GCON_IN_FA, m1, nproc=4)
+        ref = choose_template_in_process(GCON_IN_FA)
+        scores = _read_identities_by_blasr(GCON_IN_FA, m1, nproc=4)
+        mean = lambda read_id: np.ceil(np.mean(scores[read_id]))
+        self.assertTrue(mean(ref.name.split()[0]) >=
+                        mean(blasr_ref.name.split()[0]) - 1)
+
+    @unittest.skipUnless(find_executable("blasr") and
+                         find_executable("pbdagcon"),
+                         "blasr or pbdagcon not installed")
+    def test_consensus_vs_blasr(self):
+        """Test consensus of in-process alignments agrees with the
+        consensus of blasr alignments."""
+        cons = {}
+        for name, max_inprocess_reads in [("blasr", 0), ("in_process", 100)]:
+            prefix = op.join(self.out_dir, "g_consensus_" + name)
+            pbdagcon_wrapper(GCON_IN_FA, prefix, "c1", nproc=4,
+                             max_inprocess_reads=max_inprocess_reads)
+            cons[name] = _read_seqs(prefix + ".fasta").values()[0]
+        self.assertEqual(cons["blasr"], _read_seqs(GCON_OUT_FA).values()[0])
+        aln = align_in_process(cons["in_process"], KmerIndex(cons["blasr"]))
+        self.assertTrue(aln_identity(aln) >= 99)
+        self.assertTrue(abs(len(cons["in_process"]) - len(cons["blasr"])) <= 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,7 +10,9 @@ import os.path as op
 from pbcore.io import FastaReader
 
 from pbtranscript.ice.ProbModel import ProbFromQV
-from pbtranscript.io.BasQV import basQVcacher
+from pbtranscript.io.BasQV import basQVcacher, basQVstore, \
+    fastqQVcacher, fastqQVstore, QVStore
+from test_setpath import DATA_DIR
 
 MNT_DATA = "/pbi/dept/secondary/siv/testdata/pbtranscript-unittest/data"
 CCS_BAM = MNT_DATA + "/movies/rat_bax1/Analysis_Results/m131018_081703_42161_c100585152550000001823088404281404_s1_p0.1.ccs.bam"
@@ -18,6 +20,9 @@ CCS_XML = op.join(MNT_DATA, "sa3", "ccsbam.consensusreadset.xml")
 CCS_FOFN = op.join(MNT_DATA, "ccsbam.fofn")
 NFL_FASTA = op.join(MNT_DATA, "nfl.fasta")
 
+FASTQ = op.join(DATA_DIR, "test_daligner_against_ref",
+               "test_daligner_reads.fastq")
+
 READ_ID = "m131018_081703_42161_c100585152550000001823088404281404_s1_p0/43/0_568_CCS"
 
 def _get_read_ids():
@@ -64,6 +69,70 @@ class TestBasQVCacher(unittest.TestCase):
         #print dqv[100]
         self.assertEqual(len(qvs), 251)
 
+    def test_bam_store(self):
+        """Compare basQVstore with basQVcacher."""
+        seqids = [rid for rid in _get_read_ids()]
+        qver = basQVcacher()
+        qver.add_bash5(CCS_BAM)
+        qver.precache(list(seqids))
+        qver.presmooth(seqids, 3)
+
+        store = basQVstore(window_size=3)
+        store.add_bash5(CCS_BAM)
+        store.precache(list(seqids))
+        self.assertEqual(len(store), 251)
+        for read_id in seqids:
+            for qv_name in basQVcacher.qv_names:
+                self.assertEqual(list(store.get(read_id, qv_name)),
+                                 qver.get(read_id, qv_name))
+                self.assertEqual(list(store.get_smoothed(read_id, qv_name)),
+                                 qver.get_smoothed(read_id, qv_name))
+        store.close()
+
+
+class TestFastqQVStore(unittest.TestCase):
+    """Compare fastqQVstore with fastqQVcacher."""
+
+    def test_fastq_store(self):
+        """Test fastqQVstore get, get_smoothed, get_mean and remove."""
+        qver = fastqQVcacher()
+        qver.precache_fastq(FASTQ)
+        seqids = qver.qv.keys()
+        qver.presmooth(seqids, 3)
+
+        store = fastqQVstore(window_size=3)
+        self.assertEqual(sorted(store.precache_fastq(FASTQ)), sorted(seqids))
+        for seqid in seqids:
+            self.assertEqual(list(store.get(seqid, None)),
+                             qver.get(seqid, None))
+            self.assertEqual(list(store.get_smoothed(seqid, 'DeletionQV')),
+                             qver.get_smoothed(seqid, 'DeletionQV'))
+            self.assertEqual(store.get_smoothed(seqid, None, 10),
+                             qver.get_smoothed(seqid, None, 10))
+            self.assertAlmostEqual(store.get_mean(seqid, None),
+                                   qver.get_mean(seqid, None))
+
+        store.remove(seqids[0])
+        self.assertFalse(seqids[0] in store)
+        self.assertRaises(KeyError, store.get_smoothed, seqids[0], None)
+        store.close()
+
+    def test_empty_read(self):
+        """Test reads of zero length are stored with empty QVs."""
+        store = QVStore(qv_names=['QualityValue'], window_size=3)
+        store.add("empty", {'QualityValue': []})
+        store.add("r1", {'QualityValue': [0.1, 0.3, 0.2, 0.4]})
+        store.add("empty2", {'QualityValue': []})
+        self.assertEqual(len(store), 3)
+        self.assertEqual(list(store.get("empty", 'QualityValue')), [])
+        self.assertEqual(list(store.get_smoothed("empty2", 'QualityValue')), [])
+        self.assertEqual(store.get_mean("empty", 'QualityValue'), 0.)
+        self.assertAlmostEqual(store.get_mean("r1", 'QualityValue'), 0.25)
+        self.assertEqual(list(store.get("r1", 'QualityValue')),
+                         [0.1, 0.3, 0.2, 0.4])
+        self.assertRaises(IndexError, store.get, "empty", 'QualityValue', 0)
+        store.close()
+
 
 if __name__ == "__main__":
     unittest.main()
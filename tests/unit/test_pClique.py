@@ -1,8 +1,36 @@
 """Test pClique, CliqueSubList."""
 import unittest
+import random
 import pbtranscript.ice.pClique as pClique
 from networkx import Graph
 
+
+def _make_test_graph():
+    """A clique of 'a, b, c, d, e' and some other edges."""
+    G = Graph()
+    for e in ['bc', 'bd', 'be', 'bf', 'ba', 'ac', 'ad', 'ae', 'cd',
+              'ce', 'cf', 'cg', 'de', 'dg', 'eg', 'fg']:
+        G.add_edge(e[0], e[1])
+    return G
+
+
+def _random_graph(rng, n, p, clique_sizes):
+    """Random graph with edge prob p and planted quasi-cliques."""
+    edges = set()
+    for i in xrange(n):
+        for j in xrange(i + 1, n):
+            if rng.random() < p:
+                edges.add((i, j))
+    nodes = range(n)
+    rng.shuffle(nodes)
+    for size in clique_sizes:
+        members, nodes = nodes[:size], nodes[size:]
+        for i in members:
+            for j in members:
+                if i < j and rng.random() < 0.95:
+                    edges.add((i, j))
+    return edges
+
 class Test_pClique(unittest.TestCase):
     """Test pClique."""
     def test_maximal_cliques(self):
@@ -33,6 +61,99 @@ class Test_pClique(unittest.TestCase):
         print c
         self.assertTrue(set(c) == set(['a', 'b', 'c', 'd', 'e']))
 
+    def test_grasp_csr(self):
+        """Test grasp_csr finds the same clique as grasp."""
+        G = _make_test_graph()
+        nodes = list(G.nodes())
+        g = pClique.convert_graph_connectivity_to_csr(G, nodes)
+        self.assertEqual(g.n, 7)
+        self.assertEqual(sum(g.degree(i) for i in xrange(g.n)), 32)
+        i = nodes.index('a')
+        tQ = pClique.grasp_csr(g, 1, 5, i, rng=random.Random(0))
+        c = [nodes[j] for j in tQ]
+        self.assertTrue(set(c) == set(['a', 'b', 'c', 'd', 'e']))
+
+        # restricted to a subgraph without 'e'
+        active = set(j for j in xrange(g.n) if nodes[j] != 'e')
+        tQ = pClique.grasp_csr(g, 1, 5, i, rng=random.Random(0),
+                               active=active)
+        self.assertTrue(set(nodes[j] for j in tQ) == set(['a', 'b', 'c', 'd']))
+
+    def test_csr_graph(self):
+        """Test CSRGraph constructors agree."""
+        rng = random.Random(1)
+        edges = _random_graph(rng, 30, 0.2, [])
+        g = pClique.CSRGraph.from_edges(30, edges)
+        H = pClique.sparse.lil_matrix((30, 30))
+        for i, j in edges:
+            H[i, j] = 1
+            H[j, i] = 1
+        g2 = pClique.CSRGraph.from_sparse(H)
+        for i in xrange(30):
+            self.assertEqual(g.neighbors(i), g2.neighbors(i))
+            self.assertEqual(g.degree(i),
+                             sum(1 for e in edges if i in e))
+
+    def test_grasp_csr_vs_grasp(self):
+        """Test cliques found by grasp_csr are quasi-cliques, and sizes
+        are statistically equivalent to those found by grasp."""
+        rng = random.Random(2)
+        gamma = 0.8
+        sizes, sizes_csr = [], []
+        for dummy_k in xrange(4):
+            n = 60
+            edges = _random_graph(rng, n, 0.05, [12, 8, 5])
+            g = pClique.CSRGraph.from_edges(n, edges)
+            H = pClique.sparse.lil_matrix((n, n))
+            for i, j in edges:
+                H[i, j] = 1
+                H[j, i] = 1
+            H = H.tocsr()
+            for seed in xrange(n):
+                if g.degree(seed) == 0:
+                    continue
+                Q = pClique.grasp(None, H, gamma, 5, seed)
+                Q_csr = pClique.grasp_csr(g, gamma, 5, seed,
+                                          rng=random.Random(seed))
+                self.assertEqual(len(Q_csr), len(set(Q_csr)))
+                for q in Q_csr:
+                    n_in = len(g.neighbor_set(q).intersection(Q_csr))
+                    self.assertTrue(n_in >= gamma * (len(Q_csr) - 1))
+                sizes.append(len(Q))
+                sizes_csr.append(len(Q_csr))
+        mean = sum(sizes) / float(len(sizes))
+        mean_csr = sum(sizes_csr) / float(len(sizes_csr))
+        self.assertTrue(abs(mean - mean_csr) < 0.1 * mean)
+
+    def test_partition_into_cliques(self):
+        """Test partition_into_cliques returns disjoint quasi-cliques,
+        independent of number of processes."""
+        rng = random.Random(3)
+        gamma = 0.8
+        n = 200
+        edges = _random_graph(rng, n, 0.005, [20, 15, 10, 10, 8, 5, 5, 3])
+        builder = pClique.GraphBuilder()
+        for i, j in edges:
+            builder.add_edge("r%d" % i, "r%d" % j)
+        self.assertEqual(builder.number_of_edges(), len(edges))
+        g = builder.to_csr()
+
+        cliques = pClique.partition_into_cliques(g, gamma=gamma, maxitr=5,
+                                                 nproc=1, max_nodes_per_task=20)
+        seen = set()
+        for c in cliques:
+            self.assertTrue(len(c) >= 2)
+            self.assertEqual(len(seen.intersection(c)), 0)
+            seen.update(c)
+            for q in c:
+                n_in = len(g.neighbor_set(q).intersection(c))
+                self.assertTrue(n_in >= gamma * (len(c) - 1))
+        self.assertTrue(max(len(c) for c in cliques) >= 15)
+
+        cliques2 = pClique.partition_into_cliques(g, gamma=gamma, maxitr=5,
+                                                  nproc=2, max_nodes_per_task=20)
+        self.assertEqual(cliques, cliques2)
+
 
 if __name__ == "__main__":
     unittest.main()
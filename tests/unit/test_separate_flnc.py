@@ -133,6 +133,42 @@ class TestSeparateFLNCBySize(unittest.TestCase):
         expected_bin_manual = [(SizeBin(3, 4), 0), (SizeBin(4, 8), 0)]
         self._test_bin_manual(bin_manual=bin_manual, expected_bin_manual=expected_bin_manual)
 
+    def test_cost_balanced(self):
+        """Test reads are assigned to parts by estimated clustering cost,
+        with read lengths from FASTA index."""
+        out_dir = op.join(OUT_DIR, 'separate_flnc_by_size_cost_balanced')
+        mknewdir(out_dir)
+        flnc_fa = op.join(out_dir, "flnc.fasta")
+        # round-robin puts all long reads of 1to2kb to part0
+        lengths = [1900, 1000] * 6 + [500, 600, 700]
+        with open(flnc_fa, 'w') as writer:
+            for i, seqlen in enumerate(lengths):
+                writer.write(">r{i} len={l}\n{s}\n".format(i=i, l=seqlen, s="A" * seqlen))
+
+        parts = {}
+        for cost_balanced in (False, True):
+            root_dir = op.join(out_dir, "cost_balanced_%s" % cost_balanced)
+            with SeparateFLNCBySize(flnc_filename=flnc_fa, root_dir=root_dir,
+                                    max_base_limit_MB=0.01,
+                                    cost_balanced=cost_balanced) as obj:
+                obj.run()
+            self.assertEqual(obj.sorted_keys, [(SizeBin(0, 1), 0), (SizeBin(1, 2), 0),
+                                               (SizeBin(1, 2), 1)])
+            parts[cost_balanced] = []
+            for index, key in enumerate(obj.sorted_keys):
+                with FastaReader(obj.out_fasta_files[index]) as reader:
+                    seqlens = [len(r.sequence) for r in reader]
+                self.assertTrue(all([key[0].contains(l) for l in seqlens]))
+                parts[cost_balanced].append(seqlens)
+
+        self.assertTrue(op.exists(flnc_fa + ".fai"))
+        self.assertEqual(obj.read_lengths,
+                         dict(("r%d" % i, l) for i, l in enumerate(lengths)))
+        self.assertEqual(sorted(sum(parts[True], [])), sorted(lengths))
+        self.assertEqual(parts[False][1], [1900] * 6)
+        self.assertEqual(sorted(parts[True][1]), [1000] * 3 + [1900] * 3)
+        self.assertEqual(sorted(parts[True][2]), [1000] * 3 + [1900] * 3)
+
 
 def test_end_to_end():
     """Call separate_flnc.py from command line, end to end must exit gracefully."""
@@ -0,0 +1,73 @@
+"""Test pbtranscript.tofu_wrap."""
+import unittest
+import os
+import os.path as op
+import json
+import time
+from pbtranscript.Utils import rmpath, mkdir
+from pbtranscript.tofu_wrap import cluster_bins
+from test_setpath import OUT_DIR
+
+_OUT_DIR_ = op.join(OUT_DIR, "test_tofu_wrap")
+
+
+def _run_bin(flnc_file):
+    """Fake clustering of a bin, fails on bins named bad."""
+    time.sleep(0.2)
+    print "clustering " + flnc_file
+    with open(flnc_file + ".done", 'w') as writer:
+        writer.write(str(os.getpid()))
+    return 1 if "bad" in flnc_file else 0
+
+
+class TestTofuWrap(unittest.TestCase):
+    """Test functions of pbtranscript.tofu_wrap."""
+
+    def setUp(self):
+        """Define input and output file."""
+        rmpath(_OUT_DIR_)
+        mkdir(_OUT_DIR_)
+
+    def test_cluster_bins(self):
+        """Test bins are clustered in new processes, concurrently within
+        the core budget, largest first, and summarized."""
+        flnc_files = []
+        for name, size in (("0to1kb", 10), ("1to2kb", 30), ("bad", 5), ("2to3kb", 20)):
+            flnc_files.append(op.join(_OUT_DIR_, name + ".fasta"))
+            with open(flnc_files[-1], 'w') as writer:
+                writer.write(">r\n" + "A" * size + "\n")
+        summary_fn = op.join(_OUT_DIR_, "cluster_bins_summary.json")
+
+        failed = cluster_bins(flnc_files=flnc_files, run_bin=_run_bin,
+                              bin_nproc=2, bins_nproc=5, summary_fn=summary_fn)
+        self.assertEqual(failed, [flnc_files[2]])
+        self.assertTrue(all(op.exists(fn + ".done") for fn in flnc_files))
+        self.assertTrue(all(open(fn + ".done").read() != str(os.getpid())
+                            for fn in flnc_files))
+
+        summary = json.load(open(summary_fn))
+        self.assertEqual(summary["peak_concurrency"], 2)
+        self.assertEqual([b["flnc_file"] for b in summary["bins"]],
+                         [flnc_files[i] for i in (1, 3, 0, 2)])
+        self.assertEqual([b["status"] for b in summary["bins"]],
+                         ["succeeded"] * 3 + ["failed"])
+        self.assertTrue(all(b["wall_time"] >= 0.2 for b in summary["bins"]))
+        self.assertTrue(all(open(b["log"]).read().startswith("clustering " + b["flnc_file"])
+                            for b in summary["bins"]))
+
+        # one bin at a time by default
+        failed = cluster_bins(flnc_files=flnc_files[:2], run_bin=_run_bin,
+                              bin_nproc=2, summary_fn=summary_fn)
+        self.assertEqual(failed, [])
+        self.assertEqual(json.load(open(summary_fn))["peak_concurrency"], 1)
+
+        # memory budget allows one bin at a time
+        failed = cluster_bins(flnc_files=flnc_files[:2], run_bin=_run_bin,
+                              bin_nproc=1, bins_nproc=4, bin_mem_GB=3, bins_mem_GB=5,
+                              summary_fn=summary_fn)
+        self.assertEqual(failed, [])
+        self.assertEqual(json.load(open(summary_fn))["peak_concurrency"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()